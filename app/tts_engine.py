@@ -42,7 +42,8 @@ class SpeechSynthesizer:
         if not text or not text.strip():
             raise ValueError("text must be a non-empty string")
 
-        url = f"https://api-inference.huggingface.co/models/{self.model_id}"
+        base_url = os.getenv("HF_INFERENCE_BASE_URL", "https://api-inference.huggingface.co").rstrip("/")
+        url = f"{base_url}/models/{self.model_id}"
         headers = {"Accept": "audio/wav"}
         if self.api_token:
             headers["Authorization"] = f"Bearer {self.api_token}"
@@ -2,7 +2,9 @@
 Yelp AI Chat v2 client.
 
 - Reads API key from environment variable `YELP_API_KEY`
-- Provides a function `ask_yelp_ai` for programmatic use
+- Provides a function `ask_yelp_ai` for programmatic use; pass `chat_id` to continue a conversation
+- `ask_yelp_ai_transformed` adds a response cache keyed by normalised query,
+  locale and geohash cell (YELP_AI_CACHE_GEOHASH_PRECISION, default 6, about 1.2 x 0.6 km)
 - Includes a simple CLI for ad-hoc testing
 
 Usage (CLI):
@@ -13,19 +15,48 @@ Requires: requests, python-dotenv (optional for loading .env)
 """
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import sys
 from dataclasses import dataclass
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlparse
 import re
 
 import requests
 from dotenv import load_dotenv
 
+import upstream
+
 YELP_AI_CHAT_URL = "https://api.yelp.com/ai/chat/v2"
 DEFAULT_OUTPUT_FILENAME = "AI_search_results.json"
 DEFAULT_OUTPUT_PATH = os.path.join(os.path.dirname(__file__), DEFAULT_OUTPUT_FILENAME)
+YELP_AI_CACHE_GEOHASH_PRECISION = int(os.getenv("YELP_AI_CACHE_GEOHASH_PRECISION", "6"))
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+_QUERY_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+# Response parsing runs on every agent request, so its patterns are compiled once
+_FENCED_BLOCK = re.compile(r"```(?:json)?[\s\S]*?```", re.IGNORECASE)
+_FENCED_JSON = re.compile(r"```(?:json)?\n([\s\S]*?)\n```")
+_BRACED_REGION = re.compile(r"\{[\s\S]*\}")
+_IMAGE_PATH = re.compile(r"\.(?:jpg|jpeg|png|webp|gif)(?:\?.*)?$", re.IGNORECASE)
+_HOURS = re.compile(r"(\d+(?:\.\d+)?)\s*h|\b(\d+(?:\.\d+)?)\s*hour")
+_MINUTES = re.compile(r"(\d+)\s*m|\b(\d+)\s*min")
+_MINUTES_SUFFIX = re.compile(r"(\d+)\s*mins?")
+_HOURS_SUFFIX = re.compile(r"(\d+(?:\.\d+)?)\s*hours?")
+
+_BUSINESS_HINT_KEYS = frozenset(["url", "location", "coordinates", "review_count", "price", "rating"])
+# Where Yelp AI responses list businesses, in priority order
+_BUSINESS_LIST_PATHS = [
+    ("businesses",),
+    ("results", "businesses"),
+    ("data", "businesses"),
+    ("response", "businesses"),
+    ("entities",),
+]
 
 
 @dataclass
@@ -62,9 +93,11 @@ def _get_api_key() -> str:
     return api_key
 
 
-def ask_yelp_ai(query: str, user_context: UserContext, timeout_seconds: int = 20) -> Dict[str, Any]:
+def ask_yelp_ai(query: str, user_context: UserContext, timeout_seconds: int = 20,
+                chat_id: Optional[str] = None) -> Dict[str, Any]:
     """
-    Send a chat request to Yelp AI Chat v2.
+    Send a chat request to Yelp AI Chat v2. With a chat_id, the request
+    continues that conversation, so the query only needs what is new.
 
     Returns parsed JSON dict on success; raises YelpAIError on failures.
     """
@@ -78,9 +111,12 @@ def ask_yelp_ai(query: str, user_context: UserContext, timeout_seconds: int = 20
         "query": query,
         "user_context": user_context.to_dict(),
     }
+    if chat_id:
+        payload["chat_id"] = chat_id
 
     try:
-        response = requests.post(
+        response = upstream.post(
+            upstream.YELP_AI_CHAT,
             YELP_AI_CHAT_URL,
             headers=headers,
             json=payload,
@@ -108,6 +144,74 @@ def ask_yelp_ai(query: str, user_context: UserContext, timeout_seconds: int = 20
     return data
 
 
+def geohash(latitude: float, longitude: float, precision: int) -> str:
+    """Standard base32 geohash of a point; nearby points share a prefix"""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(chars) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= middle:
+            bits |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = bit_count = 0
+    return "".join(chars)
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, with punctuation and runs of whitespace collapsed to single spaces"""
+    return _WHITESPACE.sub(" ", _QUERY_PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+def yelp_ai_cache_key(query: str, user_context: UserContext, precision: Optional[int] = None) -> str:
+    """Cache key for a chat request: normalised query, locale and the geohash cell of the coordinates"""
+    precision = YELP_AI_CACHE_GEOHASH_PRECISION if precision is None else precision
+    if user_context.latitude is not None and user_context.longitude is not None:
+        cell = geohash(user_context.latitude, user_context.longitude, precision)
+    else:
+        cell = "-"
+    digest = hashlib.sha256(normalize_query(query).encode("utf-8")).hexdigest()[:32]
+    return f"yelp_ai:{user_context.locale or '-'}:{cell}:{digest}"
+
+
+def ask_yelp_ai_transformed(query: str, user_context: UserContext, cache: Any = None,
+                            timeout_seconds: int = 20) -> Tuple[Dict[str, Any], bool]:
+    """
+    ``transform_yelp_ai_response(ask_yelp_ai(...))``, answered from cache when an
+    equivalent request was made nearby within the cache TTL.
+
+    The cache holds transformed responses, so hits skip parsing too. A chat id
+    belongs to the conversation that created it, so cached responses carry none.
+
+    Args:
+        cache: Any cache with get/set (see cache_backends.create_cache), or None
+
+    Returns:
+        The transformed response and whether it came from the cache
+    """
+    key = yelp_ai_cache_key(query, user_context) if cache is not None else None
+    if key is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return dict(cached), True
+
+    transformed = transform_yelp_ai_response(ask_yelp_ai(query, user_context, timeout_seconds))
+    # Empty answers are usually transient upstream trouble; don't pin them for the TTL
+    if key is not None and (transformed.get("text") or transformed.get("businesses")):
+        cache.set(key, {**transformed, "chat_id": None})
+    return transformed, False
+
+
 def save_json_to_file(data: Dict[str, Any], file_path: str) -> None:
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     with open(file_path, "w", encoding="utf-8") as f:
@@ -161,62 +265,30 @@ def _extract_text(raw: Dict[str, Any]) -> Optional[str]:
     return None
 
 
-def _iter_dicts(value: Any):
-    if isinstance(value, dict):
-        yield value
-        for v in value.values():
-            yield from _iter_dicts(v)
-    elif isinstance(value, list):
-        for item in value:
-            yield from _iter_dicts(item)
-
-
 def _looks_like_business(obj: Dict[str, Any]) -> bool:
     if not isinstance(obj, dict):
         return False
-    has_id = isinstance(obj.get("id"), str)
-    has_name = isinstance(obj.get("name"), str)
-    has_any_business_hint = any(
-        key in obj for key in ["url", "location", "coordinates", "review_count", "price", "rating"]
+    return (
+        isinstance(obj.get("id"), str)
+        and isinstance(obj.get("name"), str)
+        and not _BUSINESS_HINT_KEYS.isdisjoint(obj)
     )
-    return has_id and has_name and has_any_business_hint
-
-
-def _collect_businesses(raw: Dict[str, Any]) -> list[Dict[str, Any]]:
-    # Priority: top-level common keys
-    candidates_lists: list[Any] = []
-    for key_path in [
-        ("businesses",),
-        ("results", "businesses"),
-        ("data", "businesses"),
-        ("response", "businesses"),
-        ("entities",),
-    ]:
-        container = _get_nested(raw, *key_path) if len(key_path) > 1 else raw.get(key_path[0])
-        if isinstance(container, list):
-            candidates_lists.append(container)
 
+
+def _listed_businesses(raw: Dict[str, Any]) -> list[Dict[str, Any]]:
+    """Business-like dicts from the known business lists, deduplicated by id"""
     businesses: list[Dict[str, Any]] = []
     seen_ids: set[str] = set()
-
-    # From candidate lists
-    for lst in candidates_lists:
-        for item in lst:
+    for key_path in _BUSINESS_LIST_PATHS:
+        container = _get_nested(raw, *key_path)
+        if not isinstance(container, list):
+            continue
+        for item in container:
             if isinstance(item, dict) and _looks_like_business(item):
                 bid = item.get("id")
                 if isinstance(bid, str) and bid not in seen_ids:
                     businesses.append(item)
                     seen_ids.add(bid)
-
-    # Fallback: recursive scan for business-like dicts
-    if not businesses:
-        for obj in _iter_dicts(raw):
-            if _looks_like_business(obj):
-                bid = obj.get("id")
-                if isinstance(bid, str) and bid not in seen_ids:
-                    businesses.append(obj)
-                    seen_ids.add(bid)
-
     return businesses
 
 
@@ -330,22 +402,24 @@ def _is_likely_image_url(url: Optional[str]) -> bool:
     if not url or not isinstance(url, str):
         return False
     try:
-        from urllib.parse import urlparse
         path = urlparse(url).path
     except Exception:
         return False
-    return bool(re.search(r"\.(?:jpg|jpeg|png|webp|gif)(?:\?.*)?$", path, flags=re.IGNORECASE))
+    return bool(_IMAGE_PATH.search(path))
 
 
-def _enrich_plan_images(plan: Dict[str, Any], businesses: list[Dict[str, Any]]) -> Dict[str, Any]:
-    if not plan:
-        return plan
+def _businesses_by_name(businesses: list[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
     name_to_biz: Dict[str, Dict[str, Any]] = {}
     for b in businesses or []:
         name = (b.get("name") or "").strip().lower()
         if name and name not in name_to_biz:
             name_to_biz[name] = b
+    return name_to_biz
+
 
+def _enrich_plan_images(plan: Dict[str, Any], name_to_biz: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    if not plan:
+        return plan
     stops = plan.get("stops") or []
     enriched_stops: list[Dict[str, Any]] = []
     for s in stops:
@@ -377,7 +451,7 @@ def _strip_json_from_text(text: Optional[str]) -> Optional[str]:
     if not isinstance(text, str) or not text:
         return text
     # Remove any fenced code blocks ```...```
-    cleaned = re.sub(r"```(?:json)?[\s\S]*?```", "", text, flags=re.IGNORECASE)
+    cleaned = _FENCED_BLOCK.sub("", text)
     # Also trim stray braces blocks at end
     # If there's a standalone JSON starting later in the text, keep only the prefix before it
     brace_idx = cleaned.find("{")
@@ -404,18 +478,17 @@ def _parse_duration_to_minutes(value: Any) -> Optional[int]:
         if s.isdigit():
             return int(s)
         # extract hours and minutes
-        import re
         hours = 0
         minutes = 0
         # 1h 30m or 1 hr 30 min
-        h_match = re.search(r"(\d+(?:\.\d+)?)\s*h|\b(\d+(?:\.\d+)?)\s*hour", s)
+        h_match = _HOURS.search(s)
         if h_match:
             val = h_match.group(1) or h_match.group(2)
             try:
                 hours = float(val)
             except Exception:
                 hours = 0
-        m_match = re.search(r"(\d+)\s*m|\b(\d+)\s*min", s)
+        m_match = _MINUTES.search(s)
         if m_match:
             valm = m_match.group(1) or m_match.group(2)
             try:
@@ -425,14 +498,14 @@ def _parse_duration_to_minutes(value: Any) -> Optional[int]:
         if hours or minutes:
             return int(round(hours * 60 + minutes))
         # maybe plain minutes with suffix like "90mins"
-        m2 = re.search(r"(\d+)\s*mins?", s)
+        m2 = _MINUTES_SUFFIX.search(s)
         if m2:
             try:
                 return int(m2.group(1))
             except Exception:
                 return None
         # maybe like "1.5 hours"
-        h2 = re.search(r"(\d+(?:\.\d+)?)\s*hours?", s)
+        h2 = _HOURS_SUFFIX.search(s)
         if h2:
             try:
                 return int(round(float(h2.group(1)) * 60))
@@ -578,20 +651,19 @@ def _normalize_day_plan(obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
 def _attempt_parse_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     if not text or "{" not in text:
         return None
-    import re, json as _json
     # grab first JSON-like block
     candidates: list[str] = []
     # within code fences
-    for m in re.finditer(r"```(?:json)?\n([\s\S]*?)\n```", text):
+    for m in _FENCED_JSON.finditer(text):
         candidates.append(m.group(1))
     # fallback: braces region
     if not candidates:
-        brace_match = re.search(r"\{[\s\S]*\}", text)
+        brace_match = _BRACED_REGION.search(text)
         if brace_match:
             candidates.append(brace_match.group(0))
     for c in candidates:
         try:
-            obj = _json.loads(c)
+            obj = json.loads(c)
             if isinstance(obj, dict):
                 return obj
         except Exception:
@@ -599,86 +671,89 @@ def _attempt_parse_json_from_text(text: str) -> Optional[Dict[str, Any]]:
     return None
 
 
-def _extract_day_plan(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    # 1) Look for an object in raw that looks like a plan
-    for obj in _iter_dicts(raw):
-        plan = _normalize_day_plan(obj)
-        if plan:
-            return plan
-    # 2) Try parse JSON from text field and normalize
-    text = _extract_text(raw)
-    if isinstance(text, str):
-        maybe = _attempt_parse_json_from_text(text)
-        if isinstance(maybe, dict):
-            plan = _normalize_day_plan(maybe)
-            if plan:
-                return plan
-        # heuristically extract a simple bullet plan could be future work
-    return None
+class _PayloadVisitor:
+    """
+    One depth-first pass over a Yelp AI payload.
 
+    Collects, in document order: business-like dicts (only when the known
+    business lists had none), the first dict that normalizes to a day plan,
+    and every plan found in a list that is a dict value. Each dict is
+    normalized at most once.
+    """
 
- 
-def transform_yelp_ai_response(raw: Dict[str, Any]) -> Dict[str, Any]:
-    chat_id = _extract_chat_id(raw)
-    text = _extract_text(raw)
-    businesses_raw = _collect_businesses(raw)
-    businesses = [_transform_business(b) for b in businesses_raw]
-    plan = _extract_day_plan(raw)
-
-    # Try to extract multiple plans if present
-    def _extract_day_plans(value: Any) -> Optional[list[Dict[str, Any]]]:
-        # 1) look for an array field that contains plan-like dicts
-        candidates: list[Dict[str, Any]] = []
+    def __init__(self, collect_businesses: bool):
+        self.collect_businesses = collect_businesses
+        self.businesses: list[Dict[str, Any]] = []
+        self.plan: Optional[Dict[str, Any]] = None
+        self.plans: list[Dict[str, Any]] = []
+        self._seen_ids: set[str] = set()
+        self._normalized: Dict[int, Optional[Dict[str, Any]]] = {}
+
+    def _normalize(self, obj: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        key = id(obj)
+        if key not in self._normalized:
+            self._normalized[key] = _normalize_day_plan(obj)
+        return self._normalized[key]
+
+    def visit(self, value: Any) -> None:
         if isinstance(value, dict):
-            for key, val in value.items():
-                if isinstance(val, list):
-                    group: list[Dict[str, Any]] = []
-                    for item in val:
+            if self.collect_businesses and _looks_like_business(value):
+                bid = value.get("id")
+                if bid not in self._seen_ids:
+                    self.businesses.append(value)
+                    self._seen_ids.add(bid)
+            if self.plan is None:
+                self.plan = self._normalize(value)
+            children = value.values()
+            for child in children:
+                if isinstance(child, list):
+                    for item in child:
                         if isinstance(item, dict):
-                            norm = _normalize_day_plan(item)
+                            norm = self._normalize(item)
                             if norm:
-                                group.append(norm)
-                    if group:
-                        candidates.extend(group)
-            # recursively explore
-            for v in value.values():
-                found = _extract_day_plans(v)
-                if found:
-                    candidates.extend(found)
+                                self.plans.append(norm)
+            for child in children:
+                if isinstance(child, (dict, list)):
+                    self.visit(child)
         elif isinstance(value, list):
             for item in value:
-                found = _extract_day_plans(item)
-                if found:
-                    candidates.extend(found)
-        return candidates or None
-
-    plans = _extract_day_plans(raw) or []
-    # Also try parsing JSON from text for an explicit { plans: [...] } or array of plans
-    if not plans and isinstance(text, str):
+                if isinstance(item, (dict, list)):
+                    self.visit(item)
+
+
+def transform_yelp_ai_response(raw: Dict[str, Any]) -> Dict[str, Any]:
+    chat_id = _extract_chat_id(raw)
+    text = _extract_text(raw)
+    businesses_raw = _listed_businesses(raw)
+    visitor = _PayloadVisitor(collect_businesses=not businesses_raw)
+    visitor.visit(raw)
+    businesses = [_transform_business(b) for b in businesses_raw or visitor.businesses]
+    plan = visitor.plan
+    plans = visitor.plans
+
+    # Fall back to JSON embedded in the text: a plan, or { plans: [...] }
+    if isinstance(text, str) and (plan is None or not plans):
         maybe = _attempt_parse_json_from_text(text)
         if isinstance(maybe, dict):
+            if plan is None:
+                plan = _normalize_day_plan(maybe)
             arr = maybe.get("plans")
-            if isinstance(arr, list):
+            if not plans and isinstance(arr, list):
                 for item in arr:
                     if isinstance(item, dict):
                         norm = _normalize_day_plan(item)
                         if norm:
                             plans.append(norm)
-        elif isinstance(maybe, list):
-            for item in maybe:
-                if isinstance(item, dict):
-                    norm = _normalize_day_plan(item)
-                    if norm:
-                        plans.append(norm)
 
     # Strip any inline JSON from the narrative text; plans are extracted separately
     text_clean = _strip_json_from_text(text)
 
     # Enrich images for plan(s) using business gallery/photo urls
+    name_to_biz = _businesses_by_name(businesses)
     if isinstance(plan, dict):
-        plan = _enrich_plan_images(plan, businesses)
-    if isinstance(plans, list) and plans:
-        plans = [_enrich_plan_images(p, businesses) if isinstance(p, dict) else p for p in plans]
+        plan = _enrich_plan_images(plan, name_to_biz)
+    if plans:
+        plans = [_enrich_plan_images(p, name_to_biz) for p in plans]
 
     result: Dict[str, Any] = {
         "chat_id": chat_id,
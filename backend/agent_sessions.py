@@ -0,0 +1,114 @@
+"""
+Server-side state for multi-turn agent conversations.
+
+The first turn of a conversation sends Yelp AI the full prompt, including
+the plan-shape instruction. A session remembers what follow-ups need to
+continue from there:
+
+- the Yelp AI ``chat_id``
+- where the conversation is anchored (location, coordinates, distance)
+- the user's requests so far
+- the structured results of the latest turn (businesses, plan, plans)
+
+With a ``chat_id``, a follow-up sends only the new request and Yelp
+continues the conversation. Answers served from the Yelp AI cache carry no
+``chat_id``. Follow-ups to those start a new conversation from the recorded
+requests.
+
+Sessions live in a bounded cache with a TTL (see cache_backends.create_cache),
+so every worker sees them and abandoned conversations expire:
+
+    AGENT_SESSION_MAX_ENTRIES=1024
+    AGENT_SESSION_MAX_BYTES=16777216
+    AGENT_SESSION_TTL_SECONDS=1800
+    AGENT_SESSION_MAX_REQUESTS=8        # requests kept for rebuilding a conversation
+"""
+
+from typing import Any, Dict, Optional
+import os
+import time
+import uuid
+
+
+AGENT_SESSION_MAX_ENTRIES = int(os.getenv("AGENT_SESSION_MAX_ENTRIES", "1024"))
+AGENT_SESSION_MAX_BYTES = int(os.getenv("AGENT_SESSION_MAX_BYTES", str(16 * 1024 * 1024)))
+AGENT_SESSION_TTL_SECONDS = float(os.getenv("AGENT_SESSION_TTL_SECONDS", "1800"))
+AGENT_SESSION_MAX_REQUESTS = int(os.getenv("AGENT_SESSION_MAX_REQUESTS", "8"))
+
+_STRUCTURED_KEYS = ("businesses", "plan", "plans")
+
+
+def merge_turn(previous: Optional[Dict[str, Any]], transformed: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    A follow-up's transformed answer, with structured results it left out
+    carried over from the previous turn. Refinements are often text-only
+    ("anything quieter?"). The client should not lose the businesses or plan
+    it is showing.
+    """
+    if not previous:
+        return transformed
+    merged = dict(transformed)
+    if not merged.get("businesses"):
+        merged["businesses"] = previous.get("businesses") or []
+    if not merged.get("plan") and not merged.get("plans"):
+        for key in ("plan", "plans"):
+            if previous.get(key):
+                merged[key] = previous[key]
+    return merged
+
+
+class AgentSessionManager:
+    """
+    Agent conversations by session id, kept in a shared cache.
+    """
+
+    def __init__(self, store: Any, max_requests: int = AGENT_SESSION_MAX_REQUESTS):
+        """
+        Args:
+            store: Shared cache (see cache_backends.create_cache) holding session state
+            max_requests: User requests remembered per session
+        """
+        self.store = store
+        self.max_requests = max_requests
+
+    @staticmethod
+    def _key(session_id: str) -> str:
+        return f"agent_session:{session_id}"
+
+    def load(self, session_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """The session's state, or None if the id is unknown or expired"""
+        if not session_id:
+            return None
+        session = self.store.get(self._key(session_id))
+        return dict(session) if session else None
+
+    def record_turn(self, session_id: Optional[str], session: Optional[Dict[str, Any]], user_request: str,
+                    transformed: Dict[str, Any], chat_id: Optional[str], anchor: Dict[str, Any]) -> str:
+        """
+        Store the state after a turn, starting a new session when there is none.
+
+        Args:
+            session_id: The id the turn was made under, or None for a new conversation
+            session: The state loaded for session_id, or None
+            user_request: The user's request this turn
+            transformed: The turn's answer (after merge_turn)
+            chat_id: The Yelp AI conversation to continue, if any
+            anchor: location, latitude, longitude and distance_miles of the conversation
+
+        Returns:
+            The session id
+        """
+        session_id = session_id if session is not None else uuid.uuid4().hex
+        requests = list((session or {}).get("requests") or []) + [user_request]
+        self.store.set(self._key(session_id), {
+            "chat_id": chat_id,
+            **anchor,
+            "requests": requests[-self.max_requests:],
+            "turns": (session or {}).get("turns", 0) + 1,
+            "updated_at": time.time(),
+            "result": {key: transformed.get(key) for key in _STRUCTURED_KEYS if transformed.get(key)},
+        })
+        return session_id
+
+    def delete(self, session_id: str) -> bool:
+        return self.store.delete(self._key(session_id))
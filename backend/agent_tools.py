@@ -1,7 +1,8 @@
 import os
 import json
-import requests
 from new_engine import ChaloSearchEngine
+from place_identity import get_place_key
+import upstream
 
 class GeminiClient:
     """Simple Gemini API client for agent functionality"""
@@ -35,7 +36,7 @@ class GeminiClient:
             }
             
             url = f"{self.base_url}?key={self.api_key}"
-            response = requests.post(url, headers=headers, json=data)
+            response = upstream.post(upstream.GEMINI, url, headers=headers, json=data)
             response.raise_for_status()
             
             result = response.json()
@@ -139,13 +140,13 @@ class AgentSearchEngine(ChaloSearchEngine):
                     ]
                     for ds in dessert_specs:
                         print(f"Searching {q} (type={ds['type']}, keyword={ds.get('keyword')})...")
-                        tasks.append((q, pool.submit(self.search_category, lat, lng, ds['type'], min_rating, ds.get('keyword'))))
+                        tasks.append((q, pool.submit(upstream.bind_context(self.search_category), lat, lng, ds['type'], min_rating, ds.get('keyword'))))
                 else:
                     spec = self.intent_map.get(norm, {"type": "restaurant"})
                     category = spec["type"]
                     keyword = spec.get("keyword")
                     print(f"Searching {q} (type={category}, keyword={keyword})...")
-                    tasks.append((q, pool.submit(self.search_category, lat, lng, category, min_rating, keyword)))
+                    tasks.append((q, pool.submit(upstream.bind_context(self.search_category), lat, lng, category, min_rating, keyword)))
 
             for q, fut in tasks:
                 try:
@@ -169,12 +170,12 @@ class AgentSearchEngine(ChaloSearchEngine):
                 results_by_category[q].extend(filtered)
                 print(f"Found {len(filtered)} places for {q}")
 
-        # Deduplicate merged categories by place_id and sort by rating then distance
+        # Deduplicate merged categories by place identity and sort by rating then distance
         for q, places in list(results_by_category.items()):
             seen = set()
             deduped = []
             for p in places:
-                pid = p.get('place_id')
+                pid = get_place_key(p)
                 if pid and pid in seen:
                     continue
                 if pid:
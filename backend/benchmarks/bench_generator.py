@@ -0,0 +1,325 @@
+"""
+Microbenchmarks for ItineraryGenerator.
+
+Runs itinerary generation, custom (hotspot clustering) generation, hotspot
+detection and route optimisation on the saved Bleeker St search results and
+on synthetic cities of 100, 1k and 10k places. For each case it reports
+wall time, peak traced allocation and quality metrics of the output, and
+compares them with a stored baseline, exiting non-zero on a regression.
+
+Usage:
+    python benchmarks/bench_generator.py                       # run and compare with the baseline
+    python benchmarks/bench_generator.py --datasets bleeker,1k --targets generate_itineraries
+    python benchmarks/bench_generator.py --save-baseline       # record a new baseline
+
+Timings depend on the machine; record the baseline on the machine that runs
+the comparison. Generation is seeded, so quality metrics are reproducible.
+"""
+
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BACKEND_DIR)
+
+import structured_logging
+from itinerary_generator import ItineraryGenerator
+from new_engine import ChaloSearchEngine
+from synthetic_city import generate_city
+
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+SYNTHETIC_SIZES = {'100': 100, '1k': 1000, '10k': 10000}
+USER_CATEGORIES = ['cafe', 'park', 'museum']
+MAX_DISTANCE_MILES = 1.5
+ROUTE_SAMPLE_SIZE = 8
+RANDOM_SEED = 1234
+# The saved search the baseline was recorded against; other Bleeker dumps in
+# search_results/ (e.g. from load runs) must not change the dataset
+BLEEKER_RESULTS = os.path.join(BACKEND_DIR, "search_results", "search_results_Bleeker_St_NY_20250807_182420.json")
+
+# Quality metrics and whether higher values are better
+QUALITY_DIRECTIONS = {
+    'itineraries': True,
+    'mean_stops': True,
+    'mean_walk_minutes': False,
+    'max_walk_minutes': False,
+    'category_diversity': True,
+    'unique_stop_ratio': True,
+    'hotspots': True,
+    'top_hotspot_score': True,
+    'route_meters': False,
+}
+
+# Differences below these are noise, whatever the relative change
+TIME_NOISE_SECONDS = 0.002
+ALLOC_NOISE_BYTES = 64 * 1024
+
+
+def load_dataset(name: str) -> Dict:
+    """Saved Bleeker St results or a synthetic city."""
+    if name == 'bleeker':
+        engine = ChaloSearchEngine("")
+        engine.testing_data_file = BLEEKER_RESULTS
+        return engine.load_testing_data()
+    if name in SYNTHETIC_SIZES:
+        return generate_city(SYNTHETIC_SIZES[name], seed=RANDOM_SEED)
+    raise ValueError(f"Unknown dataset {name}; expected bleeker or one of {', '.join(SYNTHETIC_SIZES)}")
+
+
+def fresh_copy(search_results: Dict) -> Dict:
+    """Copy the place dicts, which generation annotates in place."""
+    return {
+        **search_results,
+        'results_by_category': {
+            category: [dict(place) for place in places]
+            for category, places in search_results['results_by_category'].items()
+        },
+    }
+
+
+def flatten_for_clustering(generator: ItineraryGenerator, search_results: Dict) -> List[Dict]:
+    """All places within range, marked with user preference as custom generation does."""
+    preferred_queries = {
+        'cafes and bakeries near me', 'parks near me', 'museums near me',
+    }
+    max_distance_meters = MAX_DISTANCE_MILES * 1609.34
+    all_places = []
+    for category, places in search_results['results_by_category'].items():
+        for place in places:
+            if place.get('distance_meters', 0) <= max_distance_meters:
+                place = dict(place)
+                place['user_preference'] = category in preferred_queries
+                place['search_category'] = category
+                all_places.append(place)
+    return all_places
+
+
+def route_meters(generator: ItineraryGenerator, places: List[Dict]) -> float:
+    return sum(generator.calculate_distance_between_places(a, b) for a, b in zip(places, places[1:]))
+
+
+def itinerary_quality(itineraries: List[Dict]) -> Dict[str, float]:
+    """Stop count, walking, diversity and overlap of generated itineraries."""
+    if not itineraries:
+        return {'itineraries': 0}
+    stop_counts, walks, max_walks, diversity = [], [], [], []
+    stop_ids = []
+    for itinerary in itineraries:
+        stops = itinerary['stops']
+        stop_counts.append(len(stops))
+        legs = [stop.get('walking_time_minutes', 0) for stop in stops[1:]]
+        walks.append(sum(legs))
+        max_walks.append(max(legs, default=0))
+        diversity.append(len({stop['category'] for stop in stops}) / len(stops) if stops else 0)
+        stop_ids.extend(stop['id'] for stop in stops)
+    return {
+        'itineraries': len(itineraries),
+        'mean_stops': round(statistics.mean(stop_counts), 3),
+        'mean_walk_minutes': round(statistics.mean(walks), 3),
+        'max_walk_minutes': max(max_walks),
+        'category_diversity': round(statistics.mean(diversity), 3),
+        'unique_stop_ratio': round(len(set(stop_ids)) / len(stop_ids), 3) if stop_ids else 0,
+    }
+
+
+# Each target prepares its input outside the timed call and returns (call, quality)
+Target = Callable[[ItineraryGenerator, Dict], Tuple[Callable[[], Any], Callable[[Any], Dict[str, float]]]]
+
+
+def target_generate_itineraries(generator: ItineraryGenerator, data: Dict):
+    copy = fresh_copy(data)
+    return (lambda: generator.generate_itineraries(copy, "Benchmark", max_distance_miles=MAX_DISTANCE_MILES),
+            itinerary_quality)
+
+
+def target_generate_custom_itineraries(generator: ItineraryGenerator, data: Dict):
+    copy = fresh_copy(data)
+    return (lambda: generator.generate_custom_itineraries(copy, "Benchmark", MAX_DISTANCE_MILES, USER_CATEGORIES),
+            itinerary_quality)
+
+
+def target_find_preference_hotspots(generator: ItineraryGenerator, data: Dict):
+    all_places = flatten_for_clustering(generator, data)
+
+    def quality(hotspots: List[Dict]) -> Dict[str, float]:
+        return {
+            'hotspots': len(hotspots),
+            'top_hotspot_score': round(hotspots[0]['score'], 4) if hotspots else 0,
+        }
+    return lambda: generator.find_preference_hotspots(all_places, MAX_DISTANCE_MILES), quality
+
+
+def _route_sample(data: Dict) -> List[Dict]:
+    places = [place for places in data['results_by_category'].values() for place in places]
+    return random.Random(RANDOM_SEED).sample(places, min(ROUTE_SAMPLE_SIZE, len(places)))
+
+
+def target_optimize_stop_order(generator: ItineraryGenerator, data: Dict):
+    sample = _route_sample(data)
+    return (lambda: generator.optimize_stop_order(list(sample), MAX_DISTANCE_MILES),
+            lambda route: {'route_meters': round(route_meters(generator, route), 1)})
+
+
+def target_optimize_cluster_route(generator: ItineraryGenerator, data: Dict):
+    sample = _route_sample(data)
+    return (lambda: generator.optimize_cluster_route(list(sample)),
+            lambda route: {'route_meters': round(route_meters(generator, route), 1)})
+
+
+TARGETS: Dict[str, Target] = {
+    'generate_itineraries': target_generate_itineraries,
+    'generate_custom_itineraries': target_generate_custom_itineraries,
+    'find_preference_hotspots': target_find_preference_hotspots,
+    'optimize_stop_order': target_optimize_stop_order,
+    'optimize_cluster_route': target_optimize_cluster_route,
+}
+
+
+def run_case(target: Target, data: Dict, min_time: float, max_runs: int) -> Dict[str, Any]:
+    """
+    Time a target until min_time has elapsed (at least 3 runs unless a run
+    takes longer than min_time), then measure allocations in one extra run.
+    """
+    generator = ItineraryGenerator()
+    timings = []
+    output = None
+    spent = 0.0
+    while len(timings) < max_runs:
+        call, quality = target(generator, data)
+        random.seed(RANDOM_SEED)
+        started = time.perf_counter()
+        output = call()
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        spent += elapsed
+        if spent >= min_time and (len(timings) >= 3 or elapsed >= min_time):
+            break
+
+    call, quality = target(generator, data)
+    random.seed(RANDOM_SEED)
+    tracemalloc.start()
+    try:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        call()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'runs': len(timings),
+        'median_seconds': round(statistics.median(timings), 6),
+        'min_seconds': round(min(timings), 6),
+        'peak_alloc_bytes': peak - before,
+        'retained_bytes': after - before,
+        'quality': quality(output),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], time_tolerance: float,
+            alloc_tolerance: float, quality_tolerance: float) -> List[str]:
+    """Regressions of results against the baseline, as messages."""
+    regressions = []
+    for case, result in results.items():
+        base = baseline.get(case)
+        if base is None:
+            continue
+        if (result['median_seconds'] > base['median_seconds'] * (1 + time_tolerance)
+                and result['median_seconds'] - base['median_seconds'] > TIME_NOISE_SECONDS):
+            regressions.append(f"{case}: median time {result['median_seconds']:.4f}s vs baseline {base['median_seconds']:.4f}s")
+        if (result['peak_alloc_bytes'] > base['peak_alloc_bytes'] * (1 + alloc_tolerance)
+                and result['peak_alloc_bytes'] - base['peak_alloc_bytes'] > ALLOC_NOISE_BYTES):
+            regressions.append(f"{case}: peak allocation {result['peak_alloc_bytes']} B vs baseline {base['peak_alloc_bytes']} B")
+        for metric, base_value in base.get('quality', {}).items():
+            value = result['quality'].get(metric)
+            higher_is_better = QUALITY_DIRECTIONS.get(metric)
+            if value is None or higher_is_better is None:
+                continue
+            margin = abs(base_value) * quality_tolerance
+            worse = value < base_value - margin if higher_is_better else value > base_value + margin
+            if worse:
+                regressions.append(f"{case}: {metric} {value} vs baseline {base_value}")
+    return regressions
+
+
+def print_results(results: Dict[str, Dict], baseline: Dict[str, Dict]) -> None:
+    header = f"{'case':<50}{'runs':>5}{'median ms':>11}{'vs base':>9}{'peak KiB':>10}  quality"
+    print(header)
+    print("-" * len(header))
+    for case, result in results.items():
+        base = baseline.get(case)
+        change = ""
+        if base and base['median_seconds']:
+            change = f"{(result['median_seconds'] / base['median_seconds'] - 1) * 100:+.0f}%"
+        quality = " ".join(f"{key}={value}" for key, value in result['quality'].items())
+        print(f"{case:<50}{result['runs']:>5}{result['median_seconds'] * 1000:>11.2f}{change:>9}"
+              f"{result['peak_alloc_bytes'] / 1024:>10.0f}  {quality}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="ItineraryGenerator microbenchmarks")
+    parser.add_argument("--datasets", default="bleeker,100,1k,10k")
+    parser.add_argument("--targets", default=",".join(TARGETS))
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds to spend timing each case")
+    parser.add_argument("--max-runs", type=int, default=50)
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Allowed relative slowdown")
+    parser.add_argument("--alloc-tolerance", type=float, default=0.25, help="Allowed relative allocation growth")
+    parser.add_argument("--quality-tolerance", type=float, default=0.05, help="Allowed relative quality loss")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    structured_logging.set_level(None, "WARNING")
+    targets = [name.strip() for name in args.targets.split(",") if name.strip()]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"Unknown targets: {', '.join(sorted(unknown))}")
+
+    results: Dict[str, Dict] = {}
+    for dataset in [name.strip() for name in args.datasets.split(",") if name.strip()]:
+        data = load_dataset(dataset)
+        for target in targets:
+            results[f"{target}[{dataset}]"] = run_case(TARGETS[target], data, args.min_time, args.max_runs)
+
+    baseline: Dict[str, Dict] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f).get('cases', {})
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'cases': results}, f, indent=2)
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        with open(args.baseline, 'w') as f:
+            json.dump({'python': sys.version.split()[0], 'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                       'cases': dict(sorted(merged.items()))}, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+        return 0
+
+    regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance, args.quality_tolerance)
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline}; run with --save-baseline to record one")
+    elif regressions:
+        print("\nREGRESSIONS:")
+        for message in regressions:
+            print(f"  {message}")
+        return 1
+    else:
+        print("\nNo regressions against the baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
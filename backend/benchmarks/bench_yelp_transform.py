@@ -0,0 +1,202 @@
+"""
+Benchmark for the Yelp AI response transformer.
+
+Runs ``transform_yelp_ai_response`` over recorded Yelp AI Chat payloads
+(``yelp_payloads/`` and ``data/ai_engine_sample.json``) and over synthetic
+ones: a plan list embedded in the text and deeply nested responses. For each
+payload it reports the median time per call and a digest of the output, and
+compares both with a stored baseline. A changed digest means the output
+changed, and always fails; a slower median fails past the tolerance.
+
+Usage:
+    python benchmarks/bench_yelp_transform.py                 # run and compare with the baseline
+    python benchmarks/bench_yelp_transform.py --save-baseline # record a new baseline
+
+Timings depend on the machine; record the baseline on the machine that runs
+the comparison.
+"""
+
+from typing import Any, Dict, List, Tuple
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.append(BACKEND_DIR)
+
+from AI_engine import transform_yelp_ai_response
+
+
+DEFAULT_BASELINE = os.path.join(BENCH_DIR, "yelp_transform_baseline.json")
+PAYLOAD_DIR = os.path.join(BENCH_DIR, "yelp_payloads")
+SAMPLE_PAYLOAD = os.path.join(os.path.dirname(BACKEND_DIR), "data", "ai_engine_sample.json")
+NESTED_DEPTHS = {'nested_6': 6, 'nested_9': 9}
+RANDOM_SEED = 1234
+# Slower than the baseline by more than this fraction (and the noise floor) is a regression
+TIME_TOLERANCE = 0.25
+TIME_NOISE_SECONDS = 0.00005
+
+
+def _business(rng: random.Random, index: int) -> Dict[str, Any]:
+    return {
+        'id': f"biz-{index}",
+        'alias': f"place-{index}",
+        'name': f"Place {index}",
+        'url': f"https://www.yelp.com/biz/place-{index}",
+        'coordinates': {'latitude': 40.7 + rng.random() / 10, 'longitude': -74.0 + rng.random() / 10},
+        'location': {'address1': f"{index} Main St", 'display_address': [f"{index} Main St", "New York, NY"]},
+        'rating': round(3 + 2 * rng.random(), 1),
+        'review_count': rng.randint(1, 900),
+        'contextual_info': {'photos': [{'original_url': f"https://example.com/{index}.jpg"}]},
+    }
+
+
+def _plan(rng: random.Random, index: int) -> Dict[str, Any]:
+    return {
+        'title': f"Plan {index}",
+        'duration': "3h 30m",
+        'tips': "Go early\nBring water",
+        'stops': [
+            {'name': f"Place {rng.randint(0, 50)}", 'time': f"{10 + stop}:00", 'duration': f"{rng.randint(20, 90)} min",
+             'image': "https://example.com/page"}
+            for stop in range(4)
+        ],
+        'mood': "relaxed",
+    }
+
+
+def nested_payload(depth: int, seed: int = RANDOM_SEED) -> Dict[str, Any]:
+    """A response whose sections nest depth levels deep, two children per level, each with plans and businesses"""
+    rng = random.Random(seed)
+    counter = [0]
+
+    def section(level: int) -> Dict[str, Any]:
+        counter[0] += 1
+        node: Dict[str, Any] = {
+            'section': counter[0],
+            'items': [_plan(rng, counter[0]), _business(rng, counter[0]), {'note': "see below"}],
+        }
+        if level < depth:
+            node['children'] = [section(level + 1), [section(level + 1)]]
+        return node
+
+    plans = [_plan(rng, index) for index in range(3)]
+    return {
+        'chat_id': "bench-chat",
+        'response': {'text': "Here you go.\n\n```json\n" + json.dumps({'plans': plans}) + "\n```"},
+        'entities': [section(1)],
+    }
+
+
+def fenced_plans_payload(seed: int = RANDOM_SEED) -> Dict[str, Any]:
+    """Plans only in the text's fenced JSON block, businesses in the top-level list"""
+    rng = random.Random(seed)
+    plans = [_plan(rng, index) for index in range(5)]
+    return {
+        'chat_id': "bench-chat",
+        'text': "Three ideas for today.\n\n```json\n" + json.dumps({'plans': plans}) + "\n```\nEnjoy!",
+        'businesses': [_business(rng, index) for index in range(20)],
+    }
+
+
+def load_payloads() -> List[Tuple[str, Dict[str, Any]]]:
+    payloads = []
+    for path in sorted(glob.glob(os.path.join(PAYLOAD_DIR, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            payloads.append((os.path.splitext(os.path.basename(path))[0], json.load(f)))
+    if os.path.exists(SAMPLE_PAYLOAD):
+        with open(SAMPLE_PAYLOAD, encoding="utf-8") as f:
+            payloads.append(('ai_engine_sample', json.load(f)))
+    payloads.append(('fenced_plans', fenced_plans_payload()))
+    for name, depth in NESTED_DEPTHS.items():
+        payloads.append((name, nested_payload(depth)))
+    return payloads
+
+
+def output_digest(result: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(result, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+
+def run_payload(payload: Dict[str, Any], min_seconds: float) -> Dict[str, Any]:
+    """Median seconds per call over batches lasting about min_seconds in total, and the output digest"""
+    result = transform_yelp_ai_response(payload)
+    started = time.perf_counter()
+    calls = 0
+    while time.perf_counter() - started < min_seconds / 10:
+        transform_yelp_ai_response(payload)
+        calls += 1
+    batch = max(1, calls)
+    samples = []
+    for _ in range(10):
+        batch_started = time.perf_counter()
+        for _ in range(batch):
+            transform_yelp_ai_response(payload)
+        samples.append((time.perf_counter() - batch_started) / batch)
+    return {
+        'median_seconds': statistics.median(samples),
+        'digest': output_digest(result),
+        'businesses': len(result.get('businesses') or []),
+        'plans': len(result.get('plans') or []) + (1 if result.get('plan') else 0),
+    }
+
+
+def compare(name: str, current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    problems = []
+    if current['digest'] != baseline['digest']:
+        problems.append(f"{name}: output changed (digest {baseline['digest']} -> {current['digest']})")
+    slower = current['median_seconds'] - baseline['median_seconds']
+    if slower > TIME_NOISE_SECONDS and slower > baseline['median_seconds'] * TIME_TOLERANCE:
+        problems.append(f"{name}: {baseline['median_seconds'] * 1e6:.0f}us -> {current['median_seconds'] * 1e6:.0f}us")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transform_yelp_ai_response")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--min-seconds", type=float, default=0.5, help="Approximate time spent per payload")
+    args = parser.parse_args()
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    problems = []
+    print(f"{'payload':<20} {'median':>10} {'baseline':>10} {'change':>8}  {'businesses':>10} {'plans':>6}  digest")
+    for name, payload in load_payloads():
+        current = run_payload(payload, args.min_seconds)
+        results[name] = current
+        previous = baseline.get(name)
+        if previous:
+            change = (current['median_seconds'] - previous['median_seconds']) / previous['median_seconds'] * 100
+            baseline_text, change_text = f"{previous['median_seconds'] * 1e6:.0f}us", f"{change:+.0f}%"
+            problems.extend(compare(name, current, previous))
+        else:
+            baseline_text = change_text = "-"
+        print(f"{name:<20} {current['median_seconds'] * 1e6:>8.0f}us {baseline_text:>10} {change_text:>8}  "
+              f"{current['businesses']:>10} {current['plans']:>6}  {current['digest']}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return
+    if problems:
+        print("\nRegressions:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Synthetic cities for benchmarks.
+
+Builds search results in the shape ChaloSearchEngine returns, for any
+number of places: most places sit in a few walkable clusters (like a
+neighbourhood's commercial streets) and the rest are spread over the
+search radius. The same seed always gives the same city.
+"""
+
+from typing import Dict, List, Tuple
+import math
+import os
+import random
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from new_engine import CHALO_CATEGORIES
+from place_identity import assign_place_key
+
+
+# Google types the engine sees for each search category
+CATEGORY_TYPES = {
+    "restaurants near me": ['restaurant', 'food', 'point_of_interest', 'establishment'],
+    "cafes and bakeries near me": ['cafe', 'bakery', 'food', 'point_of_interest', 'establishment'],
+    "parks near me": ['park', 'point_of_interest', 'establishment'],
+    "delis near me": ['restaurant', 'meal_takeaway', 'food', 'point_of_interest', 'establishment'],
+    "thrift stores near me": ['clothing_store', 'store', 'point_of_interest', 'establishment'],
+    "tourist attractions near me": ['tourist_attraction', 'point_of_interest', 'establishment'],
+    "museums near me": ['museum', 'tourist_attraction', 'point_of_interest', 'establishment'],
+    "galleries near me": ['art_gallery', 'point_of_interest', 'establishment'],
+    "markets near me": ['store', 'food', 'point_of_interest', 'establishment'],
+}
+
+# Bleeker St, NY
+DEFAULT_CENTER = (40.7265, -73.9950)
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def _offset(center: Tuple[float, float], north_meters: float, east_meters: float) -> Tuple[float, float]:
+    lat, lng = center
+    return (lat + north_meters / METERS_PER_DEGREE_LAT,
+            lng + east_meters / (METERS_PER_DEGREE_LAT * math.cos(math.radians(lat))))
+
+
+def _haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin(math.radians(lat2 - lat1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2)
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+def generate_city(place_count: int, seed: int = 0, center: Tuple[float, float] = DEFAULT_CENTER,
+                  radius_miles: float = 1.5, clustered_fraction: float = 0.7) -> Dict:
+    """
+    Generate search results for a synthetic city.
+
+    Args:
+        place_count: Number of places across all categories
+        seed: Random seed; the same seed gives the same city
+        center: Search origin (lat, lng)
+        radius_miles: Places lie within this distance of the center
+        clustered_fraction: Share of places placed in walkable clusters
+
+    Returns:
+        {'search_metadata': {...}, 'results_by_category': {category: [place, ...]}}
+    """
+    rng = random.Random(seed)
+    radius_meters = radius_miles * 1609.34
+    cluster_count = max(3, place_count // 60)
+    clusters = []
+    for _ in range(cluster_count):
+        distance = radius_meters * 0.8 * math.sqrt(rng.random())
+        bearing = rng.uniform(0, 2 * math.pi)
+        clusters.append((distance * math.cos(bearing), distance * math.sin(bearing)))
+
+    results_by_category: Dict[str, List[Dict]] = {category: [] for category in CHALO_CATEGORIES}
+    for index in range(place_count):
+        category = CHALO_CATEGORIES[index % len(CHALO_CATEGORIES)]
+        if rng.random() < clustered_fraction:
+            north, east = rng.choice(clusters)
+            north += rng.gauss(0, 150)
+            east += rng.gauss(0, 150)
+        else:
+            distance = radius_meters * math.sqrt(rng.random())
+            bearing = rng.uniform(0, 2 * math.pi)
+            north, east = distance * math.cos(bearing), distance * math.sin(bearing)
+        lat, lng = _offset(center, north, east)
+        distance_meters = round(_haversine_meters(center[0], center[1], lat, lng))
+
+        place = {
+            'place_id': f"synthetic-{seed}-{index}",
+            'name': f"{category.split(' near ')[0].title()} #{index}",
+            'latitude': lat,
+            'longitude': lng,
+            'address': f"{index} Synthetic St",
+            'distance_meters': distance_meters,
+            'distance_miles': round(distance_meters / 1609.34, 2),
+            'rating': round(rng.uniform(3.8, 5.0), 1),
+            'user_ratings_total': rng.randint(5, 5000),
+            'price_level': rng.choice([None, 1, 1, 2, 2, 2, 3, 4]),
+            'types': list(CATEGORY_TYPES.get(category, ['point_of_interest', 'establishment'])),
+            'opening_hours': None,
+            'phone_number': None,
+            'website': None,
+            'photo_url': None,
+            'latest_review': None,
+            'editorial_summary': None,
+        }
+        assign_place_key(place)
+        results_by_category[category].append(place)
+
+    for places in results_by_category.values():
+        places.sort(key=lambda place: place['distance_meters'])
+
+    return {
+        'search_metadata': {
+            'origin_address': f"Synthetic city ({place_count} places, seed {seed})",
+            'search_radius_meters': int(radius_meters),
+            'search_radius_miles': radius_miles,
+            'categories_searched': len(CHALO_CATEGORIES),
+            'total_places_found': place_count,
+            'timestamp': 'synthetic',
+        },
+        'results_by_category': results_by_category,
+    }
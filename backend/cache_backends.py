@@ -0,0 +1,840 @@
+"""
+Shared cache backends for search results and itinerary session state.
+
+With ``uvicorn --workers N`` each worker has its own memory, so a refresh
+request that lands on a different worker than the original search cannot see
+the cached results. The backends here expose the same interface as the
+in-process ``SearchResultsCache`` but keep state where every worker can see it:
+
+- ``memory``: ``SearchResultsCache`` (single worker, default)
+- ``sqlite``: a SQLite database in WAL mode on local disk (all workers on a host)
+- ``redis``: any server speaking the Redis protocol (all workers on all hosts)
+
+The backend is selected with ``CHALO_CACHE_BACKEND``. ``LocalRespServer`` is a
+small in-process stand-in for a Redis server, for tests and local development.
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import fnmatch
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+
+from search_cache import SearchResultsCache
+from structured_logging import get_logger
+
+logger = get_logger("cache_backends")
+
+DEFAULT_SQLITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "chalo_cache.sqlite3")
+
+
+class CacheBackendError(Exception):
+    """Raised when a shared cache backend cannot be reached or misbehaves."""
+    pass
+
+
+class _DictInterfaceMixin:
+    """Dict-style operations on top of get/set, matching SearchResultsCache."""
+
+    def __getitem__(self, key: str) -> Any:
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def _hit_ratio(self) -> Optional[float]:
+        lookups = self.hits + self.misses
+        return round(self.hits / lookups, 4) if lookups else None
+
+
+# ==============================================================================
+# SQLite (WAL) backend
+# ==============================================================================
+
+class SQLiteCache(_DictInterfaceMixin):
+    """
+    Cache stored in a SQLite database shared by every worker on the host.
+
+    WAL mode lets readers proceed while one writer commits. Entries are
+    bounded by count and bytes per namespace and evicted least recently used
+    first, like the in-process cache.
+    """
+
+    def __init__(self, path: str, namespace: str = "search_results", max_entries: int = 64,
+                 max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 3600):
+        """
+        Open (and create if needed) the cache database.
+
+        Args:
+            path: Database file path
+            namespace: Logical cache name, so several caches can share one file
+            max_entries: Maximum number of keys in this namespace
+            max_bytes: Maximum total value bytes in this namespace
+            ttl_seconds: Default seconds after which an entry expires
+        """
+        self.path = path
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'lru': 0, 'bytes': 0, 'expired': 0, 'oversized': 0}
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_cache_entries_access ON cache_entries (namespace, last_access)"
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for a key and mark it recently used."""
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        if row[1] <= now:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self.evictions['expired'] += 1
+            self.misses += 1
+            return default
+        conn.execute(
+            "UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?",
+            (now, self.namespace, key),
+        )
+        self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """
+        Store a value, evicting least recently used entries to stay in budget.
+
+        Returns:
+            False if the value alone exceeds the byte budget and was not stored
+        """
+        encoded = json.dumps(value, ensure_ascii=False, default=str)
+        size_bytes = len(encoded.encode('utf-8'))
+        if size_bytes > self.max_bytes:
+            self.evictions['oversized'] += 1
+            return False
+
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, value, size_bytes, created_at, expires_at, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, encoded, size_bytes, now, now + ttl, now),
+            )
+            self._evict_to_fit(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return True
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl_seconds: Optional[float] = None) -> Any:
+        """
+        Replace a key's value with fn(current value or None) inside one write
+        transaction, so concurrent workers cannot lose each other's writes.
+        fn returning None deletes the key. A new value over the byte budget is
+        not stored and the key keeps its current value.
+
+        Returns:
+            The value now stored under the key
+        """
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (self.namespace, key, now),
+            ).fetchone()
+            current = json.loads(row[0]) if row else None
+            value = fn(current)
+            encoded = json.dumps(value, ensure_ascii=False, default=str) if value is not None else None
+            if encoded is None:
+                conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            elif len(encoded.encode('utf-8')) > self.max_bytes:
+                self.evictions['oversized'] += 1
+                logger.warning("Update of '%s' exceeds the %d byte budget of '%s' and was not stored",
+                               key, self.max_bytes, self.namespace)
+                value = current
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries "
+                    "(namespace, key, value, size_bytes, created_at, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (self.namespace, key, encoded, len(encoded.encode('utf-8')), now, now + ttl, now),
+                )
+                self._evict_to_fit(conn, now)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def _evict_to_fit(self, conn: sqlite3.Connection, now: float) -> None:
+        expired = conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?", (self.namespace, now)
+        ).rowcount
+        self.evictions['expired'] += max(expired, 0)
+
+        count, total_bytes = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM cache_entries WHERE namespace = ?",
+            (self.namespace,),
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = conn.execute(
+            "SELECT key, size_bytes FROM cache_entries WHERE namespace = ? ORDER BY last_access ASC",
+            (self.namespace,),
+        ).fetchall()
+        for key, size_bytes in rows[:-1]:  # Never evict the entry just written
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            reason = 'lru' if count > self.max_entries else 'bytes'
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self.evictions[reason] += 1
+            count -= 1
+            total_bytes -= size_bytes
+
+    def delete(self, key: str) -> bool:
+        """Remove a key, returning whether it was present."""
+        cursor = self._connection().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        )
+        return cursor.rowcount > 0
+
+    def clear(self) -> None:
+        """Remove every entry in this namespace."""
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry, returning the number removed."""
+        removed = self._connection().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at <= ?", (self.namespace, time.time())
+        ).rowcount
+        self.evictions['expired'] += max(removed, 0)
+        return removed
+
+    def __contains__(self, key: str) -> bool:
+        row = self._connection().execute(
+            "SELECT 1 FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (self.namespace, key, time.time()),
+        ).fetchone()
+        return row is not None
+
+    def __len__(self) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ? AND expires_at > ?",
+            (self.namespace, time.time()),
+        ).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Report size, budget and this worker's hit/eviction counters."""
+        now = time.time()
+        count, total_bytes, oldest = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), MIN(created_at) FROM cache_entries "
+            "WHERE namespace = ? AND expires_at > ?",
+            (self.namespace, now),
+        ).fetchone()
+        return {
+            'backend': 'sqlite',
+            'path': self.path,
+            'namespace': self.namespace,
+            'entries': count,
+            'bytes': total_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self._hit_ratio(),
+            'evictions': dict(self.evictions),
+            'oldest_entry_age_seconds': round(now - oldest, 1) if oldest else None,
+            'counters_scope': 'worker',
+        }
+
+    def keys_info(self) -> List[Dict[str, Any]]:
+        """Describe each live entry, most recently used last."""
+        now = time.time()
+        rows = self._connection().execute(
+            "SELECT key, size_bytes, created_at, expires_at FROM cache_entries "
+            "WHERE namespace = ? AND expires_at > ? ORDER BY last_access ASC",
+            (self.namespace, now),
+        ).fetchall()
+        return [
+            {
+                'key': key,
+                'size_bytes': size_bytes,
+                'age_seconds': round(now - created_at, 1),
+                'ttl_remaining_seconds': round(expires_at - now, 1),
+            }
+            for key, size_bytes, created_at, expires_at in rows
+        ]
+
+
+# ==============================================================================
+# Redis protocol backend
+# ==============================================================================
+
+def _encode_command(args: Tuple[Any, ...]) -> bytes:
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode('utf-8')
+        parts.append(f"${len(data)}\r\n".encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+def _read_reply(reader) -> Any:
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by cache server")
+    prefix, payload = line[:1], line[1:-2]
+    if prefix == b"+":
+        return payload.decode('utf-8')
+    if prefix == b"-":
+        raise CacheBackendError(payload.decode('utf-8'))
+    if prefix == b":":
+        return int(payload)
+    if prefix == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if prefix == b"*":
+        length = int(payload)
+        if length < 0:
+            return None
+        return [_read_reply(reader) for _ in range(length)]
+    raise CacheBackendError(f"Unexpected reply from cache server: {line!r}")
+
+
+class RespClient:
+    """
+    Minimal thread-safe client for servers speaking the Redis protocol (RESP2).
+
+    Only the handful of commands the cache needs are used, so this avoids
+    adding a client library dependency.
+    """
+
+    def __init__(self, url: str, timeout_seconds: float = 2.0):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            timeout_seconds: Socket connect and read timeout
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout_seconds = timeout_seconds
+        self._sock: Optional[socket.socket] = None
+        self._reader = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout_seconds)
+        self._sock = sock
+        self._reader = sock.makefile('rb')
+        if self.password:
+            self._send(('AUTH', self.password))
+        if self.db:
+            self._send(('SELECT', self.db))
+
+    def _send(self, args: Tuple[Any, ...]) -> Any:
+        self._sock.sendall(_encode_command(args))
+        return _read_reply(self._reader)
+
+    def _close(self) -> None:
+        try:
+            if self._sock:
+                self._sock.close()
+        finally:
+            self._sock = None
+            self._reader = None
+
+    def execute(self, *args: Any) -> Any:
+        """Run one command, reconnecting once if the connection was dropped."""
+        return self.pipeline(args)[0]
+
+    def pipeline(self, *commands: Tuple[Any, ...]) -> List[Any]:
+        """
+        Send several commands in one round trip, reconnecting once if the
+        connection was dropped.
+
+        Returns:
+            The replies in command order. If any command failed, every reply
+            is still read (keeping the connection in sync) and the first
+            error is raised.
+        """
+        if not commands:
+            return []
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    self._sock.sendall(b"".join(_encode_command(args) for args in commands))
+                    replies, error = [], None
+                    for _ in commands:
+                        try:
+                            replies.append(_read_reply(self._reader))
+                        except CacheBackendError as exc:
+                            error = error or exc
+                            replies.append(None)
+                    if error:
+                        raise error
+                    return replies
+                except OSError as exc:
+                    self._close()
+                    if attempt == 1:
+                        raise CacheBackendError(f"Cache server {self.host}:{self.port} unavailable: {exc}") from exc
+
+
+class RedisCache(_DictInterfaceMixin):
+    """
+    Cache stored in a Redis-protocol server shared by every worker and host.
+
+    Expiry uses the server's key TTLs. A sorted set per namespace
+    (``chalo-index:<namespace>``) scores each key by its last use, so ``set``
+    evicts the least recently used keys beyond ``max_entries`` and ``stats``
+    sizes the namespace in one pipelined round trip rather than ``KEYS`` plus
+    a call per key. The byte limit is left to the server's own memory policy
+    (e.g. ``maxmemory`` with ``allkeys-lru``); values larger than
+    ``max_bytes`` are still refused here.
+    """
+
+    UPDATE_LOCK_SECONDS = 5.0
+
+    def __init__(self, url: str, namespace: str = "search_results", max_entries: int = 64,
+                 max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 3600, client: Optional[RespClient] = None):
+        self.url = url
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.client = client or RespClient(url)
+        self.prefix = f"chalo:{namespace}:"
+        self.index_key = f"chalo-index:{namespace}"
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'lru': 0, 'oversized': 0}
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _scan_keys(self) -> List[bytes]:
+        keys, cursor = [], 0
+        while True:
+            cursor, batch = self.client.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            keys.extend(batch or [])
+            if int(cursor) == 0:
+                return keys
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value for a key and mark it recently used."""
+        data, _ = self.client.pipeline(
+            ('GET', self._key(key)),
+            ('ZADD', self.index_key, 'XX', time.time(), self._key(key)),
+        )
+        if data is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return json.loads(data)
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """
+        Store a value with a TTL, evicting least recently used keys beyond
+        max_entries; returns False if it exceeds the byte budget.
+        """
+        encoded = json.dumps(value, ensure_ascii=False, default=str).encode('utf-8')
+        if len(encoded) > self.max_bytes:
+            self.evictions['oversized'] += 1
+            return False
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        _, _, count = self.client.pipeline(
+            ('SET', self._key(key), encoded, 'PX', max(1, int(ttl * 1000))),
+            ('ZADD', self.index_key, time.time(), self._key(key)),
+            ('ZCARD', self.index_key),
+        )
+        if count > self.max_entries:
+            self._evict(count - self.max_entries)
+        return True
+
+    def _evict(self, excess: int) -> None:
+        # The key just written has the newest score, so it is never among these
+        oldest = self.client.execute('ZRANGE', self.index_key, 0, excess - 1)
+        if oldest:
+            removed, _ = self.client.pipeline(('DEL', *oldest), ('ZREM', self.index_key, *oldest))
+            # Index entries for keys that already expired are dropped without counting
+            self.evictions['lru'] += removed
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl_seconds: Optional[float] = None) -> Any:
+        """
+        Replace a key's value with fn(current value or None) while holding a
+        per-key lock, so concurrent workers cannot lose each other's writes.
+        fn returning None deletes the key. A new value over the byte budget is
+        not stored and the key keeps its current value.
+
+        Returns:
+            The value now stored under the key
+        """
+        lock_key = f"chalo-lock:{self.namespace}:{key}"
+        token = os.urandom(8).hex()
+        deadline = time.monotonic() + self.UPDATE_LOCK_SECONDS
+        while self.client.execute('SET', lock_key, token, 'NX', 'PX', int(self.UPDATE_LOCK_SECONDS * 1000)) is None:
+            if time.monotonic() >= deadline:
+                raise CacheBackendError(f"Timed out waiting for the update lock on '{key}'")
+            time.sleep(0.01)
+        try:
+            current = self.get(key)
+            value = fn(current)
+            if value is None:
+                self.delete(key)
+            elif not self.set(key, value, ttl_seconds):
+                logger.warning("Update of '%s' exceeds the %d byte budget of '%s' and was not stored",
+                               key, self.max_bytes, self.namespace)
+                return current
+            return value
+        finally:
+            if self.client.execute('GET', lock_key) == token.encode():
+                self.client.execute('DEL', lock_key)
+
+    def delete(self, key: str) -> bool:
+        """Remove a key, returning whether it was present."""
+        removed, _ = self.client.pipeline(('DEL', self._key(key)), ('ZREM', self.index_key, self._key(key)))
+        return bool(removed)
+
+    def clear(self) -> None:
+        """Remove every key in this namespace."""
+        keys = self._scan_keys()
+        for i in range(0, len(keys), 500):
+            self.client.execute('DEL', *keys[i:i + 500])
+        self.client.execute('DEL', self.index_key)
+
+    def purge_expired(self) -> int:
+        """Expiry is handled by the server."""
+        return 0
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self.client.execute('EXISTS', self._key(key)))
+
+    def __len__(self) -> int:
+        return len(self.keys_info())
+
+    def keys_info(self) -> List[Dict[str, Any]]:
+        """Describe each live entry in this namespace, most recently used last."""
+        members = self.client.execute('ZRANGE', self.index_key, 0, -1) or []
+        replies = self.client.pipeline(*[
+            command for member in members for command in (('PTTL', member), ('STRLEN', member))
+        ])
+        info, expired = [], []
+        for member, ttl_ms, size_bytes in zip(members, replies[0::2], replies[1::2]):
+            if ttl_ms == -2:
+                expired.append(member)
+                continue
+            info.append({
+                'key': member.decode('utf-8')[len(self.prefix):],
+                'size_bytes': size_bytes,
+                'ttl_remaining_seconds': round(ttl_ms / 1000, 1) if ttl_ms >= 0 else None,
+            })
+        if expired:
+            self.client.execute('ZREM', self.index_key, *expired)
+        return info
+
+    def stats(self) -> Dict[str, Any]:
+        """Report size, budget and this worker's hit counters."""
+        entries = self.keys_info()
+        return {
+            'backend': 'redis',
+            'server': f"{self.client.host}:{self.client.port}/{self.client.db}",
+            'namespace': self.namespace,
+            'entries': len(entries),
+            'bytes': sum(e['size_bytes'] for e in entries),
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'ttl_seconds': self.ttl_seconds,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self._hit_ratio(),
+            'evictions': dict(self.evictions),
+            'counters_scope': 'worker',
+        }
+
+
+# ==============================================================================
+# Local stand-in for a Redis server
+# ==============================================================================
+
+class _RespStore:
+    """Key/value store with millisecond expiry backing LocalRespServer."""
+
+    def __init__(self):
+        self.data: Dict[bytes, Tuple[bytes, Optional[float]]] = {}
+        self.zsets: Dict[bytes, Dict[bytes, float]] = {}
+        self.lock = threading.Lock()
+
+    def _live(self, key: bytes) -> Optional[Tuple[bytes, Optional[float]]]:
+        item = self.data.get(key)
+        if item and item[1] is not None and item[1] <= time.time():
+            del self.data[key]
+            return None
+        return item
+
+    def execute(self, args: List[bytes]) -> Any:
+        command = args[0].decode().upper()
+        with self.lock:
+            if command == 'PING':
+                return 'PONG'
+            if command in ('AUTH', 'SELECT'):
+                return 'OK'
+            if command == 'GET':
+                item = self._live(args[1])
+                return item[0] if item else None
+            if command == 'SET':
+                expires_at = None
+                options = [a.decode().upper() for a in args[3:]]
+                if 'NX' in options and self._live(args[1]) is not None:
+                    return None
+                for i, option in enumerate(options):
+                    if option == 'EX':
+                        expires_at = time.time() + int(options[i + 1])
+                    elif option == 'PX':
+                        expires_at = time.time() + int(options[i + 1]) / 1000
+                self.data[args[1]] = (args[2], expires_at)
+                return 'OK'
+            if command == 'DEL':
+                removed = 0
+                for key in args[1:]:
+                    if self._live(key) is not None:
+                        del self.data[key]
+                        removed += 1
+                    elif self.zsets.pop(key, None) is not None:
+                        removed += 1
+                return removed
+            if command == 'EXISTS':
+                return sum(1 for key in args[1:] if self._live(key) is not None or key in self.zsets)
+            if command == 'SCAN':
+                pattern = args[args.index(b'MATCH') + 1].decode() if b'MATCH' in args else '*'
+                return ['0', [k for k in list(self.data) if self._live(k) and fnmatch.fnmatchcase(k.decode(), pattern)]]
+            if command == 'ZADD':
+                zset = self.zsets.setdefault(args[1], {})
+                only_existing = args[2].upper() == b'XX'
+                pairs = args[3:] if only_existing else args[2:]
+                added = 0
+                for score, member in zip(pairs[0::2], pairs[1::2]):
+                    if only_existing and member not in zset:
+                        continue
+                    added += member not in zset
+                    zset[member] = float(score)
+                if not zset:
+                    del self.zsets[args[1]]
+                return added
+            if command == 'ZREM':
+                zset = self.zsets.get(args[1], {})
+                removed = sum(1 for member in args[2:] if zset.pop(member, None) is not None)
+                if args[1] in self.zsets and not zset:
+                    del self.zsets[args[1]]
+                return removed
+            if command == 'ZCARD':
+                return len(self.zsets.get(args[1], {}))
+            if command == 'ZRANGE':
+                members = sorted(self.zsets.get(args[1], {}).items(), key=lambda item: (item[1], item[0]))
+                start, stop = int(args[2]), int(args[3])
+                start = start + len(members) if start < 0 else start
+                stop = stop + len(members) if stop < 0 else stop
+                return [member for member, _ in members[max(start, 0):stop + 1]]
+            if command == 'KEYS':
+                pattern = args[1].decode()
+                return [k for k in list(self.data) if self._live(k) and fnmatch.fnmatchcase(k.decode(), pattern)]
+            if command == 'PTTL':
+                item = self._live(args[1])
+                if item is None:
+                    return -2
+                return -1 if item[1] is None else int((item[1] - time.time()) * 1000)
+            if command == 'STRLEN':
+                item = self._live(args[1])
+                return len(item[0]) if item else 0
+            if command == 'DBSIZE':
+                return sum(1 for k in list(self.data) if self._live(k))
+            if command == 'FLUSHDB':
+                self.data.clear()
+                self.zsets.clear()
+                return 'OK'
+        raise CacheBackendError(f"ERR unknown command '{command}'")
+
+
+def _encode_reply(value: Any) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return f"${len(value)}\r\n".encode() + value + b"\r\n"
+    if isinstance(value, list):
+        return f"*{len(value)}\r\n".encode() + b"".join(_encode_reply(v) for v in value)
+    raise TypeError(f"Cannot encode {type(value)!r}")
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                args = _read_reply(self.rfile)
+            except (ConnectionError, CacheBackendError):
+                return
+            try:
+                reply = _encode_reply(self.server.store.execute(args))
+            except (CacheBackendError, IndexError, ValueError) as exc:
+                reply = f"-{exc}\r\n".encode()
+            self.wfile.write(reply)
+
+
+class LocalRespServer(socketserver.ThreadingTCPServer):
+    """
+    In-process stand-in for a Redis server, speaking enough RESP for RedisCache.
+
+    Usage:
+        server = LocalRespServer()
+        server.start()
+        cache = RedisCache(server.url)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        super().__init__((host, port), _RespHandler)
+        self.store = _RespStore()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self) -> 'LocalRespServer':
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stop serving and close the socket."""
+        self.shutdown()
+        self.server_close()
+
+
+# ==============================================================================
+# Factory
+# ==============================================================================
+
+def create_cache(namespace: str, max_entries: int = 64, max_bytes: int = 32 * 1024 * 1024,
+                 ttl_seconds: float = 3600):
+    """
+    Create a cache for a namespace using the backend chosen by environment.
+
+    Environment:
+        CHALO_CACHE_BACKEND: memory (default), sqlite or redis
+        CHALO_CACHE_PATH: SQLite file (default cache/chalo_cache.sqlite3 next to this module)
+        CHALO_CACHE_URL: Redis URL (default redis://localhost:6379/0)
+
+    Args:
+        namespace: Logical cache name (e.g. "search_results", "sessions")
+        max_entries: Maximum number of keys
+        max_bytes: Maximum total value bytes
+        ttl_seconds: Default entry TTL
+
+    Returns:
+        A SearchResultsCache, SQLiteCache or RedisCache
+    """
+    backend = os.getenv("CHALO_CACHE_BACKEND", "memory").strip().lower()
+    if backend == "sqlite":
+        path = os.getenv("CHALO_CACHE_PATH", DEFAULT_SQLITE_PATH)
+        return SQLiteCache(path, namespace, max_entries, max_bytes, ttl_seconds)
+    if backend == "redis":
+        url = os.getenv("CHALO_CACHE_URL", "redis://localhost:6379/0")
+        return RedisCache(url, namespace, max_entries, max_bytes, ttl_seconds)
+    if backend != "memory":
+        logger.warning("Unknown CHALO_CACHE_BACKEND '%s', using in-process memory cache", backend)
+    return SearchResultsCache(max_entries, max_bytes, ttl_seconds)
+
+
+def main():
+    """Run LocalRespServer in the foreground for local multi-worker development"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local Redis-protocol stand-in for the Chalo shared cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6379)
+    args = parser.parse_args()
+
+    server = LocalRespServer(args.host, args.port)
+    print(f"Serving RESP cache stand-in at {server.url} (set CHALO_CACHE_BACKEND=redis CHALO_CACHE_URL={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
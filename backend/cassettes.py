@@ -0,0 +1,186 @@
+"""
+Record/replay store for upstream HTTP calls.
+
+In ``record`` mode every upstream request made through upstream.py is sent
+live and its response written to a cassette file named by a hash of the
+request. In ``replay`` mode responses come from the cassettes and nothing is
+sent, so any endpoint (itineraries, custom trips, refreshes, the agent) can
+be run deterministically and for free. ``replay_or_record`` replays what it
+has and records the rest.
+
+The request hash covers the method, the URL without its host, the sorted
+query parameters and the JSON body. API keys and auth headers are left out,
+so cassettes recorded with one key replay with any other (or none), and the
+files do not contain credentials.
+
+    UPSTREAM_CASSETTE_MODE=off|record|replay|replay_or_record
+    UPSTREAM_CASSETTE_DIR=cache/cassettes   # gitignored, like the other local stores
+    UPSTREAM_REPLAY_LATENCY=1    # sleep for the recorded latency on replay
+"""
+
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+import requests
+
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+REPLAY_OR_RECORD = "replay_or_record"
+MODES = (OFF, RECORD, REPLAY, REPLAY_OR_RECORD)
+
+# Query parameters that carry credentials and are not part of a request's identity
+SECRET_PARAMS = {'key', 'api_key', 'apikey', 'access_token'}
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "cassettes")
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """A replayed request has no recording; callers see it as a network error."""
+
+
+def request_fingerprint(method: str, url: str, params: Optional[Dict[str, Any]] = None,
+                        json_body: Any = None, data: Any = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    Hash the parts of a request that determine its response.
+
+    Returns:
+        (sha256 hex digest, the canonical request that was hashed)
+    """
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)]
+    for name, value in (params or {}).items():
+        values = value if isinstance(value, (list, tuple)) else [value]
+        query.extend((name, str(item)) for item in values)
+    query = sorted((name, value) for name, value in query if name.lower() not in SECRET_PARAMS)
+
+    canonical = {'method': method.upper(), 'path': parts.path, 'query': query}
+    if json_body is not None:
+        canonical['json'] = json_body
+    elif data is not None:
+        canonical['data'] = data.decode('utf-8', 'replace') if isinstance(data, bytes) else str(data)
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest(), canonical
+
+
+class CassetteStore:
+    """Content-addressed response files under one directory."""
+
+    def __init__(self, directory: str = DEFAULT_DIR, mode: str = OFF, replay_latency: bool = False):
+        self.directory = directory
+        self.mode = OFF
+        self.replay_latency = replay_latency
+        self._lock = threading.Lock()
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.set_mode(mode)
+
+    def set_mode(self, mode: str, directory: Optional[str] = None) -> None:
+        """
+        Switch mode (and optionally directory).
+
+        Raises:
+            ValueError: For an unknown mode
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown cassette mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.mode = mode
+        if directory:
+            self.directory = directory
+
+    @property
+    def active(self) -> bool:
+        return self.mode != OFF
+
+    def _path(self, fingerprint: str) -> str:
+        return os.path.join(self.directory, fingerprint[:2], f"{fingerprint}.json")
+
+    def load(self, fingerprint: str, url: str) -> Optional[requests.Response]:
+        """The recorded response for a request, or None."""
+        try:
+            with open(self._path(fingerprint), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        recorded = entry['response']
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded.get('reason')
+        response.headers.update(recorded.get('headers', {}))
+        response.encoding = recorded.get('encoding')
+        response.url = url
+        if 'body_base64' in recorded:
+            response._content = base64.b64decode(recorded['body_base64'])
+        else:
+            response._content = recorded.get('body', '').encode('utf-8')
+        if self.replay_latency:
+            time.sleep(recorded.get('elapsed_ms', 0) / 1000)
+        with self._lock:
+            self.replayed += 1
+        return response
+
+    def save(self, fingerprint: str, canonical: Dict[str, Any], api: str, response: requests.Response,
+             elapsed_seconds: float) -> None:
+        """Write a response atomically; an existing recording is replaced."""
+        content = response.content
+        recorded: Dict[str, Any] = {
+            'status': response.status_code,
+            'reason': response.reason,
+            'headers': {name: value for name, value in response.headers.items() if name.lower() == 'content-type'},
+            'encoding': response.encoding,
+            'elapsed_ms': round(elapsed_seconds * 1000, 1),
+        }
+        try:
+            recorded['body'] = content.decode('utf-8')
+        except UnicodeDecodeError:
+            recorded['body_base64'] = base64.b64encode(content).decode('ascii')
+        entry = {
+            'api': api,
+            'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'request': canonical,
+            'response': recorded,
+        }
+        path = self._path(fingerprint)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, path)
+        with self._lock:
+            self.recorded += 1
+
+    def count_miss(self) -> None:
+        with self._lock:
+            self.misses += 1
+
+    def stats(self) -> Dict[str, Any]:
+        files = 0
+        if os.path.isdir(self.directory):
+            for _, _, names in os.walk(self.directory):
+                files += sum(1 for name in names if name.endswith(".json"))
+        with self._lock:
+            return {
+                'mode': self.mode,
+                'directory': self.directory,
+                'replay_latency': self.replay_latency,
+                'cassettes': files,
+                'recorded': self.recorded,
+                'replayed': self.replayed,
+                'misses': self.misses,
+            }
+
+
+store = CassetteStore(
+    os.getenv("UPSTREAM_CASSETTE_DIR", DEFAULT_DIR),
+    os.getenv("UPSTREAM_CASSETTE_MODE", OFF).lower(),
+    os.getenv("UPSTREAM_REPLAY_LATENCY", "").lower() in ("1", "true", "yes"),
+)
@@ -6,7 +6,7 @@ from being recommended again for 5 refresh operations, ensuring variety and
 preventing repetitive suggestions.
 """
 
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 import hashlib
 
 
@@ -19,12 +19,56 @@ class CategoryExclusionManager:
     again after 5 refresh operations.
     """
     
-    def __init__(self):
-        """Initialize the exclusion manager with empty storage."""
+    def __init__(self, store: Optional[Any] = None):
+        """
+        Initialize the exclusion manager with empty storage.
+        
+        Args:
+            store: Optional shared cache (see cache_backends.create_cache) holding
+                per-location state, so every worker sees the same exclusions
+        """
         # Structure: {location_key: {category: turns_remaining}}
         self.exclusions: Dict[str, Dict[str, int]] = {}
         # Track total turns per location for cleanup
         self.location_turns: Dict[str, int] = {}
+        self.store = store
+    
+    def _load(self, location_key: str) -> None:
+        """Refresh local state for a location from the shared store, if any."""
+        if self.store is None:
+            return
+        state = self.store.get(f"exclusions:{location_key}")
+        if state:
+            self.exclusions[location_key] = dict(state.get("exclusions", {}))
+            self.location_turns[location_key] = state.get("turns", 0)
+        else:
+            self.exclusions.pop(location_key, None)
+            self.location_turns.pop(location_key, None)
+    
+    def _modify(self, location_key: str,
+                fn: Callable[[Optional[Dict[str, Any]]], Optional[Dict[str, Any]]]) -> None:
+        """
+        Replace a location's state ({"exclusions", "turns"}, or None when
+        untracked) with fn(state).
+
+        With a shared store the read and write happen in one atomic update,
+        so two workers refreshing the same location cannot drop each other's
+        exclusions. Local state mirrors the result either way.
+        """
+        if self.store is not None:
+            state = self.store.update(f"exclusions:{location_key}", fn)
+        else:
+            current = None
+            if location_key in self.exclusions:
+                current = {"exclusions": dict(self.exclusions[location_key]),
+                           "turns": self.location_turns.get(location_key, 0)}
+            state = fn(current)
+        if state:
+            self.exclusions[location_key] = dict(state["exclusions"])
+            self.location_turns[location_key] = state["turns"]
+        else:
+            self.exclusions.pop(location_key, None)
+            self.location_turns.pop(location_key, None)
     
     def _get_location_key(self, location: str) -> str:
         """
@@ -51,13 +95,12 @@ class CategoryExclusionManager:
         """
         location_key = self._get_location_key(location)
         
-        # Initialize location if not exists
-        if location_key not in self.exclusions:
-            self.exclusions[location_key] = {}
-            self.location_turns[location_key] = 0
+        def exclude(state: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            # Initialize location if not exists, then exclude category for 5 turns
+            state = state or {"exclusions": {}, "turns": 0}
+            return {"exclusions": {**state["exclusions"], category: 5}, "turns": state["turns"]}
         
-        # Exclude category for 5 turns
-        self.exclusions[location_key][category] = 5
+        self._modify(location_key, exclude)
         
         print(f"Excluded category '{category}' for location '{location}' (key: {location_key}) for 5 turns")
     
@@ -73,6 +116,7 @@ class CategoryExclusionManager:
             True if the category is excluded, False otherwise
         """
         location_key = self._get_location_key(location)
+        self._load(location_key)
         
         if location_key not in self.exclusions:
             return False
@@ -90,31 +134,29 @@ class CategoryExclusionManager:
             location: The location to increment turns for
         """
         location_key = self._get_location_key(location)
+        released: List[str] = []
         
-        # Increment total turns for this location (initialize if needed)
-        self.location_turns[location_key] = self.location_turns.get(location_key, 0) + 1
-        
-        # If no exclusions exist for this location, we're done
-        if location_key not in self.exclusions:
-            return
+        def advance(state: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+            # If no exclusions exist for this location, we're done
+            if not state:
+                return None
+            released.clear()
+            # Decrement turns remaining for all excluded categories, dropping
+            # categories that are no longer excluded
+            exclusions = {}
+            for category, turns_remaining in state["exclusions"].items():
+                if turns_remaining - 1 > 0:
+                    exclusions[category] = turns_remaining - 1
+                else:
+                    released.append(category)
+            # Clean up empty location entries
+            if not exclusions:
+                return None
+            return {"exclusions": exclusions, "turns": state["turns"] + 1}
         
-        # Decrement turns remaining for all excluded categories
-        categories_to_remove = []
-        for category, turns_remaining in self.exclusions[location_key].items():
-            if turns_remaining > 0:
-                self.exclusions[location_key][category] = turns_remaining - 1
-                if self.exclusions[location_key][category] <= 0:
-                    categories_to_remove.append(category)
-        
-        # Remove categories that are no longer excluded
-        for category in categories_to_remove:
-            del self.exclusions[location_key][category]
+        self._modify(location_key, advance)
+        for category in released:
             print(f"Category '{category}' is now available again for location '{location}'")
-        
-        # Clean up empty location entries
-        if not self.exclusions[location_key]:
-            del self.exclusions[location_key]
-            del self.location_turns[location_key]
     
     def get_available_categories(self, location: str, all_categories: List[str]) -> List[str]:
         """
@@ -145,6 +187,7 @@ class CategoryExclusionManager:
             List of excluded categories with their remaining turns
         """
         location_key = self._get_location_key(location)
+        self._load(location_key)
         
         if location_key not in self.exclusions:
             return []
@@ -162,6 +205,7 @@ class CategoryExclusionManager:
             Dictionary mapping excluded categories to their remaining turns
         """
         location_key = self._get_location_key(location)
+        self._load(location_key)
         
         if location_key not in self.exclusions:
             return {}
@@ -176,13 +220,7 @@ class CategoryExclusionManager:
             location: The location to reset exclusions for
         """
         location_key = self._get_location_key(location)
-        
-        if location_key in self.exclusions:
-            del self.exclusions[location_key]
-        
-        if location_key in self.location_turns:
-            del self.location_turns[location_key]
-        
+        self._modify(location_key, lambda state: None)
         print(f"Reset all exclusions for location '{location}'")
     
     def get_turn_count(self, location: str) -> int:
@@ -196,6 +234,7 @@ class CategoryExclusionManager:
             Total number of refresh operations performed for this location
         """
         location_key = self._get_location_key(location)
+        self._load(location_key)
         return self.location_turns.get(location_key, 0)
     
     def get_status_summary(self) -> Dict:
@@ -0,0 +1,451 @@
+"""
+Local stand-in for the upstream APIs, for load testing without spending quota.
+
+Serves Geocoding, Nearby Search, Place Details and Distance Matrix in the
+Google Maps JSON shapes, Yelp AI Chat v2, Gemini generateContent and Hugging
+Face inference, all seeded from the saved searches in ``search_results/``.
+Latency and errors can be injected per API.
+
+Usage:
+    python fake_upstream.py --port 8900 --latency-ms 80 --jitter-ms 40 --error-rate 0.01 \
+        --latency nearby_search=300 --error-rate-for yelp_ai_chat=0.05
+
+    # then run the backend against it
+    UPSTREAM_BASE_URL=http://127.0.0.1:8900 GOOGLE_PLACES_API_KEY=fake YELP_API_KEY=fake \
+        uvicorn main:app --port 8000
+
+API names for the per-API options are the ones in upstream.py plus
+``hf_inference``.
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import glob
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+import wave
+
+import upstream
+
+
+HF_INFERENCE = "hf_inference"
+WALKING_METERS_PER_SECOND = 1.4
+# Walking routes are longer than the straight line between two points
+ROUTE_DETOUR_FACTOR = 1.25
+NEARBY_PAGE_SIZE = 20
+DEFAULT_SEED_GLOB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "search_results", "*.json")
+
+
+def haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in meters."""
+    radius = 6371000.0
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lng2 - lng1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * radius * math.asin(math.sqrt(a))
+
+
+def _parse_lat_lng(value: str) -> Optional[Tuple[float, float]]:
+    try:
+        lat, lng = value.split(",", 1)
+        return float(lat), float(lng)
+    except ValueError:
+        return None
+
+
+class SeedData:
+    """Places from saved search results, reshaped into Google Places results."""
+
+    def __init__(self, paths: List[str]):
+        # Structure: {place_id: Google Place Details result}
+        self.places: Dict[str, Dict[str, Any]] = {}
+        # Structure: [(origin address, (lat, lng))]
+        self.origins: List[Tuple[str, Tuple[float, float]]] = []
+        for path in paths:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            coordinates = []
+            for places in data.get('results_by_category', {}).values():
+                for place in places:
+                    result = self._to_google_result(place)
+                    if result:
+                        self.places.setdefault(result['place_id'], result)
+                        location = result['geometry']['location']
+                        coordinates.append((location['lat'], location['lng']))
+            if coordinates:
+                centroid = (
+                    sum(lat for lat, _ in coordinates) / len(coordinates),
+                    sum(lng for _, lng in coordinates) / len(coordinates),
+                )
+                origin = data.get('search_metadata', {}).get('origin_address') or os.path.basename(path)
+                self.origins.append((origin, centroid))
+        if not self.places:
+            raise ValueError(f"No places found in {paths}")
+
+    @staticmethod
+    def _to_google_result(place: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        lat, lng = place.get('latitude'), place.get('longitude')
+        if lat is None or lng is None:
+            return None
+        place_id = place.get('place_id')
+        if not place_id:
+            digest = hashlib.sha1(f"{place.get('name')}|{lat:.6f}|{lng:.6f}".encode()).hexdigest()
+            place_id = f"fake_{digest[:24]}"
+        result = {
+            'place_id': place_id,
+            'name': place.get('name'),
+            'geometry': {'location': {'lat': lat, 'lng': lng}},
+            'formatted_address': place.get('address'),
+            'vicinity': place.get('address'),
+            'rating': place.get('rating'),
+            'user_ratings_total': place.get('user_ratings_total'),
+            'price_level': place.get('price_level'),
+            'types': place.get('types') or ['point_of_interest', 'establishment'],
+            'formatted_phone_number': place.get('phone_number'),
+            'website': place.get('website'),
+        }
+        if place.get('opening_hours'):
+            result['opening_hours'] = {
+                'weekday_text': [f"{day}: {hours}" for day, hours in place['opening_hours'].items()]
+            }
+        if place.get('latest_review'):
+            result['reviews'] = [{'text': place['latest_review'], 'rating': place.get('rating')}]
+        match = re.search(r"photoreference=([^&]+)", place.get('photo_url') or "")
+        if match:
+            result['photos'] = [{'photo_reference': match.group(1)}]
+        if place.get('editorial_summary'):
+            result['editorial_summary'] = {'overview': place['editorial_summary']}
+        return {key: value for key, value in result.items() if value is not None}
+
+    def geocode(self, address: str) -> Tuple[str, Tuple[float, float]]:
+        """
+        Resolve an address to a seeded origin.
+
+        Addresses matching a seed's origin get its centroid; any other
+        address gets the first seed's centroid shifted by up to ~200 m, so
+        distinct locations produce distinct (but overlapping) searches.
+        """
+        normalized = address.lower()
+        for origin, centroid in self.origins:
+            if origin.lower().split(",")[0] in normalized:
+                return origin, centroid
+        origin, (lat, lng) = self.origins[0]
+        digest = hashlib.sha1(normalized.encode()).digest()
+        offset_lat = (digest[0] / 255 - 0.5) * 0.0036
+        offset_lng = (digest[1] / 255 - 0.5) * 0.0048
+        return address, (lat + offset_lat, lng + offset_lng)
+
+    def nearby(self, lat: float, lng: float, place_type: Optional[str], keyword: Optional[str],
+               max_price: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Places of a type ordered by distance, like rankby=distance."""
+        candidates = list(self.places.values())
+        if max_price is not None:
+            # Like Google, maxprice also drops places without a price_level
+            candidates = [place for place in candidates if place.get('price_level') is not None
+                          and place['price_level'] <= max_price]
+        if place_type:
+            typed = [place for place in candidates if place_type in place['types']]
+            candidates = typed or candidates
+        if keyword:
+            keyword = keyword.lower()
+            matching = [place for place in candidates if keyword in place['name'].lower()]
+            candidates = matching or candidates
+        candidates.sort(key=lambda place: haversine_meters(
+            lat, lng, place['geometry']['location']['lat'], place['geometry']['location']['lng']))
+        fields = ('place_id', 'name', 'geometry', 'vicinity', 'rating', 'user_ratings_total', 'price_level', 'types', 'photos')
+        return [{field: place[field] for field in fields if field in place} for place in candidates[:NEARBY_PAGE_SIZE]]
+
+    def near(self, lat: Optional[float], lng: Optional[float], limit: int) -> List[Dict[str, Any]]:
+        """The closest places to a point, or random places without one."""
+        places = list(self.places.values())
+        if lat is None or lng is None:
+            return random.sample(places, min(limit, len(places)))
+        places.sort(key=lambda place: haversine_meters(
+            lat, lng, place['geometry']['location']['lat'], place['geometry']['location']['lng']))
+        return places[:limit]
+
+
+class Faults:
+    """Latency and error injection settings, globally and per API."""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 latency_by_api: Optional[Dict[str, float]] = None,
+                 error_rate_by_api: Optional[Dict[str, float]] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.latency_by_api = latency_by_api or {}
+        self.error_rate_by_api = error_rate_by_api or {}
+
+    def delay_seconds(self, api: str) -> float:
+        latency = self.latency_by_api.get(api, self.latency_ms)
+        return max(0.0, latency + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def should_fail(self, api: str) -> bool:
+        return random.random() < self.error_rate_by_api.get(api, self.error_rate)
+
+
+class FakeUpstream:
+    """Request routing and response building for the fake server."""
+
+    def __init__(self, seed: SeedData, faults: Faults):
+        self.seed = seed
+        self.faults = faults
+        self._lock = threading.Lock()
+        # Structure: {api: [calls, injected errors]}
+        self.counts: Dict[str, List[int]] = {}
+
+    def route(self, method: str, path: str) -> Optional[str]:
+        """The API a request path belongs to."""
+        if method == "GET" and path.endswith("/geocode/json"):
+            return upstream.GEOCODING
+        if method == "GET" and path.endswith("/place/nearbysearch/json"):
+            return upstream.NEARBY_SEARCH
+        if method == "GET" and path.endswith("/place/details/json"):
+            return upstream.PLACE_DETAILS
+        if method == "GET" and path.endswith("/distancematrix/json"):
+            return upstream.DISTANCE_MATRIX
+        if method == "POST" and path.endswith("/ai/chat/v2"):
+            return upstream.YELP_AI_CHAT
+        if method == "POST" and ":generateContent" in path:
+            return upstream.GEMINI
+        if method == "POST" and "/models/" in path:
+            return HF_INFERENCE
+        return None
+
+    def handle(self, api: str, query: Dict[str, str], body: Any, path: str) -> Tuple[int, str, bytes]:
+        """
+        Build a response, after the injected delay.
+
+        Returns:
+            (status code, content type, body)
+        """
+        time.sleep(self.faults.delay_seconds(api))
+        failed = self.faults.should_fail(api)
+        with self._lock:
+            counts = self.counts.setdefault(api, [0, 0])
+            counts[0] += 1
+            counts[1] += int(failed)
+        if failed:
+            return 503, "application/json", json.dumps({'error': 'injected failure', 'api': api}).encode()
+        if api == HF_INFERENCE:
+            return 200, "audio/wav", self.silent_wav()
+        handler = getattr(self, api)
+        return 200, "application/json", json.dumps(handler(query, body)).encode()
+
+    def geocoding(self, query: Dict[str, str], body: Any) -> Dict[str, Any]:
+        address = query.get('address', '')
+        if not address:
+            return {'status': 'INVALID_REQUEST', 'results': [], 'error_message': 'Missing address'}
+        formatted_address, (lat, lng) = self.seed.geocode(address)
+        return {
+            'status': 'OK',
+            'results': [{
+                'formatted_address': formatted_address,
+                'geometry': {'location': {'lat': lat, 'lng': lng}},
+                'place_id': f"fake_geocode_{hashlib.sha1(address.encode()).hexdigest()[:16]}",
+            }],
+        }
+
+    def nearby_search(self, query: Dict[str, str], body: Any) -> Dict[str, Any]:
+        location = _parse_lat_lng(query.get('location', ''))
+        if location is None:
+            return {'status': 'INVALID_REQUEST', 'results': []}
+        max_price = int(query['maxprice']) if query.get('maxprice', '').isdigit() else None
+        results = self.seed.nearby(location[0], location[1], query.get('type'), query.get('keyword'), max_price)
+        return {'status': 'OK' if results else 'ZERO_RESULTS', 'results': results}
+
+    def place_details(self, query: Dict[str, str], body: Any) -> Dict[str, Any]:
+        place = self.seed.places.get(query.get('place_id', ''))
+        if place is None:
+            return {'status': 'NOT_FOUND'}
+        return {'status': 'OK', 'result': place}
+
+    def distance_matrix(self, query: Dict[str, str], body: Any) -> Dict[str, Any]:
+        origins = [_parse_lat_lng(value) for value in query.get('origins', '').split('|')]
+        destinations = [_parse_lat_lng(value) for value in query.get('destinations', '').split('|')]
+        rows = []
+        for origin in origins:
+            elements = []
+            for destination in destinations:
+                if origin is None or destination is None:
+                    elements.append({'status': 'NOT_FOUND'})
+                    continue
+                meters = round(haversine_meters(*origin, *destination) * ROUTE_DETOUR_FACTOR)
+                seconds = round(meters / WALKING_METERS_PER_SECOND)
+                elements.append({
+                    'status': 'OK',
+                    'distance': {'value': meters, 'text': f"{meters / 1609.34:.1f} mi"},
+                    'duration': {'value': seconds, 'text': f"{max(1, seconds // 60)} mins"},
+                })
+            rows.append({'elements': elements})
+        return {'status': 'OK', 'origin_addresses': [], 'destination_addresses': [], 'rows': rows}
+
+    def yelp_ai_chat(self, query: Dict[str, str], body: Any) -> Dict[str, Any]:
+        body = body if isinstance(body, dict) else {}
+        user_context = body.get('user_context') or {}
+        places = self.seed.near(user_context.get('latitude'), user_context.get('longitude'), 6)
+        businesses = [self._to_yelp_business(place) for place in places]
+        plan = {
+            'title': "A day around the neighbourhood",
+            'summary': "Coffee, a walk and dinner close together.",
+            'total_stops': len(businesses[:3]),
+            'stops': [
+                {'time': f"{10 + 2 * index}:00", 'name': business['name'], 'category': business['categories'][0]['title'],
+                 'address': ", ".join(business['location']['display_address']), 'duration_minutes': 60}
+                for index, business in enumerate(businesses[:3])
+            ],
+        }
+        text = (
+            f"Here are some places I'd suggest for \"{str(body.get('query', ''))[:80]}\".\n\n"
+            f"```json\n{json.dumps({'plan': plan})}\n```"
+        )
+        return {
+            'chat_id': body.get('chat_id') or f"fake_chat_{random.getrandbits(48):012x}",
+            'response': {'text': text},
+            'entities': [{'businesses': businesses}],
+        }
+
+    @staticmethod
+    def _to_yelp_business(place: Dict[str, Any]) -> Dict[str, Any]:
+        location = place['geometry']['location']
+        address = place.get('formatted_address', '')
+        return {
+            'id': place['place_id'],
+            'alias': re.sub(r"[^a-z0-9]+", "-", place['name'].lower()).strip("-"),
+            'name': place['name'],
+            'url': f"https://www.yelp.com/biz/{place['place_id']}",
+            'coordinates': {'latitude': location['lat'], 'longitude': location['lng']},
+            'location': {'address1': address.split(",")[0], 'display_address': [part.strip() for part in address.split(",")]},
+            'categories': [{'alias': place['types'][0], 'title': place['types'][0].replace("_", " ").title()}],
+            'rating': place.get('rating'),
+            'review_count': place.get('user_ratings_total') or 0,
+            'price': "$" * place['price_level'] if place.get('price_level') else None,
+            'contextual_info': {'photos': [{'original_url': f"https://example.com/photos/{place['place_id']}.jpg"}]},
+        }
+
+    def gemini(self, query: Dict[str, str], body: Any) -> Dict[str, Any]:
+        prompt = ""
+        if isinstance(body, dict):
+            for content in body.get('contents', []):
+                for part in content.get('parts', []):
+                    prompt += part.get('text', '')
+        if "search_queries" in prompt:
+            answer = {'search_queries': ["coffee", "parks", "food"], 'mood_context': "relaxed", 'experience_type': "casual"}
+        else:
+            stops = [{'name': place['name'], 'category': place['types'][0], 'duration_minutes': 45}
+                     for place in self.seed.near(None, None, 3)]
+            answer = {'routes': [{'name': "Local favourites", 'description': "A short walk between nearby spots.",
+                                  'stops': stops, 'total_duration_minutes': 45 * len(stops),
+                                  'local_tip': "Go early to avoid the lines."}]}
+        return {'candidates': [{'content': {'parts': [{'text': json.dumps(answer)}], 'role': 'model'}, 'finishReason': 'STOP'}]}
+
+    @staticmethod
+    def silent_wav(seconds: float = 0.5, sample_rate: int = 16000) -> bytes:
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(b"\x00\x00" * int(seconds * sample_rate))
+        return buffer.getvalue()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {api: {'calls': calls, 'injected_errors': errors} for api, (calls, errors) in sorted(self.counts.items())}
+
+
+def make_handler(fake: FakeUpstream):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _dispatch(self, method: str) -> None:
+            parts = urlsplit(self.path)
+            length = int(self.headers.get('Content-Length') or 0)
+            raw_body = self.rfile.read(length) if length else b""
+            if parts.path == "/_stats":
+                self._send(200, "application/json", json.dumps(fake.stats()).encode())
+                return
+            api = fake.route(method, parts.path)
+            if api is None:
+                self._send(404, "application/json", json.dumps({'error': f"No fake for {method} {parts.path}"}).encode())
+                return
+            query = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            try:
+                body = json.loads(raw_body) if raw_body else None
+            except json.JSONDecodeError:
+                body = None
+            self._send(*fake.handle(api, query, body, parts.path))
+
+        def _send(self, status: int, content_type: str, payload: bytes) -> None:
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(host: str, port: int, fake: FakeUpstream) -> ThreadingHTTPServer:
+    """Start the fake server on a background thread and return it."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-upstream", daemon=True).start()
+    return server
+
+
+def _parse_overrides(values: List[str]) -> Dict[str, float]:
+    overrides = {}
+    for value in values:
+        api, _, number = value.partition("=")
+        overrides[api.strip()] = float(number)
+    return overrides
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Google Maps / Yelp AI / Gemini / HF server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--seed", action="append", help="Saved search results JSON (repeatable); default search_results/*.json")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Mean added latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=20.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with HTTP 503")
+    parser.add_argument("--latency", action="append", default=[], metavar="API=MS", help="Per-API latency, e.g. nearby_search=300")
+    parser.add_argument("--error-rate-for", action="append", default=[], metavar="API=RATE", help="Per-API error rate, e.g. yelp_ai_chat=0.1")
+    args = parser.parse_args()
+
+    seed = SeedData(args.seed or sorted(glob.glob(DEFAULT_SEED_GLOB)))
+    faults = Faults(args.latency_ms, args.jitter_ms, args.error_rate,
+                    _parse_overrides(args.latency), _parse_overrides(args.error_rate_for))
+    fake = FakeUpstream(seed, faults)
+    server = serve(args.host, args.port, fake)
+    print(f"Fake upstream serving {len(seed.places)} places on http://{args.host}:{args.port} (call counts at /_stats)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
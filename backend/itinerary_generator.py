@@ -1,8 +1,18 @@
 import random
 import uuid
-from typing import List, Dict, Optional, Set
+from typing import Iterator, List, Dict, Optional, Set
 from datetime import datetime
 import math
+from collections import Counter
+
+from place_identity import get_place_key, normalize_excluded_ids, STOP_ID_PREFIX
+from search_planner import area_density, MAX_PLACE_REUSE
+import pair_cache
+import tracing
+import walking_router
+from structured_logging import DEBUG, get_logger
+
+logger = get_logger("itinerary_generator")
 
 class ItineraryGenerator:
     """Generates itineraries from Chalo search results"""
@@ -30,6 +40,12 @@ class ItineraryGenerator:
         "Shopping & Boutiques": ['thrift stores near me', 'markets near me']
     }
     
+    # Highest Google price_level inside each max_price_level band ("50+" is no limit)
+    PRICE_BAND_MAX_LEVEL = {
+        "10-20": 1,
+        "20-50": 2
+    }
+    
     # Broad type mapping for diversity in mixed itineraries
     BROAD_TYPE_MAPPING = {
         'Restaurant': 'food',
@@ -51,6 +67,18 @@ class ItineraryGenerator:
     def __init__(self):
         self.image_index = 0
     
+    def categories_for_preset(self, preset: Optional[str]) -> Optional[List[str]]:
+        """Search queries for a preset, or None for a mixed search.
+
+        Raises:
+            ValueError: For an unknown preset
+        """
+        if not preset:
+            return None
+        if preset not in self.PRESET_CATEGORIES:
+            raise ValueError(f"Unknown preset '{preset}'. Valid presets: {', '.join(self.PRESET_CATEGORIES)}")
+        return self.PRESET_CATEGORIES[preset]
+    
     def get_next_image(self) -> str:
         """Get next stock image in rotation"""
         image = self.STOCK_IMAGES[self.image_index % len(self.STOCK_IMAGES)]
@@ -71,6 +99,10 @@ class ItineraryGenerator:
         else:
             return "Varies"
     
+    def max_price_for_band(self, max_price_level: Optional[str]) -> Optional[int]:
+        """Google price_level ceiling for a max_price_level band, or None when it doesn't limit anything"""
+        return self.PRICE_BAND_MAX_LEVEL.get(max_price_level) if max_price_level else None
+    
     def matches_price_filter(self, place: Dict, max_price_level: Optional[str]) -> bool:
         """Check if place matches the price filter"""
         if not max_price_level:
@@ -148,9 +180,9 @@ class ItineraryGenerator:
         return min(time_minutes, 30)  # Cap at 30 minutes
     
     def calculate_distance_between_places(self, place1: Dict, place2: Dict) -> float:
-        """Calculate distance in meters between two places using Haversine formula"""
-        import math
-        
+        """Walking distance in meters between two places over the street network when a
+        walking graph is loaded (see walking_router.py; routed pairs are kept in the
+        pair cache, see pair_cache.py), else the Haversine distance"""
         lat1 = place1.get('latitude')
         lon1 = place1.get('longitude')
         lat2 = place2.get('latitude')
@@ -159,6 +191,27 @@ class ItineraryGenerator:
         if not all([lat1, lon1, lat2, lon2]):
             return 0.0
         
+        router = walking_router.get_router()
+        if router is None:
+            return self._haversine_meters(lat1, lon1, lat2, lon2)
+        
+        distances = pair_cache.cache
+        key1 = get_place_key(place1) if distances else None
+        key2 = get_place_key(place2) if distances else None
+        if key1 and key2:
+            cached = distances.get(key1, key2)
+            if cached:
+                return cached[0]
+        
+        walking_meters = router.walking_meters(lat1, lon1, lat2, lon2)
+        if walking_meters is None:
+            return self._haversine_meters(lat1, lon1, lat2, lon2)
+        if key1 and key2:
+            distances.put(key1, key2, walking_meters, pair_cache.ROUTER)
+        return walking_meters
+    
+    @staticmethod
+    def _haversine_meters(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
         # Haversine formula
         R = 6371000  # Earth's radius in meters
         
@@ -179,15 +232,52 @@ class ItineraryGenerator:
         area_sq_miles = math.pi * (search_radius_miles ** 2)
         places_per_sq_mile = total_places / area_sq_miles
         
-        print(f"Density calculation: {total_places} places in {area_sq_miles:.2f} sq miles = {places_per_sq_mile:.1f} places/sq mile")
+        logger.debug("Density calculation: %s places in %.2f sq miles = %.1f places/sq mile", total_places, area_sq_miles, places_per_sq_mile)
         
-        if places_per_sq_mile >= 10:  # Dense urban areas like Soho, Manhattan (85 places in 7.07 sq miles = 12 places/sq mile)
-            return "dense"
-        elif places_per_sq_mile >= 5:  # Moderate density suburbs/neighborhoods
-            return "moderate" 
-        else:  # Sparse rural or spread-out areas
-            return "sparse"
+        # Shared with the adaptive radius search so both classify an area the same way
+        return area_density(total_places, search_radius_miles)
+    
+    def prepare_walking_distances(self, places: List[Dict]) -> None:
+        """Load the pairs already measured from the pair cache, then route the rest in
+        one many-to-many pass, so the pairwise lookups made while building and
+        validating itineraries stay in memory"""
+        router = walking_router.get_router()
+        if router is None:
+            return
+        places = [place for place in places if place.get('latitude') and place.get('longitude')]
+        if len(places) < 2:
+            return
+        distances = pair_cache.cache
+        if distances:
+            keys = [get_place_key(place) for place in places]
+            with tracing.span("generation.pair_prefetch", places=len(places)):
+                held = distances.prefetch(keys)
+            # Only the places with a pair the cache doesn't hold yet
+            unmeasured = set()
+            for i in range(len(places)):
+                for j in range(i + 1, len(places)):
+                    pair = (keys[i], keys[j]) if (keys[i] or "") <= (keys[j] or "") else (keys[j], keys[i])
+                    if not keys[i] or not keys[j] or pair not in held:
+                        unmeasured.update((i, j))
+            places = [places[i] for i in sorted(unmeasured)]
+        if len(places) < 2:
+            return
+        with tracing.span("generation.walking_matrix", places=len(places)):
+            matrix = router.matrix([(place['latitude'], place['longitude']) for place in places])
+        if distances:
+            # Keep the whole matrix, not just the pairs this request ends up comparing
+            keys = [get_place_key(place) for place in places]
+            for i in range(len(places)):
+                for j in range(i + 1, len(places)):
+                    if keys[i] and keys[j] and matrix[i][j] is not None:
+                        distances.put(keys[i], keys[j], matrix[i][j], pair_cache.ROUTER)
+    
+    def save_walking_distances(self) -> None:
+        """Write the distances measured during generation to the pair cache"""
+        if pair_cache.cache:
+            pair_cache.cache.flush()
     
+    @tracing.traced("generation.validate_route")
     def validate_route_quality(self, places: List[Dict]) -> bool:
         """Check route quality based on actual walking time constraints that matter to users"""
         if len(places) < 2:
@@ -197,6 +287,7 @@ class ItineraryGenerator:
         total_walking_time = 0
         max_single_walk = 0
         walking_details = []
+        log_details = logger.is_enabled(DEBUG)
         
         for i in range(1, len(places)):
             distance_meters = self.calculate_distance_between_places(places[i-1], places[i])
@@ -205,21 +296,23 @@ class ItineraryGenerator:
             
             total_walking_time += walking_time
             max_single_walk = max(max_single_walk, walking_time)
-            walking_details.append(f"{distance_miles:.2f}mi ({walking_time}min)")
+            if log_details:
+                walking_details.append(f"{distance_miles:.2f}mi ({walking_time}min)")
         
         # Realistic constraints that users care about
         total_time_ok = total_walking_time <= 45  # Max 45 min total walking
         max_walk_ok = max_single_walk <= 25       # No single walk > 25 min (adjusted from 20)
         variety_ok = len(places) >= 3             # Minimum variety
         
-        print(f"Route quality check:")
-        print(f"  Walking segments: {' -> '.join(walking_details)}")
-        print(f"  Total walking time: {total_walking_time}min ({'✓' if total_time_ok else '✗'} ≤45min)")
-        print(f"  Max single walk: {max_single_walk}min ({'✓' if max_walk_ok else '✗'} ≤25min)")
-        print(f"  Place variety: {len(places)} places ({'✓' if variety_ok else '✗'} ≥3)")
-        
         result = total_time_ok and max_walk_ok and variety_ok
-        print(f"Route quality result: {'✓ PASS' if result else '✗ FAIL'}")
+        if log_details:
+            logger.debug(
+                "Route quality %s: segments %s, total walk %smin (%s ≤45min), max walk %smin (%s ≤25min), %s places (%s ≥3)",
+                '✓ PASS' if result else '✗ FAIL', ' -> '.join(walking_details),
+                total_walking_time, '✓' if total_time_ok else '✗',
+                max_single_walk, '✓' if max_walk_ok else '✗',
+                len(places), '✓' if variety_ok else '✗'
+            )
         return result
     
     def estimate_itinerary_duration(self, places: List[Dict]) -> int:
@@ -251,12 +344,13 @@ class ItineraryGenerator:
         
         return total_duration
     
+    @tracing.traced("generation.optimize_order")
     def optimize_stop_order(self, places: List[Dict], max_distance_miles: float = 1.5, total_places_found: int = 50) -> List[Dict]:
         """Optimize stop order for minimal walking time and logical flow"""
         if len(places) <= 2:
             return places
         
-        print(f"Optimizing route for {len(places)} places based on walking efficiency")
+        logger.debug("Optimizing route for %s places based on walking efficiency", len(places))
         
         # Simple but effective: greedy nearest-neighbor with quality weighting
         optimized = [places[0]]  # Start with first place
@@ -274,7 +368,7 @@ class ItineraryGenerator:
                 # Score based on: shorter walking time = higher score, better rating = higher score
                 # Prioritize walking efficiency (70%) over place rating (30%)
                 walking_score = max(0, (20 - walking_time) / 20)  # 0-1 scale, 20min walk = 0 score
-                rating_score = (place.get('rating', 3.0) - 3.0) / 2.0  # -1 to 1 scale
+                rating_score = ((place.get('rating') or 3.0) - 3.0) / 2.0  # -1 to 1 scale
                 
                 combined_score = 0.7 * walking_score + 0.3 * rating_score
                 
@@ -294,7 +388,7 @@ class ItineraryGenerator:
                 optimized.append(closest)
                 remaining.remove(closest)
         
-        print(f"Route optimized: prioritized walking efficiency and place quality")
+        logger.debug("Route optimized: prioritized walking efficiency and place quality")
         return optimized
     
     def create_stop_from_place(self, place: Dict, walking_time: int = 0) -> Dict:
@@ -322,8 +416,12 @@ class ItineraryGenerator:
         
         description = '. '.join(description_parts) if description_parts else f"A local {self.categorize_place(place).lower()} worth exploring."
         
+        # Stop ids derive from the place identity so clients can send them back as exclusions
+        place_key = get_place_key(place)
+        
         return {
-            'id': f"stop-{uuid.uuid4()}",
+            'id': f"{STOP_ID_PREFIX}{place_key or uuid.uuid4()}",
+            'place_id': place_key,
             'name': place.get('name', 'Local Spot'),
             'category': self.categorize_place(place),
             'walking_time_minutes': walking_time,
@@ -331,9 +429,20 @@ class ItineraryGenerator:
             'image_url': image_url
         }
     
+    @tracing.traced("generation.mixed_itinerary")
     def create_mixed_itinerary(self, places_by_category: Dict, location: str, itinerary_index: int, 
-                              max_price_level: Optional[str] = None, max_distance_miles: float = 1.5) -> Optional[Dict]:
-        """Create a naturally mixed itinerary with diverse place types"""
+                              max_price_level: Optional[str] = None, max_distance_miles: float = 1.5,
+                              preset_types: Optional[Set[str]] = None, places_available: Optional[int] = None,
+                              place_uses: Optional[Dict[str, int]] = None) -> Optional[Dict]:
+        """Create a naturally mixed itinerary with diverse place types.
+        preset_types are the broad types a preset asks for: they are picked first and
+        are not held to the two-per-type diversity cap.
+        places_available is the search's estimate of the places the area offers before a
+        fetch budget or a tight adaptive radius limited hydration; area density is judged
+        on it rather than on the places fetched.
+        place_uses counts the earlier itineraries each place key appears in: places already
+        in MAX_PLACE_REUSE of them are left out while enough others remain.
+        """
 
         # Convert max_distance_miles to meters
         max_distance_meters = max_distance_miles * 1609.34
@@ -361,21 +470,30 @@ class ItineraryGenerator:
 
         elif total_places_found < 10:
             min_places_required = 2  # Relax for sparse areas
-            print(f"Debug: Using min_places_required=2 for low-density area")
+            logger.debug("Using min_places_required=2 for low-density area")
         else:
             min_places_required = 3  # Standard requirement
-            print(f"Debug: Using min_places_required=3 for standard area")
+            logger.debug("Using min_places_required=3 for standard area")
         
         if len(all_places) < min_places_required:
-            print(f"Not enough places within itinerary radius: {len(all_places)} (minimum: {min_places_required})")
+            logger.info("Not enough places within itinerary radius: %s (minimum: %s)", len(all_places), min_places_required)
             return None
         
+        # Spread the places over the itineraries, as search_planner's fetch budget assumes
+        if place_uses:
+            fresh_places = [place for place in all_places
+                            if place_uses.get(get_place_key(place), 0) < MAX_PLACE_REUSE]
+            if len(fresh_places) >= min_places_required:
+                all_places = fresh_places
+            else:
+                logger.debug("Only %s places below the reuse limit, reusing places", len(fresh_places))
+        
         # Shuffle for variety
         random.shuffle(all_places)
         
         # Calculate area density for adaptive target stops logic
-        density = self.calculate_area_density(total_places_found, max_distance_miles)
-        print(f"Debug: total_places_found={total_places_found}, min_places_required={min_places_required}, density={density}")
+        density = self.calculate_area_density(max(total_places_found, places_available or 0), max_distance_miles)
+        logger.debug("total_places_found=%s, min_places_required=%s, density=%s", total_places_found, min_places_required, density)
         
         # REMOVED: Problematic micro-itinerary logic that forced 3-spot itineraries for dense areas
         # This allows the original adaptive target_stops logic to function as designed:
@@ -385,18 +503,19 @@ class ItineraryGenerator:
         
         # Keep only low-availability micro-itinerary logic for truly sparse areas
         if total_places_found <= 10 and min_places_required <= 2 and density != "dense":
-            print(f"Debug: Low-availability micro-itinerary condition met for non-dense area!")
+            logger.debug("Low-availability micro-itinerary condition met for non-dense area!")
             selected_places = all_places[:min(2, len(all_places))]
             if selected_places:
-                print(f"Creating low-availability micro-itinerary with {len(selected_places)} places")
+                logger.debug("Creating low-availability micro-itinerary with %s places", len(selected_places))
                 return self.format_itinerary(selected_places, location, itinerary_index, is_micro=True)
         
-        print(f"Debug: Proceeding with regular itinerary generation using adaptive target_stops")
+        logger.debug("Proceeding with regular itinerary generation using adaptive target_stops")
         
         # Fewer attempts needed with realistic constraints
         max_attempts = 5 if total_places_found >= 30 else 3
-        print(f"Attempting to generate itinerary with {max_attempts} max attempts (realistic validation)")
+        logger.debug("Attempting to generate itinerary with %s max attempts (realistic validation)", max_attempts)
         for attempt in range(max_attempts):
+            tracing.event("generation.attempt", itinerary=itinerary_index, attempt=attempt + 1)
             # Force diversity by selecting from different broad types
             selected_places = []
             type_counts = {'food': 0, 'culture': 0, 'nature': 0, 'shopping': 0, 'misc': 0}
@@ -405,9 +524,14 @@ class ItineraryGenerator:
             # Shuffle for variety in each attempt
             shuffled_places = all_places.copy()
             random.shuffle(shuffled_places)
+            broad_type_order = ['nature', 'culture', 'food', 'shopping', 'misc']
+            if preset_types:
+                # Stable sort keeps the shuffle within the preset and non-preset groups
+                shuffled_places.sort(key=lambda p: self.get_broad_type(p) not in preset_types)
+                broad_type_order.sort(key=lambda t: t not in preset_types)
             
             # First pass: try to get one of each type
-            for broad_type in ['nature', 'culture', 'food', 'shopping', 'misc']:
+            for broad_type in broad_type_order:
                 for place in shuffled_places:
                     if self.get_broad_type(place) == broad_type and type_counts[broad_type] == 0:
                         selected_places.append(place)
@@ -428,7 +552,8 @@ class ItineraryGenerator:
                     continue
                     
                 broad_type = self.get_broad_type(place)
-                if type_counts[broad_type] < max_per_type:
+                type_limit = target_stops if preset_types and broad_type in preset_types else max_per_type
+                if type_counts[broad_type] < type_limit:
                     selected_places.append(place)
                     type_counts[broad_type] += 1
             
@@ -443,19 +568,20 @@ class ItineraryGenerator:
             
             # Check route quality with user-focused constraints
             if not self.validate_route_quality(selected_places):
-                print(f"Attempt {attempt + 1}: Route quality check failed, trying next combination")
+                logger.debug("Attempt %s: Route quality check failed, trying next combination", attempt + 1)
                 continue
             
             # Duration-first optimization: prioritize creating viable itineraries
             estimated_duration = self.estimate_itinerary_duration(selected_places)
             
             # For dense areas, be more flexible with duration (up to 180 min)
-            density = self.calculate_area_density(total_places_found, max_distance_miles)
             max_duration = 180 if density == "dense" else 135
             
             if estimated_duration <= max_duration:
-                print(f"Mixed itinerary {itinerary_index} (attempt {attempt + 1}): {[self.get_broad_type(p) for p in selected_places]}")
-                print(f"Estimated duration: {estimated_duration} minutes (max: {max_duration})")
+                if logger.is_enabled(DEBUG):
+                    logger.debug("Mixed itinerary %s (attempt %s): %s", itinerary_index, attempt + 1,
+                                 [self.get_broad_type(p) for p in selected_places])
+                logger.debug("Estimated duration: %s minutes (max: %s)", estimated_duration, max_duration)
                 break
             else:
                 # Smart trimming: remove places that add least value
@@ -466,7 +592,7 @@ class ItineraryGenerator:
                     
                     for idx, place in enumerate(selected_places[1:], 1):  # Skip first place
                         # Score = rating (higher is better) - walking_time_penalty
-                        rating = place.get('rating', 3.0)
+                        rating = place.get('rating') or 3.0
                         prev_distance = self.calculate_distance_between_places(selected_places[idx-1], place) if idx > 0 else 0
                         walking_penalty = self.calculate_walking_time(prev_distance) * 0.5  # Convert to score penalty
                         
@@ -479,17 +605,19 @@ class ItineraryGenerator:
                     estimated_duration = self.estimate_itinerary_duration(selected_places)
                 
                 if estimated_duration <= max_duration and len(selected_places) >= 2:
-                    print(f"Mixed itinerary {itinerary_index} (attempt {attempt + 1}, optimized): {[self.get_broad_type(p) for p in selected_places]}")
-                    print(f"Final duration: {estimated_duration} minutes")
+                    if logger.is_enabled(DEBUG):
+                        logger.debug("Mixed itinerary %s (attempt %s, optimized): %s", itinerary_index, attempt + 1,
+                                     [self.get_broad_type(p) for p in selected_places])
+                    logger.debug("Final duration: %s minutes", estimated_duration)
                     break
                 else:
-                    print(f"Attempt {attempt + 1}: Could not optimize duration under {max_duration} minutes")
+                    logger.debug("Attempt %s: Could not optimize duration under %s minutes", attempt + 1, max_duration)
                     continue
         else:
-            print(f"Could not create compliant itinerary after {max_attempts} attempts")
+            logger.info("Could not create compliant itinerary after %s attempts", max_attempts)
             # Fallback: create simple high-quality itinerary if we have good places
             if len(all_places) >= 3:
-                print(f"Fallback: creating simple high-quality 3-place itinerary")
+                logger.info("Fallback: creating simple high-quality 3-place itinerary")
                 best_places = sorted(
                     all_places,
                     key=lambda x: (-(x.get('rating') or 0), x.get('distance_meters', float('inf')))
@@ -546,53 +674,108 @@ class ItineraryGenerator:
             'stops': stops
         }
     
-    def generate_itineraries(self, search_results: Dict, location: str, preset: Optional[str] = None, 
-                           max_price_level: Optional[str] = None, max_distance_miles: float = 1.5) -> List[Dict]:
-        """Generate ONLY mixed itineraries - no themed ones"""
+    def iter_itineraries(self, search_results: Dict, location: str, preset: Optional[str] = None,
+                         max_price_level: Optional[str] = None, max_distance_miles: float = 1.5,
+                         count: int = 5) -> Iterator[Dict]:
+        """Yield itineraries one at a time, as soon as each passes validation.
+        With a preset only its categories are used and its place types are weighted;
+        otherwise itineraries are mixed.
+        """
         places_by_category = search_results.get('results_by_category', {})
         
         # Filter out empty categories
         places_by_category = {k: v for k, v in places_by_category.items() if v}
         
-        if not places_by_category:
-            return []
+        preset_types = None
+        preset_categories = self.categories_for_preset(preset)
+        if preset_categories:
+            places_by_category = {k: v for k, v in places_by_category.items() if k in preset_categories}
+            # A category's results include stray types (a museum inside a park), so each
+            # category contributes only its most common broad type
+            preset_types = set()
+            for places in places_by_category.values():
+                type_counts = Counter(self.get_broad_type(place) for place in places)
+                preset_types.add(type_counts.most_common(1)[0][0])
         
-        print(f"Generating MIXED itineraries for {location}")
+        if not places_by_category:
+            return
         
-        # Always create mixed itineraries (ignore preset for now)
-        itineraries = []
-        for i in range(5):  # Create 5 mixed itineraries
-            itinerary = self.create_mixed_itinerary(places_by_category, location, i, max_price_level, max_distance_miles)
-            if itinerary:
-                itineraries.append(itinerary)
+        logger.info("Generating %s itineraries for %s", preset or "MIXED", location)
+        self.prepare_walking_distances([place for places in places_by_category.values() for place in places])
+        places_available = search_results.get('search_metadata', {}).get('places_available')
         
-        return itineraries[:5]  # Return up to 5 mixed itineraries
+        place_uses = Counter()
+        try:
+            for i in range(count):
+                itinerary = self.create_mixed_itinerary(places_by_category, location, i, max_price_level, max_distance_miles,
+                                                        preset_types, places_available, place_uses)
+                if itinerary:
+                    place_uses.update({stop['place_id'] for stop in itinerary['stops'] if stop.get('place_id')})
+                    yield itinerary
+        finally:
+            self.save_walking_distances()
+    
+    def generate_itineraries(self, search_results: Dict, location: str, preset: Optional[str] = None, 
+                           max_price_level: Optional[str] = None, max_distance_miles: float = 1.5) -> List[Dict]:
+        """Generate up to 5 itineraries, mixed or for a preset"""
+        itineraries = list(self.iter_itineraries(search_results, location, preset, max_price_level, max_distance_miles))
+        return itineraries[:5]  # Return up to 5 itineraries
     
     def generate_custom_itineraries(self, search_results: Dict, location: str, max_distance_miles: float = 1.5, user_categories: List[str] = None) -> List[Dict]:
         """Generate custom itineraries using Preference Hotspot Clustering"""
         places_by_category = search_results.get('results_by_category', {})
         
         if not places_by_category:
-            print("No places found in search results")
+            logger.info("No places found in search results")
             return []
         
         try:
-            print(f"🎯 PREFERENCE HOTSPOT CLUSTERING - User-Centric Custom Itineraries")
-            print(f"Location: {location}")
-            print(f"Max distance: {max_distance_miles} miles")
+            logger.info("🎯 PREFERENCE HOTSPOT CLUSTERING - User-Centric Custom Itineraries",
+                        location=location, max_distance_miles=max_distance_miles)
             
             # Try new hotspot clustering approach
             return self.generate_preference_hotspot_itineraries(search_results, location, max_distance_miles, user_categories)
             
         except Exception as e:
-            print(f"⚠️ Hotspot clustering failed: {e}")
-            print("🔄 Falling back to bulletproof method")
+            logger.warning("⚠️ Hotspot clustering failed: %s", e)
+            logger.info("🔄 Falling back to bulletproof method")
             
             # Fall back to original bulletproof method
             return self.generate_bulletproof_custom_itineraries(search_results, location, max_distance_miles)
     
+    def iter_custom_itineraries(self, search_results: Dict, location: str, max_distance_miles: float = 1.5,
+                                user_categories: List[str] = None, count: int = 3) -> Iterator[Dict]:
+        """Yield custom itineraries one at a time, falling back to the bulletproof method on failure"""
+        places_by_category = search_results.get('results_by_category', {})
+        
+        if not places_by_category:
+            logger.info("No places found in search results")
+            return
+        
+        yielded = 0
+        try:
+            logger.info("🎯 PREFERENCE HOTSPOT CLUSTERING - User-Centric Custom Itineraries (streaming)")
+            for itinerary in self.iter_preference_hotspot_itineraries(search_results, location, max_distance_miles, user_categories):
+                if yielded >= count:
+                    return
+                yield itinerary
+                yielded += 1
+        except Exception as e:
+            logger.warning("⚠️ Hotspot clustering failed: %s", e)
+            logger.info("🔄 Falling back to bulletproof method")
+            
+            # Already-sent itineraries cannot be withdrawn, so only top up to the limit
+            fallback = self.generate_bulletproof_custom_itineraries(search_results, location, max_distance_miles)
+            for itinerary in fallback[:max(0, count - yielded)]:
+                yield itinerary
+    
     def generate_preference_hotspot_itineraries(self, search_results: Dict, location: str, max_distance_miles: float, user_categories: List[str] = None) -> List[Dict]:
         """Generate itineraries using Preference Hotspot Clustering algorithm"""
+        itineraries = list(self.iter_preference_hotspot_itineraries(search_results, location, max_distance_miles, user_categories))
+        return itineraries[:3]  # Return max 3 itineraries
+    
+    def iter_preference_hotspot_itineraries(self, search_results: Dict, location: str, max_distance_miles: float, user_categories: List[str] = None) -> Iterator[Dict]:
+        """Yield Preference Hotspot Clustering itineraries as each one is built"""
         places_by_category = search_results.get('results_by_category', {})
         
         # Flatten all places and filter by distance
@@ -615,10 +798,10 @@ class ItineraryGenerator:
             for query in search_queries:
                 search_query_to_user_category[query] = user_cat
         
-        print(f"User selected categories: {user_categories}")
+        logger.debug("User selected categories: %s", user_categories)
         
         for category_name, places in places_by_category.items():
-            print(f"Category '{category_name}': {len(places)} places")
+            logger.debug("Category '%s': %s places", category_name, len(places))
             
             # Determine if this category matches user preferences
             is_user_preference = False
@@ -627,9 +810,9 @@ class ItineraryGenerator:
                 user_category = search_query_to_user_category.get(category_name)
                 if user_category and user_category in user_categories:
                     is_user_preference = True
-                    print(f"  ✅ '{category_name}' matches user preference '{user_category}'")
+                    logger.debug("  ✅ '%s' matches user preference '%s'", category_name, user_category)
                 else:
-                    print(f"  ❌ '{category_name}' does not match user preferences")
+                    logger.debug("  ❌ '%s' does not match user preferences", category_name)
             
             for place in places:
                 distance_meters = place.get('distance_meters', 0)
@@ -639,19 +822,21 @@ class ItineraryGenerator:
                     place['search_category'] = category_name  # Track original search category
                     all_places.append(place)
         
-        print(f"Total places after distance filter: {len(all_places)}")
+        logger.debug("Total places after distance filter: %s", len(all_places))
         
         if len(all_places) < 4:
-            print(f"❌ Not enough places for clustering: {len(all_places)} (need minimum 4)")
-            return []
+            logger.info("❌ Not enough places for clustering: %s (need minimum 4)", len(all_places))
+            return
+        
+        self.prepare_walking_distances(all_places)
         
         # Phase 1: Create geographic grid and find hotspots
         hotspots = self.find_preference_hotspots(all_places, max_distance_miles)
-        print(f"Found {len(hotspots)} preference hotspots")
+        logger.debug("Found %s preference hotspots", len(hotspots))
         
         if not hotspots:
-            print("❌ No suitable hotspots found")
-            return []
+            logger.info("❌ No suitable hotspots found")
+            return
         
         # Phase 2: Create clusters from hotspots  
         clusters = []
@@ -660,41 +845,40 @@ class ItineraryGenerator:
             if cluster:
                 clusters.append(cluster)
         
-        print(f"Created {len(clusters)} valid clusters")
+        logger.debug("Created %s valid clusters", len(clusters))
         
         if not clusters:
-            print("❌ No valid clusters created")
-            return []
+            logger.info("❌ No valid clusters created")
+            return
         
         # Phase 3: Generate itineraries from clusters with category diversity
-        itineraries = []
+        generated = 0
         for i, cluster in enumerate(clusters[:3]):  # Generate up to 3 itineraries
             # Enforce category diversity within each cluster
             diverse_cluster = self.enforce_category_diversity(cluster, user_categories)
             if diverse_cluster:
                 itinerary = self.generate_cluster_itinerary(diverse_cluster, location, i)
                 if itinerary:
-                    itineraries.append(itinerary)
-                    print(f"✅ Generated diverse cluster itinerary {i+1} with {len(diverse_cluster)} places")
+                    generated += 1
+                    logger.debug("✅ Generated diverse cluster itinerary %s with %s places", i+1, len(diverse_cluster))
+                    yield itinerary
         
-        print(f"🎉 Generated {len(itineraries)} preference-focused itineraries")
+        self.save_walking_distances()
+        logger.info("🎉 Generated %s preference-focused itineraries", generated)
         
         # Fallback: If we couldn't generate any itineraries, create simple mixed ones
-        if len(itineraries) == 0:
-            print("⚠️ No hotspot itineraries generated, using simple mixed approach")
+        if generated == 0:
+            logger.info("⚠️ No hotspot itineraries generated, using simple mixed approach")
+        elif generated < 2:
+            logger.info("⚠️ Only one hotspot itinerary, adding simple mixed itineraries")
+        if generated < 2:
             fallback_itineraries = self.generate_simple_mixed_custom_itineraries(
                 all_places, location, user_categories, max_distance_miles
             )
-            itineraries.extend(fallback_itineraries)
-        elif len(itineraries) < 2:
-            print("⚠️ Only one hotspot itinerary, adding simple mixed itineraries")
-            fallback_itineraries = self.generate_simple_mixed_custom_itineraries(
-                all_places, location, user_categories, max_distance_miles
-            )
-            itineraries.extend(fallback_itineraries)
-        
-        return itineraries[:3]  # Return max 3 itineraries
+            yield from fallback_itineraries
+            self.save_walking_distances()
     
+    @tracing.traced("generation.find_hotspots")
     def find_preference_hotspots(self, all_places: List[Dict], search_radius_miles: float) -> List[Dict]:
         """Phase 1: Find geographic hotspots with high preference density"""
         if not all_places:
@@ -756,14 +940,16 @@ class ItineraryGenerator:
         # Sort hotspots by score and return top candidates
         hotspots.sort(key=lambda x: x['score'], reverse=True)
         
-        print(f"Grid analysis found {len(hotspots)} potential hotspots")
-        for i, hotspot in enumerate(hotspots[:5]):
-            print(f"  Hotspot {i+1}: Score={hotspot['score']:.2f}, "
-                  f"Places={hotspot['total_places']}, "
-                  f"Preferences={hotspot['preference_places']} ({hotspot['preference_ratio']:.1%})")
+        logger.debug("Grid analysis found %s potential hotspots", len(hotspots))
+        if logger.is_enabled(DEBUG):
+            for i, hotspot in enumerate(hotspots[:5]):
+                logger.debug("  Hotspot %s: Score=%.2f, Places=%s, Preferences=%s (%.1f%%)",
+                             i + 1, hotspot['score'], hotspot['total_places'],
+                             hotspot['preference_places'], hotspot['preference_ratio'] * 100)
         
         return hotspots
     
+    @tracing.traced("generation.cluster")
     def create_preference_cluster(self, hotspot: Dict, all_places: List[Dict]) -> Optional[List[Dict]]:
         """Phase 2: Create a cluster around a hotspot"""
         center_lat = hotspot['center_lat']
@@ -797,8 +983,8 @@ class ItineraryGenerator:
         if preference_ratio < 0.5:  # Reduced to 50%+ user preferences
             return None
         
-        print(f"Created cluster: {len(cluster_places)} places, "
-              f"{len(preference_places)} preferences ({preference_ratio:.1%})")
+        logger.debug("Created cluster: %s places, %s preferences (%.1f%%)",
+                     len(cluster_places), len(preference_places), preference_ratio * 100)
         
         return cluster_places
     
@@ -825,7 +1011,7 @@ class ItineraryGenerator:
         if not cluster_places or not user_categories:
             return cluster_places
         
-        print(f"Enforcing category diversity for {len(cluster_places)} places")
+        logger.debug("Enforcing category diversity for %s places", len(cluster_places))
         
         # Group places by their categories
         places_by_category = {}
@@ -838,11 +1024,11 @@ class ItineraryGenerator:
                 places_by_category[broad_type] = []
             places_by_category[broad_type].append(place)
         
-        print(f"Categories found: {list(places_by_category.keys())}")
+        logger.debug("Categories found: %s", list(places_by_category.keys()))
         
         # Ensure we have at least 2 different categories for diversity
         if len(places_by_category) < 2:
-            print("⚠️ Only one category type found - cannot enforce diversity")
+            logger.debug("⚠️ Only one category type found - cannot enforce diversity")
             return cluster_places
         
         # Select places to ensure category diversity
@@ -854,12 +1040,12 @@ class ItineraryGenerator:
             # Sort by user preference first, then by rating
             places.sort(key=lambda x: (
                 -1 if x.get('user_preference', False) else 0,  # User preferences first
-                -(x.get('rating', 0))  # Then by rating
+                -(x.get('rating') or 0)  # Then by rating
             ))
             
             if places:
                 diverse_places.append(places[0])
-                print(f"  Added from {broad_type}: {places[0].get('name', 'Unknown')}")
+                logger.debug("  Added from %s: %s", broad_type, places[0].get('name', 'Unknown'))
         
         # Second pass: Fill remaining spots while maintaining diversity
         target_size = min(6, len(cluster_places))  # Target 4-6 places
@@ -872,16 +1058,17 @@ class ItineraryGenerator:
                 if category_counts[broad_type] < max_per_category:
                     diverse_places.append(place)
                     category_counts[broad_type] += 1
-                    print(f"  Added additional from {broad_type}: {place.get('name', 'Unknown')}")
+                    logger.debug("  Added additional from %s: %s", broad_type, place.get('name', 'Unknown'))
         
         # Final check: ensure we have good category mix
         final_categories = set(self.get_broad_type(p) for p in diverse_places)
         user_preference_count = sum(1 for p in diverse_places if p.get('user_preference', False))
         
-        print(f"Final diversity: {len(final_categories)} categories, {user_preference_count}/{len(diverse_places)} user preferences")
+        logger.debug("Final diversity: %s categories, %s/%s user preferences", len(final_categories), user_preference_count, len(diverse_places))
         
         return diverse_places
     
+    @tracing.traced("generation.cluster_itinerary")
     def generate_cluster_itinerary(self, cluster_places: List[Dict], location: str, itinerary_index: int) -> Dict:
         """Phase 3: Generate optimized itinerary from cluster"""
         if not cluster_places:
@@ -898,12 +1085,11 @@ class ItineraryGenerator:
         # Issue 4 Fix: Enforce minimum 450m walking distance between stops
         selected_places = self.enforce_walking_distances(ordered_places, target_stops, min_walk_meters=450)
         
-        print(f"Selected {len(selected_places)} places for cluster itinerary:")
-        for i, place in enumerate(selected_places):
-            name = place.get('name', 'Unknown')
-            category = self.categorize_place(place)
-            is_preference = '🎯' if place.get('user_preference', False) else '📍'
-            print(f"  {i+1}. {is_preference} {name} ({category})")
+        logger.debug("Selected %s places for cluster itinerary:", len(selected_places))
+        if logger.is_enabled(DEBUG):
+            for i, place in enumerate(selected_places):
+                is_preference = '🎯' if place.get('user_preference', False) else '📍'
+                logger.debug("  %s. %s %s (%s)", i + 1, is_preference, place.get('name', 'Unknown'), self.categorize_place(place))
         
         # Create stops with walking times
         stops = []
@@ -954,7 +1140,7 @@ class ItineraryGenerator:
         
         # Start with highest-rated place
         remaining = cluster_places.copy()
-        remaining.sort(key=lambda x: x.get('rating', 0), reverse=True)
+        remaining.sort(key=lambda x: x.get('rating') or 0, reverse=True)
         
         route = [remaining.pop(0)]  # Start with best place
         
@@ -984,7 +1170,7 @@ class ItineraryGenerator:
         selected = [ordered_places[0]]
         remaining = ordered_places[1:]
         
-        print(f"Enforcing minimum {min_walk_meters}m walking distance between {target_stops} stops")
+        logger.debug("Enforcing minimum %sm walking distance between %s stops", min_walk_meters, target_stops)
         
         while len(selected) < target_stops and remaining:
             current_place = selected[-1]
@@ -1005,11 +1191,11 @@ class ItineraryGenerator:
                 remaining.remove(next_place)
                 
                 distance_km = valid_next[0][1] / 1000
-                print(f"  Added: {next_place.get('name', 'Unknown')} ({distance_km:.2f}km walk)")
+                logger.debug("  Added: %s (%.2fkm walk)", next_place.get('name', 'Unknown'), distance_km)
                 
             else:
                 # No valid places remaining at required distance - break to avoid infinite loop
-                print(f"  No more places available at minimum {min_walk_meters}m distance")
+                logger.debug("  No more places available at minimum %sm distance", min_walk_meters)
                 break
         
         # If we couldn't get enough places at the required distance, fill with closest remaining
@@ -1023,18 +1209,18 @@ class ItineraryGenerator:
             remaining.remove(closest)
             
             distance_km = distance_meters / 1000
-            print(f"  Added (relaxed): {closest.get('name', 'Unknown')} ({distance_km:.2f}km walk)")
+            logger.debug("  Added (relaxed): %s (%.2fkm walk)", closest.get('name', 'Unknown'), distance_km)
         
-        print(f"Final selection: {len(selected)} places with enforced walking distances")
+        logger.debug("Final selection: %s places with enforced walking distances", len(selected))
         return selected
     
+    @tracing.traced("generation.bulletproof")
     def generate_bulletproof_custom_itineraries(self, search_results: Dict, location: str, max_distance_miles: float) -> List[Dict]:
         """Fallback method: Generate bulletproof custom itineraries (original logic)"""
         places_by_category = search_results.get('results_by_category', {})
         
-        print(f"🔄 FALLBACK: Bulletproof custom itinerary generation")
-        print(f"Location: {location}")
-        print(f"Max distance: {max_distance_miles} miles")
+        logger.info("🔄 FALLBACK: Bulletproof custom itinerary generation",
+                    location=location, max_distance_miles=max_distance_miles)
         
         # Flatten all places into single list
         all_places = []
@@ -1047,7 +1233,7 @@ class ItineraryGenerator:
                     all_places.append(place)
         
         if len(all_places) < 3:
-            print(f"❌ Not enough places: {len(all_places)} (need minimum 3)")
+            logger.info("❌ Not enough places: %s (need minimum 3)", len(all_places))
             return []
         
         # Create 3 different itineraries
@@ -1059,10 +1245,11 @@ class ItineraryGenerator:
         
         return itineraries
     
+    @tracing.traced("generation.simple_mixed")
     def generate_simple_mixed_custom_itineraries(self, all_places: List[Dict], location: str, 
                                                 user_categories: List[str], max_distance_miles: float) -> List[Dict]:
         """Generate simple mixed itineraries when hotspot clustering fails"""
-        print(f"🔄 Generating simple mixed custom itineraries")
+        logger.info("🔄 Generating simple mixed custom itineraries")
         
         if len(all_places) < 3:
             return []
@@ -1079,7 +1266,7 @@ class ItineraryGenerator:
         for broad_type in places_by_type:
             places_by_type[broad_type].sort(key=lambda x: (
                 -1 if x.get('user_preference', False) else 0,
-                -(x.get('rating', 0))
+                -(x.get('rating') or 0)
             ))
         
         itineraries = []
@@ -1115,7 +1302,7 @@ class ItineraryGenerator:
                 itinerary = self.create_simple_mixed_itinerary(selected_places, location, i)
                 if itinerary:
                     itineraries.append(itinerary)
-                    print(f"✅ Generated simple mixed itinerary {i+1} with {len(selected_places)} places")
+                    logger.debug("✅ Generated simple mixed itinerary %s with %s places", i+1, len(selected_places))
         
         return itineraries
     
@@ -1182,12 +1369,11 @@ class ItineraryGenerator:
         # Sort by distance from origin for logical walking order
         selected_places.sort(key=lambda x: x.get('distance_meters', 0))
         
-        print(f"Selected {len(selected_places)} places:")
-        for i, place in enumerate(selected_places):
-            name = place.get('name', 'Unknown')
-            distance = place.get('distance_miles', 0)
-            category = self.categorize_place(place)
-            print(f"  {i+1}. {name} ({category}) - {distance} miles")
+        logger.debug("Selected %s places:", len(selected_places))
+        if logger.is_enabled(DEBUG):
+            for i, place in enumerate(selected_places):
+                logger.debug("  %s. %s (%s) - %s miles", i + 1, place.get('name', 'Unknown'),
+                             self.categorize_place(place), place.get('distance_miles', 0))
         
         # Create stops directly - NO VALIDATION
         stops = []
@@ -1221,7 +1407,7 @@ class ItineraryGenerator:
             'stops': stops
         }
         
-        print(f"Itinerary duration: {total_duration} minutes")
+        logger.debug("Itinerary duration: %s minutes", total_duration)
         return itinerary
     
     def generate_alternative_category_spot(
@@ -1252,13 +1438,14 @@ class ItineraryGenerator:
         if not search_results:
             # If no search results provided, we can't generate alternatives
             # In a real implementation, this would trigger a new search
-            print(f"No search results provided for alternative category generation")
+            logger.warning("No search results provided for alternative category generation")
             return None
         
         places_by_category = search_results.get('results_by_category', {})
         
         # Get all available places, excluding current category and excluded categories
         all_excluded_categories = set(excluded_categories + [current_category])
+        excluded_keys = normalize_excluded_ids(excluded_spot_ids)
         available_places = []
         
         for category_query, places in places_by_category.items():
@@ -1269,9 +1456,9 @@ class ItineraryGenerator:
                 if place_category in all_excluded_categories:
                     continue
                 
-                # Skip if place ID is in excluded spots (handle None place_id)
-                place_id = place.get('place_id')
-                if place_id and place_id in excluded_spot_ids:
+                # Skip if place is in excluded spots (stop ids or place keys)
+                place_key = get_place_key(place)
+                if place_key and place_key in excluded_keys:
                     continue
                 
                 # Only include places within itinerary radius
@@ -1280,7 +1467,7 @@ class ItineraryGenerator:
                     available_places.append(place)
         
         if not available_places:
-            print(f"No alternative category spots found for location: {location}")
+            logger.info("No alternative category spots found for location: %s", location)
             return None
         
         # Prioritize broad type diversity
@@ -1333,8 +1520,8 @@ class ItineraryGenerator:
         selected_category = self.categorize_place(selected_place)
         selected_broad_type = self.BROAD_TYPE_MAPPING.get(selected_category, 'misc')
         
-        print(f"Generated alternative category spot: {selected_place.get('name')} "
-              f"(Category: {selected_category}, Broad Type: {selected_broad_type})")
+        logger.info("Generated alternative category spot: %s (Category: %s, Broad Type: %s)",
+                    selected_place.get('name'), selected_category, selected_broad_type)
         
         return stop
     
@@ -0,0 +1,286 @@
+"""
+Load driver for the Chalo API.
+
+Sends a weighted mix of requests to /api/itineraries, /api/custom-trips,
+/api/refresh-spot, /api/refresh-category and /api/agent-recommendations
+from concurrent workers, then reports throughput and latency percentiles
+per endpoint. Pair it with fake_upstream.py to load-test without API quota.
+
+Usage:
+    python load_driver.py --base-url http://127.0.0.1:8000 --concurrency 8 --duration 60 \
+        --mix itineraries=4,custom_trips=2,refresh_spot=3,refresh_category=2,agent=1 \
+        --location "Bleeker St, NY" --location "Washington Square Park, NY"
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import argparse
+import json
+import math
+import random
+import threading
+import time
+
+import requests
+
+
+DEFAULT_MIX = "itineraries=4,custom_trips=2,refresh_spot=3,refresh_category=2,agent=1"
+CUSTOM_TRIP_CATEGORIES = ['cafe', 'restaurant', 'park', 'museum', 'art_gallery', 'tourist_attraction']
+AGENT_REQUESTS = [
+    "a relaxed afternoon with coffee and a park",
+    "cheap eats and a museum",
+    "somewhere quiet to read, then dinner",
+]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class Results:
+    """Latencies and outcomes per scenario, shared by the workers."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Structure: {scenario: [(latency_seconds, status_code)]}
+        self.samples: Dict[str, List[Tuple[float, int]]] = {}
+
+    def record(self, scenario: str, latency: float, status: int) -> None:
+        with self._lock:
+            self.samples.setdefault(scenario, []).append((latency, status))
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        """Requests, errors, throughput and latency percentiles (ms) per scenario and overall."""
+        with self._lock:
+            samples = {scenario: list(values) for scenario, values in self.samples.items()}
+        everything = [sample for values in samples.values() for sample in values]
+        report = {name: self._summarize(values, elapsed) for name, values in sorted(samples.items())}
+        report['total'] = self._summarize(everything, elapsed)
+        return report
+
+    @staticmethod
+    def _summarize(values: List[Tuple[float, int]], elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(latency * 1000 for latency, _ in values)
+        errors = sum(1 for _, status in values if status == 0 or status >= 500)
+        statuses: Dict[str, int] = {}
+        for _, status in values:
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+        summary = {
+            'requests': len(values),
+            'errors': errors,
+            'throughput_rps': round(len(values) / elapsed, 2) if elapsed > 0 else None,
+            'statuses': statuses,
+        }
+        for name, fraction in (('p50_ms', 0.5), ('p90_ms', 0.9), ('p95_ms', 0.95), ('p99_ms', 0.99)):
+            value = percentile(latencies, fraction)
+            summary[name] = round(value, 1) if value is not None else None
+        summary['max_ms'] = round(latencies[-1], 1) if latencies else None
+        return summary
+
+
+class LoadDriver:
+    """Runs scenarios against the API from a pool of worker threads."""
+
+    def __init__(self, base_url: str, locations: List[str], mix: Dict[str, float],
+                 timeout_seconds: float = 60.0, max_distance_miles: float = 1.5):
+        self.base_url = base_url.rstrip("/")
+        self.locations = locations
+        self.timeout_seconds = timeout_seconds
+        self.max_distance_miles = max_distance_miles
+        self.results = Results()
+        self._local = threading.local()
+        # Stops seen per location, used by the refresh scenarios
+        self._stops_lock = threading.Lock()
+        self.stops_by_location: Dict[str, List[Dict[str, Any]]] = {}
+
+        scenarios: Dict[str, Callable[[], None]] = {
+            'itineraries': self.itineraries,
+            'custom_trips': self.custom_trips,
+            'refresh_spot': self.refresh_spot,
+            'refresh_category': self.refresh_category,
+            'agent': self.agent_recommendations,
+        }
+        unknown = set(mix) - set(scenarios)
+        if unknown:
+            raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        self.scenarios = [(scenarios[name], weight) for name, weight in mix.items() if weight > 0]
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _post(self, scenario: str, path: str, payload: Dict[str, Any]) -> Optional[Any]:
+        started = time.perf_counter()
+        status = 0
+        try:
+            response = self._session().post(f"{self.base_url}{path}", json=payload, timeout=self.timeout_seconds)
+            status = response.status_code
+            return response.json() if response.ok else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+        finally:
+            self.results.record(scenario, time.perf_counter() - started, status)
+
+    def _remember_stops(self, location: str, data: Optional[Dict[str, Any]]) -> None:
+        if not data:
+            return
+        stops = [stop for itinerary in data.get('itineraries', []) for stop in itinerary.get('stops', [])]
+        if stops:
+            with self._stops_lock:
+                self.stops_by_location[location] = stops
+
+    def itineraries(self) -> None:
+        location = random.choice(self.locations)
+        data = self._post('itineraries', "/api/itineraries",
+                          {'location': location, 'max_distance_miles': self.max_distance_miles})
+        self._remember_stops(location, data)
+
+    def custom_trips(self) -> None:
+        location = random.choice(self.locations)
+        categories = random.sample(CUSTOM_TRIP_CATEGORIES, random.randint(2, 4))
+        self._post('custom_trips', "/api/custom-trips",
+                   {'location': location, 'categories': categories, 'max_distance_miles': self.max_distance_miles})
+
+    def _known_stops(self) -> Tuple[str, List[Dict[str, Any]]]:
+        with self._stops_lock:
+            if not self.stops_by_location:
+                return random.choice(self.locations), []
+            location = random.choice(list(self.stops_by_location))
+            return location, self.stops_by_location[location]
+
+    def refresh_spot(self) -> None:
+        location, stops = self._known_stops()
+        stop = random.choice(stops) if stops else {'category': 'Cafe', 'id': ''}
+        excluded = [s['id'] for s in random.sample(stops, min(3, len(stops)))]
+        self._post('refresh_spot', "/api/refresh-spot",
+                   {'location': location, 'category': stop['category'], 'excluded_ids': excluded})
+
+    def refresh_category(self) -> None:
+        location, stops = self._known_stops()
+        stop = random.choice(stops) if stops else {'category': 'Cafe', 'id': ''}
+        self._post('refresh_category', "/api/refresh-category",
+                   {'location': location, 'current_category': stop['category'],
+                    'excluded_spot_ids': [s['id'] for s in stops]})
+
+    def agent_recommendations(self) -> None:
+        self._post('agent', "/api/agent-recommendations",
+                   {'user_request': random.choice(AGENT_REQUESTS), 'location': random.choice(self.locations),
+                    'distance_miles': self.max_distance_miles})
+
+    def warm_up(self) -> None:
+        """Search every location once so the refresh scenarios have cached results."""
+        for location in self.locations:
+            data = self._post('warmup', "/api/itineraries", {'location': location, 'max_distance_miles': self.max_distance_miles})
+            self._remember_stops(location, data)
+
+    def run(self, concurrency: int, duration_seconds: Optional[float] = None,
+            total_requests: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Run the mix until the duration elapses or total_requests have been sent.
+
+        Returns:
+            The report from Results.report, with the run settings
+        """
+        functions = [function for function, _ in self.scenarios]
+        weights = [weight for _, weight in self.scenarios]
+        stop_at = time.monotonic() + duration_seconds if duration_seconds else None
+        remaining = [total_requests] if total_requests else None
+        remaining_lock = threading.Lock()
+
+        def take_ticket() -> bool:
+            if stop_at is not None and time.monotonic() >= stop_at:
+                return False
+            if remaining is None:
+                return True
+            with remaining_lock:
+                if remaining[0] <= 0:
+                    return False
+                remaining[0] -= 1
+                return True
+
+        def worker() -> None:
+            while take_ticket():
+                random.choices(functions, weights)[0]()
+
+        started = time.monotonic()
+        workers = [threading.Thread(target=worker, name=f"load-{index}", daemon=True) for index in range(concurrency)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        report = self.results.report(elapsed)
+        report.pop('warmup', None)
+        return {'elapsed_seconds': round(elapsed, 2), 'concurrency': concurrency, 'endpoints': report}
+
+    def upstream_totals(self) -> Optional[Dict[str, Any]]:
+        """The server's upstream call totals, if it exposes them."""
+        try:
+            response = self._session().get(f"{self.base_url}/api/upstream/stats", timeout=self.timeout_seconds)
+            return response.json().get('totals') if response.ok else None
+        except (requests.exceptions.RequestException, ValueError):
+            return None
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        if item.strip():
+            name, _, weight = item.partition("=")
+            mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['elapsed_seconds']}s at concurrency {report['concurrency']}")
+    header = f"{'endpoint':<18}{'reqs':>7}{'errs':>6}{'rps':>8}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, summary in report['endpoints'].items():
+        cells = [summary[key] if summary[key] is not None else '-' for key in ('p50_ms', 'p90_ms', 'p95_ms', 'p99_ms', 'max_ms')]
+        print(f"{name:<18}{summary['requests']:>7}{summary['errors']:>6}{summary['throughput_rps'] or 0:>8}"
+              + "".join(f"{cell:>9}" for cell in cells))
+    upstream_calls = report.get('upstream_calls')
+    total = report['endpoints']['total']['requests']
+    if upstream_calls is not None and total:
+        print(f"\nUpstream calls during the run: {upstream_calls} ({upstream_calls / total:.1f} per request)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load driver for the Chalo API")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--location", action="append", help="Location to search (repeatable); default 'Bleeker St, NY'")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--duration", type=float, help="Seconds to run (default 30 unless --requests is given)")
+    parser.add_argument("--requests", type=int, help="Total requests to send")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. itineraries=4,refresh_spot=3")
+    parser.add_argument("--max-distance-miles", type=float, default=1.5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--no-warmup", action="store_true", help="Skip the initial search per location")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    duration = args.duration if args.duration or args.requests else 30.0
+    driver = LoadDriver(args.base_url, args.location or ["Bleeker St, NY"], parse_mix(args.mix),
+                        args.timeout, args.max_distance_miles)
+    if not args.no_warmup:
+        driver.warm_up()
+    before = driver.upstream_totals()
+    report = driver.run(args.concurrency, duration, args.requests)
+    after = driver.upstream_totals()
+    if before and after:
+        report['upstream_calls'] = after['calls'] - before['calls']
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,110 @@ import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.routing import APIRoute
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+import functools
+import hmac
+import inspect
 import os
 import random
 import time
 import json
+import queue
+import re
+import threading
 from dotenv import load_dotenv
 
-from new_engine import ChaloSearchEngine
+from new_engine import ChaloSearchEngine, CHALO_CATEGORIES, SEARCH_DEADLINE_SECONDS, SearchOverloaded
 from itinerary_generator import ItineraryGenerator
 from category_exclusion_manager import CategoryExclusionManager
-from AI_engine import ask_yelp_ai, transform_yelp_ai_response, UserContext
+from place_identity import normalize_excluded_ids, is_excluded
+from cache_backends import create_cache
+import cassettes
+import metrics
+import search_planner
+import profiling
+import structured_logging
+import tracing
+import upstream
+from AI_engine import (ask_yelp_ai, ask_yelp_ai_transformed, geohash, transform_yelp_ai_response, UserContext,
+                       YelpAIError, YELP_AI_CACHE_GEOHASH_PRECISION)
+from agent_sessions import (AgentSessionManager, merge_turn, AGENT_SESSION_MAX_BYTES, AGENT_SESSION_MAX_ENTRIES,
+                            AGENT_SESSION_TTL_SECONDS)
 
 # Load environment variables
 load_dotenv()
 
+logger = structured_logging.get_logger("main")
+
+class TracedRoute(APIRoute):
+    """
+    Route that, for traced requests, records the endpoint call and the
+    response serialisation that follows it as separate spans, and that
+    profiles blocking endpoints when the request profiler asks for it.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, self._trace_endpoint(endpoint, path), **kwargs)
+
+    @staticmethod
+    def _trace_endpoint(endpoint, path: str):
+        if not inspect.iscoroutinefunction(endpoint):
+            profiled = path.startswith("/api/") and not path.startswith("/api/admin/")
+
+            # Blocking endpoints run in the threadpool, in a copy of the request's context;
+            # a span set there can't reach the handler, so they get no serialize span.
+            # cProfile is enabled on this worker thread only, so requests handled at the
+            # same time on the event loop or other workers stay out of the profile.
+            @functools.wraps(endpoint)
+            def traced_sync_endpoint(*args, **kwargs):
+                profile = profiling.request_profiler.start(path) if profiled else None
+                try:
+                    if tracing.current_trace() is None:
+                        return endpoint(*args, **kwargs)
+                    with tracing.span(f"endpoint.{endpoint.__name__}"):
+                        return endpoint(*args, **kwargs)
+                finally:
+                    if profile:
+                        profiling.request_profiler.finish(profile, path)
+            return traced_sync_endpoint
+
+        @functools.wraps(endpoint)
+        async def traced_endpoint(*args, **kwargs):
+            if tracing.current_trace() is None:
+                return await endpoint(*args, **kwargs)
+            with tracing.span(f"endpoint.{endpoint.__name__}"):
+                result = await endpoint(*args, **kwargs)
+            # Closed by the route handler once FastAPI has validated and encoded the result
+            _serialize_span.set(tracing.start_span("serialize"))
+            return result
+        return traced_endpoint
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def traced_handler(request: Request):
+            if tracing.current_trace() is None:
+                return await handler(request)
+            token = _serialize_span.set(None)
+            try:
+                return await handler(request)
+            finally:
+                serialize = _serialize_span.get()
+                if serialize:
+                    serialize.finish()
+                _serialize_span.reset(token)
+        return traced_handler
+
+_serialize_span: ContextVar = ContextVar("serialize_span", default=None)
+
 app = FastAPI(title="Chalo API", version="1.0.0")
+app.router.route_class = TracedRoute
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -31,20 +116,136 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+_route_paths = None
+
+def _endpoint_label(path: str) -> str:
+    """Metric label for a request path; unknown paths share one label to bound cardinality"""
+    global _route_paths
+    if _route_paths is None:
+        _route_paths = {route.path for route in app.routes if hasattr(route, "path")}
+    return path if path in _route_paths else "other"
+
+@app.middleware("http")
+async def track_requests(request: Request, call_next):
+    """Record request latency and in-flight count, and attribute upstream API calls to the endpoint and request id"""
+    if not request.url.path.startswith("/api/"):
+        return await call_next(request)
+    endpoint = _endpoint_label(request.url.path)
+    context = upstream.begin_request(endpoint, request.headers.get("x-request-id"))
+    structured_logging.bind_fields(request_id=context.request_id, endpoint=endpoint)
+    trace = None
+    if tracing.should_trace(request.headers.get(tracing.TRACE_HEADER)):
+        trace = tracing.start_trace(f"{request.method} {endpoint}", context.request_id)
+    metrics.http_in_flight.inc(endpoint=endpoint)
+    started = time.perf_counter()
+    status = "500"
+    try:
+        with tracing.span("request", endpoint=endpoint, method=request.method) as request_span:
+            response = await call_next(request)
+            status = str(response.status_code)
+            if request_span:
+                request_span.set(status=response.status_code)
+    finally:
+        metrics.http_in_flight.dec(endpoint=endpoint)
+        metrics.http_request_latency.observe(time.perf_counter() - started,
+                                             endpoint=endpoint, method=request.method, status=status)
+    response.headers["X-Request-ID"] = context.request_id
+    if trace:
+        response.headers["X-Trace-ID"] = trace.trace_id
+    if upstream.LOG_PER_REQUEST and context.calls:
+        context.log_summary()
+    return response
+
 # Initialize search engine and itinerary generator
 # Read Google Maps API key from environment
 API_KEY = os.getenv("GOOGLE_PLACES_API_KEY", "")
 
 search_engine = ChaloSearchEngine(API_KEY)
 itinerary_generator = ItineraryGenerator()
-category_exclusion_manager = CategoryExclusionManager()
 
-# Global cache for search results to enable refresh functionality
-search_results_cache = {}
+# Bounded cache for search results to enable refresh functionality.
+# CHALO_CACHE_BACKEND=sqlite|redis shares it (and refresh sessions) across workers.
+search_results_cache = create_cache(
+    "search_results",
+    max_entries=int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "64")),
+    max_bytes=int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("SEARCH_CACHE_TTL_SECONDS", "3600")),
+)
+session_store = create_cache(
+    "sessions",
+    max_entries=int(os.getenv("SESSION_STORE_MAX_ENTRIES", "1024")),
+    max_bytes=int(os.getenv("SESSION_STORE_MAX_BYTES", str(4 * 1024 * 1024))),
+    ttl_seconds=float(os.getenv("SESSION_STORE_TTL_SECONDS", "86400")),
+)
+# Transformed Yelp AI chat responses for repeated prompts from the same area (TTL 0 disables)
+YELP_AI_CACHE_TTL_SECONDS = float(os.getenv("YELP_AI_CACHE_TTL_SECONDS", "900"))
+yelp_ai_cache = create_cache(
+    "yelp_ai",
+    max_entries=int(os.getenv("YELP_AI_CACHE_MAX_ENTRIES", "256")),
+    max_bytes=int(os.getenv("YELP_AI_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    ttl_seconds=YELP_AI_CACHE_TTL_SECONDS,
+) if YELP_AI_CACHE_TTL_SECONDS > 0 else None
+# Multi-turn agent conversations: Yelp chat_id and the latest structured results per session
+agent_session_store = create_cache(
+    "agent_sessions",
+    max_entries=AGENT_SESSION_MAX_ENTRIES,
+    max_bytes=AGENT_SESSION_MAX_BYTES,
+    ttl_seconds=AGENT_SESSION_TTL_SECONDS,
+)
+agent_sessions = AgentSessionManager(agent_session_store)
+category_exclusion_manager = CategoryExclusionManager(store=session_store)
+metrics.registry.register_collector(metrics.cache_collector({
+    "search_results": search_results_cache,
+    "sessions": session_store,
+    "agent_sessions": agent_session_store,
+    **({"yelp_ai": yelp_ai_cache} if yelp_ai_cache is not None else {}),
+}))
+
+def cache_when_complete(*cache_keys: str):
+    """Callback that stores background-completed search results under the given keys"""
+    def store(full_results: Dict):
+        for cache_key in cache_keys:
+            search_results_cache.set(cache_key, full_results)
+        logger.info("Background search finished, cached full results", cache_keys=", ".join(cache_keys))
+    return store
+
+def itinerary_cache_key(location: str, max_distance_miles: float, preset: Optional[str] = None,
+                        max_price_level: Optional[str] = None) -> str:
+    """Cache key for /api/itineraries results; preset and price-band searches hold only part of the area"""
+    cache_key = f"{location}_{max_distance_miles}"
+    if preset:
+        cache_key += f"_{preset}"
+    if itinerary_generator.max_price_for_band(max_price_level) is not None:
+        cache_key += f"_price<={max_price_level}"
+    return cache_key
+
+def search_overloaded_error(error: SearchOverloaded) -> HTTPException:
+    """503 for a search the shared search pool refused; clients should retry shortly"""
+    logger.warning("Search refused by the search pool: %s", error)
+    return HTTPException(status_code=503, detail="Search is busy right now. Please try again in a moment.",
+                         headers={"Retry-After": "2"})
+
+def preset_search_plan(preset: Optional[str]) -> Optional[List[str]]:
+    """Categories to search for a preset (None means all), or a 400 for an unknown preset"""
+    try:
+        return itinerary_generator.categories_for_preset(preset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Custom trip category IDs to search queries
+CUSTOM_TRIP_CATEGORY_QUERIES = {
+    'cafe': 'cafes and bakeries near me',
+    'restaurant': 'restaurants near me',
+    'park': 'parks near me',
+    'museum': 'museums near me',
+    'art_gallery': 'galleries near me',
+    'tourist_attraction': 'tourist attractions near me'
+}
 
 # Data models
 class Stop(BaseModel):
     id: str
+    place_id: Optional[str] = None  # Stable place identity (Google place_id or fallback hash)
     name: str
     category: str
     walking_time_minutes: int
@@ -64,6 +265,8 @@ class GroundingChunk(BaseModel):
 class ItineraryResponse(BaseModel):
     itineraries: List[Itinerary]
     sources: List[GroundingChunk]
+    partial: bool = False  # True when some categories missed the search deadline
+    pending_categories: List[str] = []
 
 class LocationRequest(BaseModel):
     location: str
@@ -164,6 +367,7 @@ class AIDayPlan(BaseModel):
 
 class AIEngineChatResponse(BaseModel):
     chat_id: Optional[str] = None
+    session_id: Optional[str] = None
     text: Optional[str] = None
     businesses: List[AIEngineBusiness]
     plan: Optional[AIDayPlan] = None
@@ -174,6 +378,8 @@ class AgentRequest(BaseModel):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
     distance_miles: Optional[float] = 1.5
+    # Continue an earlier conversation (the session_id of its last response)
+    session_id: Optional[str] = None
 
 @app.get("/")
 async def root():
@@ -184,7 +390,7 @@ async def root():
     }
 
 @app.post("/api/itineraries", response_model=ItineraryResponse)
-async def get_itineraries(request: LocationRequest):
+def get_itineraries(request: LocationRequest):
     """
     Generate itineraries for a given location using Chalo search engine.
     Supports both mixed (default) and preset category searches with price and distance filters.
@@ -197,6 +403,7 @@ async def get_itineraries(request: LocationRequest):
         preset = request.preset
         max_price_level = request.max_price_level
         max_distance_miles = request.max_distance_miles or 1.5
+        preset_categories = preset_search_plan(preset)
         
         if preset:
             print(f"Generating {preset} itineraries for: {location}")
@@ -208,18 +415,27 @@ async def get_itineraries(request: LocationRequest):
         # CACHING DISABLED FOR TESTING - Always perform fresh search
 
         
-        # Always search fresh (no cache check)
-        search_results = search_engine.search_all_categories(location, max_distance_miles)
+        # Always search fresh (no cache check); slow categories finish in the background
+        cache_key = itinerary_cache_key(location, max_distance_miles, preset, max_price_level)
+        with metrics.time_stage("search"), tracing.span("search", preset=preset):
+            search_results = search_engine.search_all_categories(
+                location, max_distance_miles,
+                deadline_seconds=SEARCH_DEADLINE_SECONDS,
+                on_background_complete=cache_when_complete(cache_key, location),
+                categories=preset_categories,
+                max_price=itinerary_generator.max_price_for_band(max_price_level),
+                fetch_budget=search_planner.plan_fetch_budget(preset_categories or CHALO_CATEGORIES, itinerary_count=5)
+            )
         
         # Cache results for refresh functionality (but we don't read from cache first)
-        cache_key = f"{location}_{max_distance_miles}"
-        search_results_cache[cache_key] = search_results
-        search_results_cache[location] = search_results
+        search_results_cache.set(cache_key, search_results)
+        search_results_cache.set(location, search_results)
         
         # Generate itineraries from search results with filters
-        itineraries = itinerary_generator.generate_itineraries(
-            search_results, location, preset, max_price_level, max_distance_miles
-        )
+        with metrics.time_stage("generation"), tracing.span("generation"):
+            itineraries = itinerary_generator.generate_itineraries(
+                search_results, location, preset, max_price_level, max_distance_miles
+            )
         
         if not itineraries:
             error_msg = f"Could not find enough places to create itineraries for '{location}'"
@@ -238,13 +454,18 @@ async def get_itineraries(request: LocationRequest):
         search_type = f"{preset} " if preset else "mixed "
         print(f"Generated {len(itineraries)} {search_type}itineraries with {len(sources)} sources")
         
+        search_metadata = search_results.get('search_metadata', {})
         return ItineraryResponse(
             itineraries=itineraries,
-            sources=sources
+            sources=sources,
+            partial=search_metadata.get('partial', False),
+            pending_categories=search_metadata.get('pending_categories', [])
         )
         
     except HTTPException:
         raise
+    except SearchOverloaded as e:
+        raise search_overloaded_error(e)
     except Exception as e:
         print(f"Error generating itineraries: {e}")
         raise HTTPException(
@@ -253,7 +474,7 @@ async def get_itineraries(request: LocationRequest):
         )
 
 @app.post("/api/refresh-spot")
-async def refresh_spot(request: RefreshSpotRequest):
+def refresh_spot(request: RefreshSpotRequest):
     """
     Replace a specific spot in an itinerary with a new alternative using cached results
     """
@@ -264,20 +485,21 @@ async def refresh_spot(request: RefreshSpotRequest):
         print(f"Refreshing spot: {category} in {location}")
         
         # Use cached search results if available
-        if location not in search_results_cache:
+        search_results = search_results_cache.get(location)
+        if search_results is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"No cached results found for {location}. Please search for itineraries first."
             )
         
-        search_results = search_results_cache[location]
+        excluded_keys = normalize_excluded_ids(request.excluded_ids)
         
         # Find places that match the category from cached results
         all_places = []
         for category_results in search_results.get('results_by_category', {}).values():
             for place in category_results:
                 # Skip places we've already seen
-                if place.get('place_id') in request.excluded_ids:
+                if is_excluded(place, excluded_keys):
                     continue
                     
                 # Check if this place matches the requested category
@@ -314,7 +536,7 @@ async def refresh_spot(request: RefreshSpotRequest):
         )
 
 @app.post("/api/refresh-category")
-async def refresh_category(request: RefreshCategoryRequest):
+def refresh_category(request: RefreshCategoryRequest):
     """
     Replace a spot with an alternative from a different category using exclusion logic
     """
@@ -342,14 +564,13 @@ async def refresh_category(request: RefreshCategoryRequest):
         print(f"Refreshing category from '{current_category}' in {location}")
         
         # Check if we have cached search results for this location
-        if location not in search_results_cache:
+        search_results = search_results_cache.get(location)
+        if search_results is None:
             raise HTTPException(
                 status_code=404,
                 detail=f"No cached results found for {location}. Please search for itineraries first."
             )
         
-        search_results = search_results_cache[location]
-        
         # Exclude the current category from future recommendations
         category_exclusion_manager.exclude_category(location, current_category)
         
@@ -374,11 +595,12 @@ async def refresh_category(request: RefreshCategoryRequest):
             )
         
         # Find places from alternative categories
+        excluded_keys = normalize_excluded_ids(excluded_spot_ids)
         alternative_places = []
         for category_results in search_results.get('results_by_category', {}).values():
             for place in category_results:
                 # Skip places we've already seen
-                if place.get('place_id') in excluded_spot_ids:
+                if is_excluded(place, excluded_keys):
                     continue
                 
                 place_category = itinerary_generator.categorize_place(place)
@@ -418,205 +640,284 @@ async def refresh_category(request: RefreshCategoryRequest):
             detail="An error occurred while refreshing the category."
         )
 
-@app.post("/api/agent-recommendations", response_model=AIEngineChatResponse)
-async def get_agent_recommendations(request: AgentRequest):
+def _resolve_agent_context(request: AgentRequest):
     """
-    AI search powered by Yelp AI Chat v2.
+    UserContext for an agent request: explicit lat/lng, else the geocoded location string.
 
-    Accepts a natural language query and optional location (as a string) or coordinates.
-    Returns chat text and a normalized list of businesses.
+    Returns:
+        (user_context, resolved_location)
     """
-    try:
-        # Validate input
-        if not request.user_request or len(request.user_request.strip()) < 3:
-            raise HTTPException(status_code=400, detail="User request must be at least 3 characters long")
+    latitude = request.latitude
+    longitude = request.longitude
+    resolved_location = (request.location or "").strip() if request.location else None
 
-        # Resolve coordinates: prefer explicit lat/lng; else geocode location string if provided
-        latitude = request.latitude
-        longitude = request.longitude
-        resolved_location = (request.location or "").strip() if request.location else None
+    if (latitude is None or longitude is None) and resolved_location:
+        try:
+            geocode_url = (
+                f"https://maps.googleapis.com/maps/api/geocode/json?address={resolved_location}&key={API_KEY}"
+            )
+            geocode_resp = upstream.get(upstream.GEOCODING, geocode_url, timeout=10)
+            if geocode_resp.ok:
+                geo_data = geocode_resp.json()
+                results = geo_data.get("results", [])
+                if results:
+                    loc = results[0].get("geometry", {}).get("location", {})
+                    latitude = latitude or loc.get("lat")
+                    longitude = longitude or loc.get("lng")
+        except Exception:
+            # Non-fatal: continue without coordinates
+            pass
 
-        if (latitude is None or longitude is None) and resolved_location:
-            try:
-                import requests as _req
-                geocode_url = (
-                    f"https://maps.googleapis.com/maps/api/geocode/json?address={resolved_location}&key={API_KEY}"
-                )
-                geocode_resp = _req.get(geocode_url, timeout=10)
-                if geocode_resp.ok:
-                    geo_data = geocode_resp.json()
-                    results = geo_data.get("results", [])
-                    if results:
-                        loc = results[0].get("geometry", {}).get("location", {})
-                        latitude = latitude or loc.get("lat")
-                        longitude = longitude or loc.get("lng")
-            except Exception:
-                # Non-fatal: continue without coordinates
-                pass
-
-        user_context = UserContext(
-            locale="en_US",
-            latitude=latitude,
-            longitude=longitude,
-        )
+    user_context = UserContext(
+        locale="en_US",
+        latitude=latitude,
+        longitude=longitude,
+    )
+    return user_context, resolved_location
 
-        print(
-            f"AI Engine Request: '{request.user_request.strip()}', "
-            f"coords=({user_context.latitude},{user_context.longitude}), location='{resolved_location or ''}'"
-        )
+def _compose_agent_query(request: AgentRequest, resolved_location: Optional[str],
+                         earlier_requests: Optional[List[str]] = None) -> str:
+    """
+    The user's request (after any earlier requests of the conversation) plus a
+    plan-seeking instruction, so the AI can return a structured day plan JSON
+    """
+    base_query = "\n".join((earlier_requests or []) + [request.user_request.strip()])
+    miles_txt = f"within ~{request.distance_miles or 1.5} miles"
+    loc_txt = f" around {resolved_location}" if resolved_location else " nearby"
+    plan_instruction = (
+        "\n\nPlease propose a single cohesive local day plan "
+        f"{miles_txt}{loc_txt}. Provide both a short natural-language summary and, if possible, "
+        "a machine-readable JSON object named plan with this shape:"
+        " {title, summary, total_duration_minutes, total_stops, start_time, end_time, map_url, tips[], "
+        "budget, transportation, weather_note, stops:[{time, name, category, notes, address, image_url, duration_minutes}]}. "
+        "Return the JSON inside a single fenced code block labeled json."
+    )
+    return base_query + plan_instruction
 
-        # Craft a plan-seeking prompt so the AI can optionally return a structured day plan JSON
-        base_query = request.user_request.strip()
-        miles_txt = f"within ~{request.distance_miles or 1.5} miles"
-        loc_txt = f" around {resolved_location}" if resolved_location else " nearby"
-        plan_instruction = (
-            "\n\nPlease propose a single cohesive local day plan "
-            f"{miles_txt}{loc_txt}. Provide both a short natural-language summary and, if possible, "
-            "a machine-readable JSON object named plan with this shape:"
-            " {title, summary, total_duration_minutes, total_stops, start_time, end_time, map_url, tips[], "
-            "budget, transportation, weather_note, stops:[{time, name, category, notes, address, image_url, duration_minutes}]}. "
-            "Return the JSON inside a single fenced code block labeled json."
-        )
-        composed_query = base_query + plan_instruction
+def _continues_session(request: AgentRequest, session: dict) -> bool:
+    """
+    Whether a request stays where its session's conversation is anchored: the
+    same location and, for coordinates, the same geohash cell the Yelp AI
+    answer cache uses, so GPS jitter between turns does not restart it.
+    """
+    location = (request.location or "").strip() or None
+    if location and location != session.get("location"):
+        return False
+    if request.latitude is not None and request.longitude is not None:
+        if session.get("latitude") is None or session.get("longitude") is None:
+            return False
+        precision = YELP_AI_CACHE_GEOHASH_PRECISION
+        return (geohash(request.latitude, request.longitude, precision)
+                == geohash(session["latitude"], session["longitude"], precision))
+    return True
 
-        # Call Yelp AI with increased timeout and a single retry. On failure, fallback to local sample.
-        raw = ask_yelp_ai(composed_query, user_context)
-        transformed = transform_yelp_ai_response(raw)
+def _ask_agent(request: AgentRequest) -> Tuple[dict, str]:
+    """
+    Ask Yelp AI and record the turn in the request's agent session.
 
-        # Ensure shape matches Pydantic model
-        businesses_payload: list[AIEngineBusiness] = []
-        for b in transformed.get("businesses", []):
-            businesses_payload.append(
-                AIEngineBusiness(
-                    id=b.get("id"),
-                    alias=b.get("alias"),
-                    name=b.get("name"),
-                    url=b.get("url"),
-                    image_url=b.get("image_url"),
-                    photos=b.get("photos"),
-                    phoos=b.get("phoos"),
-                    location=AIEngineBusinessLocation(**(b.get("location") or {})),
-                    coordinates=AIEngineCoordinates(**(b.get("coordinates") or {})),
-                    review_count=b.get("review_count"),
-                    price=b.get("price"),
-                    rating=b.get("rating"),
-                    AboutThisBizBio=b.get("AboutThisBizBio"),
-                    AboutThisBizHistory=b.get("AboutThisBizHistory"),
-                    AboutThisBizSpecialties=b.get("AboutThisBizSpecialties"),
-                    AboutThisBizYearEstablished=b.get("AboutThisBizYearEstablished"),
-                )
+    A follow-up in the same area continues the session's Yelp conversation with
+    just the new request. Otherwise (a new conversation, a cached first answer
+    without a chat_id, a moved location, or a conversation Yelp no longer knows)
+    the full prompt is sent, through the answer cache.
+
+    Returns:
+        (transformed answer, session id)
+    """
+    session = agent_sessions.load(request.session_id)
+    continues = session is not None and _continues_session(request, session)
+    if continues:
+        user_context = UserContext(locale="en_US", latitude=session.get("latitude"), longitude=session.get("longitude"))
+        resolved_location = session.get("location")
+    else:
+        user_context, resolved_location = _resolve_agent_context(request)
+    distance_miles = request.distance_miles or 1.5
+
+    logger.info("AI Engine request: '%s'", request.user_request.strip(),
+                latitude=user_context.latitude, longitude=user_context.longitude,
+                location=resolved_location or "",
+                **({"session": request.session_id, "turn": session.get("turns", 0) + 1} if session else {}))
+
+    transformed = None
+    if continues and session.get("chat_id"):
+        follow_up = request.user_request.strip()
+        if distance_miles != session.get("distance_miles"):
+            follow_up += f"\n\nKeep it within ~{distance_miles} miles."
+        try:
+            transformed = transform_yelp_ai_response(
+                ask_yelp_ai(follow_up, user_context, chat_id=session["chat_id"])
             )
+            transformed["chat_id"] = transformed.get("chat_id") or session["chat_id"]
+            metrics.agent_session_turns.inc(turn="follow_up")
+        except YelpAIError:
+            logger.warning("Yelp AI follow-up failed, restarting the conversation",
+                           session=request.session_id, chat_id=session["chat_id"], exc_info=True)
 
-        plan_payload = None
-        plans_payload: list[AIDayPlan] = []
-        if isinstance(transformed.get("plan"), dict):
-            plan_dict = transformed.get("plan") or {}
-            try:
-                # Coerce stops
-                stops_payload: list[AIDayPlanStop] = []
-                for s in plan_dict.get("stops", []) or []:
-                    stops_payload.append(AIDayPlanStop(**s))
-                plan_payload = AIDayPlan(
-                    id=plan_dict.get("id"),
-                    title=plan_dict.get("title") or "AI Day Plan",
-                    summary=plan_dict.get("summary"),
-                    total_duration_minutes=plan_dict.get("total_duration_minutes"),
-                    total_stops=plan_dict.get("total_stops"),
-                    start_time=plan_dict.get("start_time"),
-                    end_time=plan_dict.get("end_time"),
-                    map_url=plan_dict.get("map_url"),
-                    tips=plan_dict.get("tips"),
-                    budget=plan_dict.get("budget"),
-                    transportation=plan_dict.get("transportation"),
-                    weather_note=plan_dict.get("weather_note"),
-                    stops=stops_payload,
-                    additional_info=plan_dict.get("additional_info"),
-                )
-            except Exception:
-                plan_payload = None
-
-        if isinstance(transformed.get("plans"), list):
-            for p in transformed.get("plans") or []:
-                if isinstance(p, dict):
-                    try:
-                        stops_payload: list[AIDayPlanStop] = []
-                        for s in p.get("stops", []) or []:
-                            stops_payload.append(AIDayPlanStop(**s))
-                        plans_payload.append(
-                            AIDayPlan(
-                                id=p.get("id"),
-                                title=p.get("title") or "AI Day Plan",
-                                summary=p.get("summary"),
-                                total_duration_minutes=p.get("total_duration_minutes"),
-                                total_stops=p.get("total_stops"),
-                                start_time=p.get("start_time"),
-                                end_time=p.get("end_time"),
-                                map_url=p.get("map_url"),
-                                tips=p.get("tips"),
-                                budget=p.get("budget"),
-                                transportation=p.get("transportation"),
-                                weather_note=p.get("weather_note"),
-                                stops=stops_payload,
-                                additional_info=p.get("additional_info"),
-                            )
-                        )
-                    except Exception:
-                        pass
-
-        # Fallback: synthesize a minimal plan from businesses if no plan provided and no multiple plans
-        if plan_payload is None and not plans_payload and businesses_payload:
-            try:
-                print("Synthesizing AIDayPlan from businesses…")
-                # Build minimal stops (name, address, image)
-                stops_payload: list[AIDayPlanStop] = []
-                for b in businesses_payload[:6]:
-                    stops_payload.append(
-                        AIDayPlanStop(
-                            name=b.name or "Spot",
-                            category=None,
-                            notes=None,
-                            address=(b.location.formatted_address if b.location else None),
-                            image_url=b.image_url,
-                            duration_minutes=None,
-                        )
+    if transformed is None:
+        composed_query = _compose_agent_query(request, resolved_location, (session or {}).get("requests"))
+        transformed, cache_hit = ask_yelp_ai_transformed(composed_query, user_context, yelp_ai_cache)
+        if cache_hit:
+            logger.info("Yelp AI answer served from cache")
+        metrics.agent_session_turns.inc(turn="restarted" if session else "first")
+
+    if continues:
+        transformed = merge_turn(session.get("result"), transformed)
+    session_id = agent_sessions.record_turn(
+        request.session_id, session, request.user_request.strip(), transformed, transformed.get("chat_id"),
+        {"location": resolved_location, "latitude": user_context.latitude,
+         "longitude": user_context.longitude, "distance_miles": distance_miles}
+    )
+    return transformed, session_id
+
+def _agent_businesses_payload(transformed: dict) -> List[AIEngineBusiness]:
+    """Businesses of a transformed Yelp AI answer, shaped as the Pydantic model"""
+    businesses_payload: list[AIEngineBusiness] = []
+    for b in transformed.get("businesses", []):
+        businesses_payload.append(
+            AIEngineBusiness(
+                id=b.get("id"),
+                alias=b.get("alias"),
+                name=b.get("name"),
+                url=b.get("url"),
+                image_url=b.get("image_url"),
+                photos=b.get("photos"),
+                phoos=b.get("phoos"),
+                location=AIEngineBusinessLocation(**(b.get("location") or {})),
+                coordinates=AIEngineCoordinates(**(b.get("coordinates") or {})),
+                review_count=b.get("review_count"),
+                price=b.get("price"),
+                rating=b.get("rating"),
+                AboutThisBizBio=b.get("AboutThisBizBio"),
+                AboutThisBizHistory=b.get("AboutThisBizHistory"),
+                AboutThisBizSpecialties=b.get("AboutThisBizSpecialties"),
+                AboutThisBizYearEstablished=b.get("AboutThisBizYearEstablished"),
+            )
+        )
+    return businesses_payload
+
+def _agent_day_plan(plan_dict: dict) -> AIDayPlan:
+    """A normalized plan dict as the Pydantic model; raises if a stop doesn't validate"""
+    stops_payload: list[AIDayPlanStop] = []
+    for s in plan_dict.get("stops", []) or []:
+        stops_payload.append(AIDayPlanStop(**s))
+    return AIDayPlan(
+        id=plan_dict.get("id"),
+        title=plan_dict.get("title") or "AI Day Plan",
+        summary=plan_dict.get("summary"),
+        total_duration_minutes=plan_dict.get("total_duration_minutes"),
+        total_stops=plan_dict.get("total_stops"),
+        start_time=plan_dict.get("start_time"),
+        end_time=plan_dict.get("end_time"),
+        map_url=plan_dict.get("map_url"),
+        tips=plan_dict.get("tips"),
+        budget=plan_dict.get("budget"),
+        transportation=plan_dict.get("transportation"),
+        weather_note=plan_dict.get("weather_note"),
+        stops=stops_payload,
+        additional_info=plan_dict.get("additional_info"),
+    )
+
+def _agent_plans_payload(request: AgentRequest, transformed: dict, businesses_payload: List[AIEngineBusiness]):
+    """
+    The plan and alternative plans of a transformed Yelp AI answer. Without
+    either, a minimal plan is synthesized from the businesses.
+
+    Returns:
+        (plan or None, list of plans)
+    """
+    plan_payload = None
+    plans_payload: list[AIDayPlan] = []
+    if isinstance(transformed.get("plan"), dict):
+        try:
+            plan_payload = _agent_day_plan(transformed.get("plan") or {})
+        except Exception:
+            plan_payload = None
+
+    if isinstance(transformed.get("plans"), list):
+        for p in transformed.get("plans") or []:
+            if isinstance(p, dict):
+                try:
+                    plans_payload.append(_agent_day_plan(p))
+                except Exception:
+                    pass
+
+    # Fallback: synthesize a minimal plan from businesses if no plan provided and no multiple plans
+    if plan_payload is None and not plans_payload and businesses_payload:
+        try:
+            logger.debug("Synthesizing AIDayPlan from %d businesses", len(businesses_payload))
+            # Build minimal stops (name, address, image)
+            stops_payload: list[AIDayPlanStop] = []
+            for b in businesses_payload[:6]:
+                stops_payload.append(
+                    AIDayPlanStop(
+                        name=b.name or "Spot",
+                        category=None,
+                        notes=None,
+                        address=(b.location.formatted_address if b.location else None),
+                        image_url=b.image_url,
+                        duration_minutes=None,
                     )
-                synthesized_title = (
-                    (request.user_request[:80] + ("…" if len(request.user_request) > 80 else "")).strip()
-                ) or "AI Day Plan"
-                plan_payload = AIDayPlan(
-                    title=synthesized_title,
-                    summary=transformed.get("text"),
-                    total_duration_minutes=None,
-                    total_stops=len(stops_payload),
-                    start_time=None,
-                    end_time=None,
-                    map_url=None,
-                    tips=None,
-                    budget=None,
-                    transportation=None,
-                    weather_note=None,
-                    stops=stops_payload,
-                    additional_info={"synthesized_from_businesses": True},
                 )
-                print("Synthesized plan with", len(stops_payload), "stops")
-            except Exception as synth_err:
-                print("Failed to synthesize plan:", synth_err)
-                plan_payload = None
+            synthesized_title = (
+                (request.user_request[:80] + ("…" if len(request.user_request) > 80 else "")).strip()
+            ) or "AI Day Plan"
+            plan_payload = AIDayPlan(
+                title=synthesized_title,
+                summary=transformed.get("text"),
+                total_duration_minutes=None,
+                total_stops=len(stops_payload),
+                start_time=None,
+                end_time=None,
+                map_url=None,
+                tips=None,
+                budget=None,
+                transportation=None,
+                weather_note=None,
+                stops=stops_payload,
+                additional_info={"synthesized_from_businesses": True},
+            )
+            logger.debug("Synthesized plan with %d stops", len(stops_payload))
+        except Exception:
+            logger.warning("Failed to synthesize a plan from businesses", exc_info=True)
+            plan_payload = None
+
+    return plan_payload, plans_payload
+
+def _validate_agent_request(request: AgentRequest) -> None:
+    if not request.user_request or len(request.user_request.strip()) < 3:
+        raise HTTPException(status_code=400, detail="User request must be at least 3 characters long")
+
+@app.post("/api/agent-recommendations", response_model=AIEngineChatResponse)
+def get_agent_recommendations(request: AgentRequest):
+    """
+    AI search powered by Yelp AI Chat v2.
+
+    Accepts a natural language query and optional location (as a string) or coordinates.
+    Returns chat text and a normalized list of businesses.
+    Send the returned session_id with a follow-up to refine the same conversation.
+    """
+    try:
+        _validate_agent_request(request)
+
+        # Call Yelp AI with increased timeout and a single retry. On failure, fallback to local sample.
+        transformed, session_id = _ask_agent(request)
+
+        # Ensure shape matches Pydantic model
+        businesses_payload = _agent_businesses_payload(transformed)
+        plan_payload, plans_payload = _agent_plans_payload(request, transformed, businesses_payload)
 
         return AIEngineChatResponse(
             chat_id=transformed.get("chat_id"),
+            session_id=session_id,
             text=transformed.get("text"),
             businesses=businesses_payload,
             plan=plan_payload,
             plans=plans_payload or None,
         )
 
-        
-
     except HTTPException:
         raise
-    except Exception as e:
-        print(f"AI Engine API Error: {e}")
+    except Exception:
+        logger.exception("AI Engine API error")
         raise HTTPException(
             status_code=500,
             detail="An error occurred while processing your request. Please try again."
@@ -638,6 +939,236 @@ async def health_check():
         "timestamp": "2025-01-23T12:00:00Z"
     }
 
+# ADMIN ENDPOINTS: disabled unless ADMIN_TOKEN is set; callers send it as X-Admin-Token
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Reject the request unless it carries the admin token"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+# The cached keys are the locations users searched, and clearing drops every user's refresh state
+@app.get("/api/cache/stats", dependencies=[Depends(require_admin)])
+def get_cache_stats():
+    """Search results cache size, memory budget, hit ratio and evictions"""
+    search_results_cache.purge_expired()
+    return {
+        "search_results_cache": search_results_cache.stats(),
+        "session_store": session_store.stats(),
+        "entries": search_results_cache.keys_info()
+    }
+
+@app.post("/api/cache/clear", dependencies=[Depends(require_admin)])
+def clear_cache():
+    """Drop every cached search result"""
+    search_results_cache.clear()
+    return {
+        "status": "success",
+        "search_results_cache": search_results_cache.stats()
+    }
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus text exposition: per-stage latency histograms, request latency,
+    in-flight requests, rate-limiter wait time and cache hit ratios
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/traces", dependencies=[Depends(require_admin)])
+async def list_traces():
+    """
+    Recently recorded traces (send X-Chalo-Trace: 1 or set TRACE_SAMPLE_RATE to record)
+    """
+    return {"traces": tracing.recent_traces()}
+
+@app.get("/api/traces/{trace_id}", dependencies=[Depends(require_admin)])
+async def get_trace(trace_id: str, format: str = "chrome"):
+    """
+    Export a trace as Chrome trace-event JSON (default) or OTLP/JSON (?format=otlp)
+    """
+    trace = tracing.get_trace(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found")
+    if format == "otlp":
+        return trace.to_otlp()
+    if format != "chrome":
+        raise HTTPException(status_code=400, detail="format must be 'chrome' or 'otlp'")
+    return trace.to_chrome_trace()
+
+class ProfileRequest(BaseModel):
+    requests: int = 1  # number of upcoming API requests to profile
+    endpoint: Optional[str] = None  # only profile this route, e.g. "/api/itineraries"
+
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def start_profiling(request: ProfileRequest):
+    """
+    Profile the next N API requests with cProfile, discarding earlier results
+    """
+    if not 1 <= request.requests <= 100:
+        raise HTTPException(status_code=400, detail="requests must be between 1 and 100")
+    return profiling.request_profiler.arm(request.requests, request.endpoint)
+
+@app.get("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(format: str = "text", sort: str = "cumulative", limit: int = 50):
+    """
+    The merged profile as a pstats table (format=text), a binary pstats dump
+    (format=pstats), collapsed stacks for flame graphs (format=collapsed),
+    or the profiler state (format=status)
+    """
+    profiler = profiling.request_profiler
+    if format == "status":
+        return profiler.status()
+    if format == "text":
+        try:
+            report = profiler.report_text(sort, limit)
+        except KeyError:
+            raise HTTPException(status_code=400, detail=f"Unknown sort key: {sort}")
+        if report is not None:
+            return PlainTextResponse(report)
+    elif format == "collapsed":
+        report = profiler.report_collapsed()
+        if report is not None:
+            return PlainTextResponse(report)
+    elif format == "pstats":
+        report = profiler.report_binary()
+        if report is not None:
+            return Response(report, media_type="application/octet-stream",
+                            headers={"Content-Disposition": 'attachment; filename="chalo.pstats"'})
+    else:
+        raise HTTPException(status_code=400, detail="format must be 'text', 'collapsed', 'pstats' or 'status'")
+    raise HTTPException(status_code=404, detail="No requests have been profiled yet")
+
+@app.delete("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def reset_profiling():
+    """
+    Stop profiling and discard the results
+    """
+    profiling.request_profiler.reset()
+    return profiling.request_profiler.status()
+
+@app.get("/api/admin/tracemalloc", dependencies=[Depends(require_admin)])
+async def tracemalloc_status():
+    """
+    Traced memory and the snapshots held
+    """
+    return profiling.memory_tracker.status()
+
+@app.post("/api/admin/tracemalloc/start", dependencies=[Depends(require_admin)])
+async def start_tracemalloc(frames: int = 25):
+    """
+    Start tracing allocations, keeping up to `frames` frames per traceback
+    """
+    return profiling.memory_tracker.start(frames)
+
+@app.post("/api/admin/tracemalloc/stop", dependencies=[Depends(require_admin)])
+async def stop_tracemalloc():
+    """
+    Stop tracing allocations and drop the snapshots
+    """
+    return profiling.memory_tracker.stop()
+
+@app.post("/api/admin/tracemalloc/snapshot", dependencies=[Depends(require_admin)])
+async def take_tracemalloc_snapshot(group_by: str = "lineno", limit: int = 25):
+    """
+    Take a snapshot and list its largest allocation sites (group_by: lineno, filename or traceback)
+    """
+    try:
+        return profiling.memory_tracker.snapshot(group_by, limit)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/admin/tracemalloc/diff", dependencies=[Depends(require_admin)])
+async def diff_tracemalloc_snapshots(base: int, target: Optional[int] = None, group_by: str = "lineno", limit: int = 25):
+    """
+    Allocation growth between two snapshots; target defaults to the latest
+    """
+    try:
+        return profiling.memory_tracker.diff(base, target, group_by, limit)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unknown snapshot id")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+class LoggingSettingsRequest(BaseModel):
+    module: Optional[str] = None  # e.g. "itinerary_generator"; None changes the default level
+    level: Optional[str] = None  # DEBUG, INFO, WARNING, ERROR
+    sample_rate: Optional[float] = None  # fraction of DEBUG/INFO records kept for the module
+
+@app.get("/api/logging")
+async def get_logging_settings():
+    """
+    Current log levels and per-module sample rates
+    """
+    return structured_logging.settings()
+
+@app.post("/api/logging", dependencies=[Depends(require_admin)])
+async def update_logging_settings(request: LoggingSettingsRequest):
+    """
+    Change a module's log level or sample rate at runtime, e.g. turn on
+    DEBUG for itinerary_generator at a 5% sample rate
+    """
+    try:
+        if request.level:
+            structured_logging.set_level(request.module, request.level)
+        if request.module and "sample_rate" in request.model_fields_set:
+            structured_logging.set_sample_rate(request.module, request.sample_rate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return structured_logging.settings()
+
+@app.get("/api/poi/stats")
+def poi_stats():
+    """Size and coverage of the persistent POI store"""
+    if not search_engine.poi_store:
+        raise HTTPException(status_code=503, detail="POI store is disabled (POI_STORE_PATH is empty)")
+    return search_engine.poi_store.stats()
+
+@app.get("/api/poi/places")
+def poi_places(lat: float, lng: float, radius_miles: float = 0.5, type: Optional[str] = None,
+                     category: Optional[str] = None, min_rating: Optional[float] = None,
+                     max_price: Optional[int] = None, limit: int = 50):
+    """
+    Places in the POI store within radius_miles of a point, closest first.
+    Filter by Google type (e.g. cafe), search category (e.g. "parks near me"),
+    minimum rating and maximum price_level.
+    """
+    if not search_engine.poi_store:
+        raise HTTPException(status_code=503, detail="POI store is disabled (POI_STORE_PATH is empty)")
+    if radius_miles <= 0 or radius_miles > 25:
+        raise HTTPException(status_code=400, detail="radius_miles must be between 0 and 25")
+    places = search_engine.poi_store.query(lat, lng, radius_miles * 1609.34, type, category, min_rating,
+                                           max_price, limit=max(1, min(limit, 500)))
+    for place in places:
+        place.pop('photo_url', None)
+    return {"count": len(places), "places": places}
+
+@app.get("/api/poi/places/{place_key}/ratings")
+def poi_rating_history(place_key: str):
+    """Rating observations for one place, oldest first"""
+    if not search_engine.poi_store:
+        raise HTTPException(status_code=503, detail="POI store is disabled (POI_STORE_PATH is empty)")
+    return {"place_key": place_key, "ratings": search_engine.poi_store.rating_history(place_key)}
+
+@app.get("/api/upstream/stats")
+async def upstream_stats():
+    """
+    Upstream API calls, latency, bytes and estimated cost, overall and per endpoint
+    """
+    return upstream.stats.snapshot()
+
+@app.post("/api/upstream/stats/reset", dependencies=[Depends(require_admin)])
+async def reset_upstream_stats():
+    """
+    Reset the upstream call counters
+    """
+    upstream.stats.reset()
+    return {"message": "Upstream stats reset"}
+
 # TESTING MODE: Endpoints for toggling testing mode
 @app.post("/api/testing/enable")
 async def enable_testing_mode():
@@ -664,11 +1195,31 @@ async def get_testing_status():
     """Get current testing mode status"""
     return {
         "testing_mode": search_engine.testing_mode,
-        "data_file": search_engine.testing_data_file if search_engine.testing_mode else None
+        "data_file": search_engine.testing_data_file if search_engine.testing_mode else None,
+        "cassettes": cassettes.store.stats()
     }
 
+class CassetteModeRequest(BaseModel):
+    mode: str  # off, record, replay or replay_or_record
+    directory: Optional[str] = None  # defaults to the current cassette directory
+    replay_latency: Optional[bool] = None  # sleep for the recorded latency when replaying
+
+@app.post("/api/testing/cassettes", dependencies=[Depends(require_admin)])
+async def set_cassette_mode(request: CassetteModeRequest):
+    """
+    Record upstream calls to cassettes, or replay them without calling the APIs
+    (covers every endpoint, unlike testing mode)
+    """
+    try:
+        cassettes.store.set_mode(request.mode, request.directory)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if request.replay_latency is not None:
+        cassettes.store.replay_latency = request.replay_latency
+    return cassettes.store.stats()
+
 @app.post("/api/custom-trips", response_model=ItineraryResponse)
-async def get_custom_trips(request: CustomTripRequest):
+def get_custom_trips(request: CustomTripRequest):
     """
     Generate custom trips based on user-selected categories and distance preferences.
     Uses the new_engine.py functionality for category-specific searches.
@@ -692,37 +1243,32 @@ async def get_custom_trips(request: CustomTripRequest):
         
         # Convert category IDs to search queries
         category_queries = []
-        category_mapping = {
-            'cafe': 'cafes and bakeries near me',
-            'restaurant': 'restaurants near me',
-            'park': 'parks near me',
-            'museum': 'museums near me',
-            'art_gallery': 'galleries near me',
-            'tourist_attraction': 'tourist attractions near me'
-        }
-        
         for category_id in request.categories:
-            if category_id in category_mapping:
-                category_queries.append(category_mapping[category_id])
+            if category_id in CUSTOM_TRIP_CATEGORY_QUERIES:
+                category_queries.append(CUSTOM_TRIP_CATEGORY_QUERIES[category_id])
         
         if not category_queries:
             raise HTTPException(status_code=400, detail="Invalid categories selected")
         
-        # Always search fresh (no cache check)
-        search_results = search_engine.search_specific_categories(
-            location, category_queries, max_distance_miles
-        )
+        # Always search fresh (no cache check); slow categories finish in the background
+        cache_key = f"{location}_{','.join(sorted(request.categories))}_{max_distance_miles}"
+        with metrics.time_stage("search"), tracing.span("search"):
+            search_results = search_engine.search_specific_categories(
+                location, category_queries, max_distance_miles,
+                deadline_seconds=SEARCH_DEADLINE_SECONDS,
+                on_background_complete=cache_when_complete(cache_key, location)
+            )
         
         # Cache results for refresh functionality (but we don't read from cache first)
-        cache_key = f"{location}_{','.join(sorted(request.categories))}_{max_distance_miles}"
-        search_results_cache[cache_key] = search_results
+        search_results_cache.set(cache_key, search_results)
         # Also cache with location key for refresh endpoints
-        search_results_cache[location] = search_results
+        search_results_cache.set(location, search_results)
         
         # Generate custom itineraries with user category preferences
-        itineraries = itinerary_generator.generate_custom_itineraries(
-            search_results, location, max_distance_miles, request.categories
-        )
+        with metrics.time_stage("generation"), tracing.span("generation"):
+            itineraries = itinerary_generator.generate_custom_itineraries(
+                search_results, location, max_distance_miles, request.categories
+            )
         
         if not itineraries:
             total_places = sum(len(places) for places in search_results.get('results_by_category', {}).values())
@@ -743,13 +1289,18 @@ async def get_custom_trips(request: CustomTripRequest):
         
         print(f"Generated {len(limited_itineraries)} custom trips with {len(sources)} sources")
         
+        search_metadata = search_results.get('search_metadata', {})
         return ItineraryResponse(
             itineraries=limited_itineraries,
-            sources=sources
+            sources=sources,
+            partial=search_metadata.get('partial', False),
+            pending_categories=search_metadata.get('pending_categories', [])
         )
         
     except HTTPException:
         raise
+    except SearchOverloaded as e:
+        raise search_overloaded_error(e)
     except Exception as e:
         print(f"Error generating custom trips: {e}")
         raise HTTPException(
@@ -757,8 +1308,261 @@ async def get_custom_trips(request: CustomTripRequest):
             detail="An error occurred while generating custom trips. Please try again."
         )
 
+# STREAMING: NDJSON / Server-Sent Events variants of the itinerary endpoints
+def _wants_sse(http_request: Request, format: Optional[str]) -> bool:
+    """SSE when ?format=sse or the client accepts text/event-stream; NDJSON otherwise"""
+    if format:
+        return format.lower() == "sse"
+    return "text/event-stream" in http_request.headers.get("accept", "")
+
+def _format_stream_event(event: str, data: dict, use_sse: bool) -> str:
+    """Encode one stream event as an SSE frame or an NDJSON line"""
+    with tracing.span("serialize", event=event):
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"event": event, **data}) + "\n"
+
+def _stream_search_and_itineraries(run_search, iter_itineraries, categories: List[str], cache_keys: List[str],
+                                   limit: int, not_found_detail, use_sse: bool):
+    """
+    Run a search in a worker thread, emitting a progress event per category,
+    then emit each itinerary as soon as it passes validation.
+    """
+    events: "queue.Queue" = queue.Queue()
+    outcome = {}
+    completed = []
+
+    def on_category_complete(category, results):
+        completed.append(category)
+        events.put(("category_complete", {
+            "category": category,
+            "places_found": len(results),
+            "completed": len(completed),
+            "total": len(categories)
+        }))
+
+    def search_worker():
+        try:
+            with metrics.time_stage("search"), tracing.span("search"):
+                outcome["results"] = run_search(on_category_complete)
+        except Exception as e:
+            outcome["error"] = e
+        finally:
+            events.put(None)
+
+    threading.Thread(target=upstream.bind_context(search_worker), daemon=True).start()
+    yield _format_stream_event("search_started", {"categories": categories}, use_sse)
+
+    while True:
+        item = events.get()
+        if item is None:
+            break
+        yield _format_stream_event(item[0], item[1], use_sse)
+
+    if "error" in outcome:
+        if isinstance(outcome["error"], SearchOverloaded):
+            error = search_overloaded_error(outcome["error"])
+            yield _format_stream_event("error", {"status": error.status_code, "detail": error.detail}, use_sse)
+            return
+        logger.error("Streaming search failed", exc_info=outcome["error"])
+        yield _format_stream_event("error", {
+            "status": 500,
+            "detail": "An error occurred while searching. Please try again."
+        }, use_sse)
+        return
+
+    search_results = outcome["results"]
+    for cache_key in cache_keys:
+        search_results_cache.set(cache_key, search_results)
+
+    total_places = sum(len(places) for places in search_results.get('results_by_category', {}).values())
+    search_metadata = search_results.get('search_metadata', {})
+    yield _format_stream_event("search_complete", {
+        "total_places": total_places,
+        "partial": search_metadata.get('partial', False),
+        "pending_categories": search_metadata.get('pending_categories', [])
+    }, use_sse)
+
+    count = 0
+    # Generation time excludes the time spent waiting on the client between itineraries
+    generation_seconds = 0.0
+    try:
+        itineraries = iter_itineraries(search_results)
+        while count < limit:
+            started = time.perf_counter()
+            with tracing.span("generation", index=count):
+                itinerary = next(itineraries, None)
+            generation_seconds += time.perf_counter() - started
+            if itinerary is None:
+                break
+            validated = Itinerary(**itinerary)
+            yield _format_stream_event("itinerary", {"index": count, "itinerary": validated.model_dump()}, use_sse)
+            count += 1
+    except Exception:
+        metrics.observe_stage("generation", generation_seconds, error=True)
+        logger.exception("Streaming itinerary generation failed")
+        yield _format_stream_event("error", {
+            "status": 500,
+            "detail": "An error occurred while generating itineraries. Please try again."
+        }, use_sse)
+        return
+
+    metrics.observe_stage("generation", generation_seconds)
+
+    if count == 0:
+        yield _format_stream_event("error", {"status": 404, "detail": not_found_detail(search_results)}, use_sse)
+        return
+
+    sources = itinerary_generator.create_sources_from_search(search_results)
+    yield _format_stream_event("sources", {"sources": sources}, use_sse)
+    yield _format_stream_event("done", {"itineraries": count}, use_sse)
+
+def _streaming_response(events, use_sse: bool) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream" if use_sse else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/itineraries/stream")
+async def stream_itineraries(request: LocationRequest, http_request: Request, format: Optional[str] = None):
+    """
+    Streaming variant of /api/itineraries.
+    Emits search_started, category_complete (per category), search_complete,
+    itinerary (per itinerary, as soon as it is built), sources and done events
+    as NDJSON, or as Server-Sent Events with ?format=sse.
+    """
+    if not request.location or len(request.location.strip()) < 2:
+        raise HTTPException(status_code=400, detail="Location must be at least 2 characters long")
+
+    location = request.location.strip()
+    max_distance_miles = request.max_distance_miles or 1.5
+    use_sse = _wants_sse(http_request, format)
+    preset_categories = preset_search_plan(request.preset)
+    cache_key = itinerary_cache_key(location, max_distance_miles, request.preset, request.max_price_level)
+    max_price = itinerary_generator.max_price_for_band(request.max_price_level)
+
+    logger.info("Streaming %s itineraries for: %s", request.preset or "mixed", location)
+
+    def not_found_detail(search_results):
+        return (f"Could not find enough places to create itineraries for '{location}' "
+                f"within {max_distance_miles} miles. Try adjusting your filters or a different area.")
+
+    events = _stream_search_and_itineraries(
+        run_search=lambda on_done: search_engine.search_all_categories(
+            location, max_distance_miles, on_done, SEARCH_DEADLINE_SECONDS,
+            cache_when_complete(cache_key, location), preset_categories, max_price,
+            search_planner.plan_fetch_budget(preset_categories or CHALO_CATEGORIES, itinerary_count=5)
+        ),
+        iter_itineraries=lambda results: itinerary_generator.iter_itineraries(
+            results, location, request.preset, request.max_price_level, max_distance_miles
+        ),
+        categories=list(preset_categories or CHALO_CATEGORIES),
+        cache_keys=[cache_key, location],
+        limit=5,
+        not_found_detail=not_found_detail,
+        use_sse=use_sse
+    )
+    return _streaming_response(events, use_sse)
+
+@app.post("/api/custom-trips/stream")
+async def stream_custom_trips(request: CustomTripRequest, http_request: Request, format: Optional[str] = None):
+    """
+    Streaming variant of /api/custom-trips, with the same events as
+    /api/itineraries/stream.
+    """
+    if not request.location or len(request.location.strip()) < 2:
+        raise HTTPException(status_code=400, detail="Location must be at least 2 characters long")
+
+    category_queries = [CUSTOM_TRIP_CATEGORY_QUERIES[c] for c in request.categories or [] if c in CUSTOM_TRIP_CATEGORY_QUERIES]
+    if not category_queries:
+        raise HTTPException(status_code=400, detail="At least one valid category must be selected")
+
+    location = request.location.strip()
+    max_distance_miles = request.max_distance_miles or 1.5
+    use_sse = _wants_sse(http_request, format)
+
+    logger.info("Streaming custom trips for: %s", location, categories=request.categories)
+    custom_cache_key = f"{location}_{','.join(sorted(request.categories))}_{max_distance_miles}"
+
+    def not_found_detail(search_results):
+        total_places = sum(len(places) for places in search_results.get('results_by_category', {}).values())
+        return (f"Could not create custom trips for '{location}' with selected categories"
+                f" - found {total_places} places. Try selecting different categories or increasing distance range.")
+
+    events = _stream_search_and_itineraries(
+        run_search=lambda on_done: search_engine.search_specific_categories(
+            location, category_queries, max_distance_miles, on_done, SEARCH_DEADLINE_SECONDS,
+            cache_when_complete(custom_cache_key, location)
+        ),
+        iter_itineraries=lambda results: itinerary_generator.iter_custom_itineraries(
+            results, location, max_distance_miles, request.categories
+        ),
+        categories=category_queries,
+        cache_keys=[custom_cache_key, location],
+        limit=3,
+        not_found_detail=not_found_detail,
+        use_sse=use_sse
+    )
+    return _streaming_response(events, use_sse)
+
+# Sentence-sized pieces of narrative text; concatenated they give back the text exactly
+_NARRATIVE_CHUNK = re.compile(r"\s*\S.*?(?:[.!?]+(?=\s|\Z)|\n|\Z)\s*", re.S)
+
+def _stream_agent_recommendations(request: AgentRequest, use_sse: bool):
+    """
+    Ask Yelp AI and emit the answer piece by piece: narrative text first, in
+    sentence-sized deltas, then businesses, then plans, each as soon as it is
+    built.
+    """
+    yield _format_stream_event("started", {"user_request": request.user_request.strip()}, use_sse)
+    # Anything failing after "started" still ends the stream with an error
+    # event, so clients never wait on a stream that stopped without "done"
+    try:
+        transformed, session_id = _ask_agent(request)
+
+        for chunk in _NARRATIVE_CHUNK.findall(transformed.get("text") or ""):
+            yield _format_stream_event("text", {"delta": chunk}, use_sse)
+
+        businesses_payload = _agent_businesses_payload(transformed)
+        yield _format_stream_event("businesses", {
+            "businesses": [b.model_dump() for b in businesses_payload]
+        }, use_sse)
+
+        plan_payload, plans_payload = _agent_plans_payload(request, transformed, businesses_payload)
+        if plan_payload is not None:
+            yield _format_stream_event("plan", {"plan": plan_payload.model_dump()}, use_sse)
+        if plans_payload:
+            yield _format_stream_event("plans", {"plans": [p.model_dump() for p in plans_payload]}, use_sse)
+
+        yield _format_stream_event("done", {
+            "chat_id": transformed.get("chat_id"),
+            "session_id": session_id,
+            "businesses": len(businesses_payload),
+            "plans": len(plans_payload) + (1 if plan_payload is not None else 0)
+        }, use_sse)
+    except HTTPException as e:
+        yield _format_stream_event("error", {"status": e.status_code, "detail": e.detail}, use_sse)
+    except Exception:
+        logger.exception("AI Engine API error")
+        yield _format_stream_event("error", {
+            "status": 500,
+            "detail": "An error occurred while processing your request. Please try again."
+        }, use_sse)
+
+@app.post("/api/agent-recommendations/stream")
+async def stream_agent_recommendations(request: AgentRequest, format: Optional[str] = None):
+    """
+    Streaming variant of /api/agent-recommendations.
+    Emits started, text (narrative deltas), businesses, plan, plans and done
+    events as Server-Sent Events, or as NDJSON with ?format=ndjson.
+    """
+    _validate_agent_request(request)
+    use_sse = format.lower() != "ndjson" if format else True
+    return _streaming_response(_stream_agent_recommendations(request, use_sse), use_sse)
+
 @app.post("/api/get-available-spots")
-async def get_available_spots(request: GetAvailableSpotsRequest):
+def get_available_spots(request: GetAvailableSpotsRequest):
     """
     Get available spots that can be added to an itinerary
     """
@@ -771,19 +1575,19 @@ async def get_available_spots(request: GetAvailableSpotsRequest):
         print(f"Getting available spots for: {location}")
         
         # Use cached search results if available, otherwise search fresh
-        if location not in search_results_cache:
+        search_results = search_results_cache.get(location)
+        if search_results is None:
             # Perform fresh search
             search_results = search_engine.search_all_categories(location, request.max_distance_miles)
-            search_results_cache[location] = search_results
-        else:
-            search_results = search_results_cache[location]
+            search_results_cache.set(location, search_results)
         
         # Find available places
+        excluded_keys = normalize_excluded_ids(request.excluded_ids)
         available_places = []
         for category_results in search_results.get('results_by_category', {}).values():
             for place in category_results:
                 # Skip excluded places
-                if place.get('place_id') in request.excluded_ids:
+                if is_excluded(place, excluded_keys):
                     continue
                 
                 # Filter by category if specified
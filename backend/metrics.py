@@ -0,0 +1,295 @@
+"""
+Prometheus-style metrics for the Chalo API.
+
+A small in-process registry of counters, gauges and histograms rendered in
+the Prometheus text exposition format by ``/metrics``. Recording a value is
+a dict lookup, a bisect and an add under a lock, cheap enough to leave on in
+production. Values that already live elsewhere (cache hit counters) are read
+at scrape time through collectors instead of being duplicated here.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+import threading
+import time
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Upstream API name (see upstream.py) -> stage label
+UPSTREAM_STAGES = {
+    'geocoding': 'geocode',
+    'nearby_search': 'nearby',
+    'place_details': 'details',
+    'distance_matrix': 'distance',
+    'yelp_ai_chat': 'yelp_ai',
+    'gemini': 'gemini',
+}
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(label_names: Sequence[str], label_values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    metric_type = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """A monotonically increasing value per label set."""
+
+    metric_type = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that can go up and down per label set."""
+
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Cumulative bucketed observations with sum and count per label set."""
+
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # Structure: {label_values: [per-bucket counts..., +Inf count, sum]}
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall time of the with-block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._values.items())
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (float("inf"),), series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.label_names, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {_format_value(cumulative)}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+            lines.append(f"{self.name}_count{labels} {_format_value(cumulative)}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and scrape-time collectors and renders them."""
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], List[_Metric]]] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[_Metric]]) -> None:
+        """Register a callable returning freshly built metrics at each scrape."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                print(f"Metrics collector failed: {e}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_latency = registry.register(Histogram(
+    "chalo_stage_latency_seconds",
+    "Latency of each pipeline stage (upstream APIs, search, generation).",
+    ("stage",),
+))
+stage_errors = registry.register(Counter(
+    "chalo_stage_errors_total",
+    "Failed upstream calls and stages.",
+    ("stage",),
+))
+http_request_latency = registry.register(Histogram(
+    "chalo_http_request_duration_seconds",
+    "API request latency until the response starts.",
+    ("endpoint", "method", "status"),
+))
+http_in_flight = registry.register(Gauge(
+    "chalo_http_requests_in_flight",
+    "API requests currently being handled.",
+    ("endpoint",),
+))
+rate_limiter_wait = registry.register(Counter(
+    "chalo_rate_limiter_wait_seconds_total",
+    "Time spent sleeping between upstream calls to respect rate limits.",
+    ("stage",),
+))
+fetch_budget_skipped = registry.register(Counter(
+    "chalo_fetch_budget_skipped_total",
+    "Nearby Search candidates not hydrated because the category's fetch budget was met.",
+    ("category",),
+))
+search_pool_rejections = registry.register(Counter(
+    "chalo_search_pool_rejections_total",
+    "Searches refused because the shared category search pool was full.",
+))
+walking_routes = registry.register(Counter(
+    "chalo_walking_routes_total",
+    "Walking distance lookups by the offline router, by result (routed, beyond_limit, off_graph).",
+    ("result",),
+))
+pair_cache_lookups = registry.register(Counter(
+    "chalo_pair_cache_lookups_total",
+    "Place-pair distance lookups in the pair cache, by result (hit, miss).",
+    ("result",),
+))
+agent_session_turns = registry.register(Counter(
+    "chalo_agent_session_turns_total",
+    "Agent recommendation turns, by kind (first, follow_up, restarted).",
+    ("turn",),
+))
+rate_limiter_waits = registry.register(Counter(
+    "chalo_rate_limiter_waits_total",
+    "Number of rate-limiting sleeps between upstream calls.",
+    ("stage",),
+))
+
+
+def observe_stage(stage: str, seconds: float, error: bool = False) -> None:
+    """Record the latency of one stage execution."""
+    stage_latency.observe(seconds, stage=stage)
+    if error:
+        stage_errors.inc(stage=stage)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    """Time the with-block as a stage, counting an error if it raises."""
+    started = time.perf_counter()
+    error = False
+    try:
+        yield
+    except Exception:
+        error = True
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started, error)
+
+
+def rate_limit_sleep(seconds: float, stage: str) -> None:
+    """Sleep between upstream calls and account the wait."""
+    time.sleep(seconds)
+    rate_limiter_wait.inc(seconds, stage=stage)
+    rate_limiter_waits.inc(stage=stage)
+
+
+def cache_collector(caches: Dict[str, object]) -> Callable[[], List[_Metric]]:
+    """
+    Build a collector exposing hit/miss counters for named caches.
+
+    Only the caches' in-process counters are read, so a scrape never touches
+    a shared backend; sizes are reported by /api/cache/stats.
+
+    Args:
+        caches: Cache name to cache object with hits and misses attributes
+
+    Returns:
+        A collector for Registry.register_collector
+    """
+    def collect() -> List[_Metric]:
+        hits = Counter("chalo_cache_hits_total", "Cache lookups that found a live entry.", ("cache",))
+        misses = Counter("chalo_cache_misses_total", "Cache lookups that found nothing.", ("cache",))
+        ratio = Gauge("chalo_cache_hit_ratio", "Cache hits over lookups since start.", ("cache",))
+        for name, cache in caches.items():
+            cache_hits, cache_misses = cache.hits, cache.misses
+            hits.inc(cache_hits, cache=name)
+            misses.inc(cache_misses, cache=name)
+            if cache_hits + cache_misses:
+                ratio.set(round(cache_hits / (cache_hits + cache_misses), 4), cache=name)
+        return [hits, misses, ratio]
+    return collect
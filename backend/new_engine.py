@@ -3,13 +3,29 @@ import json
 import os
 import time
 import hashlib
+import sqlite3
 import concurrent.futures
-from typing import List, Dict, Optional, Tuple
+import copy
+import threading
+from typing import Callable, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
 from pathlib import Path
 
+from place_identity import PlaceIdentityIndex, assign_place_key, get_place_key
+from search_planner import CategoryAllowance, FetchBudget
+import search_planner
+import pair_cache
+import poi_store
+import metrics
+import tracing
+from structured_logging import get_logger
+import upstream
+import walking_router
+
 load_dotenv()
 
+logger = get_logger("new_engine")
+
 # ==============================================================================
 # Chalo Search Parameters (for compatibility)
 # ==============================================================================
@@ -25,6 +41,25 @@ CHALO_CATEGORIES = [
     "markets near me"
 ]
 
+# Latency budgets (seconds). Every upstream call is bounded by UPSTREAM_TIMEOUT_SECONDS
+# and by whatever is left of its category's background budget; a request waits at most
+# SEARCH_DEADLINE_SECONDS for categories and answers with the ones that finished.
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "5"))
+SEARCH_DEADLINE_SECONDS = float(os.getenv("SEARCH_DEADLINE_SECONDS", "4"))
+SEARCH_BACKGROUND_BUDGET_SECONDS = float(os.getenv("SEARCH_BACKGROUND_BUDGET_SECONDS", "60"))
+# Category searches share one pool per process. Requests whose categories would take the
+# queued and running searches (background ones included) past SEARCH_POOL_MAX_PENDING
+# are refused with SearchOverloaded rather than piling up upstream work.
+SEARCH_POOL_WORKERS = int(os.getenv("SEARCH_POOL_WORKERS", "16"))
+SEARCH_POOL_MAX_PENDING = int(os.getenv("SEARCH_POOL_MAX_PENDING", "64"))
+
+# Full searches are saved here for review. Against a stand-in upstream (UPSTREAM_BASE_URL, e.g.
+# fake_upstream.py in load tests) they default to the gitignored cache/ instead of
+# search_results/, which fake_upstream seeds from
+SEARCH_RESULTS_DIR = os.getenv("SEARCH_RESULTS_DIR") or (
+    os.path.join("cache", "search_results") if upstream.UPSTREAM_BASE_URL else "search_results"
+)
+
 SEARCH_RADIUS_METERS = 4023  # Approximately 2.5 miles for search
 ITINERARY_RADIUS_METERS = 2414  # Approximately 1.5 miles for final itinerary
 DEFAULT_LOCATION = "Hells Kitchen, NY"
@@ -35,6 +70,69 @@ NEARBY_SEARCH_BASE_URL = "https://maps.googleapis.com/maps/api/place/nearbysearc
 PLACE_DETAILS_BASE_URL = "https://maps.googleapis.com/maps/api/place/details/json"
 DISTANCE_MATRIX_BASE_URL = "https://maps.googleapis.com/maps/api/distancematrix/json"
 
+# Place types whose Nearby Search can take maxprice. Google drops places without a
+# price_level when maxprice is set, which would empty out parks, museums and shops.
+PRICED_PLACE_TYPES = {'restaurant', 'cafe'}
+
+
+class SearchOverloaded(Exception):
+    """The shared search pool has no room for another request's categories."""
+
+
+class SearchPool:
+    """
+    Process-wide worker pool for category searches, with admission control.
+
+    A request's categories are admitted together or not at all, counting
+    every search still queued or running, including the ones finishing in
+    the background after a request's deadline.
+    """
+
+    def __init__(self, workers: int = SEARCH_POOL_WORKERS, max_pending: int = SEARCH_POOL_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="chalo-search")
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    def submit_all(self, fn: Callable, items: List) -> Dict[concurrent.futures.Future, object]:
+        """
+        Run fn(item) for every item on the pool, in the caller's context.
+
+        Returns:
+            Futures mapped to their items
+
+        Raises:
+            SearchOverloaded: When the items don't fit under max_pending
+        """
+        with self._lock:
+            if self._pending + len(items) > self.max_pending:
+                self.rejected += 1
+                metrics.search_pool_rejections.inc()
+                raise SearchOverloaded(
+                    f"{self._pending} category searches pending, limit {self.max_pending}"
+                )
+            self._pending += len(items)
+        futures = {}
+        for item in items:
+            future = self._executor.submit(upstream.bind_context(fn), item)
+            future.add_done_callback(self._release)
+            futures[future] = item
+        return futures
+
+    def _release(self, future: concurrent.futures.Future) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'workers': self.workers, 'max_pending': self.max_pending,
+                    'pending': self._pending, 'rejected': self.rejected}
+
+
+search_pool = SearchPool()
+
 class ChaloSearchEngine:
     """Chalo search engine for discovering and organizing local places"""
     
@@ -43,40 +141,76 @@ class ChaloSearchEngine:
         # Testing mode functionality
         self.testing_mode = False
         self.testing_data_file = "search_results/search_results_manhattan_NY_20250724_185116.json"
+        # Structure: (path, mtime, parsed and deduped data)
+        self._testing_data_cache: Optional[Tuple[str, float, Dict]] = None
+        # Per-thread deadline for upstream calls, set while a category search runs
+        self._call_budget = threading.local()
+        # Every hydrated place is kept here; None when POI_STORE_PATH is empty
+        self.poi_store = poi_store.store
+
+    def upstream_timeout(self) -> float:
+        """Timeout for the next upstream call: the per-call cap or the remaining budget, whichever is smaller"""
+        deadline = getattr(self._call_budget, 'deadline', None)
+        if deadline is None:
+            return UPSTREAM_TIMEOUT_SECONDS
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout("Search budget exhausted")
+        return min(UPSTREAM_TIMEOUT_SECONDS, remaining)
+
+    def budget_exhausted(self) -> bool:
+        """Whether the current thread's search budget has run out"""
+        deadline = getattr(self._call_budget, 'deadline', None)
+        return deadline is not None and time.monotonic() >= deadline
 
     def geocode_address(self, address: str) -> Tuple[Optional[float], Optional[float]]:
         """Convert address to latitude/longitude coordinates"""
         params = {'address': address, 'key': self.api_key}
         
         try:
-            response = requests.get(GEOCODING_BASE_URL, params=params)
+            response = upstream.get(upstream.GEOCODING, GEOCODING_BASE_URL, params=params, timeout=self.upstream_timeout())
             response.raise_for_status()
             data = response.json()
             
             if data['status'] == 'OK' and data['results']:
                 location = data['results'][0]['geometry']['location']
                 formatted_address = data['results'][0]['formatted_address']
-                print(f"Geocoded: {formatted_address}")
+                logger.debug("Geocoded: %s", formatted_address)
                 return location['lat'], location['lng']
             else:
-                print(f"Geocoding Error for {address}: {data['status']} - {data.get('error_message', 'No error message.')}")
+                logger.warning("Geocoding Error for %s: %s - %s", address, data['status'], data.get('error_message', 'No error message.'))
                 return None, None
                 
         except requests.exceptions.RequestException as e:
-            print(f"Request failed for {address}: {e}")
+            logger.warning("Request failed for %s: %s", address, e)
             return None, None
 
     def calculate_distance(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float) -> Optional[float]:
-        """Calculate distance between two points using Distance Matrix API"""
+        """Distance between two points: walked over the local graph when WALKING_GRAPH_PATH
+        covers both points, otherwise from the Distance Matrix API"""
+        router = walking_router.get_router()
+        if router:
+            walking_meters = router.walking_meters(origin_lat, origin_lng, dest_lat, dest_lng,
+                                                   max_meters=SEARCH_RADIUS_METERS * 2)
+            if walking_meters is not None:
+                return round(walking_meters, 1)
+        return self.request_distance_matrix(origin_lat, origin_lng, dest_lat, dest_lng)
+
+    def request_distance_matrix(self, origin_lat: float, origin_lng: float, dest_lat: float, dest_lng: float,
+                                mode: Optional[str] = None) -> Optional[float]:
+        """Distance between two points in meters from the Distance Matrix API, in its
+        travel mode (e.g. 'walking'), or its default driving mode when mode is None"""
         params = {
             'origins': f"{origin_lat},{origin_lng}",
             'destinations': f"{dest_lat},{dest_lng}",
             'units': 'imperial',
             'key': self.api_key
         }
+        if mode:
+            params['mode'] = mode
         
         try:
-            response = requests.get(DISTANCE_MATRIX_BASE_URL, params=params)
+            response = upstream.get(upstream.DISTANCE_MATRIX, DISTANCE_MATRIX_BASE_URL, params=params, timeout=self.upstream_timeout())
             response.raise_for_status()
             data = response.json()
             
@@ -91,13 +225,39 @@ class ChaloSearchEngine:
                 return None
                 
         except requests.exceptions.RequestException as e:
-            print(f"Distance calculation failed: {e}")
+            logger.warning("Distance calculation failed: %s", e)
             return None
 
-    def search_category(self, lat: float, lng: float, category: str, min_rating: float = 4.4, keyword: Optional[str] = None) -> List[Dict]:
+    def search_category(self, lat: float, lng: float, category: str, min_rating: float = 4.4, keyword: Optional[str] = None,
+                        max_price: Optional[int] = None, allowance: Optional[CategoryAllowance] = None) -> List[Dict]:
         """Search for places in a specific category and filter by rating.
         Supports optional keyword (e.g., cuisine: 'thai').
+        With max_price (Google's 0-4 price_level), places priced above it are dropped
+        before any Details or Distance Matrix call; places with no price_level are kept.
+        With an allowance, only its limit of the candidates are hydrated, best rated first.
         """
+        return self.search_category_with_coverage(lat, lng, category, min_rating, keyword, max_price, allowance)[0]
+
+    def search_category_with_coverage(self, lat: float, lng: float, category: str, min_rating: float = 4.4,
+                                      keyword: Optional[str] = None, max_price: Optional[int] = None,
+                                      allowance: Optional[CategoryAllowance] = None) -> Tuple[List[Dict], Optional[float]]:
+        """search_category, plus the radius within which every qualifying place was hydrated
+        (None when none were left out; see search_planner.complete_radius).
+        """
+        candidates = self.nearby_candidates(lat, lng, category, min_rating, keyword, max_price, limit=None)
+        capped = candidates[:search_planner.MAX_CANDIDATES_PER_CATEGORY]
+        if allowance:
+            allowance.offer(len(capped))
+        filtered_results = self.hydrate_candidates(lat, lng, category, capped, allowance)
+        if allowance:
+            allowance.finish()
+        return filtered_results, search_planner.complete_radius(lat, lng, candidates, filtered_results)
+
+    def nearby_candidates(self, lat: float, lng: float, category: str, min_rating: float = 4.4, keyword: Optional[str] = None,
+                          max_price: Optional[int] = None,
+                          limit: Optional[int] = search_planner.MAX_CANDIDATES_PER_CATEGORY) -> List[Dict]:
+        """Nearby Search results worth hydrating: the closest (at most limit, default 10) rated at least
+        min_rating and within max_price"""
         params = {
             'location': f'{lat},{lng}',
             'type': category,
@@ -106,23 +266,48 @@ class ChaloSearchEngine:
         }
         if keyword:
             params['keyword'] = keyword
+        if max_price is not None and category in PRICED_PLACE_TYPES:
+            params['maxprice'] = max_price
         
-        response = requests.get(NEARBY_SEARCH_BASE_URL, params=params)
-        data = response.json()
+        try:
+            response = upstream.get(upstream.NEARBY_SEARCH, NEARBY_SEARCH_BASE_URL, params=params, timeout=self.upstream_timeout())
+            response.raise_for_status()
+            data = response.json()
+        except requests.exceptions.RequestException as e:
+            logger.warning("Nearby search failed for %s: %s", category, e)
+            return []
         
         # Get place IDs first, then fetch detailed information
-        place_ids = []
-        if data.get('results'):
-            for result in data['results']:
-                rating = result.get('rating')
-                if rating is not None and rating >= min_rating:
-                    place_ids.append(result['place_id'])
-        
+        candidates = []
+        for result in data.get('results') or []:
+            rating = result.get('rating')
+            if rating is None or rating < min_rating:
+                continue
+            if max_price is not None and (result.get('price_level') or 0) > max_price:
+                continue
+            candidates.append(result)
+        return candidates[:limit] if limit else candidates  # Limit to top 10 to save API calls
+
+    def hydrate_candidates(self, lat: float, lng: float, category: str, candidates: List[Dict],
+                           allowance: Optional[CategoryAllowance] = None) -> List[Dict]:
+        """Fetch details and walking distance for Nearby Search candidates, closest first"""
+        if allowance and allowance.limit is not None:
+            # The top-rated candidates are the ones process_category_search would keep
+            candidates = sorted(candidates, key=lambda result: -(result.get('rating') or 0))
+
         # Fetch detailed place information including photos
         filtered_results = []
-        for place_id in place_ids[:10]:  # Limit to top 10 to save API calls
-            time.sleep(0.2)  # Rate limiting
-            place_details = self.get_place_details(place_id)
+        for candidate in candidates:
+            if allowance and allowance.exhausted():
+                logger.debug("Fetch budget of %s met for %s", allowance.limit, category)
+                break
+            if self.budget_exhausted():
+                logger.info("Search budget exhausted for %s, keeping %s places", category, len(filtered_results))
+                break
+            metrics.rate_limit_sleep(0.2, 'details')  # Rate limiting
+            if allowance:
+                allowance.use()
+            place_details = self.get_place_details(candidate['place_id'])
             if place_details:
                 # Calculate distance from origin
                 place_location = place_details.get('geometry', {}).get('location', {})
@@ -130,7 +315,7 @@ class ChaloSearchEngine:
                 place_lng = place_location.get('lng')
                 
                 if place_lat and place_lng:
-                    time.sleep(0.1)  # Rate limiting
+                    metrics.rate_limit_sleep(0.1, 'distance')  # Rate limiting
                     distance_meters = self.calculate_distance(lat, lng, place_lat, place_lng)
                     
                     if distance_meters is not None:
@@ -142,7 +327,7 @@ class ChaloSearchEngine:
                         formatted_place = self.format_place_data(place_details, lat, lng)
                         if formatted_place:
                             filtered_results.append(formatted_place)
-        
+
         # Sort by distance (closest first)
         filtered_results.sort(key=lambda x: x.get('distance_meters', float('inf')))
         return filtered_results
@@ -151,29 +336,31 @@ class ChaloSearchEngine:
         """Get detailed information for a specific place"""
         params = {
             'place_id': place_id,
-            'fields': 'name,geometry,formatted_address,rating,price_level,types,opening_hours,reviews,photos,formatted_phone_number,website,editorial_summary',
+            'fields': 'place_id,name,geometry,formatted_address,rating,price_level,types,opening_hours,reviews,photos,formatted_phone_number,website,editorial_summary',
             'key': self.api_key
         }
         
         try:
-            response = requests.get(PLACE_DETAILS_BASE_URL, params=params)
+            response = upstream.get(upstream.PLACE_DETAILS, PLACE_DETAILS_BASE_URL, params=params, timeout=self.upstream_timeout())
             response.raise_for_status()
             data = response.json()
             
             if data['status'] == 'OK':
                 result = data['result']
-
+                # Keep the id we asked for even if the response omits it
+                result.setdefault('place_id', place_id)
                 return result
             else:
-                print(f"Place details error: {data['status']}")
+                logger.warning("Place details error: %s", data['status'])
                 return None
                 
         except requests.exceptions.RequestException as e:
-            print(f"Place details request failed: {e}")
+            logger.warning("Place details request failed: %s", e)
             return None
 
     def calculate_distance_between_places(self, place1: Dict, place2: Dict) -> Optional[float]:
-        """Calculate distance between two places"""
+        """Walking distance in meters between two places: cached, routed over the local
+        graph, or from the Distance Matrix API in walking mode"""
         place1_location = place1.get('geometry', {}).get('location', {})
         place2_location = place2.get('geometry', {}).get('location', {})
         
@@ -185,8 +372,27 @@ class ChaloSearchEngine:
         if not all([lat1, lng1, lat2, lng2]):
             return None
         
-        time.sleep(0.1)  # Rate limiting
-        return self.calculate_distance(lat1, lng1, lat2, lng2)
+        # Popular pairs come back in search after search; reuse any earlier walking measurement
+        key1, key2 = get_place_key(place1), get_place_key(place2)
+        distances = pair_cache.cache if key1 and key2 else None
+        if distances:
+            cached = distances.get(key1, key2, pair_cache.WALKING)
+            if cached:
+                return cached[0]
+        
+        router = walking_router.get_router()
+        if router:
+            walking_meters = router.walking_meters(lat1, lng1, lat2, lng2)
+            if walking_meters is not None:
+                if distances:
+                    distances.put(key1, key2, walking_meters, pair_cache.ROUTER)
+                return round(walking_meters, 1)
+        
+        metrics.rate_limit_sleep(0.1, 'distance')  # Rate limiting
+        meters = self.request_distance_matrix(lat1, lng1, lat2, lng2, mode=pair_cache.WALKING)
+        if meters is not None and distances:
+            distances.put(key1, key2, meters, pair_cache.DISTANCE_MATRIX, pair_cache.WALKING)
+        return meters
 
     def find_clustered_places(self, results_by_category: Dict, max_distance_miles: float = 0.5) -> List[List[Dict]]:
         """Find places that are clustered within max_distance_miles of each other"""
@@ -201,7 +407,7 @@ class ChaloSearchEngine:
         if len(all_places) < 2:
             return []
         
-        print(f"   Analyzing {len(all_places)} top-rated places for clustering...")
+        logger.debug("   Analyzing %s top-rated places for clustering...", len(all_places))
         
         max_distance_meters = max_distance_miles * 1609.34
         
@@ -237,7 +443,10 @@ class ChaloSearchEngine:
         else:
             return query.replace(" near me", ""), "me"
 
-    def process_category_search(self, category_query: str, origin_address: str, search_radius_meters: int = SEARCH_RADIUS_METERS) -> Tuple[str, List[Dict]]:
+    @tracing.traced("search.category")
+    def process_category_search(self, category_query: str, origin_address: str, search_radius_meters: int = SEARCH_RADIUS_METERS,
+                                max_price: Optional[int] = None,
+                                fetch_budget: Optional[FetchBudget] = None) -> Tuple[str, List[Dict]]:
         """Process a single category search and return formatted results"""
         keyword, location_str = self.parse_category_query(category_query)
         if location_str == "me":
@@ -248,11 +457,14 @@ class ChaloSearchEngine:
         if not user_lat:
             return category_query, []
 
-        time.sleep(0.5)  # Rate limiting
+        metrics.rate_limit_sleep(0.5, 'nearby')  # Rate limiting
         
         # Convert keyword to Google Places API type
         category_type = self.keyword_to_place_type(keyword)
-        results = self.search_category(user_lat, user_lng, category_type, min_rating=4.4)
+        allowance = fetch_budget.allowance(category_query) if fetch_budget else None
+        results, complete_meters = self.search_category_with_coverage(user_lat, user_lng, category_type, min_rating=4.4,
+                                                                      max_price=max_price, allowance=allowance)
+        self.remember_results(category_query, user_lat, user_lng, search_radius_meters, results, complete_meters)
         
         # Filter by search radius - results are already formatted by search_category
         filtered_results = []
@@ -342,30 +554,475 @@ class ChaloSearchEngine:
                 'latest_review': latest_review,
                 'editorial_summary': place_result.get('editorial_summary', {}).get('overview')
             }
+            assign_place_key(formatted_place)
 
             return formatted_place
 
         except Exception as e:
-            print(f"Error formatting place data: {e}")
+            logger.warning("Error formatting place data: %s", e)
             return None
 
-    def search_specific_categories(self, origin_address: str, categories: List[str], search_radius_miles: float = 2.5) -> Dict:
-        """Search specific categories and return organized results"""
+    def search_specific_categories(self, origin_address: str, categories: List[str], search_radius_miles: float = 2.5,
+                                   on_category_complete: Optional[Callable[[str, List[Dict]], None]] = None,
+                                   deadline_seconds: Optional[float] = None,
+                                   on_background_complete: Optional[Callable[[Dict], None]] = None,
+                                   max_price: Optional[int] = None,
+                                   fetch_budget: Optional[FetchBudget] = None,
+                                   adaptive_radius: bool = False) -> Dict:
+        """Search specific categories and return organized results.
+        on_category_complete(category, results) is called as each category finishes.
+
+        With deadline_seconds, categories are searched in parallel and the results
+        hold only the categories that finished in time (search_metadata.partial is
+        set and pending_categories lists the rest). The slow categories keep running
+        in the background and on_background_complete(full_results) is called once
+        they all finish.
+
+        max_price (Google's 0-4 price_level) is pushed down into each Nearby Search, and
+        fetch_budget limits how many places each category hydrates; its report is added
+        to search_metadata.fetch_budget.
+
+        With adaptive_radius the search starts from a tight radius and widens it only
+        while too few places have been found (see _search_categories_adaptive).
+        """
         search_radius_meters = int(search_radius_miles * 1609.34)
         
-        print(f"Chalo Search Engine - Specific Categories")
-        print(f"Origin: {origin_address}")
-        print(f"Search Radius: {search_radius_meters} meters ({search_radius_miles} miles)")
-        print(f"Categories: {len(categories)}")
-        print("-" * 60)
+        logger.info("Searching %s categories near %s", len(categories), origin_address,
+                    radius_meters=search_radius_meters, radius_miles=search_radius_miles)
+
+        local = self.answer_from_store(origin_address, categories, search_radius_meters, max_price)
+        if local:
+            for category, places in local.items():
+                if on_category_complete:
+                    on_category_complete(category, places)
+            summary = self._summarize_results(origin_address, categories, search_radius_miles, search_radius_meters, local)
+            summary['search_metadata']['source'] = 'poi_store'
+            logger.info("Answered from the POI store: %s places", summary['search_metadata']['total_places_found'])
+            return summary
+
+        if adaptive_radius:
+            summary = self._search_categories_adaptive(
+                origin_address, categories, search_radius_miles, search_radius_meters,
+                deadline_seconds, on_category_complete, on_background_complete, max_price, fetch_budget
+            )
+        elif deadline_seconds is not None:
+            summary = self._search_categories_with_deadline(
+                origin_address, categories, search_radius_miles, search_radius_meters,
+                deadline_seconds, on_category_complete, on_background_complete, max_price, fetch_budget
+            )
+        else:
+            # Process specified categories
+            all_results = {}
+            for category in categories:
+                logger.debug("Searching %s...", category)
+                category_query, results = self.process_category_search(category, origin_address, search_radius_meters,
+                                                                       max_price, fetch_budget)
+                all_results[category] = results
+                logger.debug("✓ Completed: %s - Found %s places", category, len(results))
+                if on_category_complete:
+                    on_category_complete(category, results)
+            summary = self._summarize_results(origin_address, categories, search_radius_miles, search_radius_meters, all_results,
+                                              fetch_budget)
+
+        logger.info("Search complete: %s places found", summary['search_metadata']['total_places_found'],
+                    partial=summary['search_metadata'].get('partial', False))
+
+        return summary
+
+    def _run_category_with_budget(self, category: str, origin_address: str, search_radius_meters: int,
+                                  budget_deadline: float, max_price: Optional[int] = None,
+                                  fetch_budget: Optional[FetchBudget] = None) -> Tuple[str, List[Dict]]:
+        """Run one category search with every upstream call bounded by budget_deadline"""
+        self._call_budget.deadline = budget_deadline
+        try:
+            return self.process_category_search(category, origin_address, search_radius_meters, max_price, fetch_budget)
+        finally:
+            self._call_budget.deadline = None
+
+    def _search_categories_with_deadline(self, origin_address: str, categories: List[str], search_radius_miles: float,
+                                         search_radius_meters: int, deadline_seconds: float,
+                                         on_category_complete: Optional[Callable[[str, List[Dict]], None]],
+                                         on_background_complete: Optional[Callable[[Dict], None]],
+                                         max_price: Optional[int] = None,
+                                         fetch_budget: Optional[FetchBudget] = None) -> Dict:
+        """Search categories in parallel, returning whatever finished within deadline_seconds"""
+        started = time.monotonic()
+        budget_deadline = started + max(deadline_seconds, SEARCH_BACKGROUND_BUDGET_SECONDS)
+        results_lock = threading.Lock()
+        all_results: Dict[str, List[Dict]] = {}
+
+        futures = search_pool.submit_all(
+            lambda category: self._run_category_with_budget(category, origin_address, search_radius_meters,
+                                                            budget_deadline, max_price, fetch_budget),
+            categories
+        )
+
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=deadline_seconds):
+                category = futures[future]
+                try:
+                    _, results = future.result()
+                except Exception as e:
+                    logger.warning("Error searching %s: %s", category, e)
+                    results = []
+                with results_lock:
+                    all_results[category] = results
+                logger.debug("✓ Completed: %s - Found %s places", category, len(results))
+                if on_category_complete:
+                    on_category_complete(category, results)
+        except concurrent.futures.TimeoutError:
+            pass
+
+        with results_lock:
+            finished = {category: all_results[category] for category in categories if category in all_results}
+        pending = [category for category in categories if category not in finished]
+
+        summary = self._summarize_results(origin_address, categories, search_radius_miles, search_radius_meters, finished,
+                                          fetch_budget)
+        summary['search_metadata']['partial'] = bool(pending)
+        summary['search_metadata']['pending_categories'] = pending
+        summary['search_metadata']['elapsed_seconds'] = round(time.monotonic() - started, 2)
+
+        if pending:
+            logger.info("Deadline of %ss reached, still searching: %s", deadline_seconds, ', '.join(pending))
+            pending_futures = [future for future, category in futures.items() if category in pending]
+            # The request generates from these place dicts while the background summary re-keys its own copies
+            finished_snapshot = copy.deepcopy(finished)
+            remaining = [len(pending_futures)]
+
+            def finish_in_background():
+                for future in pending_futures:
+                    category = futures[future]
+                    try:
+                        _, results = future.result()
+                    except Exception as e:
+                        logger.warning("Error searching %s: %s", category, e)
+                        results = []
+                    with results_lock:
+                        all_results[category] = results
+                    logger.info("✓ Completed in background: %s - Found %s places", category, len(results))
+                full = self._summarize_results(
+                    origin_address, categories, search_radius_miles, search_radius_meters,
+                    {category: finished_snapshot.get(category) or all_results.get(category, []) for category in categories},
+                    fetch_budget
+                )
+                full['search_metadata']['partial'] = False
+                full['search_metadata']['pending_categories'] = []
+                full['search_metadata']['elapsed_seconds'] = round(time.monotonic() - started, 2)
+                if on_background_complete:
+                    try:
+                        on_background_complete(full)
+                    except Exception as e:
+                        logger.warning("Error storing background search results: %s", e)
+
+            finish = upstream.bind_context(finish_in_background)
+
+            def on_pending_done(future: concurrent.futures.Future) -> None:
+                # The last pending search finishes the summary on its pool worker, no extra thread
+                with results_lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    finish()
+
+            for future in pending_futures:
+                future.add_done_callback(on_pending_done)
+
+        return summary
+
+    def remember_results(self, category: str, lat: float, lng: float, radius_meters: float, results: List[Dict],
+                         complete_meters: Optional[float] = None) -> None:
+        """Upsert a category search's places into the POI store and record the search as coverage.
+        Empty or budget-cut searches are not recorded as coverage, since a failed Nearby
+        Search also comes back empty. When some candidates were not hydrated, only the
+        circle inside the nearest of them (complete_meters) counts as covered.
+        """
+        if not self.poi_store or not results:
+            return
+        covered_meters = radius_meters if complete_meters is None else min(radius_meters, complete_meters)
+        try:
+            self.poi_store.upsert_places(results, "google_places", category, (lat, lng))
+            if not self.budget_exhausted() and covered_meters > 0:
+                self.poi_store.record_search(category, lat, lng, covered_meters, len(results))
+        except sqlite3.Error as e:
+            logger.warning("Could not store results for %s: %s", category, e)
+
+    def answer_from_store(self, origin_address: str, categories: List[str], search_radius_meters: int,
+                          max_price: Optional[int] = None) -> Optional[Dict[str, List[Dict]]]:
+        """Results for every category from the POI store, or None unless all are covered by recent searches.
+        Only used with POI_STORE_LOCAL_ANSWERS; costs one geocoding call.
+        """
+        if not self.poi_store or not poi_store.POI_STORE_LOCAL_ANSWERS:
+            return None
+        if any(self.parse_category_query(category)[1] != "me" for category in categories):
+            return None
+        lat, lng = self.geocode_address(origin_address)
+        if not lat:
+            return None
+        try:
+            if not all(self.poi_store.covered(category, lat, lng, search_radius_meters) for category in categories):
+                return None
+            results = {}
+            for category in categories:
+                places = self.poi_store.query(lat, lng, search_radius_meters, category=category, min_rating=4.4,
+                                              max_price=max_price, max_age_seconds=poi_store.POI_STORE_MAX_AGE_SECONDS,
+                                              include_unrated=True)
+                for place in places:
+                    if place.get('photo_url') and self.api_key:
+                        place['photo_url'] += f"&key={self.api_key}"
+                # Sort by rating and distance, like process_category_search
+                places.sort(key=lambda x: (-(x.get('rating') or 0), x.get('distance_meters', float('inf'))))
+                results[category] = places[:10]
+            return results
+        except sqlite3.Error as e:
+            logger.warning("POI store lookup failed: %s", e)
+            return None
+
+    @staticmethod
+    def _category_results(future: concurrent.futures.Future, category: str) -> List:
+        try:
+            return future.result()
+        except Exception as e:
+            logger.warning("Error searching %s: %s", category, e)
+            return []
+
+    def _map_categories(self, function: Callable[[str], List], categories: List[str], budget_deadline: float,
+                        timeout: Optional[float] = None) -> Tuple[Dict[str, List], Dict[concurrent.futures.Future, str]]:
+        """Run function(category) for every category on the search pool.
+
+        Returns:
+            The results of the categories that finished within timeout seconds (all of
+            them when timeout is None), and the futures of those still running
+        """
+        def run(category: str) -> List:
+            self._call_budget.deadline = budget_deadline
+            try:
+                return function(category)
+            finally:
+                self._call_budget.deadline = None
+
+        results: Dict[str, List] = {}
+        if not categories:
+            return results, {}
+        futures = search_pool.submit_all(run, categories)
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=timeout):
+                results[futures[future]] = self._category_results(future, futures[future])
+        except concurrent.futures.TimeoutError:
+            pass
+        return results, {future: category for future, category in futures.items() if category not in results}
+
+    def _search_categories_adaptive(self, origin_address: str, categories: List[str], search_radius_miles: float,
+                                    search_radius_meters: int, deadline_seconds: Optional[float],
+                                    on_category_complete: Optional[Callable[[str, List[Dict]], None]],
+                                    on_background_complete: Optional[Callable[[Dict], None]] = None,
+                                    max_price: Optional[int] = None,
+                                    fetch_budget: Optional[FetchBudget] = None) -> Dict:
+        """Search categories ring by ring, widening the radius only while places are too few or too sparse.
+
+        Nearby Search (rankby=distance) doesn't depend on the radius, so it runs once per
+        category, with its first ring. Each step then hydrates only the candidates whose
+        straight-line distance falls in the new ring, keeping what earlier steps found. The
+        search stops at the first radius with enough places for the itineraries at a
+        non-sparse density, at search_radius_miles, or at deadline_seconds.
+
+        A category is complete, and on_category_complete called, once no candidate lies
+        beyond the rings searched or the search stops. Categories still hydrating their
+        ring at the deadline are left out of the results and listed in pending_categories,
+        as in _search_categories_with_deadline: they finish that ring in the background and
+        on_background_complete(full_results) is called once they all have.
+        """
+        started = time.monotonic()
+        deadline_at = started + deadline_seconds if deadline_seconds is not None else None
+        budget_deadline = started + max(deadline_seconds or 0, SEARCH_BACKGROUND_BUDGET_SECONDS)
+        itinerary_count = fetch_budget.itinerary_count if fetch_budget else 5
+        places_needed = search_planner.places_needed(categories, itinerary_count)
+
+        # Geocode each distinct origin once rather than once per category
+        origins: Dict[str, Tuple[Optional[float], Optional[float]]] = {}
+        plans: Dict[str, Tuple[float, float, str]] = {}
+        for category in categories:
+            keyword, location_str = self.parse_category_query(category)
+            if location_str == "me":
+                location_str = origin_address
+            if location_str not in origins:
+                origins[location_str] = self.geocode_address(location_str)
+            lat, lng = origins[location_str]
+            if lat:
+                plans[category] = (lat, lng, self.keyword_to_place_type(keyword))
+
+        allowances = {category: fetch_budget.allowance(category) if fetch_budget else None for category in plans}
+        # Every qualifying candidate per category, including those past the top-10 cap, to
+        # work out how much of the area the search really covered
+        qualifying: Dict[str, List[Dict]] = {}
+        candidates_by_category: Dict[str, List[Tuple[float, Dict]]] = {}
+        hydrated: Dict[str, List[Dict]] = {category: [] for category in categories}
+        completed: Dict[str, List[Dict]] = {}
+        lock = threading.Lock()
+
+        def fetch_candidates(category: str) -> List[Tuple[float, Dict]]:
+            lat, lng, place_type = plans[category]
+            metrics.rate_limit_sleep(0.5, 'nearby')  # Rate limiting
+            qualifying[category] = self.nearby_candidates(lat, lng, place_type, min_rating=4.4, max_price=max_price,
+                                                          limit=None)
+            candidates = []
+            for candidate in qualifying[category][:search_planner.MAX_CANDIDATES_PER_CATEGORY]:
+                location = candidate.get('geometry', {}).get('location', {})
+                if location.get('lat') is not None and location.get('lng') is not None:
+                    distance = search_planner.haversine_meters(lat, lng, location['lat'], location['lng'])
+                else:
+                    distance = 0.0  # No position to judge; hydrate it with the first ring
+                candidates.append((distance, candidate))
+            if allowances[category]:
+                allowances[category].offer(len(candidates))
+            with lock:
+                candidates_by_category[category] = candidates
+            return candidates
+
+        def complete(category: str, radius_meters: float, notify: bool = True) -> None:
+            """Keep a category's best places within the search radius and record its coverage"""
+            results = [
+                result for result in hydrated[category]
+                if result.get('distance_meters', float('inf')) <= search_radius_meters
+            ]
+            # Sort by rating and distance, like process_category_search
+            results.sort(key=lambda x: (-(x.get('rating') or 0), x.get('distance_meters', float('inf'))))
+            if category in plans:
+                lat, lng, _ = plans[category]
+                complete_meters = search_planner.complete_radius(lat, lng, qualifying.get(category, []), hydrated[category])
+                self.remember_results(category, lat, lng, radius_meters, results, complete_meters)
+            if allowances.get(category):
+                allowances[category].finish()
+            with lock:
+                completed[category] = results[:10]
+            if notify and on_category_complete:
+                on_category_complete(category, completed[category])
 
-        # Process specified categories
-        all_results = {}
         for category in categories:
-            print(f"Searching {category}...")
-            category_query, results = self.process_category_search(category, origin_address, search_radius_meters)
-            all_results[category] = results
-            print(f"✓ Completed: {category} - Found {len(results)} places")
+            if category not in plans:
+                complete(category, 0)
+
+        steps = []
+        pending: Dict[concurrent.futures.Future, str] = {}
+        searching = list(plans)
+        inner_meters = -1.0
+        for radius_miles in search_planner.radius_steps(search_radius_miles):
+            radius_meters = radius_miles * 1609.34
+
+            def hydrate_ring(category: str, inner: float = inner_meters, outer: float = radius_meters) -> List[Dict]:
+                candidates = candidates_by_category.get(category)
+                if candidates is None:
+                    candidates = fetch_candidates(category)
+                lat, lng, place_type = plans[category]
+                ring = [candidate for distance, candidate in candidates if inner < distance <= outer]
+                return self.hydrate_candidates(lat, lng, place_type, ring, allowances[category]) if ring else []
+
+            timeout = None if deadline_at is None else max(0.0, deadline_at - time.monotonic())
+            ring_results, pending = self._map_categories(hydrate_ring, searching, budget_deadline, timeout)
+            inner_meters = radius_meters
+            for category, results in ring_results.items():
+                hydrated[category].extend(results)
+                # A failed Nearby Search leaves no candidates; nothing further out to wait for
+                with lock:
+                    candidates = candidates_by_category.get(category, [])
+                if all(distance <= radius_meters for distance, _ in candidates):
+                    complete(category, radius_meters)
+            searching = [category for category in searching if category not in completed and category not in pending.values()]
+
+            found = len({
+                place.get('place_id') or place.get('name')
+                for category in categories for place in hydrated[category]
+                if place.get('distance_meters', float('inf')) <= search_radius_meters
+            })
+            density = search_planner.area_density(found, radius_miles)
+            steps.append({'radius_miles': radius_miles, 'places_found': found, 'density': density})
+            tracing.event("search.radius_step", radius_miles=radius_miles, places_found=found, density=density)
+            logger.debug("Radius %s miles: %s places (%s), need %s", radius_miles, found, density, places_needed)
+            if pending or (deadline_at is not None and time.monotonic() >= deadline_at):
+                logger.info("Deadline of %ss reached at radius %s miles", deadline_seconds, radius_miles,
+                            pending=", ".join(pending.values()))
+                break
+            if not searching or (found >= places_needed and density != "sparse"):
+                break
+
+        for category in searching:
+            complete(category, inner_meters)
+
+        with lock:
+            finished = {category: completed[category] for category in categories if category in completed}
+            candidates_beyond = sum(
+                1 for candidates in candidates_by_category.values() for distance, _ in candidates if distance > inner_meters
+            )
+        pending_categories = [category for category in categories if category in pending.values()]
+        summary = self._summarize_results(origin_address, categories, search_radius_miles, search_radius_meters,
+                                          finished, fetch_budget)
+        metadata = summary['search_metadata']
+        radius_used = steps[-1]['radius_miles'] if steps else search_radius_miles
+        # What the full radius would hold at the density seen so far
+        estimate = round(metadata['total_places_found'] * (search_radius_miles / radius_used) ** 2)
+        metadata['places_available'] = max(metadata.get('places_available', 0), estimate)
+        metadata['adaptive_radius'] = {
+            'radius_miles': radius_used,
+            'max_radius_miles': search_radius_miles,
+            'places_needed': places_needed,
+            'steps': steps,
+            'candidates_beyond_radius': candidates_beyond,
+        }
+        metadata['partial'] = bool(pending_categories)
+        metadata['pending_categories'] = pending_categories
+        metadata['elapsed_seconds'] = round(time.monotonic() - started, 2)
+        logger.info("Adaptive search stopped at %s of %s miles", radius_used, search_radius_miles,
+                    places_found=metadata['total_places_found'], partial=metadata['partial'])
+
+        if pending:
+            # The request generates from these place dicts while the background summary re-keys its own copies
+            finished_snapshot = copy.deepcopy(finished)
+            adaptive_metadata = copy.deepcopy(metadata['adaptive_radius'])
+            remaining = [len(pending)]
+            stop_meters = inner_meters
+
+            def finish_in_background():
+                full = self._summarize_results(
+                    origin_address, categories, search_radius_miles, search_radius_meters,
+                    {category: finished_snapshot.get(category) or completed.get(category, []) for category in categories},
+                    fetch_budget
+                )
+                full['search_metadata']['adaptive_radius'] = adaptive_metadata
+                full['search_metadata']['partial'] = False
+                full['search_metadata']['pending_categories'] = []
+                full['search_metadata']['elapsed_seconds'] = round(time.monotonic() - started, 2)
+                if on_background_complete:
+                    try:
+                        on_background_complete(full)
+                    except Exception as e:
+                        logger.warning("Error storing background search results: %s", e)
+
+            def on_pending_done(future: concurrent.futures.Future) -> None:
+                # Each pending category finishes its ring on its pool worker; the last one finishes the summary
+                category = pending[future]
+                hydrated[category].extend(self._category_results(future, category))
+                complete(category, stop_meters, notify=False)
+                logger.info("✓ Completed in background: %s - Found %s places", category, len(completed[category]))
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    finish_in_background()
+
+            for future in pending:
+                future.add_done_callback(upstream.bind_context(on_pending_done))
+
+        return summary
+
+    def _summarize_results(self, origin_address: str, categories: List[str], search_radius_miles: float,
+                           search_radius_meters: int, all_results: Dict[str, List[Dict]],
+                           fetch_budget: Optional[FetchBudget] = None) -> Dict:
+        """Dedupe places across categories and wrap them with search metadata"""
+        # The same place often matches several categories; keep it under the first one
+        identity_index = PlaceIdentityIndex()
+        all_results = identity_index.dedupe_results_by_category(all_results)
+        if identity_index.duplicates_merged:
+            logger.debug("Merged %s places found under multiple categories", identity_index.duplicates_merged)
 
         # Create summary
         total_places = sum(len(results) for results in all_results.values())
@@ -382,11 +1039,12 @@ class ChaloSearchEngine:
             },
             'results_by_category': all_results
         }
-
-        print("-" * 60)
-        print(f"Chalo Specific Search Complete!")
-        print(f"Total places found: {total_places}")
-
+        if fetch_budget:
+            report = fetch_budget.report()
+            summary['search_metadata']['fetch_budget'] = report
+            summary['search_metadata']['places_available'] = report['places_available']
+            if report['details_calls_saved']:
+                logger.info("Fetch budget skipped %s of %s candidates", report['details_calls_saved'], report['places_available'])
         return summary
 
     def get_cache_key(self, origin_address: str, categories: List[str]) -> str:
@@ -399,15 +1057,15 @@ class ChaloSearchEngine:
         timestamp = time.strftime('%Y%m%d_%H%M%S')
         safe_location = origin_address.replace(' ', '_').replace(',', '').replace('/', '_')
         filename = f"search_results_{safe_location}_{timestamp}.json"
-        filepath = os.path.join('search_results', filename)
+        filepath = os.path.join(SEARCH_RESULTS_DIR, filename)
         
         # Create directory if it doesn't exist
-        os.makedirs('search_results', exist_ok=True)
+        os.makedirs(SEARCH_RESULTS_DIR, exist_ok=True)
         
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(results, f, indent=2, ensure_ascii=False)
         
-        print(f"Search results saved to: {filepath}")
+        logger.info("Search results saved to: %s", filepath)
         return filepath
     
     def load_cached_results(self, cache_key: str) -> Optional[Dict]:
@@ -437,22 +1095,56 @@ class ChaloSearchEngine:
             with open(cache_file, 'w', encoding='utf-8') as f:
                 json.dump(results, f, indent=2, ensure_ascii=False)
         except Exception as e:
-            print(f"Failed to save cache: {e}")
+            logger.warning("Failed to save cache: %s", e)
 
-    def search_all_categories(self, origin_address: str, search_radius_miles: float = 2.5) -> Dict:
-        """Search all categories and return organized results - CACHING DISABLED FOR TESTING"""
+    def search_all_categories(self, origin_address: str, search_radius_miles: float = 2.5,
+                              on_category_complete: Optional[Callable[[str, List[Dict]], None]] = None,
+                              deadline_seconds: Optional[float] = None,
+                              on_background_complete: Optional[Callable[[Dict], None]] = None,
+                              categories: Optional[List[str]] = None, max_price: Optional[int] = None,
+                              fetch_budget: Optional[FetchBudget] = None,
+                              adaptive_radius: Optional[bool] = None) -> Dict:
+        """Search all categories and return organized results - CACHING DISABLED FOR TESTING
+        categories narrows the search plan to a subset of CHALO_CATEGORIES (e.g. a preset's);
+        only those categories are sent upstream. max_price, fetch_budget and adaptive_radius
+        (default: SEARCH_ADAPTIVE_RADIUS) are passed to search_specific_categories.
+        """
+        if adaptive_radius is None:
+            adaptive_radius = search_planner.SEARCH_ADAPTIVE_RADIUS_ENABLED
+        categories = list(categories) if categories else CHALO_CATEGORIES
         # TESTING MODE: Check if testing mode is enabled
         if self.testing_mode:
-            print(f"TESTING MODE: Using saved Manhattan data for {origin_address}")
-            return self.load_testing_data()
+            logger.info("TESTING MODE: Using saved Manhattan data for %s", origin_address)
+            data = self.load_testing_data()
+            if categories is not CHALO_CATEGORIES:
+                data['results_by_category'] = {
+                    category: places for category, places in data['results_by_category'].items()
+                    if category in categories
+                }
+                data['search_metadata']['categories_searched'] = len(categories)
+                data['search_metadata']['total_places_found'] = sum(
+                    len(places) for places in data['results_by_category'].values()
+                )
+            if on_category_complete:
+                for category, places in data.get('results_by_category', {}).items():
+                    on_category_complete(category, places)
+            return data
         
 
         
         # Always perform fresh search (no cache check)
-        results = self.search_specific_categories(origin_address, CHALO_CATEGORIES, search_radius_miles)
+        def save_and_forward(full_results: Dict):
+            self.save_results_to_file(full_results, origin_address)
+            if on_background_complete:
+                on_background_complete(full_results)
+
+        results = self.search_specific_categories(origin_address, categories, search_radius_miles,
+                                                  on_category_complete, deadline_seconds, save_and_forward, max_price,
+                                                  fetch_budget, adaptive_radius)
         
-        # Save results to file for review
-        self.save_results_to_file(results, origin_address)
+        # Save results to file for review (partial results are saved once the background search finishes)
+        if not results['search_metadata'].get('partial'):
+            self.save_results_to_file(results, origin_address)
         
         # Skip saving to cache for testing
         # self.save_cached_results(cache_key, results)
@@ -463,17 +1155,36 @@ class ChaloSearchEngine:
     def set_testing_mode(self, enabled: bool):
         """Enable or disable testing mode"""
         self.testing_mode = enabled
-        print(f"Testing mode {'enabled' if enabled else 'disabled'}")
+        logger.info("Testing mode %s", 'enabled' if enabled else 'disabled')
     
     def load_testing_data(self) -> Dict:
-        """Load saved Manhattan search results for testing"""
+        """Load saved Manhattan search results for testing.
+        The file is parsed once and reused until it changes; each call gets its own
+        copies of the place dicts because callers annotate them.
+        """
         try:
-            with open(self.testing_data_file, 'r') as f:
-                data = json.load(f)
-                print(f"Loaded testing data: {data['search_metadata']['total_places_found']} places")
-                return data
+            mtime = os.path.getmtime(self.testing_data_file)
+            cached = self._testing_data_cache
+            if cached is None or cached[0] != self.testing_data_file or cached[1] != mtime:
+                with open(self.testing_data_file, 'r') as f:
+                    data = json.load(f)
+                # Saved files predate place_id in the Details fields, so derive keys here
+                data['results_by_category'] = PlaceIdentityIndex().dedupe_results_by_category(
+                    data.get('results_by_category', {})
+                )
+                self._testing_data_cache = cached = (self.testing_data_file, mtime, data)
+                logger.info("Loaded testing data: %s places", data['search_metadata']['total_places_found'])
+            data = cached[2]
+            return {
+                **data,
+                'search_metadata': dict(data['search_metadata']),
+                'results_by_category': {
+                    category: [dict(place) for place in places]
+                    for category, places in data['results_by_category'].items()
+                },
+            }
         except FileNotFoundError:
-            print(f"Testing data file not found: {self.testing_data_file}")
+            logger.warning("Testing data file not found: %s", self.testing_data_file)
             # Return empty structure if file not found
             return {
                 "search_metadata": {
@@ -489,7 +1200,7 @@ class ChaloSearchEngine:
                 "results_by_category": {}
             }
         except Exception as e:
-            print(f"Error loading testing data: {e}")
+            logger.warning("Error loading testing data: %s", e)
             return {
                 "search_metadata": {
                     "origin_address": "manhattan, NY",
@@ -580,6 +1291,8 @@ class ChaloSearchEngine:
                 itinerary[i]['next_stop_distance_miles'] = round(distance_meters / 1609.34, 2)
             else:
                 itinerary[i]['next_stop_distance_miles'] = None
+        if pair_cache.cache:
+            pair_cache.cache.flush()
         
         return itinerary
 
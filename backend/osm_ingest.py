@@ -0,0 +1,374 @@
+"""
+Bulk ingest of OpenStreetMap extracts into the POI store.
+
+Reads a local extract and upserts every named point of interest whose tags
+map to a Chalo category, in batches, so memory stays flat however large the
+file is. Each place gets Google-style ``types`` (so ``categorize_place``
+treats it like a Places result) and the search categories it belongs to. Every
+grid cell of the extract's footprint is recorded as covered for every category,
+with no places where the extract has none of that category, so with
+POI_STORE_LOCAL_ANSWERS=1 searches there are answered without API calls.
+OSM has no ratings; such places are stored unrated, and places already found
+by a search (same name, close by) are not duplicated.
+
+Inputs:
+    *.geojsonseq / *.geojsonl / *.ndjson  one feature per line (``osmium export -f geojsonseq``)
+    *.geojson / *.json                    a FeatureCollection, parsed feature by feature
+    *.osm.pbf                             needs the optional ``osmium`` package (pip install osmium)
+
+Usage:
+    python osm_ingest.py manhattan.geojsonseq
+    python osm_ingest.py new-york-latest.osm.pbf --node-index sparse_file_array,/tmp/nodes.idx
+"""
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import math
+import os
+import re
+import time
+
+from poi_store import POIStore, DEFAULT_PATH, METERS_PER_DEGREE_LAT
+
+
+SOURCE = "osm"
+DEFAULT_BATCH_SIZE = 5000
+READ_CHUNK_BYTES = 1 << 20
+# Coverage is recorded per square cell of this size inside the extract's footprint
+COVERAGE_CELL_METERS = 400
+# The "features" key (not a "features" string value) and the bracket opening its array
+FEATURES_ARRAY = re.compile(r'"features"\s*:\s*\[')
+
+# (tag key, tag value or "*") -> (Google-style types, Chalo search category or None).
+# Checked in order; the first match wins.
+TAG_RULES: List[Tuple[str, str, List[str], Optional[str]]] = [
+    ('tourism', 'museum', ['museum', 'tourist_attraction'], "museums near me"),
+    ('tourism', 'gallery', ['art_gallery'], "galleries near me"),
+    ('shop', 'art', ['art_gallery', 'store'], "galleries near me"),
+    ('tourism', 'zoo', ['zoo', 'tourist_attraction'], "tourist attractions near me"),
+    ('tourism', 'aquarium', ['aquarium', 'tourist_attraction'], "tourist attractions near me"),
+    ('tourism', 'theme_park', ['amusement_park', 'tourist_attraction'], "tourist attractions near me"),
+    ('tourism', 'attraction', ['tourist_attraction'], "tourist attractions near me"),
+    ('tourism', 'viewpoint', ['tourist_attraction'], "tourist attractions near me"),
+    ('historic', '*', ['tourist_attraction'], "tourist attractions near me"),
+    ('amenity', 'cafe', ['cafe', 'food'], "cafes and bakeries near me"),
+    ('shop', 'bakery', ['bakery', 'food'], "cafes and bakeries near me"),
+    ('shop', 'pastry', ['bakery', 'food'], "cafes and bakeries near me"),
+    ('shop', 'deli', ['restaurant', 'meal_takeaway', 'food'], "delis near me"),
+    ('amenity', 'restaurant', ['restaurant', 'food'], "restaurants near me"),
+    ('amenity', 'fast_food', ['meal_takeaway', 'food'], "restaurants near me"),
+    ('amenity', 'food_court', ['restaurant', 'food'], "restaurants near me"),
+    ('leisure', 'park', ['park'], "parks near me"),
+    ('leisure', 'garden', ['park'], "parks near me"),
+    ('leisure', 'nature_reserve', ['park'], "parks near me"),
+    ('shop', 'second_hand', ['clothing_store', 'store'], "thrift stores near me"),
+    ('shop', 'charity', ['clothing_store', 'store'], "thrift stores near me"),
+    ('amenity', 'marketplace', ['store', 'food'], "markets near me"),
+    ('shop', 'farm', ['store', 'food'], "markets near me"),
+    ('shop', 'books', ['book_store', 'store'], None),
+    ('amenity', 'library', ['library'], None),
+    ('amenity', 'cinema', ['movie_theater'], None),
+    ('shop', 'clothes', ['clothing_store', 'store'], None),
+    ('shop', 'mall', ['shopping_mall'], None),
+]
+WORSHIP_TYPES = {'christian': 'church', 'jewish': 'synagogue', 'muslim': 'mosque'}
+CATEGORIES = list(dict.fromkeys(category for _, _, _, category in TAG_RULES if category))
+
+
+def map_tags(tags: Dict[str, str]) -> Optional[Tuple[List[str], Optional[str]]]:
+    """Google-style types and Chalo search category for a set of OSM tags, or None if not a POI we use"""
+    for key, value, types, category in TAG_RULES:
+        tag_value = tags.get(key)
+        if tag_value and (value == '*' or tag_value == value):
+            return list(types) + ['point_of_interest', 'establishment'], category
+    if tags.get('amenity') == 'place_of_worship' and tags.get('religion') in WORSHIP_TYPES:
+        return [WORSHIP_TYPES[tags['religion']], 'place_of_worship', 'point_of_interest', 'establishment'], None
+    if tags.get('shop'):
+        return ['store', 'point_of_interest', 'establishment'], None
+    return None
+
+
+def place_from_tags(osm_id: str, tags: Dict[str, str], lat: float, lng: float) -> Optional[Tuple[Dict, Optional[str]]]:
+    """A formatted place (the shape format_place_data produces) and its search category"""
+    name = tags.get('name')
+    mapped = map_tags(tags) if name else None
+    if not mapped:
+        return None
+    types, category = mapped
+    street = " ".join(part for part in (tags.get('addr:housenumber'), tags.get('addr:street')) if part)
+    address = ", ".join(part for part in (street, tags.get('addr:city')) if part) or None
+    return {
+        'place_id': f"osm_{osm_id.replace('/', '_')}",
+        'name': name,
+        'latitude': round(lat, 7),
+        'longitude': round(lng, 7),
+        'address': address,
+        'distance_meters': None,
+        'distance_miles': None,
+        'rating': None,
+        'user_ratings_total': None,
+        'price_level': None,
+        'types': types,
+        'opening_hours': None,
+        'osm_opening_hours': tags.get('opening_hours'),
+        'phone_number': tags.get('phone') or tags.get('contact:phone'),
+        'website': tags.get('website') or tags.get('contact:website'),
+        'photo_url': None,
+        'latest_review': None,
+        'editorial_summary': tags.get('description'),
+    }, category
+
+
+def _centroid(coordinates: Any) -> Optional[Tuple[float, float]]:
+    """Mean of a geometry's vertices as (lat, lng); good enough to place a park or building"""
+    total_lng = total_lat = 0.0
+    count = 0
+    stack = [coordinates]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, list) and len(item) >= 2 and all(isinstance(v, (int, float)) for v in item[:2]):
+            total_lng += item[0]
+            total_lat += item[1]
+            count += 1
+        elif isinstance(item, list):
+            stack.extend(item)
+    return (total_lat / count, total_lng / count) if count else None
+
+
+def place_from_feature(feature: Dict) -> Optional[Tuple[Dict, Optional[str]]]:
+    properties = feature.get('properties') or {}
+    # osmium export puts tags at the top level of properties; Overpass exports nest them
+    tags = properties.get('tags') if isinstance(properties.get('tags'), dict) else properties
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') == 'Point':
+        coordinates = geometry.get('coordinates') or []
+        point = (coordinates[1], coordinates[0]) if len(coordinates) >= 2 else None
+    else:
+        point = _centroid(geometry.get('coordinates'))
+    if point is None:
+        return None
+    osm_id = str(feature.get('id') or properties.get('@id') or properties.get('id') or "")
+    if not osm_id:
+        osm_id = f"{tags.get('name', '')}@{point[0]:.5f},{point[1]:.5f}"
+    return place_from_tags(osm_id, tags, point[0], point[1])
+
+
+def iter_geojson_seq(path: str) -> Iterator[Dict]:
+    """Features from a GeoJSON text sequence (one per line, optionally RS-prefixed)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip().lstrip('\x1e')
+            if line:
+                yield json.loads(line)
+
+
+def iter_feature_collection(path: str) -> Iterator[Dict]:
+    """Features from a FeatureCollection, decoded one at a time from a sliding buffer"""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = ""
+        # Skip to the start of the "features" array
+        while True:
+            chunk = f.read(READ_CHUNK_BYTES)
+            if not chunk:
+                return
+            buffer += chunk
+            match = FEATURES_ARRAY.search(buffer)
+            if match:
+                buffer = buffer[match.end():]
+                break
+            # Keep a key that may be split across chunks
+            marker = buffer.rfind('"features"')
+            buffer = buffer[marker:] if marker >= 0 else buffer[-16:]
+        eof = False
+        while True:
+            buffer = buffer.lstrip(" \t\r\n,")
+            if buffer.startswith(']'):
+                return
+            try:
+                feature, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                chunk = f.read(READ_CHUNK_BYTES)
+                eof = not chunk
+                buffer += chunk
+                continue
+            yield feature
+            buffer = buffer[end:]
+
+
+def iter_pbf(path: str, node_index: str = "flex_mem") -> Iterator[Tuple[Dict, Optional[str]]]:
+    """
+    Places from an OSM PBF file via pyosmium: tagged nodes and areas (closed ways, multipolygons).
+
+    Raises:
+        RuntimeError: If the osmium package is not installed
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .osm.pbf needs the osmium package (pip install osmium), "
+                           "or convert first: osmium export -f geojsonseq extract.osm.pbf -o extract.geojsonseq")
+
+    # FileProcessor reads block by block; areas are assembled from closed ways and multipolygons
+    processor = osmium.FileProcessor(path).with_locations(node_index).with_areas()
+    for obj in processor:
+        if 'name' not in obj.tags:
+            continue
+        if obj.is_node():
+            place = place_from_tags(f"node/{obj.id}", dict(obj.tags), obj.location.lat, obj.location.lon)
+        elif obj.is_area():
+            lat_total = lng_total = 0.0
+            count = 0
+            for ring in obj.outer_rings():
+                for node_ref in ring:
+                    if node_ref.location.valid():
+                        lat_total += node_ref.location.lat
+                        lng_total += node_ref.location.lon
+                        count += 1
+            if not count:
+                continue
+            osm_id = f"{'way' if obj.from_way() else 'relation'}/{obj.orig_id()}"
+            place = place_from_tags(osm_id, dict(obj.tags), lat_total / count, lng_total / count)
+        else:
+            continue
+        if place:
+            yield place
+
+
+def iter_places(path: str, node_index: str = "flex_mem") -> Iterator[Tuple[Dict, Optional[str]]]:
+    lower = path.lower()
+    if lower.endswith(".pbf"):
+        yield from iter_pbf(path, node_index)
+        return
+    if lower.endswith((".geojsonseq", ".geojsonl", ".geojsons", ".ndjson", ".jsonl")):
+        features = iter_geojson_seq(path)
+    else:
+        features = iter_feature_collection(path)
+    for feature in features:
+        place = place_from_feature(feature)
+        if place:
+            yield place
+
+
+class Coverage:
+    """
+    Grid cells of an extract's footprint, with their ingested places per category.
+
+    The footprint is every cell between the westmost and eastmost cell holding
+    a place, row by row, so a river or park inside the extract is part of it
+    while areas outside it still go upstream. Each footprint cell counts as
+    covered for every category; one without places of a category is a known zero.
+    """
+
+    def __init__(self, cell_meters: float = COVERAGE_CELL_METERS):
+        self.cell_meters = cell_meters
+        self.cells: Dict[str, Dict[Tuple[int, int], int]] = {}
+        # Row -> (first, last) column holding a place of any kind
+        self.rows: Dict[int, Tuple[int, int]] = {}
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        row = math.floor(lat * METERS_PER_DEGREE_LAT / self.cell_meters)
+        row_lat = (row + 0.5) * self.cell_meters / METERS_PER_DEGREE_LAT
+        lng_meters = lng * METERS_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(row_lat)))
+        return row, math.floor(lng_meters / self.cell_meters)
+
+    def add(self, category: Optional[str], lat: float, lng: float) -> None:
+        row, column = cell = self._cell(lat, lng)
+        first, last = self.rows.get(row, (column, column))
+        self.rows[row] = (min(first, column), max(last, column))
+        if category:
+            cells = self.cells.setdefault(category, {})
+            cells[cell] = cells.get(cell, 0) + 1
+
+    def circles(self, categories: Optional[List[str]] = None) -> Iterator[Tuple[str, float, float, float, int]]:
+        """(category, lat, lng, radius_meters, places) of the circle around each footprint cell, for
+        categories (every Chalo category by default)"""
+        radius_meters = math.ceil(self.cell_meters * math.sqrt(2) / 2) + 1
+        for category in categories if categories is not None else CATEGORIES:
+            cells = self.cells.get(category, {})
+            for row, (first, last) in self.rows.items():
+                lat = (row + 0.5) * self.cell_meters / METERS_PER_DEGREE_LAT
+                meters_per_degree_lng = METERS_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(lat)))
+                for column in range(first, last + 1):
+                    lng = (column + 0.5) * self.cell_meters / meters_per_degree_lng
+                    yield category, lat, lng, radius_meters, cells.get((row, column), 0)
+
+
+def ingest(path: str, store: POIStore, batch_size: int = DEFAULT_BATCH_SIZE, node_index: str = "flex_mem",
+           record_coverage: bool = True, progress_every: int = 100000) -> Dict[str, Any]:
+    """
+    Stream places from an extract into the store in batches of batch_size.
+
+    Returns:
+        Counts of places written, by category, and the elapsed time
+    """
+    started = time.monotonic()
+    observed_at = time.time()
+    coverage = Coverage()
+    batch: Dict[Optional[str], List[Dict]] = {}
+    batched = 0
+    written = 0
+    by_category: Dict[str, int] = {}
+    next_report = progress_every
+
+    def flush() -> int:
+        count = 0
+        for category, places in batch.items():
+            count += store.upsert_places(places, SOURCE, category, observed_at=observed_at)
+        batch.clear()
+        return count
+
+    for place, category in iter_places(path, node_index):
+        batch.setdefault(category, []).append(place)
+        batched += 1
+        label = category or "other"
+        by_category[label] = by_category.get(label, 0) + 1
+        coverage.add(category, place['latitude'], place['longitude'])
+        if batched >= batch_size:
+            written += flush()
+            batched = 0
+            if progress_every and written >= next_report:
+                next_report += progress_every
+                print(f"  {written} places ({written / (time.monotonic() - started):.0f}/s)")
+    written += flush()
+
+    if record_coverage:
+        for category, lat, lng, radius_meters, count in coverage.circles():
+            store.record_search(category, lat, lng, radius_meters, count, SOURCE, observed_at)
+
+    return {
+        'places': written,
+        'by_category': by_category,
+        'elapsed_seconds': round(time.monotonic() - started, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load an OpenStreetMap extract into the Chalo POI store")
+    parser.add_argument("path", help=".osm.pbf, .geojson or .geojsonseq file")
+    parser.add_argument("--db", default=os.getenv("POI_STORE_PATH") or DEFAULT_PATH, help="POI store path")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Places per transaction")
+    parser.add_argument("--node-index", default="flex_mem",
+                        help="pyosmium location index for .pbf, e.g. sparse_file_array,/tmp/nodes.idx to keep memory flat")
+    parser.add_argument("--no-coverage", action="store_true",
+                        help="Don't mark the area as covered (places are stored but searches still go upstream)")
+    args = parser.parse_args()
+
+    store = POIStore(args.db)
+    print(f"Ingesting {args.path} into {args.db}")
+    try:
+        result = ingest(args.path, store, args.batch_size, args.node_index, not args.no_coverage)
+    except RuntimeError as e:
+        store.close()
+        raise SystemExit(str(e))
+    print(f"Wrote {result['places']} places in {result['elapsed_seconds']}s")
+    for category, count in sorted(result['by_category'].items(), key=lambda item: -item[1]):
+        print(f"  {count:>9}  {category}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
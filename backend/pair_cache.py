@@ -0,0 +1,232 @@
+"""
+Persistent cache of distances between pairs of places.
+
+Popular places show up in many itineraries, and every request used to
+recompute (or re-request) the distances between them. Pairs are keyed by the
+two place keys (see place_identity.py, order does not matter) and a travel
+mode, and remember where the value came from:
+
+- ``router``: the offline walking router (walking_router.py)
+- ``distance_matrix``: Google Distance Matrix
+
+Straight-line estimates are never stored: they are cheaper to recompute than
+to look up. A value is only replaced by one from the same or a better source.
+Lookups are served from an in-memory LRU in front of a SQLite table shared by
+every worker on the host; writes are batched.
+
+    PAIR_CACHE_PATH=cache/pair_distances.sqlite3   # empty to disable
+    PAIR_CACHE_MAX_AGE_DAYS=30
+    PAIR_CACHE_MEMORY_ENTRIES=200000
+"""
+
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from structured_logging import get_logger
+
+
+logger = get_logger("pair_cache")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "pair_distances.sqlite3")
+PAIR_CACHE_MAX_AGE_SECONDS = float(os.getenv("PAIR_CACHE_MAX_AGE_DAYS", "30")) * 86400
+PAIR_CACHE_MEMORY_ENTRIES = int(os.getenv("PAIR_CACHE_MEMORY_ENTRIES", "200000"))
+
+# Walking legs from the router and from Distance Matrix (mode=walking) share this mode,
+# so the source ranking decides between them
+WALKING = "walking"
+DRIVING = "driving"
+
+ROUTER = "router"
+DISTANCE_MATRIX = "distance_matrix"
+SOURCE_RANK = {ROUTER: 1, DISTANCE_MATRIX: 2}
+
+# Pending writes are committed in one transaction once this many accumulate
+FLUSH_BATCH = 500
+# Place keys per prefetch query, well under SQLite's bound-parameter limit
+PREFETCH_CHUNK = 400
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pair_distances (
+    place_a TEXT NOT NULL,
+    place_b TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    meters REAL NOT NULL,
+    source TEXT NOT NULL,
+    source_rank INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (place_a, place_b, mode)
+);
+"""
+
+PairKey = Tuple[str, str, str]
+
+
+def _pair_key(place_a: str, place_b: str, mode: str) -> PairKey:
+    return (place_a, place_b, mode) if place_a <= place_b else (place_b, place_a, mode)
+
+
+class PairDistanceCache:
+    """Pair distances in memory and SQLite; safe to share between threads."""
+
+    def __init__(self, path: str = DEFAULT_PATH, memory_entries: int = PAIR_CACHE_MEMORY_ENTRIES,
+                 max_age_seconds: float = PAIR_CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.memory_entries = memory_entries
+        self.max_age_seconds = max_age_seconds
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+        self._memory: "OrderedDict[PairKey, Tuple[float, str]]" = OrderedDict()
+        self._pending: Dict[PairKey, Tuple[float, str, float]] = {}
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key: PairKey, meters: float, source: str) -> None:
+        # Caller holds the lock
+        self._memory[key] = (meters, source)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, place_a: str, place_b: str, mode: str = WALKING) -> Optional[Tuple[float, str]]:
+        """(meters, source) for a pair, or None if it was never measured"""
+        key = _pair_key(place_a, place_b, mode)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                self._memory.move_to_end(key)
+                metrics.pair_cache_lookups.inc(result="hit")
+                return cached
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._remember(key, pending[0], pending[1])
+                metrics.pair_cache_lookups.inc(result="hit")
+                return pending[0], pending[1]
+            row = self._conn.execute(
+                "SELECT meters, source FROM pair_distances WHERE place_a = ? AND place_b = ? AND mode = ? "
+                "AND updated_at >= ?", (*key, time.time() - self.max_age_seconds)
+            ).fetchone()
+            if row is None:
+                metrics.pair_cache_lookups.inc(result="miss")
+                return None
+            self._remember(key, row[0], row[1])
+            metrics.pair_cache_lookups.inc(result="hit")
+            return row[0], row[1]
+
+    def put(self, place_a: str, place_b: str, meters: float, source: str, mode: str = WALKING) -> None:
+        """Record a measured pair unless a better source already measured it"""
+        key = _pair_key(place_a, place_b, mode)
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None and SOURCE_RANK[cached[1]] > SOURCE_RANK[source]:
+                return
+            self._remember(key, meters, source)
+            self._pending[key] = (meters, source, time.time())
+            flush = len(self._pending) >= FLUSH_BATCH
+        if flush:
+            self.flush()
+
+    def prefetch(self, place_keys: Iterable[str], mode: str = WALKING) -> Set[Tuple[str, str]]:
+        """
+        Load every stored pair among place_keys into memory with one query per
+        chunk of keys, so the pairwise lookups that follow stay in memory.
+
+        Returns:
+            The pairs among place_keys the cache holds, each as (smaller key, larger key)
+        """
+        keys = sorted(set(key for key in place_keys if key))
+        held: Set[Tuple[str, str]] = set()
+        if len(keys) < 2:
+            return held
+        cutoff = time.time() - self.max_age_seconds
+        key_set = set(keys)
+        with self._lock:
+            for start in range(0, len(keys), PREFETCH_CHUNK):
+                chunk = keys[start:start + PREFETCH_CHUNK]
+                rows = self._conn.execute(
+                    f"SELECT place_a, place_b, meters, source FROM pair_distances "
+                    f"WHERE mode = ? AND updated_at >= ? AND place_a IN ({','.join('?' * len(chunk))})",
+                    (mode, cutoff, *chunk)
+                ).fetchall()
+                for place_a, place_b, meters, source in rows:
+                    if place_b not in key_set:
+                        continue
+                    key = (place_a, place_b, mode)
+                    cached = self._memory.get(key)
+                    if cached is None or SOURCE_RANK[cached[1]] <= SOURCE_RANK[source]:
+                        self._remember(key, meters, source)
+                    held.add((place_a, place_b))
+            # Measured by this worker but not written yet
+            for place_a, place_b, pending_mode in self._pending:
+                if pending_mode == mode and place_a in key_set and place_b in key_set:
+                    held.add((place_a, place_b))
+        return held
+
+    def flush(self) -> int:
+        """Commit pending measurements; returns how many were written"""
+        with self._lock:
+            if not self._pending:
+                return 0
+            pending, self._pending = self._pending, {}
+            rows = [(*key, meters, source, SOURCE_RANK[source], updated_at)
+                    for key, (meters, source, updated_at) in pending.items()]
+            try:
+                with self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO pair_distances (place_a, place_b, mode, meters, source, source_rank, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT (place_a, place_b, mode) DO UPDATE SET "
+                        "meters = excluded.meters, source = excluded.source, "
+                        "source_rank = excluded.source_rank, updated_at = excluded.updated_at "
+                        "WHERE excluded.source_rank >= pair_distances.source_rank "
+                        "OR pair_distances.updated_at < ?",
+                        [row + (time.time() - self.max_age_seconds,) for row in rows]
+                    )
+            except sqlite3.Error as e:
+                logger.warning("Pair distance cache write failed: %s", e)
+                return 0
+        return len(rows)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            by_source = {
+                source: count for source, count in
+                self._conn.execute("SELECT source, COUNT(*) FROM pair_distances GROUP BY source")
+            }
+            return {
+                'path': self.path,
+                'stored_pairs': sum(by_source.values()),
+                'stored_by_source': by_source,
+                'memory_pairs': len(self._memory),
+                'pending_writes': len(self._pending),
+                'max_age_days': self.max_age_seconds / 86400,
+            }
+
+
+def _open_default() -> Optional[PairDistanceCache]:
+    path = os.getenv("PAIR_CACHE_PATH", DEFAULT_PATH)
+    if not path:
+        return None
+    try:
+        return PairDistanceCache(path)
+    except sqlite3.Error as e:
+        logger.warning("Pair distance cache disabled, could not open %s: %s", path, e)
+        return None
+
+
+cache = _open_default()
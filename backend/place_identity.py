@@ -0,0 +1,212 @@
+"""
+Stable place identity for Chalo search results.
+
+Every place that flows through search, itinerary generation and the refresh
+endpoints is identified by a single key: the Google ``place_id`` when we have
+one, otherwise a short hash of the normalized name and rounded coordinates.
+The same place frequently comes back under several search categories (a deli
+is also a restaurant, a museum is also a tourist attraction), so this module
+also provides an index that merges those duplicates.
+"""
+
+from typing import Dict, Iterable, List, Optional, Set
+import hashlib
+import re
+
+
+# 4 decimal places is roughly 11 meters, enough to absorb geocoding jitter
+# between two API responses for the same storefront.
+COORDINATE_PRECISION = 4
+FALLBACK_KEY_PREFIX = "local-"
+STOP_ID_PREFIX = "stop-"
+
+_NAME_PUNCTUATION = re.compile(r"[^\w\s]")
+
+
+def compute_place_key(place: Dict) -> Optional[str]:
+    """
+    Compute the identity key for a place without consulting a cached value.
+
+    Args:
+        place: A formatted place (``latitude``/``longitude``) or a raw Google
+            result (``geometry.location``)
+
+    Returns:
+        The Google place_id, a fallback hash, or None if the place has neither
+        an id nor a name
+    """
+    place_id = place.get('place_id')
+    if place_id:
+        return place_id
+
+    name = (place.get('name') or '').strip().lower()
+    if not name:
+        return None
+
+    lat = place.get('latitude')
+    lng = place.get('longitude')
+    if lat is None or lng is None:
+        location = place.get('geometry', {}).get('location', {})
+        lat = location.get('lat')
+        lng = location.get('lng')
+
+    if lat is not None and lng is not None:
+        key_string = f"{name}|{round(lat, COORDINATE_PRECISION)}|{round(lng, COORDINATE_PRECISION)}"
+    else:
+        key_string = f"{name}|{(place.get('address') or '').strip().lower()}"
+
+    return FALLBACK_KEY_PREFIX + hashlib.sha1(key_string.encode()).hexdigest()[:16]
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Lowercase a place name, drop punctuation and a leading "the", and collapse whitespace."""
+    words = _NAME_PUNCTUATION.sub("", (name or "").lower().replace("&", " and ")).split()
+    if words[:1] == ["the"]:
+        words = words[1:]
+    return " ".join(words)
+
+
+def same_name(first: Optional[str], second: Optional[str]) -> bool:
+    """
+    Check whether two sources name the same place.
+
+    Names match when they are equal after normalize_name, or when one is the
+    other plus trailing words ("Joe's Pizza" and "Joe's Pizza Bleecker St").
+    A one-word name ("Cafe") only matches exactly.
+    """
+    first, second = normalize_name(first), normalize_name(second)
+    if not first or not second:
+        return False
+    shorter, longer = sorted((first, second), key=len)
+    if longer == shorter:
+        return True
+    return " " in shorter and longer.startswith(shorter + " ")
+
+
+def get_place_key(place: Dict) -> Optional[str]:
+    """
+    Return the identity key for a place, preferring the one assigned at search time.
+
+    Args:
+        place: A place dictionary
+
+    Returns:
+        The stable identity key, or None if one cannot be derived
+    """
+    return place.get('place_key') or compute_place_key(place)
+
+
+def assign_place_key(place: Dict) -> Optional[str]:
+    """
+    Store the identity key on the place so it travels with it.
+
+    Args:
+        place: A place dictionary, modified in place
+
+    Returns:
+        The assigned key
+    """
+    key = get_place_key(place)
+    if key:
+        place['place_key'] = key
+    return key
+
+
+def normalize_excluded_ids(excluded_ids: Iterable[str]) -> Set[str]:
+    """
+    Normalize client-supplied exclusion ids to place keys.
+
+    Clients send back the ``id`` of stops they have already seen, which is the
+    place key with a ``stop-`` prefix, or the ``place_id`` field directly.
+
+    Args:
+        excluded_ids: Stop ids and/or place keys
+
+    Returns:
+        A set of place keys
+    """
+    normalized = set()
+    for excluded_id in excluded_ids or []:
+        if not excluded_id:
+            continue
+        if excluded_id.startswith(STOP_ID_PREFIX):
+            excluded_id = excluded_id[len(STOP_ID_PREFIX):]
+        normalized.add(excluded_id)
+    return normalized
+
+
+def is_excluded(place: Dict, excluded_keys: Set[str]) -> bool:
+    """Check whether a place's identity key is in a normalized exclusion set."""
+    return bool(excluded_keys) and get_place_key(place) in excluded_keys
+
+
+class PlaceIdentityIndex:
+    """
+    Index of places by identity key that merges duplicates across categories.
+
+    The first occurrence of a place wins its slot; later occurrences only add
+    their search category to ``search_categories`` and fill in fields the first
+    response was missing.
+    """
+
+    def __init__(self):
+        """Initialize an empty index."""
+        self.places: Dict[str, Dict] = {}
+        self.duplicates_merged = 0
+
+    def __contains__(self, place_key: str) -> bool:
+        return place_key in self.places
+
+    def __len__(self) -> int:
+        return len(self.places)
+
+    def get(self, place_key: str) -> Optional[Dict]:
+        """Look up a place by identity key."""
+        return self.places.get(place_key)
+
+    def add(self, place: Dict, category: Optional[str] = None) -> bool:
+        """
+        Add a place to the index, merging it into an existing entry if known.
+
+        Args:
+            place: The place to add
+            category: The search category the place was found under
+
+        Returns:
+            True if the place is new, False if it was merged into an existing entry
+        """
+        key = assign_place_key(place)
+        if not key:
+            return True
+
+        existing = self.places.get(key)
+        if existing is None:
+            categories = list(place.get('search_categories') or [])
+            if category and category not in categories:
+                categories.append(category)
+            place['search_categories'] = categories
+            self.places[key] = place
+            return True
+
+        if category and category not in existing['search_categories']:
+            existing['search_categories'].append(category)
+        for field, value in place.items():
+            if value is not None and existing.get(field) is None:
+                existing[field] = value
+        self.duplicates_merged += 1
+        return False
+
+    def dedupe_results_by_category(self, results_by_category: Dict[str, List[Dict]]) -> Dict[str, List[Dict]]:
+        """
+        Remove places already listed under an earlier category.
+
+        Args:
+            results_by_category: Search results keyed by category query
+
+        Returns:
+            New results keyed by the same categories, each place listed once
+        """
+        deduped: Dict[str, List[Dict]] = {}
+        for category, places in results_by_category.items():
+            deduped[category] = [place for place in places if self.add(place, category)]
+        return deduped
@@ -0,0 +1,408 @@
+"""
+Persistent local store of every place the search engine has seen.
+
+Each hydrated search result is upserted into a SQLite database with an R-tree
+index on its coordinates. A place keeps its latest data, where it came from
+(``google_places``, ``osm``, ...), when it was first and last seen, and a
+history of its rating. Every category search is also recorded with its
+origin and radius. An area and category already searched recently count as
+covered, and such searches can be answered from the store without any
+upstream call.
+
+    POI_STORE_PATH=cache/poi_store.sqlite3   # empty to disable the store
+    POI_STORE_LOCAL_ANSWERS=0                # 1: answer covered searches locally
+    POI_STORE_MAX_AGE_HOURS=168              # how old a covering search may be
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from place_identity import get_place_key, same_name
+from search_planner import haversine_meters
+from structured_logging import get_logger
+
+
+logger = get_logger("poi_store")
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "poi_store.sqlite3")
+POI_STORE_LOCAL_ANSWERS = os.getenv("POI_STORE_LOCAL_ANSWERS", "0").lower() in ("1", "true", "yes")
+POI_STORE_MAX_AGE_SECONDS = float(os.getenv("POI_STORE_MAX_AGE_HOURS", "168")) * 3600
+
+# A stored walking distance is reused when the new origin is this close to the one it was measured from
+SAME_ORIGIN_METERS = 50
+METERS_PER_DEGREE_LAT = 111320.0
+
+# Unrated bulk ingests. A searched place replaces an ingested one with the same
+# name within DUPLICATE_METERS, and ingests skip places already searched.
+OFFLINE_SOURCES = ("osm",)
+DUPLICATE_METERS = 75
+# A circle not inside any single search is checked on a lattice of this many
+# points per radius (each way) against the union of the searches near it
+COVERAGE_LATTICE_STEPS = 8
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS places (
+    id INTEGER PRIMARY KEY,
+    place_key TEXT NOT NULL UNIQUE,
+    name TEXT,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    rating REAL,
+    user_ratings_total INTEGER,
+    price_level INTEGER,
+    types TEXT NOT NULL DEFAULT '[]',
+    source TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    origin_latitude REAL,
+    origin_longitude REAL,
+    data TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS places_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng);
+CREATE TABLE IF NOT EXISTS place_categories (
+    place_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    PRIMARY KEY (place_id, category)
+);
+CREATE INDEX IF NOT EXISTS place_categories_category ON place_categories (category);
+CREATE TABLE IF NOT EXISTS place_types (
+    place_id INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (place_id, type)
+);
+CREATE INDEX IF NOT EXISTS place_types_type ON place_types (type);
+CREATE TABLE IF NOT EXISTS rating_history (
+    place_id INTEGER NOT NULL,
+    observed_at REAL NOT NULL,
+    rating REAL,
+    user_ratings_total INTEGER,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rating_history_place ON rating_history (place_id, observed_at);
+CREATE TABLE IF NOT EXISTS searches (
+    id INTEGER PRIMARY KEY,
+    category TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    radius_meters REAL NOT NULL,
+    result_count INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    searched_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS searches_category ON searches (category, searched_at);
+"""
+
+
+def _strip_secret_params(url: Optional[str]) -> Optional[str]:
+    """Drop the API key from a URL (photo URLs embed it) before it is written to disk"""
+    if not url:
+        return url
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if name != 'key']
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _bounding_box(lat: float, lng: float, radius_meters: float):
+    delta_lat = radius_meters / METERS_PER_DEGREE_LAT
+    delta_lng = radius_meters / (METERS_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(lat))))
+    return lat - delta_lat, lat + delta_lat, lng - delta_lng, lng + delta_lng
+
+
+class POIStore:
+    """SQLite place store; safe to share between search threads."""
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        if path != ":memory:":
+            self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def upsert_places(self, places: Iterable[Dict], source: str, category: Optional[str] = None,
+                      origin: Optional[tuple] = None, observed_at: Optional[float] = None) -> int:
+        """
+        Insert or update places in one transaction.
+
+        Args:
+            places: Formatted places (latitude/longitude, rating, types, ...)
+            source: Where they came from, e.g. "google_places" or "osm"
+            category: Search query they were found under, if any
+            origin: (lat, lng) their distance_meters was measured from, if any
+            observed_at: Observation time (default now)
+
+        Returns:
+            Number of places written
+        """
+        observed_at = observed_at or time.time()
+        origin_lat, origin_lng = origin if origin else (None, None)
+        written = 0
+        with self._lock, self._conn:
+            for place in places:
+                place_key = get_place_key(place)
+                lat, lng = place.get('latitude'), place.get('longitude')
+                if not place_key or lat is None or lng is None:
+                    continue
+                data = dict(place)
+                data['photo_url'] = _strip_secret_params(data.get('photo_url'))
+                types = list(place.get('types') or [])
+                row = self._conn.execute(
+                    "SELECT id, rating, user_ratings_total FROM places WHERE place_key = ?", (place_key,)
+                ).fetchone()
+                values = (place.get('name'), lat, lng, place.get('rating'), place.get('user_ratings_total'),
+                          place.get('price_level'), json.dumps(types), source, observed_at)
+                if row is None:
+                    duplicate_id = self._find_duplicate(place.get('name'), lat, lng, source in OFFLINE_SOURCES)
+                    if duplicate_id is not None and source in OFFLINE_SOURCES:
+                        # Already searched: the searched place answers for this category too
+                        if category:
+                            self._conn.execute("INSERT OR IGNORE INTO place_categories VALUES (?, ?)", (duplicate_id, category))
+                        continue
+                    place_id = self._conn.execute(
+                        "INSERT INTO places (name, latitude, longitude, rating, user_ratings_total, price_level, types, "
+                        "source, last_seen, place_key, first_seen, origin_latitude, origin_longitude, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        values + (place_key, observed_at, origin_lat, origin_lng, json.dumps(data, default=str))
+                    ).lastrowid
+                    rating_changed = True
+                    if duplicate_id is not None:
+                        self._replace_duplicate(duplicate_id, place_id)
+                else:
+                    place_id = row['id']
+                    rating_changed = (row['rating'], row['user_ratings_total']) != (place.get('rating'), place.get('user_ratings_total'))
+                    if origin is None:
+                        # Keep the distance measured from the last search origin
+                        stored = json.loads(self._conn.execute("SELECT data FROM places WHERE id = ?", (place_id,)).fetchone()['data'])
+                        data['distance_meters'] = stored.get('distance_meters')
+                    self._conn.execute(
+                        "UPDATE places SET name = ?, latitude = ?, longitude = ?, rating = ?, user_ratings_total = ?, "
+                        "price_level = ?, types = ?, source = ?, last_seen = ?, "
+                        "origin_latitude = COALESCE(?, origin_latitude), origin_longitude = COALESCE(?, origin_longitude), "
+                        "data = ? WHERE id = ?",
+                        values + (origin_lat, origin_lng, json.dumps(data, default=str), place_id)
+                    )
+                self._conn.execute("INSERT OR REPLACE INTO places_rtree VALUES (?, ?, ?, ?, ?)", (place_id, lat, lat, lng, lng))
+                self._conn.execute("DELETE FROM place_types WHERE place_id = ?", (place_id,))
+                self._conn.executemany("INSERT OR IGNORE INTO place_types VALUES (?, ?)", [(place_id, t) for t in types])
+                if category:
+                    self._conn.execute("INSERT OR IGNORE INTO place_categories VALUES (?, ?)", (place_id, category))
+                if rating_changed and (place.get('rating') is not None or place.get('user_ratings_total') is not None):
+                    self._conn.execute(
+                        "INSERT INTO rating_history VALUES (?, ?, ?, ?, ?)",
+                        (place_id, observed_at, place.get('rating'), place.get('user_ratings_total'), source)
+                    )
+                written += 1
+        return written
+
+    def _find_duplicate(self, name: Optional[str], lat: float, lng: float, offline: bool) -> Optional[int]:
+        """
+        Id of a place from the other kind of source (searched if offline, else
+        offline) with the same name within DUPLICATE_METERS. Caller holds the lock.
+        """
+        if not name:
+            return None
+        min_lat, max_lat, min_lng, max_lng = _bounding_box(lat, lng, DUPLICATE_METERS)
+        marks = ", ".join("?" * len(OFFLINE_SOURCES))
+        rows = self._conn.execute(
+            "SELECT p.id, p.name, p.latitude, p.longitude FROM places_rtree r JOIN places p ON p.id = r.id "
+            "WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lng >= ? AND r.max_lng <= ? "
+            f"AND p.source {'NOT IN' if offline else 'IN'} ({marks})",
+            (min_lat, max_lat, min_lng, max_lng, *OFFLINE_SOURCES)
+        ).fetchall()
+        for row in rows:
+            if (haversine_meters(lat, lng, row['latitude'], row['longitude']) <= DUPLICATE_METERS
+                    and same_name(name, row['name'])):
+                return row['id']
+        return None
+
+    def _replace_duplicate(self, offline_id: int, place_id: int) -> None:
+        """Drop an ingested place in favour of the searched one, keeping its categories. Caller holds the lock."""
+        self._conn.execute(
+            "INSERT OR IGNORE INTO place_categories SELECT ?, category FROM place_categories WHERE place_id = ?",
+            (place_id, offline_id)
+        )
+        for table, column in (("places", "id"), ("places_rtree", "id"), ("place_categories", "place_id"),
+                              ("place_types", "place_id"), ("rating_history", "place_id")):
+            self._conn.execute(f"DELETE FROM {table} WHERE {column} = ?", (offline_id,))
+
+    def record_search(self, category: str, lat: float, lng: float, radius_meters: float, result_count: int,
+                      source: str = "google_places", searched_at: Optional[float] = None) -> None:
+        """Remember that a category was searched around a point"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO searches (category, latitude, longitude, radius_meters, result_count, source, searched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (category, lat, lng, radius_meters, result_count, source, searched_at or time.time())
+            )
+
+    def covered(self, category: str, lat: float, lng: float, radius_meters: float,
+                max_age_seconds: float = POI_STORE_MAX_AGE_SECONDS) -> bool:
+        """
+        Whether recent searches of this category cover the whole circle.
+
+        A single search containing it is enough. Otherwise (offline ingests
+        record one small circle per grid cell of the extract) every point of
+        a lattice over the circle has to lie in one of the searches near it.
+        """
+        outer = _bounding_box(lat, lng, 2 * radius_meters)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT latitude, longitude, radius_meters FROM searches "
+                "WHERE category = ? AND searched_at >= ? "
+                "AND (radius_meters >= ? OR (latitude BETWEEN ? AND ? AND longitude BETWEEN ? AND ?))",
+                (category, time.time() - max_age_seconds, radius_meters, *outer)
+            ).fetchall()
+
+        meters_per_degree_lng = METERS_PER_DEGREE_LAT * max(0.01, math.cos(math.radians(lat)))
+        circles = []
+        for row in rows:
+            distance = haversine_meters(lat, lng, row['latitude'], row['longitude'])
+            if distance + radius_meters <= row['radius_meters']:
+                return True
+            if distance < radius_meters + row['radius_meters']:
+                circles.append(((row['latitude'] - lat) * METERS_PER_DEGREE_LAT,
+                                (row['longitude'] - lng) * meters_per_degree_lng,
+                                row['radius_meters'] ** 2))
+        if not circles:
+            return False
+
+        step = radius_meters / COVERAGE_LATTICE_STEPS
+        last = circles[0]
+        for i in range(-COVERAGE_LATTICE_STEPS, COVERAGE_LATTICE_STEPS + 1):
+            for j in range(-COVERAGE_LATTICE_STEPS, COVERAGE_LATTICE_STEPS + 1):
+                x, y = i * step, j * step
+                if x * x + y * y > radius_meters * radius_meters:
+                    continue
+                # Neighbouring points usually fall in the same circle
+                if (x - last[0]) ** 2 + (y - last[1]) ** 2 <= last[2]:
+                    continue
+                last = next((c for c in circles if (x - c[0]) ** 2 + (y - c[1]) ** 2 <= c[2]), None)
+                if last is None:
+                    return False
+        return True
+
+    def query(self, lat: float, lng: float, radius_meters: float, place_type: Optional[str] = None,
+              category: Optional[str] = None, min_rating: Optional[float] = None, max_price: Optional[int] = None,
+              max_age_seconds: Optional[float] = None, limit: Optional[int] = None,
+              include_unrated: bool = False) -> List[Dict]:
+        """
+        Places within radius_meters of a point, closest first.
+
+        Args:
+            place_type: Only places with this Google type (e.g. "cafe")
+            category: Only places found under this search query
+            min_rating: Only places rated at least this
+            max_price: Drop places priced above this price_level (unpriced places are kept)
+            max_age_seconds: Only places seen this recently
+            limit: At most this many places
+            include_unrated: Keep unrated places from offline ingests (OpenStreetMap has
+                no ratings) when filtering by min_rating, unless a searched source has
+                places in the circle; then the rating floor applies to everything
+
+        Returns:
+            Formatted places; distance_meters is the stored walking distance when the
+            point is the origin it was measured from, otherwise the straight-line distance
+        """
+        min_lat, max_lat, min_lng, max_lng = _bounding_box(lat, lng, radius_meters)
+        sql = ["SELECT p.* FROM places_rtree r JOIN places p ON p.id = r.id "
+               "WHERE r.min_lat >= ? AND r.max_lat <= ? AND r.min_lng >= ? AND r.max_lng <= ?"]
+        params: List[Any] = [min_lat, max_lat, min_lng, max_lng]
+        if place_type:
+            sql.append("AND p.id IN (SELECT place_id FROM place_types WHERE type = ?)")
+            params.append(place_type)
+        if category:
+            sql.append("AND p.id IN (SELECT place_id FROM place_categories WHERE category = ?)")
+            params.append(category)
+        if min_rating is not None and not include_unrated:
+            sql.append("AND p.rating >= ?")
+            params.append(min_rating)
+        if max_price is not None:
+            sql.append("AND COALESCE(p.price_level, 0) <= ?")
+            params.append(max_price)
+        if max_age_seconds is not None:
+            sql.append("AND p.last_seen >= ?")
+            params.append(time.time() - max_age_seconds)
+        with self._lock:
+            rows = self._conn.execute(" ".join(sql), params).fetchall()
+
+        places = []
+        for row in rows:
+            straight_line = haversine_meters(lat, lng, row['latitude'], row['longitude'])
+            if straight_line > radius_meters:
+                continue
+            place = json.loads(row['data'])
+            same_origin = (row['origin_latitude'] is not None and place.get('distance_meters') is not None and
+                           haversine_meters(lat, lng, row['origin_latitude'], row['origin_longitude']) <= SAME_ORIGIN_METERS)
+            if not same_origin:
+                place['distance_meters'] = round(straight_line, 1)
+                place['distance_miles'] = round(straight_line / 1609.34, 2)
+            place['source'] = row['source']
+            place['last_seen'] = row['last_seen']
+            places.append(place)
+        if min_rating is not None and include_unrated:
+            searched_here = any(place['source'] not in OFFLINE_SOURCES for place in places)
+            places = [
+                place for place in places
+                if (place.get('rating') is not None and place['rating'] >= min_rating)
+                or (place.get('rating') is None and place['source'] in OFFLINE_SOURCES and not searched_here)
+            ]
+        places.sort(key=lambda place: place.get('distance_meters') or 0)
+        return places[:limit] if limit else places
+
+    def rating_history(self, place_key: str) -> List[Dict]:
+        """Rating observations for a place, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT h.observed_at, h.rating, h.user_ratings_total, h.source FROM rating_history h "
+                "JOIN places p ON p.id = h.place_id WHERE p.place_key = ? ORDER BY h.observed_at",
+                (place_key,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            places = self._conn.execute("SELECT COUNT(*) FROM places").fetchone()[0]
+            by_source = {
+                row['source']: row['n']
+                for row in self._conn.execute("SELECT source, COUNT(*) AS n FROM places GROUP BY source")
+            }
+            searches = self._conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+            history = self._conn.execute("SELECT COUNT(*) FROM rating_history").fetchone()[0]
+        return {
+            'path': self.path,
+            'places': places,
+            'places_by_source': by_source,
+            'searches': searches,
+            'rating_observations': history,
+            'local_answers': POI_STORE_LOCAL_ANSWERS,
+            'max_age_hours': POI_STORE_MAX_AGE_SECONDS / 3600,
+        }
+
+
+def _open_default() -> Optional[POIStore]:
+    path = os.getenv("POI_STORE_PATH", DEFAULT_PATH)
+    if not path:
+        return None
+    try:
+        return POIStore(path)
+    except sqlite3.Error as e:
+        logger.warning("POI store disabled, could not open %s: %s", path, e)
+        return None
+
+
+store = _open_default()
@@ -0,0 +1,310 @@
+"""
+On-demand profiling for a running worker.
+
+``RequestProfiler`` runs cProfile over the next N API requests and reports
+the merged result as a pstats table, a binary pstats dump (for snakeviz or
+``python -m pstats``) or collapsed stacks (for flamegraph.pl / speedscope).
+``MemoryTracker`` wraps tracemalloc: start tracing, take numbered snapshots
+and diff any two of them to see what grew.
+
+cProfile only sees the thread it is enabled on (up to Python 3.11; from
+3.12 it hooks sys.monitoring and sees every thread). Profiles are started on
+the threadpool worker that runs a blocking (plain ``def``) endpoint, so
+requests handled concurrently on the event loop or other workers stay out of
+them; async endpoints are not profiled. Work handed to search worker threads
+shows up as time spent waiting on them.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import cProfile
+import io
+import os
+import pstats
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+
+# From 3.12 cProfile records every thread, so a profile is a process-wide sample
+PROCESS_WIDE = sys.version_info >= (3, 12)
+
+
+class RequestProfiler:
+    """Profile the next N matching requests and merge the results."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.remaining = 0
+        self.endpoint: Optional[str] = None
+        self.armed_at: Optional[float] = None
+        self.profiled: List[str] = []
+        self._stats: Optional[pstats.Stats] = None
+        # Only one cProfile profiler can be active per process
+        self._active = False
+
+    def arm(self, requests: int, endpoint: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Profile the next `requests` API requests, discarding earlier results.
+
+        Args:
+            requests: Number of requests to profile
+            endpoint: Only profile requests to this path, if given
+        """
+        with self._lock:
+            self.remaining = max(0, requests)
+            self.endpoint = endpoint
+            self.armed_at = time.time()
+            self.profiled = []
+            self._stats = None
+        return self.status()
+
+    def reset(self) -> None:
+        self.arm(0)
+
+    def start(self, endpoint: str) -> Optional[cProfile.Profile]:
+        """Start profiling a request if one is wanted and none is running."""
+        if not self.remaining:
+            return None
+        with self._lock:
+            if self._active or self.remaining <= 0 or (self.endpoint and self.endpoint != endpoint):
+                return None
+            self.remaining -= 1
+            self._active = True
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) owns the hook
+            with self._lock:
+                self._active = False
+            return None
+        return profile
+
+    def finish(self, profile: cProfile.Profile, endpoint: str) -> None:
+        """Stop profiling a request and merge its stats."""
+        profile.disable()
+        with self._lock:
+            self._active = False
+            if self._stats is None:
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+            self.profiled.append(endpoint)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'remaining': self.remaining,
+                'endpoint_filter': self.endpoint,
+                'armed_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.armed_at)) if self.armed_at else None,
+                'profiled_requests': list(self.profiled),
+                'scope': 'process' if PROCESS_WIDE else 'request_thread',
+            }
+
+    def _merged_stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            return self._stats
+
+    def report_text(self, sort: str = "cumulative", limit: int = 50) -> Optional[str]:
+        """The merged profile as a pstats table, or None if nothing was profiled."""
+        stats = self._merged_stats()
+        if stats is None:
+            return None
+        buffer = io.StringIO()
+        stats.stream = buffer
+        stats.sort_stats(sort).print_stats(limit)
+        return buffer.getvalue()
+
+    def report_binary(self) -> Optional[bytes]:
+        """The merged profile in pstats' marshal format."""
+        stats = self._merged_stats()
+        if stats is None:
+            return None
+        fd, path = tempfile.mkstemp(suffix=".pstats")
+        os.close(fd)
+        try:
+            stats.dump_stats(path)
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.unlink(path)
+
+    def report_collapsed(self) -> Optional[str]:
+        """
+        The merged profile as collapsed stacks ("a;b;c <microseconds>").
+
+        cProfile records caller/callee edges rather than full stacks, so
+        stacks are rebuilt from the call graph, splitting each function's time
+        across its callers in proportion to the time each caller spent in it.
+        """
+        stats = self._merged_stats()
+        if stats is None:
+            return None
+        return "\n".join(collapse_stats(stats.stats)) + "\n"
+
+
+def _function_label(func: Tuple[str, int, str]) -> str:
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def collapse_stats(raw_stats: Dict, max_depth: int = 64) -> List[str]:
+    """
+    Rebuild collapsed stacks from raw pstats data.
+
+    Args:
+        raw_stats: pstats.Stats.stats, {func: (cc, nc, tt, ct, callers)}
+        max_depth: Stack depth limit
+
+    Returns:
+        Lines of "frame;frame;frame microseconds", heaviest first
+    """
+    children: Dict[Any, List[Tuple[Any, float]]] = {}
+    roots = []
+    for func, (_, _, _, _, callers) in raw_stats.items():
+        if not callers:
+            roots.append(func)
+        for caller, edge in callers.items():
+            # edge is (cc, nc, tt, ct) for this caller -> func
+            children.setdefault(caller, []).append((func, edge[3]))
+
+    totals: Dict[str, float] = {}
+
+    def walk(func, path: List[str], on_path: set, share: float) -> None:
+        _, _, self_time, cumulative, _ = raw_stats[func]
+        if cumulative <= 0 or share <= 0:
+            return
+        fraction = min(1.0, share / cumulative)
+        label = ";".join(path)
+        totals[label] = totals.get(label, 0.0) + self_time * fraction
+        if len(path) >= max_depth:
+            return
+        for child, edge_time in children.get(func, []):
+            if child in on_path or child not in raw_stats:
+                continue
+            on_path.add(child)
+            path.append(_function_label(child))
+            walk(child, path, on_path, edge_time * fraction)
+            path.pop()
+            on_path.discard(child)
+
+    for root in roots:
+        walk(root, [_function_label(root)], {root}, raw_stats[root][3])
+
+    lines = []
+    for stack, seconds in sorted(totals.items(), key=lambda item: -item[1]):
+        micros = int(round(seconds * 1e6))
+        if micros > 0:
+            lines.append(f"{stack} {micros}")
+    return lines
+
+
+class MemoryTracker:
+    """tracemalloc snapshots kept by id, with diffs between them."""
+
+    IGNORED_FILES = (tracemalloc.__file__, "<frozen importlib._bootstrap>", "<frozen importlib._bootstrap_external>", "<unknown>")
+
+    def __init__(self, max_snapshots: int = 5):
+        self.max_snapshots = max_snapshots
+        self._lock = threading.Lock()
+        self._snapshots: Dict[int, Tuple[float, tracemalloc.Snapshot]] = {}
+        self._next_id = 1
+
+    def start(self, frames: int = 25) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.status()
+
+    def stop(self) -> Dict[str, Any]:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        with self._lock:
+            self._snapshots.clear()
+        return self.status()
+
+    def status(self) -> Dict[str, Any]:
+        tracing = tracemalloc.is_tracing()
+        current, peak = tracemalloc.get_traced_memory() if tracing else (0, 0)
+        with self._lock:
+            snapshots = [
+                {'id': snapshot_id, 'taken_at': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(taken_at))}
+                for snapshot_id, (taken_at, _) in sorted(self._snapshots.items())
+            ]
+        return {
+            'tracing': tracing,
+            'frames': tracemalloc.get_traceback_limit() if tracing else None,
+            'traced_bytes': current,
+            'peak_traced_bytes': peak,
+            'snapshots': snapshots,
+        }
+
+    def _filtered(self, snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces([tracemalloc.Filter(False, pattern) for pattern in self.IGNORED_FILES])
+
+    def snapshot(self, key_type: str = "lineno", limit: int = 25) -> Dict[str, Any]:
+        """
+        Take a snapshot and report its largest allocation sites.
+
+        Raises:
+            RuntimeError: If tracemalloc is not tracing
+        """
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not tracing; start it first")
+        snapshot = self._filtered(tracemalloc.take_snapshot())
+        with self._lock:
+            snapshot_id = self._next_id
+            self._next_id += 1
+            self._snapshots[snapshot_id] = (time.time(), snapshot)
+            while len(self._snapshots) > self.max_snapshots:
+                del self._snapshots[min(self._snapshots)]
+        statistics = snapshot.statistics(key_type)
+        return {
+            'id': snapshot_id,
+            'total_bytes': sum(stat.size for stat in statistics),
+            'top': [self._describe(stat) for stat in statistics[:limit]],
+        }
+
+    def diff(self, base_id: int, target_id: Optional[int] = None, key_type: str = "lineno", limit: int = 25) -> Dict[str, Any]:
+        """
+        Compare two snapshots; target defaults to the most recent one.
+
+        Raises:
+            KeyError: If a snapshot id is unknown
+        """
+        with self._lock:
+            if target_id is None and self._snapshots:
+                target_id = max(self._snapshots)
+            base = self._snapshots[base_id][1]
+            target = self._snapshots[target_id][1]
+        differences = target.compare_to(base, key_type)
+        return {
+            'base': base_id,
+            'target': target_id,
+            'size_diff_bytes': sum(stat.size_diff for stat in differences),
+            'top': [
+                {
+                    **self._describe(stat),
+                    'size_diff_bytes': stat.size_diff,
+                    'count_diff': stat.count_diff,
+                }
+                for stat in differences[:limit]
+            ],
+        }
+
+    @staticmethod
+    def _describe(stat) -> Dict[str, Any]:
+        frames = stat.traceback.format(limit=3)
+        return {
+            'location': str(stat.traceback[0]) if len(stat.traceback) else None,
+            'size_bytes': stat.size,
+            'count': stat.count,
+            'traceback': [line.strip() for line in frames if line.strip()],
+        }
+
+
+request_profiler = RequestProfiler()
+memory_tracker = MemoryTracker()
@@ -0,0 +1,289 @@
+"""
+Bounded search results cache with TTL expiry and memory accounting.
+
+Search results are large (roughly 140KB of place JSON per search) and every
+search is stored under two or three keys, so an unbounded dict grows without
+limit in a long-running worker. This cache bounds the number of entries and
+the estimated bytes held, expires entries after a TTL, and evicts the least
+recently used entries first.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+import json
+import threading
+import time
+
+from structured_logging import get_logger
+
+logger = get_logger("search_cache")
+
+
+class _CacheEntry:
+    """A cached value with its expiry time and estimated size."""
+
+    __slots__ = ('value', 'size_bytes', 'created_at', 'expires_at')
+
+    def __init__(self, value: Any, size_bytes: int, created_at: float, expires_at: float):
+        self.value = value
+        self.size_bytes = size_bytes
+        self.created_at = created_at
+        self.expires_at = expires_at
+
+
+def estimate_size_bytes(value: Any) -> int:
+    """
+    Estimate the memory cost of a cached value from its JSON encoding.
+
+    Args:
+        value: A JSON-serializable value
+
+    Returns:
+        The encoded size in bytes
+    """
+    try:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode('utf-8'))
+    except (TypeError, ValueError):
+        return len(repr(value).encode('utf-8'))
+
+
+class SearchResultsCache:
+    """
+    LRU cache bounded by entry count and estimated bytes, with TTL expiry.
+
+    Several keys often point at the same search results object (by location,
+    by location and radius, by location and categories); a shared object is
+    only counted once against the byte budget.
+
+    Supports the dict operations the API endpoints use (``in``, ``[]``,
+    ``get``), so it can stand in for the previous module-level dict.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 32 * 1024 * 1024, ttl_seconds: float = 3600):
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_entries: Maximum number of keys held
+            max_bytes: Maximum estimated bytes held across distinct values
+            ttl_seconds: Seconds after which an entry expires
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        # Structure: {id(value): [size_bytes, number_of_keys_referencing_it]}
+        self._value_refs: Dict[int, list] = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._update_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {'lru': 0, 'bytes': 0, 'expired': 0, 'oversized': 0}
+
+    def _acquire_value(self, value: Any) -> int:
+        ref = self._value_refs.get(id(value))
+        if ref is None:
+            size_bytes = estimate_size_bytes(value)
+            self._value_refs[id(value)] = [size_bytes, 1]
+            self._total_bytes += size_bytes
+            return size_bytes
+        ref[1] += 1
+        return ref[0]
+
+    def _release_value(self, value: Any) -> None:
+        ref = self._value_refs.get(id(value))
+        if ref is None:
+            return
+        ref[1] -= 1
+        if ref[1] <= 0:
+            self._total_bytes -= ref[0]
+            del self._value_refs[id(value)]
+
+    def _remove(self, key: str, reason: Optional[str] = None) -> None:
+        entry = self._entries.pop(key)
+        self._release_value(entry.value)
+        if reason:
+            self.evictions[reason] += 1
+
+    def _get_live_entry(self, key: str) -> Optional[_CacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at <= time.time():
+            self._remove(key, 'expired')
+            return None
+        return entry
+
+    def _evict_to_fit(self) -> None:
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)), 'lru')
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)), 'bytes')
+
+    def purge_expired(self) -> int:
+        """
+        Drop every expired entry.
+
+        Returns:
+            The number of entries removed
+        """
+        with self._lock:
+            now = time.time()
+            expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+            for key in expired:
+                self._remove(key, 'expired')
+            return len(expired)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """
+        Return the cached value for a key and mark it recently used.
+
+        Args:
+            key: The cache key
+            default: Value returned on a miss
+
+        Returns:
+            The cached value or default
+        """
+        with self._lock:
+            entry = self._get_live_entry(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None) -> bool:
+        """
+        Store a value, evicting least recently used entries to stay in budget.
+
+        Args:
+            key: The cache key
+            value: A JSON-serializable value
+            ttl_seconds: Optional TTL overriding the cache default
+
+        Returns:
+            False if the value alone exceeds the byte budget and was not stored
+        """
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            size_bytes = self._acquire_value(value)
+            if size_bytes > self.max_bytes:
+                self._release_value(value)
+                self.evictions['oversized'] += 1
+                return False
+
+            now = time.time()
+            ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+            self._entries[key] = _CacheEntry(value, size_bytes, now, now + ttl)
+            self._evict_to_fit()
+            return key in self._entries
+
+    def update(self, key: str, fn: Callable[[Any], Any], ttl_seconds: Optional[float] = None) -> Any:
+        """
+        Replace a key's value with fn(current value or None), with no other
+        update to the cache in between. fn returning None deletes the key. A
+        new value over the byte budget is not stored and the key keeps its
+        current value.
+
+        Returns:
+            The value now stored under the key
+        """
+        with self._update_lock:
+            current = self.get(key)
+            value = fn(current)
+            if value is None:
+                self.delete(key)
+            elif estimate_size_bytes(value) > self.max_bytes:
+                with self._lock:
+                    self.evictions['oversized'] += 1
+                logger.warning("Update of '%s' exceeds the %d byte budget and was not stored", key, self.max_bytes)
+                return current
+            else:
+                self.set(key, value, ttl_seconds)
+            return value
+
+    def delete(self, key: str) -> bool:
+        """Remove a key, returning whether it was present."""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        """Remove every entry."""
+        with self._lock:
+            self._entries.clear()
+            self._value_refs.clear()
+            self._total_bytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return self._get_live_entry(key) is not None
+
+    def __getitem__(self, key: str) -> Any:
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        self.set(key, value)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Report size, budget and hit/eviction counters.
+
+        Returns:
+            A JSON-serializable stats dictionary
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            now = time.time()
+            oldest_age = None
+            if self._entries:
+                oldest_age = round(now - min(e.created_at for e in self._entries.values()), 1)
+            return {
+                'entries': len(self._entries),
+                'distinct_values': len(self._value_refs),
+                'bytes': self._total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': dict(self.evictions),
+                'oldest_entry_age_seconds': oldest_age,
+            }
+
+    def keys_info(self) -> list:
+        """
+        Describe each live entry, most recently used last.
+
+        Returns:
+            A list of {key, size_bytes, age_seconds, ttl_remaining_seconds}
+        """
+        with self._lock:
+            now = time.time()
+            return [
+                {
+                    'key': key,
+                    'size_bytes': entry.size_bytes,
+                    'age_seconds': round(now - entry.created_at, 1),
+                    'ttl_remaining_seconds': round(entry.expires_at - now, 1),
+                }
+                for key, entry in self._entries.items()
+                if entry.expires_at > now
+            ]
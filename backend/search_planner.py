@@ -0,0 +1,239 @@
+"""
+Search planning: how many places each category search needs to hydrate.
+
+Every Nearby Search returns up to 20 places, and hydrating one costs a Place
+Details call and a Distance Matrix call. Itinerary generation needs far fewer
+than the 10 per category we used to fetch: 5 itineraries of at most 6 stops,
+with at most 2 stops of a broad type (food, nature, culture, shopping) each.
+``plan_fetch_budget`` turns those rules into a per-category hydration limit.
+``search_category`` stops once it reaches that limit and records what it
+skipped.
+
+The adaptive radius search hydrates places ring by ring, starting from a
+tight radius, and only widens the radius while the places found so far are
+too few or too sparse (``area_density``) for the requested itineraries.
+
+    SEARCH_FETCH_BUDGET=0                # hydrate every candidate, as before
+    SEARCH_ADAPTIVE_RADIUS=1             # start tight and expand on demand
+    SEARCH_ADAPTIVE_START_MILES=0.5
+    SEARCH_ADAPTIVE_STEP_MILES=0.5
+"""
+
+from typing import Any, Dict, List, Optional
+import math
+import os
+import threading
+
+import metrics
+
+
+SEARCH_FETCH_BUDGET_ENABLED = os.getenv("SEARCH_FETCH_BUDGET", "1").lower() not in ("0", "false", "no")
+SEARCH_ADAPTIVE_RADIUS_ENABLED = os.getenv("SEARCH_ADAPTIVE_RADIUS", "0").lower() in ("1", "true", "yes")
+SEARCH_ADAPTIVE_START_MILES = float(os.getenv("SEARCH_ADAPTIVE_START_MILES", "0.5"))
+SEARCH_ADAPTIVE_STEP_MILES = float(os.getenv("SEARCH_ADAPTIVE_STEP_MILES", "0.5"))
+
+# Broad type (see ItineraryGenerator.BROAD_TYPE_MAPPING) each search query mostly returns
+CATEGORY_BROAD_TYPES = {
+    "restaurants near me": "food",
+    "cafes and bakeries near me": "food",
+    "delis near me": "food",
+    "parks near me": "nature",
+    "tourist attractions near me": "culture",
+    "museums near me": "culture",
+    "galleries near me": "culture",
+    "thrift stores near me": "shopping",
+    "markets near me": "shopping",
+}
+
+# Mirrors create_mixed_itinerary: stops per itinerary by area density and the
+# per-type diversity cap
+STOPS_BY_DENSITY = {"dense": 5, "moderate": 6, "sparse": 4}
+MAX_PER_TYPE = 2
+# A place may appear in this many of the generated itineraries (enforced by
+# ItineraryGenerator.iter_itineraries while the area has enough other places)
+MAX_PLACE_REUSE = 2
+# Extra candidates for combinations rejected by the route-quality checks
+CANDIDATE_SLACK = 1.5
+# Never hydrate fewer than this per category, nor more than search_category's cap
+MIN_CANDIDATES_PER_CATEGORY = 3
+MAX_CANDIDATES_PER_CATEGORY = 10
+
+
+class CategoryAllowance:
+    """Hydration limit for one category search and what it actually used."""
+
+    def __init__(self, category: str, limit: Optional[int]):
+        self.category = category
+        self.limit = limit
+        self.candidates = 0
+        self.hydrated = 0
+
+    def offer(self, candidates: int) -> None:
+        """Record how many candidates Nearby Search offered"""
+        self.candidates = candidates
+
+    def exhausted(self) -> bool:
+        return self.limit is not None and self.hydrated >= self.limit
+
+    def use(self) -> None:
+        """Count one hydrated candidate"""
+        self.hydrated += 1
+
+    def finish(self) -> None:
+        """Account the candidates that were never hydrated"""
+        skipped = self.candidates - self.hydrated
+        if skipped > 0:
+            metrics.fetch_budget_skipped.inc(skipped, category=self.category)
+
+
+class FetchBudget:
+    """Per-category hydration limits for one search, with a report of the savings."""
+
+    def __init__(self, limits: Dict[str, Optional[int]], itinerary_count: int, density: Optional[str] = None):
+        self.limits = limits
+        self.itinerary_count = itinerary_count
+        self.density = density
+        self._lock = threading.Lock()
+        self._allowances: Dict[str, CategoryAllowance] = {}
+
+    def allowance(self, category: str) -> CategoryAllowance:
+        allowance = CategoryAllowance(category, self.limits.get(category))
+        with self._lock:
+            self._allowances[category] = allowance
+        return allowance
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Limits and usage per category.
+
+        Each skipped candidate is one Place Details call and one Distance
+        Matrix call saved. places_available is the number of places the
+        unbudgeted search would have hydrated, which generation uses to judge
+        area density.
+        """
+        with self._lock:
+            allowances = list(self._allowances.values())
+        candidates = sum(allowance.candidates for allowance in allowances)
+        hydrated = sum(allowance.hydrated for allowance in allowances)
+        return {
+            'itinerary_count': self.itinerary_count,
+            'density': self.density,
+            'limits': dict(self.limits),
+            'places_available': candidates,
+            'places_hydrated': hydrated,
+            'details_calls_saved': candidates - hydrated,
+            'by_category': {
+                allowance.category: {
+                    'limit': allowance.limit,
+                    'candidates': allowance.candidates,
+                    'hydrated': allowance.hydrated,
+                }
+                for allowance in allowances
+            },
+        }
+
+
+def haversine_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in meters"""
+    earth_radius = 6371000
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lng2 - lng1)
+    a = math.sin(delta_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    return earth_radius * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def complete_radius(lat: float, lng: float, candidates: List[Dict], results: List[Dict]) -> Optional[float]:
+    """
+    Straight-line radius (meters) around a search origin within which every
+    Nearby Search candidate was hydrated into results, or None if all were.
+    Candidates cut by the top-10 cap, a fetch budget or a failed lookup leave
+    the search incomplete from the nearest of them outwards.
+    """
+    hydrated = {result.get('place_id') for result in results}
+    missing = []
+    for candidate in candidates:
+        if candidate.get('place_id') in hydrated:
+            continue
+        location = candidate.get('geometry', {}).get('location', {})
+        if location.get('lat') is None or location.get('lng') is None:
+            return 0.0
+        missing.append(haversine_meters(lat, lng, location['lat'], location['lng']))
+    return max(0.0, min(missing) - 1) if missing else None
+
+
+def area_density(total_places: int, radius_miles: float) -> str:
+    """Classify places per square mile as dense, moderate or sparse"""
+    places_per_sq_mile = total_places / (math.pi * radius_miles ** 2)
+    if places_per_sq_mile >= 10:  # Dense urban areas like Soho, Manhattan (85 places in 7.07 sq miles = 12 places/sq mile)
+        return "dense"
+    elif places_per_sq_mile >= 5:  # Moderate density suburbs/neighborhoods
+        return "moderate"
+    return "sparse"
+
+
+def distinct_places_per_broad_type(itinerary_count: int, broad_type_count: int, density: Optional[str] = None) -> int:
+    """
+    Distinct places of one broad type needed to fill itinerary_count itineraries.
+
+    With several broad types an itinerary holds at most MAX_PER_TYPE of each;
+    with fewer types (a preset) each type has to fill a larger share of the stops.
+    """
+    stops = STOPS_BY_DENSITY.get(density, max(STOPS_BY_DENSITY.values()))
+    per_itinerary = max(min(MAX_PER_TYPE, stops), math.ceil(stops / max(1, broad_type_count)))
+    return math.ceil(itinerary_count * per_itinerary / MAX_PLACE_REUSE)
+
+
+def candidates_per_broad_type(itinerary_count: int, broad_type_count: int, density: Optional[str] = None) -> int:
+    """Candidates to hydrate for one broad type, with slack for rejected routes"""
+    return math.ceil(distinct_places_per_broad_type(itinerary_count, broad_type_count, density) * CANDIDATE_SLACK)
+
+
+def places_needed(categories: List[str], itinerary_count: int = 5) -> int:
+    """Distinct places a search over these categories should find before it stops widening"""
+    broad_types = {CATEGORY_BROAD_TYPES.get(category, category) for category in categories}
+    return len(broad_types) * distinct_places_per_broad_type(itinerary_count, len(broad_types))
+
+
+def radius_steps(max_radius_miles: float, start_miles: Optional[float] = None,
+                 step_miles: Optional[float] = None) -> List[float]:
+    """Radii (miles) the adaptive search tries, ending at max_radius_miles"""
+    start_miles = SEARCH_ADAPTIVE_START_MILES if start_miles is None else start_miles
+    step_miles = SEARCH_ADAPTIVE_STEP_MILES if step_miles is None else step_miles
+    steps = []
+    radius = min(start_miles, max_radius_miles)
+    while radius < max_radius_miles - 1e-9 and step_miles > 0:
+        steps.append(round(radius, 3))
+        radius += step_miles
+    steps.append(max_radius_miles)
+    return steps
+
+
+def plan_fetch_budget(categories: List[str], itinerary_count: int = 5, density: Optional[str] = None) -> Optional[FetchBudget]:
+    """
+    Plan how many places each category should hydrate.
+
+    A broad type's need is split across the categories that return it, so the
+    three food queries share one food budget. Unknown categories are not limited.
+    The density is unknown before searching, so by default the plan assumes
+    the area that needs the most stops.
+
+    Returns:
+        The budget, or None when SEARCH_FETCH_BUDGET is off
+    """
+    if not SEARCH_FETCH_BUDGET_ENABLED:
+        return None
+    categories_by_type: Dict[str, List[str]] = {}
+    for category in categories:
+        broad_type = CATEGORY_BROAD_TYPES.get(category)
+        if broad_type:
+            categories_by_type.setdefault(broad_type, []).append(category)
+
+    limits: Dict[str, Optional[int]] = {category: None for category in categories}
+    for broad_type, typed_categories in categories_by_type.items():
+        needed = candidates_per_broad_type(itinerary_count, len(categories_by_type), density)
+        per_category = math.ceil(needed / len(typed_categories))
+        per_category = max(MIN_CANDIDATES_PER_CATEGORY, min(MAX_CANDIDATES_PER_CATEGORY, per_category))
+        for category in typed_categories:
+            limits[category] = per_category
+    return FetchBudget(limits, itinerary_count, density)
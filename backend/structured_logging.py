@@ -0,0 +1,201 @@
+"""
+Leveled, structured logging for the Chalo backend.
+
+Thin layer over the standard ``logging`` module:
+
+- Messages use %-style arguments, so nothing is formatted unless the record
+  is emitted, and a disabled level costs one cached ``isEnabledFor`` check.
+- Keyword arguments become structured fields (``key=value`` in text output,
+  top-level keys in JSON output).
+- DEBUG and INFO records can be sampled per module, so verbose modules can
+  be turned on in production at a fraction of their volume.
+- Fields bound with ``bind_fields`` (the API middleware binds ``request_id``
+  and ``endpoint``) are added to every record logged in that context,
+  including from pool threads started with ``upstream.bind_context``.
+- ``exc_info=True`` attaches the current exception at any level.
+
+Configuration comes from the environment and can be changed at runtime
+through ``set_level``/``set_sample_rate``:
+
+    CHALO_LOG_LEVEL=INFO                          # default level
+    CHALO_LOG_LEVELS=itinerary_generator=DEBUG    # per-module levels
+    CHALO_LOG_SAMPLE=itinerary_generator=0.05     # per-module DEBUG/INFO sampling
+    CHALO_LOG_FORMAT=text|json
+"""
+
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+import json
+import logging
+import os
+import random
+import sys
+import threading
+
+
+ROOT_LOGGER = "chalo"
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARNING = logging.WARNING
+ERROR = logging.ERROR
+
+_sample_rates: Dict[str, float] = {}
+_context_fields: ContextVar[Dict[str, Any]] = ContextVar("log_context_fields", default={})
+_configure_lock = threading.Lock()
+_configured = False
+
+
+class TextFormatter(logging.Formatter):
+    """``LEVEL module: message key=value ...``"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{record.levelname:<7} {record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER}: {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, module and fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname.lower(),
+            'module': record.name[len(ROOT_LOGGER) + 1:] or ROOT_LOGGER,
+            'msg': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class StructuredLogger:
+    """Logger with lazy formatting, structured fields and per-module sampling."""
+
+    __slots__ = ('module', '_logger')
+
+    def __init__(self, module: str):
+        self.module = module
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{module}")
+
+    def is_enabled(self, level: int) -> bool:
+        """Whether a record at this level would be emitted (before sampling)."""
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level: int, msg: str, args: tuple, fields: Dict[str, Any], exc_info: Any = None) -> None:
+        if not self._logger.isEnabledFor(level):
+            return
+        if level < WARNING:
+            rate = _sample_rates.get(self.module)
+            if rate is not None and random.random() >= rate:
+                return
+        exc_info = fields.pop('exc_info', exc_info)
+        bound = _context_fields.get()
+        if bound:
+            fields = {**bound, **fields}
+        self._logger.log(level, msg, *args, extra={'fields': fields} if fields else None, exc_info=exc_info)
+
+    def debug(self, msg: str, *args: Any, **fields: Any) -> None:
+        self._log(DEBUG, msg, args, fields)
+
+    def info(self, msg: str, *args: Any, **fields: Any) -> None:
+        self._log(INFO, msg, args, fields)
+
+    def warning(self, msg: str, *args: Any, **fields: Any) -> None:
+        self._log(WARNING, msg, args, fields)
+
+    def error(self, msg: str, *args: Any, **fields: Any) -> None:
+        self._log(ERROR, msg, args, fields)
+
+    def exception(self, msg: str, *args: Any, **fields: Any) -> None:
+        self._log(ERROR, msg, args, fields, exc_info=True)
+
+
+def _parse_module_settings(value: str) -> Dict[str, str]:
+    settings = {}
+    for item in value.split(","):
+        if "=" in item:
+            module, setting = item.split("=", 1)
+            settings[module.strip()] = setting.strip()
+    return settings
+
+
+def _level_number(level: str) -> int:
+    number = logging.getLevelName(str(level).upper())
+    if not isinstance(number, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return number
+
+
+def configure(force: bool = False) -> None:
+    """Apply the CHALO_LOG_* environment settings (once, unless forced)."""
+    global _configured
+    with _configure_lock:
+        if _configured and not force:
+            return
+        root = logging.getLogger(ROOT_LOGGER)
+        root.setLevel(_level_number(os.getenv("CHALO_LOG_LEVEL", "INFO")))
+        root.propagate = False
+        handler = logging.StreamHandler(sys.stdout)
+        if os.getenv("CHALO_LOG_FORMAT", "text").lower() == "json":
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler.setFormatter(TextFormatter())
+        root.handlers = [handler]
+
+        for module, level in _parse_module_settings(os.getenv("CHALO_LOG_LEVELS", "")).items():
+            logging.getLogger(f"{ROOT_LOGGER}.{module}").setLevel(_level_number(level))
+        _sample_rates.clear()
+        for module, rate in _parse_module_settings(os.getenv("CHALO_LOG_SAMPLE", "")).items():
+            _sample_rates[module] = float(rate)
+        _configured = True
+
+
+def bind_fields(**fields: Any) -> None:
+    """Add fields to every record logged in the current context (e.g. one request)."""
+    _context_fields.set({**_context_fields.get(), **fields})
+
+
+def get_logger(module: str) -> StructuredLogger:
+    """Return the logger for a module, configuring logging on first use."""
+    configure()
+    return StructuredLogger(module)
+
+
+def set_level(module: Optional[str], level: str) -> None:
+    """Change the level of one module, or of every module when module is None."""
+    configure()
+    name = f"{ROOT_LOGGER}.{module}" if module else ROOT_LOGGER
+    logging.getLogger(name).setLevel(_level_number(level))
+
+
+def set_sample_rate(module: str, rate: Optional[float]) -> None:
+    """Emit only this fraction of a module's DEBUG/INFO records; None disables sampling."""
+    if rate is None:
+        _sample_rates.pop(module, None)
+    else:
+        _sample_rates[module] = max(0.0, min(1.0, float(rate)))
+
+
+def settings() -> Dict[str, Any]:
+    """Current levels and sample rates."""
+    configure()
+    root = logging.getLogger(ROOT_LOGGER)
+    modules = {}
+    for name, logger in logging.root.manager.loggerDict.items():
+        if name.startswith(ROOT_LOGGER + ".") and isinstance(logger, logging.Logger):
+            modules[name[len(ROOT_LOGGER) + 1:]] = logging.getLevelName(logger.getEffectiveLevel())
+    return {
+        'level': logging.getLevelName(root.level),
+        'modules': dict(sorted(modules.items())),
+        'sample_rates': dict(_sample_rates),
+        'format': 'json' if isinstance(root.handlers[0].formatter, JsonFormatter) else 'text',
+    }
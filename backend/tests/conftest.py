@@ -0,0 +1,14 @@
+"""
+Offline checks for the backend's pure functions. No network, API keys or
+on-disk stores are needed: run ``python -m pytest`` from backend/.
+"""
+
+import os
+import sys
+
+# The module-level default stores would otherwise open files under cache/
+os.environ.setdefault("PAIR_CACHE_PATH", "")
+os.environ.setdefault("POI_STORE_PATH", "")
+os.environ.setdefault("WALKING_GRAPH_PATH", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
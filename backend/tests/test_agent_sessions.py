@@ -0,0 +1,42 @@
+from agent_sessions import merge_turn
+
+
+PREVIOUS = {
+    "text": "Here are some ideas",
+    "businesses": [{"id": "cafe"}, {"id": "park"}],
+    "plan": {"stops": ["cafe", "park"]},
+}
+
+
+def test_first_turn_is_returned_as_is():
+    transformed = {"text": "Hello", "businesses": []}
+    assert merge_turn(None, transformed) is transformed
+
+
+def test_text_only_follow_up_keeps_the_previous_results():
+    merged = merge_turn(PREVIOUS, {"text": "The park is quieter"})
+    assert merged == {"text": "The park is quieter", **{key: PREVIOUS[key] for key in ("businesses", "plan")}}
+
+
+def test_new_results_replace_the_previous_ones():
+    transformed = {"text": "Try these", "businesses": [{"id": "museum"}], "plan": {"stops": ["museum"]}}
+    assert merge_turn(PREVIOUS, transformed) == transformed
+
+
+def test_new_plans_are_not_mixed_with_the_previous_plan():
+    transformed = {"text": "Two options", "plans": [{"stops": ["a"]}, {"stops": ["b"]}]}
+    merged = merge_turn(PREVIOUS, transformed)
+    assert "plan" not in merged
+    assert merged["plans"] == transformed["plans"]
+    assert merged["businesses"] == PREVIOUS["businesses"]
+
+
+def test_previous_plans_are_carried_over():
+    previous = {"businesses": [], "plans": [{"stops": ["a"]}]}
+    assert merge_turn(previous, {"text": "Sure"})["plans"] == previous["plans"]
+
+
+def test_transformed_answer_is_not_modified():
+    transformed = {"text": "Sure"}
+    merge_turn(PREVIOUS, transformed)
+    assert transformed == {"text": "Sure"}
@@ -0,0 +1,35 @@
+import pytest
+
+from cache_backends import LocalRespServer, RedisCache, SQLiteCache
+from search_cache import SearchResultsCache
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def cache(request, tmp_path):
+    if request.param == "memory":
+        yield SearchResultsCache(max_entries=10, max_bytes=200, ttl_seconds=60)
+    elif request.param == "sqlite":
+        yield SQLiteCache(str(tmp_path / "cache.sqlite3"), "test", max_entries=10, max_bytes=200, ttl_seconds=60)
+    else:
+        server = LocalRespServer().start()
+        yield RedisCache(server.url, "test", max_entries=10, max_bytes=200, ttl_seconds=60)
+        server.stop()
+
+
+def test_update_returns_the_stored_value(cache):
+    assert cache.update("turns", lambda state: {"turns": (state or {}).get("turns", 0) + 1}) == {"turns": 1}
+    assert cache.update("turns", lambda state: {"turns": state["turns"] + 1}) == {"turns": 2}
+    assert cache.get("turns") == {"turns": 2}
+
+
+def test_oversized_update_keeps_the_current_value(cache):
+    cache.set("state", {"turns": 1})
+    assert cache.update("state", lambda state: {"turns": 2, "padding": "x" * 500}) == {"turns": 1}
+    assert cache.get("state") == {"turns": 1}
+    assert cache.evictions['oversized'] == 1
+
+
+def test_update_to_none_deletes(cache):
+    cache.set("state", {"turns": 1})
+    assert cache.update("state", lambda state: None) is None
+    assert cache.get("state") is None
@@ -0,0 +1,32 @@
+import os
+import random
+import sys
+from collections import Counter
+
+import pytest
+
+from itinerary_generator import ItineraryGenerator
+from search_planner import MAX_PLACE_REUSE
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+from synthetic_city import generate_city  # noqa: E402
+
+
+def stop_uses(itineraries):
+    return Counter(stop['place_id'] for itinerary in itineraries for stop in itinerary['stops'])
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_places_are_not_reused_beyond_the_limit(seed):
+    random.seed(seed)
+    city = generate_city(60, seed=seed)
+    itineraries = ItineraryGenerator().generate_itineraries(city, "Testville")
+    assert len(itineraries) == 5
+    assert max(stop_uses(itineraries).values()) <= MAX_PLACE_REUSE
+
+
+def test_small_areas_still_get_every_itinerary():
+    random.seed(0)
+    city = generate_city(12, seed=0)
+    itineraries = ItineraryGenerator().generate_itineraries(city, "Testville")
+    assert len(itineraries) == 5
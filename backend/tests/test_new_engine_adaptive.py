@@ -0,0 +1,86 @@
+import threading
+import time
+
+import metrics
+from new_engine import ChaloSearchEngine
+
+
+LAT0, LNG0 = 40.700, -74.000
+
+
+def adaptive_engine(monkeypatch, slow_type, release):
+    """An engine whose slow_type hydration blocks until release is set"""
+    engine = ChaloSearchEngine("test-key")
+    monkeypatch.setattr(engine, "poi_store", None)
+    monkeypatch.setattr(engine, "geocode_address", lambda address: (LAT0, LNG0))
+    monkeypatch.setattr(metrics, "rate_limit_sleep", lambda *args: None)
+
+    def nearby_candidates(lat, lng, place_type, **kwargs):
+        return [
+            {'place_id': f"{place_type}-{i}", 'geometry': {'location': {'lat': LAT0 + i * 0.001, 'lng': LNG0}}}
+            for i in range(3)
+        ]
+
+    def hydrate_candidates(lat, lng, place_type, candidates, allowance=None):
+        if place_type == slow_type:
+            release.wait(5)
+        return [
+            {'place_id': candidate['place_id'], 'name': candidate['place_id'], 'rating': 4.6,
+             'distance_meters': (candidate['geometry']['location']['lat'] - LAT0) * 111320.0}
+            for candidate in candidates
+        ]
+
+    monkeypatch.setattr(engine, "nearby_candidates", nearby_candidates)
+    monkeypatch.setattr(engine, "hydrate_candidates", hydrate_candidates)
+    return engine
+
+
+def test_adaptive_search_returns_partial_results_at_the_deadline(monkeypatch):
+    release = threading.Event()
+    engine = adaptive_engine(monkeypatch, "museum", release)
+    completed = []
+    background = []
+    background_done = threading.Event()
+
+    def on_background_complete(results):
+        background.append(results)
+        background_done.set()
+
+    started = time.monotonic()
+    summary = engine.search_specific_categories(
+        "Somewhere, NY", ["parks near me", "museums near me"], search_radius_miles=1.0,
+        on_category_complete=lambda category, results: completed.append(category),
+        deadline_seconds=0.3, on_background_complete=on_background_complete, adaptive_radius=True
+    )
+    assert time.monotonic() - started < 2
+    metadata = summary['search_metadata']
+    assert metadata['partial'] is True
+    assert metadata['pending_categories'] == ["museums near me"]
+    assert completed == ["parks near me"]
+    results = summary['results_by_category']
+    assert [place['place_id'] for place in results["parks near me"]] == ["park-0", "park-1", "park-2"]
+    assert "museums near me" not in results
+
+    release.set()
+    assert background_done.wait(5)
+    full = background[0]['search_metadata']
+    assert full['partial'] is False
+    assert full['pending_categories'] == []
+    assert full['adaptive_radius'] == metadata['adaptive_radius']
+    assert len(background[0]['results_by_category']["museums near me"]) == 3
+    assert len(background[0]['results_by_category']["parks near me"]) == 3
+
+
+def test_adaptive_search_without_a_deadline_finishes_every_category(monkeypatch):
+    release = threading.Event()
+    release.set()
+    engine = adaptive_engine(monkeypatch, "museum", release)
+    summary = engine.search_specific_categories(
+        "Somewhere, NY", ["parks near me", "museums near me"], search_radius_miles=1.0, adaptive_radius=True
+    )
+    metadata = summary['search_metadata']
+    assert metadata['partial'] is False
+    assert metadata['pending_categories'] == []
+    assert {category: len(places) for category, places in summary['results_by_category'].items()} == {
+        "parks near me": 3, "museums near me": 3
+    }
@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import osm_ingest
+import poi_store
+from new_engine import ChaloSearchEngine
+from osm_ingest import Coverage, iter_feature_collection
+from poi_store import METERS_PER_DEGREE_LAT, POIStore
+
+
+METERS_PER_DEGREE_LNG = METERS_PER_DEGREE_LAT * 0.7581  # cos(40.7 degrees)
+
+
+def feature(name, geometry):
+    return {"type": "Feature", "properties": {"name": name, "amenity": "cafe"}, "geometry": geometry}
+
+
+FEATURES = [
+    feature("Café ] \"features\": [", {"type": "Point", "coordinates": [-74.0, 40.7]}),
+    feature("Plaza {", {"type": "Polygon", "coordinates": [[[-74.0, 40.7], [-74.001, 40.7], [-74.0, 40.701],
+                                                           [-74.0, 40.7]]]}),
+    feature("Pier 45", {"type": "Point", "coordinates": [-74.01, 40.73]}),
+]
+
+
+@pytest.fixture(params=[1, 7, 1 << 20])
+def chunk_bytes(request, monkeypatch):
+    monkeypatch.setattr(osm_ingest, "READ_CHUNK_BYTES", request.param)
+    return request.param
+
+
+def write(tmp_path, text):
+    path = tmp_path / "extract.geojson"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+@pytest.mark.parametrize("indent", [None, 2])
+def test_features_are_read_one_by_one(tmp_path, chunk_bytes, indent):
+    collection = {"type": "FeatureCollection", "name": "features", "bbox": [-74.1, 40.6, -73.9, 40.8],
+                  "features": FEATURES}
+    path = write(tmp_path, json.dumps(collection, indent=indent, ensure_ascii=False))
+    assert list(iter_feature_collection(path)) == FEATURES
+
+
+def test_empty_collection(tmp_path, chunk_bytes):
+    path = write(tmp_path, '{"type": "FeatureCollection", "features": [ ]}')
+    assert list(iter_feature_collection(path)) == []
+
+
+def test_file_without_features(tmp_path, chunk_bytes):
+    assert list(iter_feature_collection(write(tmp_path, '{"type": "Feature"}'))) == []
+
+
+def test_truncated_file_is_an_error(tmp_path, chunk_bytes):
+    text = json.dumps({"type": "FeatureCollection", "features": FEATURES})
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_feature_collection(write(tmp_path, text[:-40])))
+
+
+def test_coverage_is_recorded_per_cell():
+    coverage = Coverage(cell_meters=400)
+    coverage.add("cafes and bakeries near me", 40.7001, -74.0001)
+    coverage.add("cafes and bakeries near me", 40.7002, -74.0002)
+    coverage.add("parks near me", 40.7001, -74.0001)
+    coverage.add(None, 40.7001, -73.99)
+    circles = list(coverage.circles(["cafes and bakeries near me", "parks near me"]))
+    # One row spanning the three cells from the cafés to the uncategorized place, for each category
+    assert sorted((category, places) for category, _, _, _, places in circles) == [
+        ("cafes and bakeries near me", 0), ("cafes and bakeries near me", 0), ("cafes and bakeries near me", 2),
+        ("parks near me", 0), ("parks near me", 0), ("parks near me", 1)]
+    # Each circle encloses its whole square cell
+    assert all(radius >= 400 / 2 ** 0.5 for _, _, _, radius, _ in circles)
+
+
+def test_ingested_region_answers_a_search_from_the_store(tmp_path, monkeypatch):
+    # Cafés every 300 m over 4 km, with a 900 m strip of river without places, and one park
+    lines = []
+    for row in range(14):
+        for column in range(14):
+            if 6 <= column <= 8:
+                continue
+            lat, lng = 40.68 + row * 300 / METERS_PER_DEGREE_LAT, -74.02 + column * 300 / METERS_PER_DEGREE_LNG
+            lines.append({"type": "Feature", "id": f"node/{row * 100 + column}",
+                          "properties": {"name": f"Café {row}-{column}", "amenity": "cafe"},
+                          "geometry": {"type": "Point", "coordinates": [lng, lat]}})
+    lines.append({"type": "Feature", "id": "node/9999", "properties": {"name": "Corner Park", "leisure": "park"},
+                  "geometry": {"type": "Point", "coordinates": [-74.02, 40.68]}})
+    path = tmp_path / "extract.geojsonseq"
+    path.write_text("\n".join(json.dumps(line) for line in lines), encoding="utf-8")
+
+    store = POIStore(str(tmp_path / "poi.sqlite3"))
+    osm_ingest.ingest(str(path), store)
+    center = (40.68 + 1950 / METERS_PER_DEGREE_LAT, -74.02 + 1950 / METERS_PER_DEGREE_LNG)
+
+    engine = ChaloSearchEngine("")
+    monkeypatch.setattr(engine, "poi_store", store)
+    monkeypatch.setattr(engine, "geocode_address", lambda address: center)
+    monkeypatch.setattr(poi_store, "POI_STORE_LOCAL_ANSWERS", True)
+    categories = ["cafes and bakeries near me", "parks near me"]
+    results = engine.answer_from_store("Somewhere, NY", categories, 1600)
+    assert len(results["cafes and bakeries near me"]) == 10
+    # The park is over 1600 m away: a known zero rather than a gap
+    assert results["parks near me"] == []
+
+    # A circle reaching past the extract still goes upstream
+    assert engine.answer_from_store("Somewhere, NY", categories, 3000) is None
+    store.close()
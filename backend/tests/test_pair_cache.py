@@ -0,0 +1,139 @@
+import sqlite3
+import time
+
+import pytest
+
+import metrics
+import pair_cache
+import walking_router
+from itinerary_generator import ItineraryGenerator
+from new_engine import ChaloSearchEngine
+from pair_cache import DISTANCE_MATRIX, DRIVING, ROUTER, PairDistanceCache
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "pairs.sqlite3")
+
+
+def test_pairs_are_unordered():
+    cache = PairDistanceCache(":memory:")
+    cache.put("b", "a", 420.0, ROUTER)
+    assert cache.get("a", "b") == (420.0, ROUTER)
+    assert cache.get("a", "b", DRIVING) is None
+
+
+def test_router_does_not_replace_distance_matrix():
+    cache = PairDistanceCache(":memory:")
+    cache.put("a", "b", 900.0, DISTANCE_MATRIX)
+    cache.put("a", "b", 850.0, ROUTER)
+    assert cache.get("a", "b") == (900.0, DISTANCE_MATRIX)
+
+
+def test_distance_matrix_replaces_router():
+    cache = PairDistanceCache(":memory:")
+    cache.put("a", "b", 850.0, ROUTER)
+    cache.put("a", "b", 900.0, DISTANCE_MATRIX)
+    assert cache.get("a", "b") == (900.0, DISTANCE_MATRIX)
+
+
+def test_ranking_holds_across_workers(path):
+    first, second = PairDistanceCache(path), PairDistanceCache(path)
+    first.put("a", "b", 900.0, DISTANCE_MATRIX)
+    first.flush()
+    second.put("a", "b", 850.0, ROUTER)
+    second.flush()
+    assert PairDistanceCache(path).get("a", "b") == (900.0, DISTANCE_MATRIX)
+
+    second.put("c", "d", 300.0, ROUTER)
+    second.flush()
+    first.put("c", "d", 320.0, DISTANCE_MATRIX)
+    first.flush()
+    assert PairDistanceCache(path).get("c", "d") == (320.0, DISTANCE_MATRIX)
+
+
+def test_stale_values_are_replaced_by_any_source(path):
+    cache = PairDistanceCache(path, max_age_seconds=60)
+    cache.put("a", "b", 900.0, DISTANCE_MATRIX)
+    cache.flush()
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE pair_distances SET updated_at = ?", (time.time() - 120,))
+    fresh = PairDistanceCache(path, max_age_seconds=60)
+    assert fresh.get("a", "b") is None
+    fresh.put("a", "b", 850.0, ROUTER)
+    fresh.flush()
+    assert PairDistanceCache(path, max_age_seconds=60).get("a", "b") == (850.0, ROUTER)
+
+
+def test_prefetch_reports_stored_and_pending_pairs(path):
+    writer = PairDistanceCache(path)
+    writer.put("a", "b", 100.0, ROUTER)
+    writer.put("a", "z", 100.0, ROUTER)
+    writer.flush()
+    reader = PairDistanceCache(path)
+    reader.put("b", "c", 200.0, DISTANCE_MATRIX)
+    assert reader.prefetch(["c", "b", "a"]) == {("a", "b"), ("b", "c")}
+    assert reader.prefetch(["a", "b"], DRIVING) == set()
+    assert reader.stats()['memory_pairs'] == 2
+
+
+class FixedRouter:
+    def __init__(self, meters):
+        self.meters = meters
+
+    def walking_meters(self, *points, **limits):
+        return self.meters
+
+
+def engine_place(place_key, lat, lng):
+    return {'place_key': place_key, 'geometry': {'location': {'lat': lat, 'lng': lng}}}
+
+
+def generator_place(place_key, lat, lng):
+    return {'place_key': place_key, 'latitude': lat, 'longitude': lng}
+
+
+@pytest.mark.parametrize("router_flushed_first", [True, False])
+def test_distance_matrix_walk_replaces_a_routed_walk_across_workers(path, monkeypatch, router_flushed_first):
+
+    # Worker A generates itineraries over the walking graph
+    generator_worker = PairDistanceCache(path)
+    monkeypatch.setattr(pair_cache, "cache", generator_worker)
+    monkeypatch.setattr(walking_router, "get_router", lambda: FixedRouter(500.0))
+    generator = ItineraryGenerator()
+    assert generator.calculate_distance_between_places(
+        generator_place("a", 40.70, -74.00), generator_place("b", 40.703, -74.00)) == 500.0
+
+    # Worker B, with no graph, asks Distance Matrix for the walk before A has flushed
+    engine_worker = PairDistanceCache(path)
+    monkeypatch.setattr(pair_cache, "cache", engine_worker)
+    monkeypatch.setattr(walking_router, "get_router", lambda: None)
+    engine = ChaloSearchEngine("test-key")
+    requested = []
+    monkeypatch.setattr(engine, "request_distance_matrix",
+                        lambda *points, mode=None: requested.append(mode) or 620.0)
+    monkeypatch.setattr(metrics, "rate_limit_sleep", lambda *args: None)
+    assert engine.calculate_distance_between_places(
+        engine_place("a", 40.70, -74.00), engine_place("b", 40.703, -74.00)) == 620.0
+    assert requested == [pair_cache.WALKING]
+
+    for worker in ((generator_worker, engine_worker) if router_flushed_first else (engine_worker, generator_worker)):
+        worker.flush()
+    assert PairDistanceCache(path).get("a", "b") == (620.0, DISTANCE_MATRIX)
+
+    # Generation on a fresh worker now uses the Distance Matrix walk
+    monkeypatch.setattr(pair_cache, "cache", PairDistanceCache(path))
+    monkeypatch.setattr(walking_router, "get_router", lambda: FixedRouter(500.0))
+    assert generator.calculate_distance_between_places(
+        generator_place("a", 40.70, -74.00), generator_place("b", 40.703, -74.00)) == 620.0
+
+
+def test_walking_legs_never_use_driving_distances(monkeypatch):
+
+    distances = PairDistanceCache(":memory:")
+    distances.put("a", "b", 2400.0, DISTANCE_MATRIX, DRIVING)
+    monkeypatch.setattr(pair_cache, "cache", distances)
+    monkeypatch.setattr(walking_router, "get_router", lambda: FixedRouter(800.0))
+    engine = ChaloSearchEngine("test-key")
+    assert engine.calculate_distance_between_places(
+        engine_place("a", 40.70, -74.00), engine_place("b", 40.703, -74.00)) == 800.0
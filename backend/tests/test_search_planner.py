@@ -0,0 +1,68 @@
+import pytest
+
+import search_planner
+from search_planner import complete_radius, haversine_meters, plan_fetch_budget, radius_steps
+
+
+FOOD = ["restaurants near me", "cafes and bakeries near me", "delis near me"]
+
+
+def place(place_id, lat, lng):
+    return {'place_id': place_id, 'geometry': {'location': {'lat': lat, 'lng': lng}}}
+
+
+def test_food_categories_share_one_budget():
+    budget = plan_fetch_budget(FOOD + ["parks near me", "museums near me", "bowling near me"])
+    limits = budget.limits
+    assert limits["restaurants near me"] == limits["cafes and bakeries near me"] == limits["delis near me"] == 3
+    assert limits["parks near me"] == limits["museums near me"] == 8
+    # Categories without a broad type are not limited
+    assert limits["bowling near me"] is None
+
+
+def test_single_type_fills_every_stop():
+    limits = plan_fetch_budget(["parks near me"]).limits
+    assert limits == {"parks near me": search_planner.MAX_CANDIDATES_PER_CATEGORY}
+
+
+def test_limits_stay_within_bounds():
+    for itinerary_count in (1, 5, 20):
+        for limit in plan_fetch_budget(FOOD + ["parks near me"], itinerary_count).limits.values():
+            assert search_planner.MIN_CANDIDATES_PER_CATEGORY <= limit <= search_planner.MAX_CANDIDATES_PER_CATEGORY
+
+
+def test_budget_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(search_planner, "SEARCH_FETCH_BUDGET_ENABLED", False)
+    assert plan_fetch_budget(FOOD) is None
+
+
+def test_report_counts_skipped_candidates():
+    budget = plan_fetch_budget(["parks near me"])
+    allowance = budget.allowance("parks near me")
+    allowance.offer(20)
+    while not allowance.exhausted():
+        allowance.use()
+    report = budget.report()
+    assert (report['places_available'], report['places_hydrated'], report['details_calls_saved']) == (20, 10, 10)
+
+
+@pytest.mark.parametrize("max_radius, start, step, expected", [
+    (1.5, 0.5, 0.5, [0.5, 1.0, 1.5]),
+    (1.2, 0.5, 0.5, [0.5, 1.0, 1.2]),
+    (0.3, 0.5, 0.5, [0.3]),
+    (1.5, 0.5, 0, [1.5]),
+])
+def test_radius_steps_end_at_the_requested_radius(max_radius, start, step, expected):
+    assert radius_steps(max_radius, start, step) == expected
+
+
+def test_complete_radius_stops_short_of_the_nearest_skipped_candidate():
+    near, far = place("near", 40.701, -74.0), place("far", 40.71, -74.0)
+    assert complete_radius(40.7, -74.0, [near, far], [near, far]) is None
+    radius = complete_radius(40.7, -74.0, [near, far], [near])
+    assert radius == pytest.approx(haversine_meters(40.7, -74.0, 40.71, -74.0) - 1)
+    assert complete_radius(40.7, -74.0, [near, far], [far]) < haversine_meters(40.7, -74.0, 40.701, -74.0)
+
+
+def test_complete_radius_without_a_location_covers_nothing():
+    assert complete_radius(40.7, -74.0, [{'place_id': "unknown"}], []) == 0.0
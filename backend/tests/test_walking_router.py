@@ -0,0 +1,112 @@
+import random
+
+import pytest
+
+from search_planner import haversine_meters
+from walking_router import WalkingGraph, WalkingRouter
+
+
+LAT0, LNG0 = 40.700, -74.000
+METERS_PER_DEGREE_LAT = 111320.0
+METERS_PER_DEGREE_LNG = METERS_PER_DEGREE_LAT * 0.7581  # cos(40.7 degrees)
+
+
+def point(north_meters: float, east_meters: float):
+    """(lat, lng) offset from the origin"""
+    return LAT0 + north_meters / METERS_PER_DEGREE_LAT, LNG0 + east_meters / METERS_PER_DEGREE_LNG
+
+
+def line(*points):
+    return [(lng, lat) for lat, lng in points]
+
+
+@pytest.fixture
+def river_graph():
+    """Two 1 km streets 150 m apart, joined only by a bridge at their north ends"""
+    lines = [
+        line(point(0, 0), point(1000, 0)),
+        line(point(0, 150), point(1000, 150)),
+        line(point(1000, 0), point(1000, 150)),
+    ]
+    return WalkingGraph.from_lines(lambda: iter(lines))
+
+
+@pytest.fixture
+def grid_graph():
+    """A 5 x 5 street grid, 200 m blocks, with the middle of one avenue missing"""
+    lines = []
+    for row in range(5):
+        lines.append(line(*(point(row * 200, column * 200) for column in range(5))))
+    for column in range(5):
+        if column == 2:
+            lines.append(line(point(0, 400), point(200, 400)))
+            lines.append(line(point(600, 400), point(800, 400)))
+        else:
+            lines.append(line(*(point(row * 200, column * 200) for row in range(5))))
+    return WalkingGraph.from_lines(lambda: iter(lines))
+
+
+def test_detour_is_longer_than_straight_line(river_graph):
+    router = WalkingRouter(river_graph, max_meters=5000)
+    west, east = point(0, 0), point(0, 150)
+    meters = router.walking_meters(*west, *east)
+    assert meters == pytest.approx(2150, rel=0.01)
+    assert meters > haversine_meters(*west, *east)
+
+
+def test_beyond_limit_is_reported_as_the_limit(river_graph):
+    router = WalkingRouter(river_graph, max_meters=500)
+    assert router.walking_meters(*point(0, 0), *point(0, 150)) == 500
+
+
+def test_cached_beyond_limit_does_not_answer_a_larger_limit(river_graph):
+    router = WalkingRouter(river_graph, max_meters=500)
+    west, east = point(0, 0), point(0, 150)
+    assert router.walking_meters(*west, *east) == 500
+    # The pair is now cached as "further than 500 m"; a wider query has to route it
+    assert router.walking_meters(*west, *east, max_meters=5000) == pytest.approx(2150, rel=0.01)
+    # A narrower query is still answered with its own limit
+    assert router.walking_meters(*west, *east, max_meters=400) >= 400
+
+
+def test_wider_miss_is_not_cached_for_the_default_limit(river_graph):
+    router = WalkingRouter(river_graph, max_meters=500)
+    west, east = point(0, 0), point(0, 150)
+    assert router.walking_meters(*west, *east, max_meters=1000) == 1000
+    assert router.stats()['cached_pairs'] == 0
+    assert router.walking_meters(*west, *east) == 500
+
+
+def test_points_off_the_graph_are_not_routed(river_graph):
+    router = WalkingRouter(river_graph, max_meters=5000, snap_meters=100)
+    assert router.walking_meters(*point(0, 0), *point(500, 2000)) is None
+
+
+@pytest.mark.parametrize("max_meters", [300, 700, 5000])
+def test_matrix_agrees_with_walking_meters(grid_graph, max_meters):
+    rng = random.Random(7)
+    points = [point(rng.uniform(0, 800), rng.uniform(0, 800)) for _ in range(12)]
+
+    pairwise = WalkingRouter(grid_graph, max_meters=max_meters)
+    expected = [[0.0 if i == j else pairwise.walking_meters(*points[i], *points[j])
+                 for j in range(len(points))] for i in range(len(points))]
+
+    warmed = WalkingRouter(grid_graph, max_meters=max_meters)
+    assert warmed.matrix(points) == [[pytest.approx(meters) for meters in row] for row in expected]
+    assert warmed.stats()['cached_pairs'] > 0
+
+
+def test_walking_is_symmetric(grid_graph):
+    router = WalkingRouter(grid_graph, max_meters=5000)
+    a, b = point(150, 90), point(700, 650)
+    assert router.walking_meters(*a, *b) == pytest.approx(router.walking_meters(*b, *a))
+
+
+def test_compiled_graph_round_trips(grid_graph, tmp_path):
+    path = str(tmp_path / "grid.walkgraph")
+    grid_graph.save(path)
+    loaded = WalkingGraph.load(path)
+    assert (len(loaded), loaded.edge_count()) == (len(grid_graph), grid_graph.edge_count())
+    a, b = point(0, 0), point(800, 800)
+    assert (WalkingRouter(loaded).walking_meters(*a, *b)
+            == pytest.approx(WalkingRouter(grid_graph).walking_meters(*a, *b)))
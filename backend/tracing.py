@@ -0,0 +1,315 @@
+"""
+Lightweight in-process request tracing.
+
+A traced request records nested spans (search, each upstream call, each
+generation attempt, response serialisation) and instant events. Tracing is
+off unless the request sends ``X-Chalo-Trace: 1`` or is picked by
+``TRACE_SAMPLE_RATE``; for untraced requests ``span()`` is a single context
+variable lookup. Finished traces are kept in a small ring buffer and can be
+exported as Chrome trace-event JSON (chrome://tracing, Perfetto, speedscope)
+or as OTLP/JSON.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import functools
+import os
+import random
+import threading
+import time
+import uuid
+
+
+TRACE_HEADER = "x-chalo-trace"
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "50"))
+SERVICE_NAME = "chalo-api"
+
+
+class Span:
+    """A timed operation within a trace."""
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'start_ns', 'end_ns', 'thread_id', 'thread_name', 'attributes', 'error')
+
+    def __init__(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        thread = threading.current_thread()
+        self.thread_id = thread.ident
+        self.thread_name = thread.name
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any) -> None:
+        """Add attributes to the span."""
+        self.attributes.update(attributes)
+
+    def finish(self) -> None:
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+
+class Trace:
+    """All spans and events recorded for one request."""
+
+    def __init__(self, name: str, request_id: Optional[str] = None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.request_id = request_id
+        self.spans: List[Span] = []
+        # Structure: [(name, timestamp_ns, thread_id, thread_name, parent_span_id, attributes)]
+        self.events: List[tuple] = []
+        self._lock = threading.Lock()
+
+    def start_span(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> Span:
+        span = Span(name, parent_id, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def add_event(self, name: str, parent_id: Optional[str], attributes: Dict[str, Any]) -> None:
+        thread = threading.current_thread()
+        with self._lock:
+            self.events.append((name, time.time_ns(), thread.ident, thread.name, parent_id, attributes))
+
+    def summary(self) -> Dict[str, Any]:
+        """Trace id, name, duration and span count."""
+        with self._lock:
+            spans = list(self.spans)
+        start = min((s.start_ns for s in spans), default=0)
+        end = max((s.end_ns or s.start_ns for s in spans), default=0)
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'request_id': self.request_id,
+            'start': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start / 1e9)) if spans else None,
+            'duration_ms': round((end - start) / 1e6, 2),
+            'spans': len(spans),
+            'events': len(self.events),
+        }
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Export as Chrome trace-event JSON.
+
+        Returns:
+            A {"traceEvents": [...]} document with one complete ("X") event per
+            span and one instant ("i") event per event, timestamps in microseconds
+        """
+        with self._lock:
+            spans = list(self.spans)
+            events = list(self.events)
+        thread_ids: Dict[int, int] = {}
+        thread_names: Dict[int, str] = {}
+
+        def tid(thread_id: int, thread_name: str) -> int:
+            if thread_id not in thread_ids:
+                thread_ids[thread_id] = len(thread_ids) + 1
+                thread_names[thread_ids[thread_id]] = thread_name
+            return thread_ids[thread_id]
+
+        trace_events = []
+        for span in spans:
+            end_ns = span.end_ns or span.start_ns
+            args = dict(span.attributes)
+            if span.error:
+                args['error'] = span.error
+            trace_events.append({
+                'name': span.name,
+                'cat': span.name.split('.', 1)[0],
+                'ph': 'X',
+                'ts': span.start_ns / 1000,
+                'dur': (end_ns - span.start_ns) / 1000,
+                'pid': 1,
+                'tid': tid(span.thread_id, span.thread_name),
+                'args': args,
+            })
+        for name, timestamp_ns, thread_id, thread_name, _, attributes in events:
+            trace_events.append({
+                'name': name,
+                'cat': name.split('.', 1)[0],
+                'ph': 'i',
+                's': 't',
+                'ts': timestamp_ns / 1000,
+                'pid': 1,
+                'tid': tid(thread_id, thread_name),
+                'args': dict(attributes),
+            })
+        trace_events.append({'name': 'process_name', 'ph': 'M', 'pid': 1, 'args': {'name': f"{SERVICE_NAME} {self.name}"}})
+        for number, thread_name in thread_names.items():
+            trace_events.append({'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': number, 'args': {'name': thread_name}})
+        return {
+            'traceEvents': trace_events,
+            'displayTimeUnit': 'ms',
+            'otherData': {'trace_id': self.trace_id, 'request_id': self.request_id},
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        Export as OTLP/JSON (the body of an OTLP/HTTP traces export request).
+
+        Returns:
+            A {"resourceSpans": [...]} document
+        """
+        with self._lock:
+            spans = list(self.spans)
+            events = list(self.events)
+        events_by_span: Dict[Optional[str], List[Dict[str, Any]]] = {}
+        for name, timestamp_ns, _, _, parent_id, attributes in events:
+            events_by_span.setdefault(parent_id, []).append({
+                'timeUnixNano': str(timestamp_ns),
+                'name': name,
+                'attributes': _otlp_attributes(attributes),
+            })
+
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span.span_id,
+                'name': span.name,
+                'kind': 1,  # SPAN_KIND_INTERNAL
+                'startTimeUnixNano': str(span.start_ns),
+                'endTimeUnixNano': str(span.end_ns or span.start_ns),
+                'attributes': _otlp_attributes({**span.attributes, 'thread.name': span.thread_name}),
+                'events': events_by_span.get(span.span_id, []),
+                'status': {'code': 2, 'message': span.error} if span.error else {'code': 1},
+            }
+            if span.parent_id:
+                otlp_span['parentSpanId'] = span.parent_id
+            otlp_spans.append(otlp_span)
+
+        resource_attributes = {'service.name': SERVICE_NAME}
+        if self.request_id:
+            resource_attributes['request.id'] = self.request_id
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': _otlp_attributes(resource_attributes)},
+                'scopeSpans': [{'scope': {'name': 'chalo.tracing'}, 'spans': otlp_spans}],
+            }]
+        }
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    converted = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {'boolValue': value}
+        elif isinstance(value, int):
+            otlp_value = {'intValue': str(value)}
+        elif isinstance(value, float):
+            otlp_value = {'doubleValue': value}
+        else:
+            otlp_value = {'stringValue': str(value)}
+        converted.append({'key': key, 'value': otlp_value})
+    return converted
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_current_span_id: ContextVar[Optional[str]] = ContextVar("current_span_id", default=None)
+
+_finished_traces: "OrderedDict[str, Trace]" = OrderedDict()
+_finished_lock = threading.Lock()
+
+
+def should_trace(header_value: Optional[str]) -> bool:
+    """Decide whether to trace a request from its trace header and the sampling rate."""
+    if header_value is not None:
+        return header_value.strip().lower() in ("1", "true", "yes", "on")
+    return TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE
+
+
+def start_trace(name: str, request_id: Optional[str] = None) -> Trace:
+    """
+    Begin tracing in the current context and keep the trace for export.
+
+    Spans recorded after the request returns (streamed bodies, background
+    search) are still added to the stored trace.
+    """
+    trace = Trace(name, request_id)
+    _current_trace.set(trace)
+    _current_span_id.set(None)
+    with _finished_lock:
+        _finished_traces[trace.trace_id] = trace
+        while len(_finished_traces) > TRACE_BUFFER_SIZE:
+            _finished_traces.popitem(last=False)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    """The trace recording in the current context, if any."""
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Record a span around the with-block if the current request is traced.
+
+    Yields:
+        The span (to add attributes), or None when not tracing
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = trace.start_span(name, _current_span_id.get(), attributes)
+    token = _current_span_id.set(current.span_id)
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.finish()
+        _current_span_id.reset(token)
+
+
+def start_span(name: str, **attributes: Any) -> Optional[Span]:
+    """
+    Open a span that the caller finishes explicitly, e.g. across a return.
+
+    The span is not made current; returns None when not tracing.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        return None
+    return trace.start_span(name, _current_span_id.get(), attributes)
+
+
+def event(name: str, **attributes: Any) -> None:
+    """Record an instant event in the current span if the request is traced."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_event(name, _current_span_id.get(), attributes)
+
+
+def traced(name: str) -> Callable:
+    """Decorator recording a span around each call of the function."""
+    def decorator(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_trace(trace_id: str) -> Optional[Trace]:
+    """Look up a recent trace by id."""
+    with _finished_lock:
+        return _finished_traces.get(trace_id)
+
+
+def recent_traces() -> List[Dict[str, Any]]:
+    """Summaries of the buffered traces, most recent first."""
+    with _finished_lock:
+        traces = list(_finished_traces.values())
+    return [trace.summary() for trace in reversed(traces)]
@@ -0,0 +1,323 @@
+"""
+Shared HTTP client for upstream APIs with per-call accounting.
+
+Every call to Google Maps, Yelp AI or Gemini goes through ``get``/``post``
+here, which records the call count, latency, response bytes and estimated
+SKU cost per API. Totals are kept process-wide, per originating endpoint,
+and per request (see ``begin_request``), so we can see what one
+``/api/itineraries`` call actually costs.
+
+Setting ``UPSTREAM_BASE_URL`` sends every call to that host instead, keeping
+the path and query, so the backend can run against ``fake_upstream.py``.
+Calls can also be recorded to and replayed from cassettes (see cassettes.py).
+"""
+
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple
+from urllib.parse import urlsplit, urlunsplit
+import contextvars
+import os
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import cassettes
+import metrics
+import tracing
+from structured_logging import get_logger
+
+logger = get_logger("upstream")
+
+
+# API names used to tag calls
+GEOCODING = "geocoding"
+NEARBY_SEARCH = "nearby_search"
+PLACE_DETAILS = "place_details"
+DISTANCE_MATRIX = "distance_matrix"
+YELP_AI_CHAT = "yelp_ai_chat"
+GEMINI = "gemini"
+
+# Estimated list price in USD per 1000 calls. Place Details requests Basic,
+# Contact and Atmosphere fields (17 + 3 + 5); Distance Matrix is billed per
+# element and we always send one origin and one destination.
+SKU_COST_PER_1000 = {
+    GEOCODING: 5.00,
+    NEARBY_SEARCH: 32.00,
+    PLACE_DETAILS: 25.00,
+    DISTANCE_MATRIX: 5.00,
+    YELP_AI_CHAT: float(os.getenv("YELP_AI_COST_PER_1000", "0")),
+    GEMINI: float(os.getenv("GEMINI_COST_PER_1000", "0")),
+}
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_DEFAULT_TIMEOUT_SECONDS", "30"))
+POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "16"))
+LOG_PER_REQUEST = os.getenv("UPSTREAM_LOG_PER_REQUEST", "").lower() in ("1", "true", "yes")
+# Redirect all upstream calls, e.g. to http://127.0.0.1:8900 for load tests
+UPSTREAM_BASE_URL = os.getenv("UPSTREAM_BASE_URL", "").rstrip("/")
+
+
+def _new_counters() -> Dict[str, Any]:
+    return {'calls': 0, 'errors': 0, 'latency_seconds': 0.0, 'bytes': 0, 'estimated_cost_usd': 0.0}
+
+
+def _add_call(counters: Dict[str, Any], latency: float, size_bytes: int, cost: float, error: bool) -> None:
+    counters['calls'] += 1
+    counters['latency_seconds'] += latency
+    counters['bytes'] += size_bytes
+    counters['estimated_cost_usd'] += cost
+    if error:
+        counters['errors'] += 1
+
+
+def _report(counters_by_api: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Round the counters and add totals and mean latency."""
+    by_api = {}
+    totals = _new_counters()
+    for api, counters in sorted(counters_by_api.items()):
+        by_api[api] = {
+            'calls': counters['calls'],
+            'errors': counters['errors'],
+            'latency_seconds': round(counters['latency_seconds'], 3),
+            'mean_latency_ms': round(1000 * counters['latency_seconds'] / counters['calls'], 1) if counters['calls'] else None,
+            'bytes': counters['bytes'],
+            'estimated_cost_usd': round(counters['estimated_cost_usd'], 4),
+        }
+        for field in totals:
+            totals[field] += counters[field]
+    totals['latency_seconds'] = round(totals['latency_seconds'], 3)
+    totals['estimated_cost_usd'] = round(totals['estimated_cost_usd'], 4)
+    return {'by_api': by_api, 'totals': totals}
+
+
+class RequestContext:
+    """Upstream calls made on behalf of one API request."""
+
+    def __init__(self, request_id: str, endpoint: str):
+        self.request_id = request_id
+        self.endpoint = endpoint
+        self.started_at = time.time()
+        self.calls: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, api: str, latency: float, size_bytes: int, cost: float, error: bool) -> None:
+        with self._lock:
+            _add_call(self.calls.setdefault(api, _new_counters()), latency, size_bytes, cost, error)
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-API counters and totals for this request."""
+        with self._lock:
+            report = _report(self.calls)
+        report['request_id'] = self.request_id
+        report['endpoint'] = self.endpoint
+        return report
+
+    def log_summary(self) -> None:
+        """Log this request's upstream usage as one INFO record with structured fields."""
+        summary = self.summary()
+        totals = summary['totals']
+        logger.info(
+            "upstream usage", request_id=self.request_id, endpoint=self.endpoint,
+            calls=totals['calls'], errors=totals['errors'], bytes=totals['bytes'],
+            latency_seconds=totals['latency_seconds'], cost_usd=round(totals['estimated_cost_usd'], 4),
+            by_api={api: counters['calls'] for api, counters in summary['by_api'].items()},
+        )
+
+
+class UpstreamStats:
+    """Process-wide upstream counters, by API and by originating endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.by_api: Dict[str, Dict[str, Any]] = {}
+        self.by_endpoint: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.requests_by_endpoint: Dict[str, int] = {}
+
+    def record(self, api: str, endpoint: Optional[str], latency: float, size_bytes: int, cost: float, error: bool) -> None:
+        with self._lock:
+            _add_call(self.by_api.setdefault(api, _new_counters()), latency, size_bytes, cost, error)
+            endpoint_calls = self.by_endpoint.setdefault(endpoint or "(none)", {})
+            _add_call(endpoint_calls.setdefault(api, _new_counters()), latency, size_bytes, cost, error)
+
+    def count_request(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests_by_endpoint[endpoint] = self.requests_by_endpoint.get(endpoint, 0) + 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Report counters since start or the last reset.
+
+        Returns:
+            A JSON-serializable dictionary with overall and per-endpoint
+            counters; per-endpoint entries include calls per request
+        """
+        with self._lock:
+            overall = _report(self.by_api)
+            endpoints = {}
+            for endpoint, calls in sorted(self.by_endpoint.items()):
+                report = _report(calls)
+                request_count = self.requests_by_endpoint.get(endpoint, 0)
+                report['requests'] = request_count
+                if request_count:
+                    report['calls_per_request'] = round(report['totals']['calls'] / request_count, 2)
+                    report['cost_per_request_usd'] = round(report['totals']['estimated_cost_usd'] / request_count, 4)
+                endpoints[endpoint] = report
+            return {
+                'since': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started_at)),
+                'sku_cost_per_1000_usd': dict(SKU_COST_PER_1000),
+                **overall,
+                'by_endpoint': endpoints,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self.started_at = time.time()
+            self.by_api.clear()
+            self.by_endpoint.clear()
+            self.requests_by_endpoint.clear()
+
+
+stats = UpstreamStats()
+_current_request: ContextVar[Optional[RequestContext]] = ContextVar("upstream_request", default=None)
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+
+def begin_request(endpoint: str, request_id: Optional[str] = None) -> RequestContext:
+    """
+    Start attributing upstream calls in the current context to an API request.
+
+    Args:
+        endpoint: The originating endpoint path
+        request_id: The caller's request id; a new one is generated if omitted
+
+    Returns:
+        The request context, also available via current_request()
+    """
+    context = RequestContext(request_id or uuid.uuid4().hex[:16], endpoint)
+    _current_request.set(context)
+    stats.count_request(endpoint)
+    return context
+
+
+def current_request() -> Optional[RequestContext]:
+    """The request context upstream calls are attributed to, if any."""
+    return _current_request.get()
+
+
+def bind_context(fn: Callable) -> Callable:
+    """
+    Wrap fn to run in a copy of the current context.
+
+    Threads do not inherit context variables; wrap work submitted to a pool
+    or thread so its upstream calls are attributed to the originating request.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.run(fn, *args, **kwargs)
+    return run
+
+
+def redirect_url(url: str, base_url: str) -> str:
+    """Replace the scheme and host of url with base_url, keeping path and query."""
+    target = urlsplit(url)
+    base = urlsplit(base_url)
+    return urlunsplit((base.scheme, base.netloc, base.path + target.path, target.query, target.fragment))
+
+
+def _send_with_cassettes(api: str, method: str, url: str, kwargs: Dict[str, Any]) -> Tuple[requests.Response, bool]:
+    """
+    Replay a recorded response or send the request, recording it.
+
+    Returns:
+        (response, whether it was replayed)
+
+    Raises:
+        cassettes.CassetteMiss: In replay mode when there is no recording
+    """
+    store = cassettes.store
+    fingerprint, canonical = cassettes.request_fingerprint(method, url, kwargs.get('params'),
+                                                           kwargs.get('json'), kwargs.get('data'))
+    if store.mode in (cassettes.REPLAY, cassettes.REPLAY_OR_RECORD):
+        response = store.load(fingerprint, url)
+        if response is not None:
+            return response, True
+        if store.mode == cassettes.REPLAY:
+            store.count_miss()
+            raise cassettes.CassetteMiss(f"No cassette for {api} {method} {canonical['path']} ({fingerprint[:12]})")
+    started = time.perf_counter()
+    response = _session.request(method, url, **kwargs)
+    # Don't let a transient outage become a permanent replayed failure
+    if response.status_code < 500:
+        store.save(fingerprint, canonical, api, response, time.perf_counter() - started)
+    return response, False
+
+
+def request(api: str, method: str, url: str, **kwargs) -> requests.Response:
+    """
+    Send an upstream request through the shared session and record it.
+
+    Args:
+        api: The API name used for accounting (e.g. GEOCODING)
+        method: HTTP method
+        url: Request URL
+        **kwargs: Passed to requests (params, json, headers, timeout, ...)
+
+    Returns:
+        The response
+
+    Raises:
+        requests.exceptions.RequestException: On network errors and timeouts,
+            and on replay misses (cassettes.CassetteMiss)
+    """
+    kwargs.setdefault('timeout', DEFAULT_TIMEOUT_SECONDS)
+    if UPSTREAM_BASE_URL:
+        url = redirect_url(url, UPSTREAM_BASE_URL)
+    context = _current_request.get()
+    cost = SKU_COST_PER_1000.get(api, 0.0) / 1000
+    started = time.perf_counter()
+    try:
+        with tracing.span(f"upstream.{api}", method=method) as call_span:
+            if cassettes.store.active:
+                response, replayed = _send_with_cassettes(api, method, url, kwargs)
+                if replayed:
+                    cost = 0.0
+                if call_span:
+                    call_span.set(replayed=replayed)
+            else:
+                response = _session.request(method, url, **kwargs)
+            if call_span:
+                call_span.set(status=response.status_code, bytes=len(response.content))
+    except requests.exceptions.RequestException:
+        # No response came back (network error, timeout, replay miss): nothing to bill
+        latency = time.perf_counter() - started
+        metrics.observe_stage(metrics.UPSTREAM_STAGES.get(api, api), latency, error=True)
+        stats.record(api, context.endpoint if context else None, latency, 0, 0.0, True)
+        if context:
+            context.record(api, latency, 0, 0.0, True)
+        raise
+    latency = time.perf_counter() - started
+    size_bytes = len(response.content)
+    error = response.status_code >= 400
+    metrics.observe_stage(metrics.UPSTREAM_STAGES.get(api, api), latency, error)
+    stats.record(api, context.endpoint if context else None, latency, size_bytes, cost, error)
+    if context:
+        context.record(api, latency, size_bytes, cost, error)
+    return response
+
+
+def get(api: str, url: str, **kwargs) -> requests.Response:
+    """Send a GET request; see request()."""
+    return request(api, "GET", url, **kwargs)
+
+
+def post(api: str, url: str, **kwargs) -> requests.Response:
+    """Send a POST request; see request()."""
+    return request(api, "POST", url, **kwargs)
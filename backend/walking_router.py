@@ -0,0 +1,455 @@
+"""
+Offline pedestrian routing over a street graph built from a local OpenStreetMap extract.
+
+Walking distances otherwise come from Distance Matrix calls (slow and paid) or from
+straight lines, which are wrong wherever a river, park or rail yard is in the way.
+The graph keeps only junctions and dead ends as vertices (the points in between
+just add length to an edge), so a city graph stays small enough for pure Python.
+
+Routing is distance-bounded: pairs further apart than WALKING_ROUTER_MAX_METERS are
+reported as that far (a lower bound), which is all itinerary generation needs since a
+single walk is capped at 30 minutes. ``walking_meters`` answers one pair with A*
+(straight-line heuristic); ``matrix`` answers many-to-many with one multi-target
+Dijkstra per source that stops once every target is settled.
+
+    WALKING_GRAPH_PATH=cache/manhattan.walkgraph   # compiled graph, or a .geojson/.geojsonseq/.osm.pbf extract
+    WALKING_ROUTER_MAX_METERS=2500
+    WALKING_ROUTER_SNAP_METERS=300                 # places further than this from the graph are not routed
+    WALKING_ROUTER_CACHE_SIZE=200000               # routed vertex pairs kept in memory
+
+Compile an extract once (loading a compiled graph takes well under a second):
+    python walking_router.py build manhattan.geojsonseq -o cache/manhattan.walkgraph
+    python walking_router.py route cache/manhattan.walkgraph 40.7359,-73.9911 40.7281,-74.0027
+"""
+
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+import argparse
+import heapq
+import math
+import os
+import pickle
+import threading
+import time
+
+import metrics
+from search_planner import haversine_meters
+from structured_logging import get_logger
+
+logger = get_logger("walking_router")
+
+WALKING_GRAPH_PATH = os.getenv("WALKING_GRAPH_PATH", "")
+WALKING_ROUTER_MAX_METERS = float(os.getenv("WALKING_ROUTER_MAX_METERS", "2500"))
+WALKING_ROUTER_SNAP_METERS = float(os.getenv("WALKING_ROUTER_SNAP_METERS", "300"))
+WALKING_ROUTER_CACHE_SIZE = int(os.getenv("WALKING_ROUTER_CACHE_SIZE", "200000"))
+
+# highway=* values a pedestrian can use
+WALKABLE_HIGHWAYS = {
+    'footway', 'pedestrian', 'path', 'steps', 'living_street', 'residential', 'service', 'unclassified',
+    'tertiary', 'tertiary_link', 'secondary', 'secondary_link', 'primary', 'primary_link', 'track',
+    'corridor', 'cycleway', 'bridleway', 'road', 'trunk', 'trunk_link',
+}
+NO_ACCESS = {'no', 'private'}
+# Snapping grid cell size in degrees (about 220 m of latitude)
+GRID_DEGREES = 0.002
+GRAPH_FORMAT_VERSION = 1
+# Edge lengths are float32 sums over the unrounded line points, so a straight line between
+# (rounded) vertices can exceed them by a few millimetres. Shrinking the A* heuristic keeps
+# it admissible, and walking_meters then agrees with the Dijkstra behind matrix.
+HEURISTIC_FACTOR = 0.999
+
+
+def is_walkable(tags: Dict[str, str]) -> bool:
+    """Whether a way with these tags can be walked"""
+    if tags.get('highway') not in WALKABLE_HIGHWAYS:
+        return False
+    if tags.get('foot') in NO_ACCESS:
+        return False
+    if tags.get('access') in NO_ACCESS and tags.get('foot') not in ('yes', 'designated', 'permissive'):
+        return False
+    return True
+
+
+def _vertex_key(lng: float, lat: float) -> Tuple[int, int]:
+    """Coordinates at 1e-7 degrees; ways share a junction when they share a vertex"""
+    return round(lng * 1e7), round(lat * 1e7)
+
+
+def iter_walkable_lines(path: str) -> Iterator[List[Tuple[float, float]]]:
+    """Coordinate lists (lng, lat) of the walkable ways in an extract"""
+    if path.lower().endswith(".pbf"):
+        yield from _iter_pbf_lines(path)
+        return
+    from osm_ingest import iter_feature_collection, iter_geojson_seq
+    lower = path.lower()
+    if lower.endswith((".geojsonseq", ".geojsonl", ".geojsons", ".ndjson", ".jsonl")):
+        features = iter_geojson_seq(path)
+    else:
+        features = iter_feature_collection(path)
+    for feature in features:
+        properties = feature.get('properties') or {}
+        tags = properties.get('tags') if isinstance(properties.get('tags'), dict) else properties
+        if not is_walkable(tags):
+            continue
+        geometry = feature.get('geometry') or {}
+        if geometry.get('type') == 'LineString':
+            yield [(c[0], c[1]) for c in geometry.get('coordinates') or []]
+        elif geometry.get('type') == 'MultiLineString':
+            for line in geometry.get('coordinates') or []:
+                yield [(c[0], c[1]) for c in line]
+
+
+def _iter_pbf_lines(path: str) -> Iterator[List[Tuple[float, float]]]:
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .osm.pbf needs the osmium package (pip install osmium), "
+                           "or convert first: osmium export -f geojsonseq extract.osm.pbf -o extract.geojsonseq")
+    for way in osmium.FileProcessor(path).with_locations():
+        if not way.is_way() or not is_walkable(dict(way.tags)):
+            continue
+        line = [(node.location.lon, node.location.lat) for node in way.nodes if node.location.valid()]
+        if len(line) >= 2:
+            yield line
+
+
+class WalkingGraph:
+    """Undirected walking graph in compressed adjacency form, with a grid index for snapping."""
+
+    def __init__(self, lats: array, lngs: array, offsets: array, targets: array, weights: array):
+        self.lats = lats
+        self.lngs = lngs
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+        self._grid: Dict[Tuple[int, int], List[int]] = {}
+        for vertex in range(len(lats)):
+            self._grid.setdefault(self._cell(lats[vertex], lngs[vertex]), []).append(vertex)
+
+    @staticmethod
+    def _cell(lat: float, lng: float) -> Tuple[int, int]:
+        return int(math.floor(lat / GRID_DEGREES)), int(math.floor(lng / GRID_DEGREES))
+
+    @classmethod
+    def from_lines(cls, lines_factory) -> "WalkingGraph":
+        """
+        Build from walkable lines. lines_factory() must return a fresh iterator each
+        call: the first pass finds junctions, the second builds edges between them.
+        """
+        uses: Dict[Tuple[int, int], int] = {}
+        for line in lines_factory():
+            last = len(line) - 1
+            for i, (lng, lat) in enumerate(line):
+                key = _vertex_key(lng, lat)
+                # Endpoints always become vertices; shared interior points are junctions
+                uses[key] = uses.get(key, 0) + (2 if i == 0 or i == last else 1)
+
+        vertex_ids: Dict[Tuple[int, int], int] = {}
+        lats, lngs = array('d'), array('d')
+        adjacency: List[Dict[int, float]] = []
+
+        def vertex(key: Tuple[int, int]) -> int:
+            vertex_id = vertex_ids.get(key)
+            if vertex_id is None:
+                vertex_id = vertex_ids[key] = len(lats)
+                lngs.append(key[0] / 1e7)
+                lats.append(key[1] / 1e7)
+                adjacency.append({})
+            return vertex_id
+
+        for line in lines_factory():
+            if len(line) < 2:
+                continue
+            start = vertex(_vertex_key(*line[0]))
+            length = 0.0
+            for (lng1, lat1), (lng2, lat2) in zip(line, line[1:]):
+                length += haversine_meters(lat1, lng1, lat2, lng2)
+                key = _vertex_key(lng2, lat2)
+                if uses.get(key, 0) >= 2:
+                    end = vertex(key)
+                    if end != start and length < adjacency[start].get(end, math.inf):
+                        adjacency[start][end] = adjacency[end][start] = length
+                    start, length = end, 0.0
+        uses.clear()
+
+        offsets, targets, weights = array('l', [0]), array('l'), array('f')
+        for neighbours in adjacency:
+            for target, weight in neighbours.items():
+                targets.append(target)
+                weights.append(weight)
+            offsets.append(len(targets))
+        return cls(lats, lngs, offsets, targets, weights)
+
+    @classmethod
+    def from_extract(cls, path: str) -> "WalkingGraph":
+        return cls.from_lines(lambda: iter_walkable_lines(path))
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            pickle.dump((GRAPH_FORMAT_VERSION, self.lats, self.lngs, self.offsets, self.targets, self.weights), f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, path: str) -> "WalkingGraph":
+        """A compiled graph (from save) or, for any other file, an extract to build from"""
+        if path.lower().endswith((".pbf", ".geojson", ".geojsonseq", ".geojsonl", ".geojsons", ".ndjson", ".json", ".jsonl")):
+            return cls.from_extract(path)
+        with open(path, 'rb') as f:
+            version, *arrays = pickle.load(f)
+        if version != GRAPH_FORMAT_VERSION:
+            raise ValueError(f"{path} is walking graph format {version}, expected {GRAPH_FORMAT_VERSION}; rebuild it")
+        return cls(*arrays)
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def edge_count(self) -> int:
+        return len(self.targets) // 2
+
+    def snap(self, lat: float, lng: float, max_meters: float) -> Optional[Tuple[int, float]]:
+        """Closest vertex to a point and its distance, if within max_meters"""
+        row, column = self._cell(lat, lng)
+        reach = max(1, math.ceil(max_meters / 111000 / GRID_DEGREES))
+        # Equirectangular distance is plenty to rank vertices this close together
+        lng_scale = math.cos(math.radians(lat))
+        best, best_squared = -1, math.inf
+        for r in range(row - reach, row + reach + 1):
+            for c in range(column - reach, column + reach + 1):
+                for vertex in self._grid.get((r, c), ()):
+                    d_lat = self.lats[vertex] - lat
+                    d_lng = (self.lngs[vertex] - lng) * lng_scale
+                    squared = d_lat * d_lat + d_lng * d_lng
+                    if squared < best_squared:
+                        best, best_squared = vertex, squared
+        if best < 0:
+            return None
+        meters = haversine_meters(lat, lng, self.lats[best], self.lngs[best])
+        return (best, meters) if meters <= max_meters else None
+
+    def shortest_path(self, source: int, target: int, max_meters: float) -> Optional[float]:
+        """A* from source to target; None when the target is further than max_meters"""
+        if source == target:
+            return 0.0
+        lats, lngs, offsets, targets, weights = self.lats, self.lngs, self.offsets, self.targets, self.weights
+        target_lat, target_lng = lats[target], lngs[target]
+        best = {source: 0.0}
+        heap = [(HEURISTIC_FACTOR * haversine_meters(lats[source], lngs[source], target_lat, target_lng),
+                 0.0, source)]
+        while heap:
+            _, distance, vertex = heapq.heappop(heap)
+            if vertex == target:
+                return distance
+            if distance > best.get(vertex, math.inf):
+                continue
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                neighbour = targets[edge]
+                candidate = distance + weights[edge]
+                if candidate < best.get(neighbour, math.inf):
+                    remaining = HEURISTIC_FACTOR * haversine_meters(lats[neighbour], lngs[neighbour],
+                                                                    target_lat, target_lng)
+                    if candidate + remaining > max_meters:
+                        continue
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate + remaining, candidate, neighbour))
+        return None
+
+    def distances_to(self, source: int, destinations: Iterable[int], max_meters: float) -> Dict[int, float]:
+        """Dijkstra from source until every destination is settled or max_meters is reached"""
+        pending = set(destinations)
+        pending.discard(source)
+        found = {source: 0.0}
+        if not pending:
+            return found
+        offsets, targets, weights = self.offsets, self.targets, self.weights
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        while heap and pending:
+            distance, vertex = heapq.heappop(heap)
+            if distance > best[vertex]:
+                continue
+            if vertex in pending:
+                pending.discard(vertex)
+                found[vertex] = distance
+            for edge in range(offsets[vertex], offsets[vertex + 1]):
+                neighbour = targets[edge]
+                candidate = distance + weights[edge]
+                if candidate <= max_meters and candidate < best.get(neighbour, math.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return found
+
+
+class WalkingRouter:
+    """Walking distances between points over a WalkingGraph, with a bounded cache of routed vertex pairs."""
+
+    def __init__(self, graph: WalkingGraph, max_meters: float = WALKING_ROUTER_MAX_METERS,
+                 snap_meters: float = WALKING_ROUTER_SNAP_METERS, cache_size: int = WALKING_ROUTER_CACHE_SIZE):
+        self.graph = graph
+        self.max_meters = max_meters
+        self.snap_meters = snap_meters
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._pairs: "OrderedDict[Tuple[int, int], Optional[float]]" = OrderedDict()
+        self._snaps: Dict[Tuple[float, float], Optional[Tuple[int, float]]] = {}
+
+    def _snap(self, lat: float, lng: float) -> Optional[Tuple[int, float]]:
+        key = (lat, lng)
+        with self._lock:
+            if key in self._snaps:
+                return self._snaps[key]
+        snapped = self.graph.snap(lat, lng, self.snap_meters)
+        with self._lock:
+            if len(self._snaps) >= self.cache_size:
+                self._snaps.clear()
+            self._snaps[key] = snapped
+        return snapped
+
+    def _cached(self, pair: Tuple[int, int]):
+        with self._lock:
+            if pair in self._pairs:
+                self._pairs.move_to_end(pair)
+                return True, self._pairs[pair]
+        return False, None
+
+    def _remember(self, pair: Tuple[int, int], meters: Optional[float]) -> None:
+        with self._lock:
+            self._pairs[pair] = meters
+            self._pairs.move_to_end(pair)
+            while len(self._pairs) > self.cache_size:
+                self._pairs.popitem(last=False)
+
+    def walking_meters(self, lat1: float, lng1: float, lat2: float, lng2: float,
+                       max_meters: Optional[float] = None) -> Optional[float]:
+        """
+        Walking distance between two points in meters.
+
+        Returns:
+            The network distance plus the walk to and from the graph; max_meters
+            (or the straight-line distance, if longer) when the route is longer than
+            that; None when either point is off the graph
+        """
+        max_meters = self.max_meters if max_meters is None else max_meters
+        straight_line = haversine_meters(lat1, lng1, lat2, lng2)
+        if straight_line >= max_meters:
+            metrics.walking_routes.inc(result="beyond_limit")
+            return straight_line
+        start, end = self._snap(lat1, lng1), self._snap(lat2, lng2)
+        if start is None or end is None:
+            metrics.walking_routes.inc(result="off_graph")
+            return None
+        if start[0] == end[0]:
+            metrics.walking_routes.inc(result="routed")
+            return straight_line
+
+        pair = (min(start[0], end[0]), max(start[0], end[0]))
+        found, network = self._cached(pair)
+        # A cached "beyond the limit" only answers queries with the same or a smaller limit
+        if not found or (network is None and max_meters > self.max_meters):
+            network = self.graph.shortest_path(start[0], end[0], max(max_meters, self.max_meters))
+            if network is not None or max_meters <= self.max_meters:
+                self._remember(pair, network)
+        if network is None:
+            metrics.walking_routes.inc(result="beyond_limit")
+            return max(max_meters, straight_line)
+        metrics.walking_routes.inc(result="routed")
+        return max(straight_line, start[1] + network + end[1])
+
+    def warm(self, points: Sequence[Tuple[float, float]]) -> None:
+        """Route every pair of points (lat, lng) into the pair cache, one Dijkstra per source"""
+        snaps = [self._snap(lat, lng) for lat, lng in points]
+        vertices = sorted({snap[0] for snap in snaps if snap})
+        # Walking is symmetric, so each source only needs the vertices after it
+        for i, source in enumerate(vertices):
+            destinations = [vertex for vertex in vertices[i + 1:] if not self._cached((source, vertex))[0]]
+            if not destinations:
+                continue
+            distances = self.graph.distances_to(source, destinations, self.max_meters)
+            for destination in destinations:
+                self._remember((source, destination), distances.get(destination))
+
+    def matrix(self, points: Sequence[Tuple[float, float]]) -> List[List[Optional[float]]]:
+        """Walking distances between every pair of points (lat, lng), same units and fallbacks as walking_meters"""
+        self.warm(points)
+        return [[0.0 if i == j else self.walking_meters(points[i][0], points[i][1], points[j][0], points[j][1])
+                 for j in range(len(points))] for i in range(len(points))]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            cached_pairs = len(self._pairs)
+        return {
+            'vertices': len(self.graph),
+            'edges': self.graph.edge_count(),
+            'max_meters': self.max_meters,
+            'snap_meters': self.snap_meters,
+            'cached_pairs': cached_pairs,
+        }
+
+
+_router: Optional[WalkingRouter] = None
+_router_loaded = False
+_router_lock = threading.Lock()
+
+
+def get_router() -> Optional[WalkingRouter]:
+    """The router for WALKING_GRAPH_PATH, loaded on first use; None when unset or unreadable"""
+    global _router, _router_loaded
+    if _router_loaded:
+        return _router
+    with _router_lock:
+        if not _router_loaded:
+            if WALKING_GRAPH_PATH:
+                started = time.monotonic()
+                try:
+                    graph = WalkingGraph.load(WALKING_GRAPH_PATH)
+                    _router = WalkingRouter(graph)
+                    logger.info("Loaded walking graph %s: %s vertices, %s edges in %.1fs", WALKING_GRAPH_PATH,
+                                len(graph), graph.edge_count(), time.monotonic() - started)
+                except (OSError, ValueError, RuntimeError, pickle.UnpicklingError) as e:
+                    logger.warning("Walking graph %s unavailable, using straight-line distances: %s", WALKING_GRAPH_PATH, e)
+            _router_loaded = True
+    return _router
+
+
+def _parse_point(text: str) -> Tuple[float, float]:
+    lat, lng = text.split(",")
+    return float(lat), float(lng)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query an offline walking graph")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Compile an OSM extract into a walking graph")
+    build.add_argument("extract", help=".geojson, .geojsonseq or .osm.pbf file")
+    build.add_argument("-o", "--output", required=True, help="Compiled graph path")
+    route = commands.add_parser("route", help="Walking distance between two lat,lng points")
+    route.add_argument("graph", help="Compiled graph or extract")
+    route.add_argument("origin")
+    route.add_argument("destination")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    try:
+        graph = WalkingGraph.from_extract(args.extract) if args.command == "build" else WalkingGraph.load(args.graph)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    print(f"{len(graph)} vertices, {graph.edge_count()} edges in {time.monotonic() - started:.1f}s")
+    if args.command == "build":
+        graph.save(args.output)
+        print(f"Wrote {args.output}")
+        return
+
+    router = WalkingRouter(graph, max_meters=50000)
+    (lat1, lng1), (lat2, lng2) = _parse_point(args.origin), _parse_point(args.destination)
+    started = time.monotonic()
+    meters = router.walking_meters(lat1, lng1, lat2, lng2)
+    if meters is None:
+        print("A point is more than %.0fm from the walking graph" % router.snap_meters)
+        return
+    straight_line = haversine_meters(lat1, lng1, lat2, lng2)
+    print(f"{meters:.0f}m walking ({meters / 1.34 / 60:.0f} min), {straight_line:.0f}m straight line, "
+          f"routed in {(time.monotonic() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,6 @@
 import React, { useState } from 'react';
 import { AIEngineResponse, AIBusiness } from '../types';
-import { getAgentRecommendations } from '../services/apiService';
+import { streamAgentRecommendations } from '../services/apiService';
 import AgentInput from './AgentInput';
 // Agent route components are not used with AI Engine response
 import AgentLoadingState from './AgentLoadingState';
@@ -21,11 +21,11 @@ const AgentChatPage: React.FC = () => {
     setCurrentSearch({ userRequest, location });
 
     try {
-      const minDelay = new Promise(resolve => setTimeout(resolve, 3000));
-      const apiCall = getAgentRecommendations(userRequest, location, distanceMiles);
-      const [result] = await Promise.all([apiCall, minDelay]);
+      // Show the narrative and places as they stream in rather than after the whole answer
+      const result = await streamAgentRecommendations(userRequest, location, distanceMiles, setAgentResponse);
       setAgentResponse(result);
     } catch (e) {
+      setAgentResponse(null);
       console.error('Agent search error:', e);
       if (e instanceof Error) {
         if (e.message.includes('Unable to connect to the server')) {
@@ -69,7 +69,7 @@ const AgentChatPage: React.FC = () => {
       </div>
 
       {/* Loading State */}
-      {isLoading && currentSearch && (
+      {isLoading && !agentResponse && currentSearch && (
         <AgentLoadingState 
           userRequest={currentSearch.userRequest}
           location={currentSearch.location}
@@ -89,7 +89,7 @@ const AgentChatPage: React.FC = () => {
       )}
 
       {/* Results Section */}
-      {!isLoading && agentResponse && (
+      {agentResponse && (
         <div className="space-y-8">
           {/* Chat text summary */}
           {agentResponse.text && (
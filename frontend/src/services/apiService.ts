@@ -5,6 +5,8 @@ const API_BASE_URL = import.meta.env.VITE_API_URL || 'http://localhost:8000';
 interface ApiResponse {
     itineraries: Itinerary[];
     sources: GroundingChunk[];
+    partial?: boolean;
+    pending_categories?: string[];
 }
 
 interface ErrorResponse {
@@ -346,3 +348,89 @@ export const getAgentRecommendations = async (
     }
 };
 
+
+export const streamAgentRecommendations = async (
+    userRequest: string,
+    location: string | undefined,
+    distanceMiles: number,
+    onUpdate: (partial: import('../types').AIEngineResponse) => void,
+): Promise<import('../types').AIEngineResponse> => {
+    const requestBody: any = {
+        user_request: userRequest,
+        distance_miles: distanceMiles,
+    };
+    if (location) requestBody.location = location;
+
+    let response: Response;
+    try {
+        response = await fetch(`${API_BASE_URL}/api/agent-recommendations/stream?format=ndjson`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify(requestBody),
+        });
+    } catch {
+        throw new Error('Unable to connect to the server. Please ensure the backend is running on port 8000.');
+    }
+
+    if (!response.ok || !response.body) {
+        let errorMessage = `HTTP error! status: ${response.status}`;
+        try {
+            const errorData: ErrorResponse = await response.json();
+            errorMessage = errorData.detail || errorMessage;
+        } catch {
+            // If we can't parse error response, use default message
+        }
+        throw new Error(errorMessage);
+    }
+
+    // Events arrive as NDJSON: started, text (deltas), businesses, plan, plans, then done or error
+    const result: import('../types').AIEngineResponse = { text: '', businesses: [] };
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffered = '';
+
+    const handle = (line: string): boolean => {
+        if (!line.trim()) return false;
+        const event = JSON.parse(line);
+        switch (event.event) {
+            case 'text':
+                result.text = (result.text || '') + event.delta;
+                break;
+            case 'businesses':
+                result.businesses = event.businesses;
+                break;
+            case 'plan':
+                result.plan = event.plan;
+                break;
+            case 'plans':
+                result.plans = event.plans;
+                break;
+            case 'done':
+                result.chat_id = event.chat_id;
+                result.session_id = event.session_id;
+                return true;
+            case 'error':
+                throw new Error(event.status === 500 ? 'Server error occurred. Please try again.' : event.detail);
+            default:
+                return false;
+        }
+        onUpdate({ ...result });
+        return false;
+    };
+
+    while (true) {
+        const { value, done } = await reader.read();
+        buffered += decoder.decode(value, { stream: !done });
+        const lines = buffered.split('\n');
+        buffered = lines.pop() || '';
+        for (const line of lines) {
+            if (handle(line)) return result;
+        }
+        if (done) {
+            if (handle(buffered)) return result;
+            throw new Error('The connection closed before the recommendations finished. Please try again.');
+        }
+    }
+};
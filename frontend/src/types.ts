@@ -1,5 +1,6 @@
 export interface Stop {
   id: string;
+  place_id?: string;
   name: string;
   category: string;
   walking_time_minutes: number;
@@ -132,6 +133,7 @@ export interface AIDayPlan {
 
 export interface AIEngineResponse {
   chat_id?: string;
+  session_id?: string;
   text?: string;
   businesses: AIBusiness[];
   plan?: AIDayPlan;